@@ -1,12 +1,20 @@
 from myhdl import *
 
+from mem import CTI_INCR
+
 @block
 def BusArbiter(i_rstn, i_clk, i_adr, i_dat, o_dat, i_we, i_stb, o_ack,
                o_mem_adr, o_mem_dat, i_mem_dat, o_mem_we, o_mem_stb, i_mem_ack,
-               NUM_PORTS=4):
+               o_wait_cycles=None, i_cti=None, i_bte=None, o_mem_cti=None, o_mem_bte=None,
+               NUM_PORTS=4, MODE="priority", BURST=1):
 
     """
-    Super simple priority-based bus arbiter. Note: Makes no attempt to prevent clients from hogging the bus
+    Simple bus arbiter
+
+    In "priority" mode, the lowest numbered client requesting a transaction is always granted the bus. Note: Makes no attempt to prevent clients from hogging the bus
+    In "round_robin" mode, grants rotate through the clients starting after the last one granted, and the bus is handed straight to the next waiting client
+    on the same clock its current transaction is acknowledged (no idle cycle between grants)
+    In both modes, a client in the middle of an incrementing burst keeps the bus until the last beat of the burst is acknowledged
 
     - i_rstn: Reset signal
     - i_clk: Clock signal
@@ -24,26 +32,95 @@ def BusArbiter(i_rstn, i_clk, i_adr, i_dat, o_dat, i_we, i_stb, o_ack,
     - o_mem_we: Output write enable signal to backing memory
     - o_mem_stb: Output request transaction signal to backing memory
     - i_mem_ack: Input transaction acknowledge signal from backing memory
+
+    - o_wait_cycles: Optional output count of cycles each client spent requesting a transaction without holding the bus [NUM_PORTS]
+    - i_cti: Optional input cycle type identifier lines [NUM_PORTS]
+    - i_bte: Optional input burst type extension lines [NUM_PORTS]
+    - o_mem_cti: Optional output cycle type identifier to backing memory
+    - o_mem_bte: Optional output burst type extension to backing memory
+
+    - NUM_PORTS: Number of clients
+    - MODE: Grant policy ("priority" or "round_robin")
+    - BURST: Max number of back-to-back transactions (or bursts) a client may complete per grant (either a single value, or a weight per client [NUM_PORTS])
     """
 
+    assert MODE in ("priority", "round_robin"), "Unknown arbiter mode: %s" % MODE
+
+    _burst_tbl = tuple(BURST) if isinstance(BURST, (tuple, list)) else (BURST,) * NUM_PORTS
+    assert len(_burst_tbl) == NUM_PORTS and min(_burst_tbl) >= 1, "BURST must be at least 1 for every port"
+
+    if o_wait_cycles is None:
+        o_wait_cycles = [Signal(intbv(0)[32:]) for _ in range(NUM_PORTS)]
+    if i_cti is None:
+        i_cti = [Signal(intbv(0)[3:]) for _ in range(NUM_PORTS)]
+    if i_bte is None:
+        i_bte = [Signal(intbv(0)[2:]) for _ in range(NUM_PORTS)]
+    if o_mem_cti is None:
+        o_mem_cti = Signal(intbv(0)[3:])
+    if o_mem_bte is None:
+        o_mem_bte = Signal(intbv(0)[2:])
+
     _active_grant = Signal(intbv(0)[8:0])
     _is_active = Signal(bool(0))
+    _burst_count = Signal(intbv(0)[8:0])
 
     @always(i_clk.posedge, i_rstn)
     def clk_logic():
         if i_rstn == 0:
             _is_active.next = False
+            _active_grant.next = NUM_PORTS - 1
         elif _is_active == False:
-            # first client in the list who requests a transaction is granted access until the request is acknowledged
-            for i in range(NUM_PORTS):
-                if i_stb[i]:
-                    _active_grant.next = i
-                    _is_active.next = True
-                    break
+            _burst_count.next = 0
+            if MODE == "round_robin":
+                # first client after the last one granted who requests a transaction is granted access
+                for k in range(1, NUM_PORTS + 1):
+                    i = (_active_grant + k) % NUM_PORTS
+                    if i_stb[i]:
+                        _active_grant.next = i
+                        _is_active.next = True
+                        break
+            else:
+                # first client in the list who requests a transaction is granted access until the request is acknowledged
+                for i in range(NUM_PORTS):
+                    if i_stb[i]:
+                        _active_grant.next = i
+                        _is_active.next = True
+                        break
         elif _is_active == True:
-            # if request is acknowledged, release grant
-            if i_mem_ack:
+            if not i_stb[_active_grant]:
+                # client stopped requesting before using up its burst, release grant
                 _is_active.next = False
+            elif i_mem_ack:
+                if i_cti[_active_grant] == CTI_INCR:
+                    # client is in the middle of a burst, keep grant
+                    pass
+                elif _burst_count < _burst_tbl[_active_grant] - 1:
+                    # client keeps the bus for its next transaction
+                    _burst_count.next = _burst_count + 1
+                elif MODE == "round_robin":
+                    # hand grant over to the next waiting client. the current client isn't a candidate,
+                    # as its request line is still high for the transaction being acknowledged
+                    _is_active.next = False
+                    _burst_count.next = 0
+                    for k in range(1, NUM_PORTS):
+                        i = (_active_grant + k) % NUM_PORTS
+                        if i_stb[i]:
+                            _active_grant.next = i
+                            _is_active.next = True
+                            break
+                else:
+                    # if request is acknowledged, release grant
+                    _is_active.next = False
+
+    @always(i_clk.posedge, i_rstn)
+    def wait_logic():
+        if i_rstn == 0:
+            for i in range(NUM_PORTS):
+                o_wait_cycles[i].next = 0
+        else:
+            for i in range(NUM_PORTS):
+                if i_stb[i] and not (_is_active and _active_grant == i):
+                    o_wait_cycles[i].next = o_wait_cycles[i] + 1
 
     @always_comb
     def comb_logic():
@@ -51,8 +128,10 @@ def BusArbiter(i_rstn, i_clk, i_adr, i_dat, o_dat, i_we, i_stb, o_ack,
         o_mem_dat.next = i_dat[_active_grant]
         o_mem_we.next = i_we[_active_grant]
         o_mem_stb.next = i_stb[_active_grant] and _is_active
+        o_mem_cti.next = i_cti[_active_grant]
+        o_mem_bte.next = i_bte[_active_grant]
         o_dat.next = i_mem_dat
         for i in range(NUM_PORTS):
             o_ack[i].next = i_mem_ack and _active_grant == i
 
-    return clk_logic, comb_logic
\ No newline at end of file
+    return clk_logic, wait_logic, comb_logic
\ No newline at end of file
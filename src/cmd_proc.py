@@ -0,0 +1,320 @@
+from myhdl import *
+
+from memcache import MemCache
+
+t_State = enum("IDLE", "HEADER", "LOAD", "ISSUE", "DRAIN")
+
+# command packet opcodes (top 8 bits of a packet's header word, the rest is the packet's argument)
+CMD_END = 0
+CMD_TRI = 1
+CMD_STATE = 2
+CMD_FILL = 3
+
+# triangle record: header followed by these words, in order
+TRI_RECORD = ("v0", 2), ("v1", 2), ("v2", 2), ("col_init", 4), ("col_dx", 4), ("col_dy", 4), \
+             ("1ow_init", 1), ("1ow_dx", 1), ("1ow_dy", 1), ("sow_init", 1), ("sow_dx", 1), ("sow_dy", 1), \
+             ("tow_init", 1), ("tow_dx", 1), ("tow_dy", 1), ("zow_init", 1), ("zow_dx", 1), ("zow_dy", 1)
+TRI_WORDS = sum(n for (_, n) in TRI_RECORD)
+
+# word offsets within the triangle record
+_TRI_OFFS = {}
+_offs = 0
+for (_name, _n) in TRI_RECORD:
+    _TRI_OFFS[_name] = _offs
+    _offs += _n
+
+# fill packet: header followed by the fill color (4 words, Q8.12 like col_init) & depth. words are loaded into the triangle record's col_init & zow_init
+FILL_WORDS = 5
+_FILL_IDX = tuple(range(_TRI_OFFS["col_init"], _TRI_OFFS["col_init"] + 4)) + (_TRI_OFFS["zow_init"],)
+
+# render state registers, set with a state packet (header argument is the register number, followed by one word)
+STATE_REGS = ("tex_en", "dtest_en", "dcmp", "bl_en", "bl_src", "bl_dst", "bl_op", "fog_en", "fog_col",
+              "tex_w", "tex_h", "tex_fmt", "tex_flt", "tex_clmp_s", "tex_clmp_t", "tex_mip") + tuple("tex_mip_tbl_%s" % i for i in range(16)) + \
+             ("tex_cb_adr",)
+STATE_NUM = len(STATE_REGS)
+
+def pack_header(op, arg=0):
+    return (op << 24) | (arg & 0xFFFFFF)
+
+def pack_tri(tri):
+    """
+    Packs a triangle record from a dict of TriRaster triangle parameters (missing parameters are 0)
+    """
+    words = [pack_header(CMD_TRI)]
+    for (name, n) in TRI_RECORD:
+        value = tri.get(name, (0,) * n if n > 1 else 0)
+        words += [int(v) & 0xFFFFFFFF for v in (value if n > 1 else (value,))]
+    return words
+
+def pack_fill(fill):
+    """
+    Packs a fill packet from a dict with the fill col_init & zow_init
+    """
+    return [pack_header(CMD_FILL)] + [int(c) & 0xFFFFFFFF for c in fill["col_init"]] + [int(fill["zow_init"]) & 0xFFFFFFFF]
+
+def pack_state(state):
+    """
+    Packs a state packet for every render state register given in a dict (tex_mip_tbl may be given as a list of addresses)
+    """
+    words = []
+    for (name, value) in state.items():
+        values = [(name, value)] if name != "tex_mip_tbl" else [("tex_mip_tbl_%s" % i, v) for (i, v) in enumerate(value)]
+        for (reg, v) in values:
+            words += [pack_header(CMD_STATE, STATE_REGS.index(reg)), int(v) & 0xFFFFFFFF]
+    return words
+
+def pack_end():
+    return [pack_header(CMD_END)]
+
+@block
+def CmdProc(i_rstn, i_clk, i_valid, i_ptr, o_ready,
+            o_v0, o_v1, o_v2,
+            o_col_init, o_col_dx, o_col_dy,
+            o_1ow_init, o_1ow_dx, o_1ow_dy,
+            o_sow_init, o_sow_dx, o_sow_dy,
+            o_tow_init, o_tow_dx, o_tow_dy,
+            o_zow_init, o_zow_dx, o_zow_dy,
+            o_tex_en, o_dtest_en, o_dcmp, o_bl_en, o_bl_src, o_bl_dst, o_bl_op, o_fog_en, o_fog_col,
+            o_tex_mip_tbl, o_tex_w, o_tex_h, o_tex_fmt, o_tex_flt, o_tex_clmp_s, o_tex_clmp_t, o_tex_mip,
+            o_tri_stb, o_fill_stb, o_flush_stb, i_raster_busy, i_tri_ready, o_resolve_stb, i_resolve_busy,
+            o_mem_adr, i_mem_dat, o_mem_stb, i_mem_ack, o_mem_cti=None, o_mem_bte=None,
+            o_packets=None, o_wait_cycles=None, o_starve_cycles=None, o_tex_cb_adr=None,
+            IDXBITS=6, LINEBITS=4):
+    """
+    Command processor
+
+    Executes a tile's command queue from shared memory (read through a MemCache) and drives a TriRaster with it, so that the host only has to
+    submit a queue pointer. A queue is a sequence of packets, each starting with a header word (opcode in the top 8 bits, argument in the rest):
+
+    - CMD_TRI: triangle record (TRI_WORDS words of triangle parameters, in TRI_RECORD order) - draws a triangle
+    - CMD_STATE: one word - sets the render state register given by the argument (see STATE_REGS)
+    - CMD_FILL: FILL_WORDS words (fill color & depth) - clears the tile
+    - CMD_END: end of tile - flushes the tile, then starts resolving it (a core whose resolve fills in fast cleared blocks itself may leave the flush
+      request unconnected, see TileCore)
+
+    (see pack_tri, pack_state, pack_fill & pack_end)
+
+    Packets are loaded into a set of shadow registers, which are copied to the outputs when the packet is issued, so the next packet is fetched while the
+    previous triangle rasterizes. Triangles are issued as soon as the TriRaster can queue them (the TriRaster queues each triangle's render state with it),
+    unless the texture state has changed since the last one - the texture sampler reads that directly, so such triangles wait for the TriRaster to go idle.
+    Fills & the end of tile always wait for the TriRaster to go idle. State packets only update the shadow registers, & take effect with the next
+    triangle. Triangles & the end of tile wait for the previous tile's resolve to finish, fills don't
+
+    - i_rstn: Reset signal
+    - i_clk: Clock signal
+
+    - i_valid: Input command queue valid signal (the queue is taken on a clock where both i_valid & o_ready are high)
+    - i_ptr: Input address of command queue in shared memory
+    - o_ready: 1 while idle (ready to take a command queue), 0 otherwise
+
+    - o_v0 ... o_fog_col: Output triangle parameters & render state to TriRaster (see TriRaster)
+    - o_tex_mip_tbl ... o_tex_mip: Output texture state to texture sampler/cache (see TileCore)
+
+    - o_tri_stb: Output draw triangle request signal to TriRaster
+    - o_fill_stb: Output fill request signal to TriRaster
+    - o_flush_stb: Output flush request signal to TriRaster
+    - i_raster_busy: Input TriRaster busy signal
+    - i_tri_ready: Input TriRaster ready to take a triangle signal
+    - o_resolve_stb: Output resolve tile request signal
+    - i_resolve_busy: Input resolve busy signal
+
+    - o_mem_adr: Output read address to shared memory
+    - i_mem_dat: Input read data from shared memory
+    - o_mem_stb: Output request transaction signal to shared memory
+    - i_mem_ack: Input transaction acknowledge signal from shared memory
+    - o_mem_cti: Optional output cycle type identifier to shared memory
+    - o_mem_bte: Optional output burst type extension to shared memory
+
+    - o_packets: Optional output count of packets executed
+    - o_wait_cycles: Optional output count of cycles a loaded packet waited for the TriRaster (or resolve) to be ready for it
+    - o_starve_cycles: Optional output count of cycles the TriRaster sat idle while a packet was being fetched
+    - o_tex_cb_adr: Optional output codebook address of VQ textures to texture cache (see SetAssocTexCache)
+
+    - IDXBITS: log2 of command cache size in words
+    - LINEBITS: log2 of command cache line size in words
+    """
+
+    if o_mem_cti is None:
+        o_mem_cti = Signal(intbv(0)[3:])
+    if o_mem_bte is None:
+        o_mem_bte = Signal(intbv(0)[2:])
+    if o_packets is None:
+        o_packets = Signal(intbv(0)[32:])
+    if o_wait_cycles is None:
+        o_wait_cycles = Signal(intbv(0)[32:])
+    if o_starve_cycles is None:
+        o_starve_cycles = Signal(intbv(0)[32:])
+    if o_tex_cb_adr is None:
+        o_tex_cb_adr = Signal(intbv(0)[32:])
+
+    O_V0 = _TRI_OFFS["v0"]
+    O_V1 = _TRI_OFFS["v1"]
+    O_V2 = _TRI_OFFS["v2"]
+    O_COL_INIT = _TRI_OFFS["col_init"]
+    O_COL_DX = _TRI_OFFS["col_dx"]
+    O_COL_DY = _TRI_OFFS["col_dy"]
+    O_1OW = _TRI_OFFS["1ow_init"]
+    O_SOW = _TRI_OFFS["sow_init"]
+    O_TOW = _TRI_OFFS["tow_init"]
+    O_ZOW = _TRI_OFFS["zow_init"]
+    S_MIP_TBL = STATE_REGS.index("tex_mip_tbl_0")
+    S_CB_ADR = STATE_REGS.index("tex_cb_adr")
+    # registers from here on are texture state
+    S_TEX = STATE_REGS.index("tex_w")
+
+    cache_i_adr = Signal(intbv(0)[32:0])
+    cache_o_dat = Signal(intbv(0)[32:0])
+    cache_i_stb = Signal(bool(0))
+    cache_o_ack = Signal(bool(0))
+    cache = MemCache(i_rstn, i_clk, cache_i_adr, cache_o_dat, cache_i_stb, cache_o_ack,
+                     o_mem_adr, i_mem_dat, o_mem_stb, i_mem_ack, o_mem_cti, o_mem_bte,
+                     WIDTH=32, ADRBITS=32, IDXBITS=IDXBITS, LINEBITS=LINEBITS, ID="cmdcache")
+
+    _state = Signal(t_State.IDLE)
+    _adr = Signal(intbv(0)[32:0])
+    # opcode of the packet being loaded/issued, shadow register being loaded & words left to load
+    _op = Signal(intbv(0)[8:0])
+    _idx = Signal(intbv(0)[8:0])
+    _cnt = Signal(intbv(0)[8:0])
+    _tri_sh = [Signal(intbv(0)[32:0]) for _ in range(TRI_WORDS)]
+    _state_sh = [Signal(intbv(0)[32:0]) for _ in range(STATE_NUM)]
+    # set when the texture state has been written since the last triangle was issued
+    _tex_dirty = Signal(bool(0))
+
+    @always(i_clk.posedge, i_rstn)
+    def clk_logic():
+        if i_rstn == 0:
+            _state.next = t_State.IDLE
+            _tex_dirty.next = False
+            o_tri_stb.next = False
+            o_fill_stb.next = False
+            o_flush_stb.next = False
+            o_resolve_stb.next = False
+            o_packets.next = 0
+            o_wait_cycles.next = 0
+            o_starve_cycles.next = 0
+        else:
+            o_tri_stb.next = False
+            o_fill_stb.next = False
+            o_flush_stb.next = False
+            o_resolve_stb.next = False
+            # a request which was just made isn't reflected on the busy signals yet
+            raster_idle = not (i_raster_busy or o_tri_stb or o_fill_stb or o_flush_stb)
+            resolve_idle = not (i_resolve_busy or o_resolve_stb)
+            tri_ready = i_tri_ready and not o_tri_stb and (raster_idle or not _tex_dirty)
+
+            if (_state == t_State.HEADER or _state == t_State.LOAD) and raster_idle:
+                o_starve_cycles.next = o_starve_cycles + 1
+
+            if _state == t_State.IDLE:
+                if i_valid:
+                    _adr.next = i_ptr
+                    _state.next = t_State.HEADER
+            elif _state == t_State.HEADER:
+                if cache_o_ack:
+                    _adr.next = _adr + 1
+                    _op.next = cache_o_dat[32:24]
+                    if cache_o_dat[32:24] == CMD_TRI:
+                        _idx.next = 0
+                        _cnt.next = TRI_WORDS
+                        _state.next = t_State.LOAD
+                    elif cache_o_dat[32:24] == CMD_FILL:
+                        _idx.next = 0
+                        _cnt.next = FILL_WORDS
+                        _state.next = t_State.LOAD
+                    elif cache_o_dat[32:24] == CMD_STATE:
+                        _idx.next = cache_o_dat[8:0]
+                        _cnt.next = 1
+                        _state.next = t_State.LOAD
+                    else:
+                        # end of tile (unknown packets end the queue too)
+                        _op.next = CMD_END
+                        _state.next = t_State.ISSUE
+            elif _state == t_State.LOAD:
+                if cache_o_ack:
+                    if _op == CMD_STATE:
+                        if _idx < STATE_NUM:
+                            _state_sh[_idx].next = cache_o_dat
+                            if _idx >= S_TEX:
+                                _tex_dirty.next = True
+                    elif _op == CMD_FILL:
+                        _tri_sh[_FILL_IDX[_idx]].next = cache_o_dat
+                    else:
+                        _tri_sh[_idx].next = cache_o_dat
+                    _adr.next = _adr + 1
+                    _idx.next = _idx + 1
+                    _cnt.next = _cnt - 1
+                    if _cnt == 1:
+                        if _op == CMD_STATE:
+                            o_packets.next = o_packets + 1
+                            _state.next = t_State.HEADER
+                        else:
+                            _state.next = t_State.ISSUE
+            elif _state == t_State.ISSUE:
+                if (tri_ready if _op == CMD_TRI else raster_idle) and (resolve_idle or _op == CMD_FILL):
+                    o_packets.next = o_packets + 1
+                    for i in range(2):
+                        o_v0[i].next = _tri_sh[O_V0 + i].signed()
+                        o_v1[i].next = _tri_sh[O_V1 + i].signed()
+                        o_v2[i].next = _tri_sh[O_V2 + i].signed()
+                    for i in range(4):
+                        o_col_init[i].next = _tri_sh[O_COL_INIT + i].signed()
+                        o_col_dx[i].next = _tri_sh[O_COL_DX + i].signed()
+                        o_col_dy[i].next = _tri_sh[O_COL_DY + i].signed()
+                    o_1ow_init.next = _tri_sh[O_1OW].signed()
+                    o_1ow_dx.next = _tri_sh[O_1OW + 1].signed()
+                    o_1ow_dy.next = _tri_sh[O_1OW + 2].signed()
+                    o_sow_init.next = _tri_sh[O_SOW].signed()
+                    o_sow_dx.next = _tri_sh[O_SOW + 1].signed()
+                    o_sow_dy.next = _tri_sh[O_SOW + 2].signed()
+                    o_tow_init.next = _tri_sh[O_TOW].signed()
+                    o_tow_dx.next = _tri_sh[O_TOW + 1].signed()
+                    o_tow_dy.next = _tri_sh[O_TOW + 2].signed()
+                    o_zow_init.next = _tri_sh[O_ZOW].signed()
+                    o_zow_dx.next = _tri_sh[O_ZOW + 1].signed()
+                    o_zow_dy.next = _tri_sh[O_ZOW + 2].signed()
+
+                    o_tex_en.next = _state_sh[0][0]
+                    o_dtest_en.next = _state_sh[1][0]
+                    o_dcmp.next = _state_sh[2][3:0]
+                    o_bl_en.next = _state_sh[3][0]
+                    o_bl_src.next = _state_sh[4][4:0]
+                    o_bl_dst.next = _state_sh[5][4:0]
+                    o_bl_op.next = _state_sh[6][0]
+                    o_fog_en.next = _state_sh[7][0]
+                    o_fog_col.next = _state_sh[8]
+                    o_tex_w.next = _state_sh[9][4:0]
+                    o_tex_h.next = _state_sh[10][4:0]
+                    o_tex_fmt.next = _state_sh[11][3:0]
+                    o_tex_flt.next = _state_sh[12][0]
+                    o_tex_clmp_s.next = _state_sh[13][0]
+                    o_tex_clmp_t.next = _state_sh[14][0]
+                    o_tex_mip.next = _state_sh[15][0]
+                    for i in range(16):
+                        o_tex_mip_tbl[i].next = _state_sh[S_MIP_TBL + i]
+                    o_tex_cb_adr.next = _state_sh[S_CB_ADR]
+
+                    if _op == CMD_TRI:
+                        o_tri_stb.next = True
+                        _tex_dirty.next = False
+                        _state.next = t_State.HEADER
+                    elif _op == CMD_FILL:
+                        o_fill_stb.next = True
+                        _state.next = t_State.HEADER
+                    else:
+                        o_flush_stb.next = True
+                        _state.next = t_State.DRAIN
+                else:
+                    o_wait_cycles.next = o_wait_cycles + 1
+            elif _state == t_State.DRAIN:
+                if raster_idle:
+                    o_resolve_stb.next = True
+                    _state.next = t_State.IDLE
+
+    @always_comb
+    def comb_logic():
+        cache_i_adr.next = _adr
+        cache_i_stb.next = _state == t_State.HEADER or _state == t_State.LOAD
+        o_ready.next = _state == t_State.IDLE
+
+    return cache, clk_logic, comb_logic
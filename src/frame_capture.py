@@ -0,0 +1,98 @@
+from collections import deque
+
+import numpy as np
+from myhdl import block, always
+from PIL import Image
+
+# x/y offset of each pixel in a 2x2 cluster
+_lane_x = np.array([0, 1, 0, 1])
+_lane_y = np.array([0, 0, 1, 1])
+
+class FrameBuffer:
+    """
+    Host-side storage for pixels captured by FrameCapture
+
+    - DIM: width/height of render area
+    - HISTORY: number of finished frames to keep (0 = don't keep any)
+
+    - color: current color buffer [DIM, DIM] (uint32, packed as ABGR like o_wr_data_rgb)
+    - depth: current depth buffer [DIM, DIM] (uint32)
+    - history: finished frames, as (color, depth) pairs
+    """
+
+    def __init__(self, DIM=32, HISTORY=0):
+        self.DIM = DIM
+        self.color = np.zeros((DIM, DIM), dtype=np.uint32)
+        self.depth = np.zeros((DIM, DIM), dtype=np.uint32)
+        self.history = deque(maxlen=HISTORY)
+
+    def clear(self):
+        # NOTE: buffers are always modified in place, as FrameCapture holds views of them
+        self.color[...] = 0
+        self.depth[...] = 0
+
+    def end_frame(self):
+        """
+        Push a copy of the current buffers onto the frame history
+        """
+        if self.history.maxlen:
+            self.history.append((self.color.copy(), self.depth.copy()))
+
+    def color_rgba(self, color=None):
+        """
+        Returns color buffer as a [DIM, DIM, 4] RGBA uint8 array
+        """
+        color = self.color if color is None else color
+        return color.astype('<u4').view(np.uint8).reshape(color.shape + (4,))
+
+    def depth_l8(self, depth=None):
+        """
+        Returns top 8 bits of the 24-bit depth buffer as a [DIM, DIM] uint8 array
+        """
+        depth = self.depth if depth is None else depth
+        return np.minimum(depth >> 16, 255).astype(np.uint8)
+
+    def save_png(self, color_path, depth_path=None):
+        Image.fromarray(self.color_rgba(), 'RGBA').save(color_path)
+        if depth_path is not None:
+            Image.fromarray(self.depth_l8(), 'L').save(depth_path)
+
+    def save_npy(self, color_path, depth_path=None):
+        np.save(color_path, self.color)
+        if depth_path is not None:
+            np.save(depth_path, self.depth)
+
+@block
+def FrameCapture(i_clk, i_wr_en_rgb, i_wr_data_rgb, i_wr_en_d, i_wr_data_d, i_wr_pos, FB):
+    """
+    Testbench sink which captures TriRaster pixel cluster writes into a FrameBuffer
+
+    - i_clk: Clock signal
+    - i_wr_en_rgb: for each pixel in cluster, 1 if pixel color is written [4]
+    - i_wr_data_rgb: Pixel cluster colors [4]
+    - i_wr_en_d: for each pixel in cluster, 1 if pixel depth is written [4]
+    - i_wr_data_d: Pixel cluster depth values [4]
+    - i_wr_pos: Pixel cluster x/y (in units of 2x2 clusters)
+
+    - FB: FrameBuffer to write into
+    """
+
+    DIM = FB.DIM
+
+    # view buffers as [cluster y, y in cluster, cluster x, x in cluster], so each cluster write is a single scatter store
+    _color = FB.color.reshape(DIM >> 1, 2, DIM >> 1, 2)
+    _depth = FB.depth.reshape(DIM >> 1, 2, DIM >> 1, 2)
+
+    @always(i_clk.posedge)
+    def capture():
+        en_rgb = np.array([bool(en) for en in i_wr_en_rgb])
+        en_d = np.array([bool(en) for en in i_wr_en_d])
+        if en_rgb.any() or en_d.any():
+            qx = int(i_wr_pos[0])
+            qy = int(i_wr_pos[1])
+            if en_rgb.any():
+                _color[qy, _lane_y[en_rgb], qx, _lane_x[en_rgb]] = np.array([int(d) for d in i_wr_data_rgb], dtype=np.uint32)[en_rgb]
+            if en_d.any():
+                _depth[qy, _lane_y[en_d], qx, _lane_x[en_d]] = np.array([int(d) for d in i_wr_data_d], dtype=np.uint32)[en_d]
+
+    return capture
@@ -15,6 +15,24 @@ def RAM(o_data, i_data, i_addr, i_we, i_clk, WIDTH=8, DEPTH=128, ID="mem"):
 
     return write, read
 
+@block
+def DualPortRAM(o_data, i_rd_addr, i_data, i_wr_addr, i_we, i_clk, WIDTH=8, DEPTH=128, ID="mem"):
+    """
+    Version of RAM with separate read & write addresses, so that a pipelined client can read one location while writing back another
+    """
+    _mem = [Signal(intbv(0)[WIDTH:]) for _ in range(DEPTH)]
+
+    @always(i_clk.posedge)
+    def write():
+        if i_we:
+            _mem[i_wr_addr].next = i_data
+
+    @always_comb
+    def read():
+        o_data.next = _mem[i_rd_addr]
+
+    return write, read
+
 @block
 def ROM(o_data, i_addr, CONTENT):
     @always_comb
@@ -22,4 +40,80 @@ def ROM(o_data, i_addr, CONTENT):
         mask = (1 << (len(CONTENT) - 1).bit_length()) - 1
         o_data.next = CONTENT[int(i_addr) & mask]
 
+    return read
+
+# Wishbone cycle type identifiers (CTI) & burst type extensions (BTE)
+CTI_CLASSIC = 0b000
+CTI_CONST = 0b001
+CTI_INCR = 0b010
+CTI_END = 0b111
+
+BTE_LINEAR = 0b00
+BTE_WRAP4 = 0b01
+BTE_WRAP8 = 0b10
+BTE_WRAP16 = 0b11
+
+def burst_next_adr(adr, cti, bte):
+    """
+    Address of the beat following adr in a burst of the given type
+    """
+    if cti != CTI_INCR:
+        return adr
+    if bte == BTE_LINEAR:
+        return adr + 1
+    # wrapping bursts increment within an aligned 4/8/16 word window
+    mask = (2 << bte) - 1
+    return (adr & ~mask) | ((adr + 1) & mask)
+
+@block
+def BurstRAM(o_data, i_data, i_addr, i_we, i_stb, o_ack, i_cti, i_bte, i_clk, WIDTH=8, DEPTH=128, ID="mem", CONTENT=()):
+    """
+    RAM with a registered feedback bus interface
+
+    Classic cycles take two clocks (one to latch the address, one to ack). During an incrementing burst the next address is known in advance,
+    so after the first beat a new word is acked every clock
+
+    - o_data: Output read data
+    - i_data: Input write data
+    - i_addr: Input address
+    - i_we: Input write enable signal
+    - i_stb: Input request transaction signal
+    - o_ack: Output transaction acknowledge signal
+    - i_cti: Input cycle type identifier (CTI_*)
+    - i_bte: Input burst type extension (BTE_*)
+    - i_clk: Clock signal
+
+    - CONTENT: Optional initial contents of the start of the RAM
+    """
+    _mem = [Signal(intbv(CONTENT[i] if i < len(CONTENT) else 0)[WIDTH:]) for i in range(DEPTH)]
+
+    @always(i_clk.posedge)
+    def access():
+        # a beat is acked every clock while the beat being acked continues an incrementing burst, otherwise every other clock
+        if i_stb and (not o_ack or i_cti == CTI_INCR):
+            adr = burst_next_adr(int(i_addr), i_cti, i_bte) if o_ack else int(i_addr)
+            o_data.next = _mem[adr % DEPTH]
+            o_ack.next = True
+        else:
+            o_ack.next = False
+        if i_stb and i_we and o_ack:
+            _mem[int(i_addr) % DEPTH].next = i_data
+
+    return access
+
+@block
+def BurstROM(o_data, i_addr, i_stb, o_ack, i_cti, i_bte, i_clk, CONTENT):
+    """
+    ROM with a registered feedback bus interface (see BurstRAM)
+    """
+    @always(i_clk.posedge)
+    def read():
+        mask = (1 << (len(CONTENT) - 1).bit_length()) - 1
+        if i_stb and (not o_ack or i_cti == CTI_INCR):
+            adr = burst_next_adr(int(i_addr), i_cti, i_bte) if o_ack else int(i_addr)
+            o_data.next = CONTENT[adr & mask]
+            o_ack.next = True
+        else:
+            o_ack.next = False
+
     return read
\ No newline at end of file
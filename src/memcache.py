@@ -1,20 +1,32 @@
 from myhdl import *
 
+from simtrace import EV_MISS, EV_FILL_START, EV_FILL_WORD, EV_FILL_DONE
+from mem import CTI_INCR, CTI_END, BTE_LINEAR
+
 t_State = enum("IDLE", "FILL")
 
 @block
 def MemCache(i_rstn, i_clk, i_adr, o_dat, i_stb, o_ack,
-             o_mem_adr, i_mem_dat, o_mem_stb, i_mem_ack,
-             WIDTH=8, ADRBITS=32, IDXBITS=7):
+             o_mem_adr, i_mem_dat, o_mem_stb, i_mem_ack, o_mem_cti=None, o_mem_bte=None,
+             WIDTH=8, ADRBITS=32, IDXBITS=7, LINEBITS=None, WAYS=1, ID="memcache", TRACE=None):
     DEPTH = 1 << IDXBITS
-    TAGBITS = ADRBITS - IDXBITS
+    LINEBITS = IDXBITS if LINEBITS is None else LINEBITS
+    LINE = 1 << LINEBITS
+    NUM_LINES = DEPTH >> LINEBITS
+    SETS = NUM_LINES // WAYS
+    SETBITS = (SETS - 1).bit_length()
+    TAGBITS = ADRBITS - LINEBITS - SETBITS
 
     """
     A basic read-only memory cache
 
+    The cache is split into lines of 1 << LINEBITS words, each with its own tag. Lines are grouped into sets of WAYS lines each, with LRU replacement within a set.
+    Misses fill the requested word first and wrap around the line (critical word first), and requests for words which have already arrived are
+    acknowledged while the rest of the line is still being filled (early restart). Requests which hit other lines are acknowledged during a fill as well.
+
     - i_rst: Reset signal
     - i_clk: Clock signal
-    
+
     - i_adr: Input read address
     - o_dat: Output read data
     - i_stb: Request transaction signal
@@ -24,50 +36,174 @@ def MemCache(i_rstn, i_clk, i_adr, o_dat, i_stb, o_ack,
     - i_mem_dat: Input read data from backing memory
     - o_mem_stb: Output request transaction signal to backing memory
     - i_mem_ack: Input data valid signal from backing memory
-    
+    - o_mem_cti: Optional output cycle type to backing memory
+    - o_mem_bte: Optional output burst type to backing memory (lines of 4, 8 or 16 words are filled with a single wrapping burst, otherwise
+      a linear burst up to the end of the line and another from the start of the line)
+
     - WIDTH: width of data in bits
     - ADRBITS: width of address line in bits
     - IDXBITS: portion of address line dedicated to index bits (controls size of cache)
+    - LINEBITS: log2 of words per line (defaults to IDXBITS, a single line spanning the whole cache)
+    - WAYS: Number of lines per set (1, 2, or 4)
+    - ID: Name of this cache in traces
+    - TRACE: Optional trace sink (see simtrace.py) which records misses & fills
     """
 
+    assert 1 <= LINEBITS <= IDXBITS, "LINEBITS must be between 1 and IDXBITS"
+    assert WAYS in (1, 2, 4) and NUM_LINES % WAYS == 0, "WAYS must be 1, 2, or 4, and no larger than the number of lines"
+
+    # wrapping bursts cover 4, 8, or 16 words (BTE_WRAP4, BTE_WRAP8, BTE_WRAP16)
+    WRAP_BURST = 2 <= LINEBITS <= 4
+    LINE_BTE = LINEBITS - 1 if WRAP_BURST else BTE_LINEAR
+
+    if o_mem_cti is None:
+        o_mem_cti = Signal(intbv(0)[3:])
+    if o_mem_bte is None:
+        o_mem_bte = Signal(intbv(0)[2:])
+
     _cachemem = [Signal(intbv(0)[WIDTH:]) for _ in range(DEPTH)]
-    _tag = Signal(intbv(0)[TAGBITS:])
-    _valid = Signal(bool(0))
+    # per-line tags & valid bits, indexed by (set * WAYS) + way
+    _tag = [Signal(intbv(0)[TAGBITS:]) for _ in range(NUM_LINES)]
+    _valid = [Signal(bool(0)) for _ in range(NUM_LINES)]
+    # LRU age of each line within its set (0 = most recently used)
+    _age = [Signal(intbv(0, min=0, max=WAYS)) for _ in range(NUM_LINES)]
     _state = Signal(t_State.IDLE)
-    _filladr = Signal(intbv(0)[TAGBITS:])
-    _filloffs = Signal(intbv(0)[IDXBITS:])
+    _fillline = Signal(intbv(0, min=0, max=NUM_LINES))
+    _filltag = Signal(intbv(0)[TAGBITS:])
+    _fillset = Signal(intbv(0, min=0, max=SETS))
+    _filloffs = Signal(intbv(0)[LINEBITS:])
+    _fillcount = Signal(intbv(0)[LINEBITS:])
+    # words of the line being filled which have already arrived
+    _fillmask = Signal(intbv(0)[LINE:])
+
+    # lookup results for the current request
+    _req_offs = Signal(intbv(0)[LINEBITS:])
+    _req_set = Signal(intbv(0, min=0, max=SETS))
+    _req_tag = Signal(intbv(0)[TAGBITS:])
+    _hit = Signal(bool(0))
+    _hit_line = Signal(intbv(0, min=0, max=NUM_LINES))
+    _victim_line = Signal(intbv(0, min=0, max=NUM_LINES))
+
+    @always_comb
+    def lookup():
+        adr = int(i_adr)
+        offs = adr & (LINE - 1)
+        s = (adr >> LINEBITS) & (SETS - 1)
+        tag = (adr >> (LINEBITS + SETBITS)) & ((1 << TAGBITS) - 1)
+
+        hit = False
+        hit_line = s * WAYS
+        for w in range(WAYS):
+            line = (s * WAYS) + w
+            if _valid[line] and _tag[line] == tag and not hit:
+                hit = True
+                hit_line = line
+        # the line being filled can serve any words which have already arrived
+        if not hit and _state == t_State.FILL and _fillset == s and _filltag == tag and _fillmask[offs]:
+            hit = True
+            hit_line = _fillline
+
+        # pick a victim: first invalid way, otherwise least recently used way
+        victim = s * WAYS
+        for w in range(WAYS - 1, -1, -1):
+            line = (s * WAYS) + w
+            if _age[line] == WAYS - 1:
+                victim = line
+        for w in range(WAYS - 1, -1, -1):
+            line = (s * WAYS) + w
+            if not _valid[line]:
+                victim = line
+
+        _req_offs.next = offs
+        _req_set.next = s
+        _req_tag.next = tag
+        _hit.next = hit
+        _hit_line.next = hit_line
+        _victim_line.next = victim
 
     @always(i_clk.posedge, i_rstn)
     def reset_and_fill():
         if i_rstn == 0:
-            _valid.next = False
+            for i in range(NUM_LINES):
+                _valid[i].next = False
             _state.next = t_State.IDLE
         elif _state == t_State.IDLE:
-            # if requested address is not in cache, switch to FILL state
-            if i_stb and (not _valid or _tag != i_adr[ADRBITS:IDXBITS]):
-                print("Cache miss (input address: %s, tag: %s, valid: %s)" % (i_adr, _tag, _valid))
+            # if requested address is not in cache, evict a line from its set and switch to FILL state, starting with the requested word
+            if i_stb and not _hit:
+                _valid[_victim_line].next = False
+                _fillline.next = _victim_line
+                _filltag.next = _req_tag
+                _fillset.next = _req_set
+                _filloffs.next = _req_offs
+                _fillcount.next = 0
+                _fillmask.next = 0
                 _state.next = t_State.FILL
-                _filloffs.next = 0
-                _filladr.next = i_adr[ADRBITS:IDXBITS]
         elif _state == t_State.FILL:
-            # if backing memory acks request, fill spot and increment
-            # when cache is full, set tag & valid and switch back to IDLE state
+            # if backing memory acks request, fill spot and advance (wrapping around the end of the line)
+            # when line is full, set tag & valid and switch back to IDLE state
             if i_mem_ack:
-                print("Fill cache (offs: %d, addr: %s, data: %s)" % (_filloffs, o_mem_adr, i_mem_dat))
-                _cachemem[_filloffs].next = i_mem_dat
-                if _filloffs == (1 << IDXBITS) - 1:
-                    _tag.next = _filladr
-                    _valid.next = True
+                _cachemem[(_fillline << LINEBITS) | _filloffs].next = i_mem_dat
+                _fillmask.next = _fillmask | (1 << int(_filloffs))
+                _filloffs.next = (_filloffs + 1) % LINE
+                if _fillcount == LINE - 1:
+                    _tag[_fillline].next = _filltag
+                    _valid[_fillline].next = True
                     _state.next = t_State.IDLE
-                    print("Cache filled")
                 else:
-                    _filloffs.next = _filloffs + 1
+                    _fillcount.next = _fillcount + 1
+
+    @always(i_clk.posedge, i_rstn)
+    def lru_logic():
+        if i_rstn == 0:
+            for i in range(NUM_LINES):
+                _age[i].next = i % WAYS
+        elif WAYS > 1:
+            # mark line as most recently used on each hit and each new fill
+            line = -1
+            if i_stb and _hit:
+                line = int(_hit_line)
+            elif i_stb and _state == t_State.IDLE:
+                line = int(_victim_line)
+            if line >= 0:
+                base = line - (line % WAYS)
+                for w in range(WAYS):
+                    if base + w == line:
+                        _age[base + w].next = 0
+                    elif _age[base + w] < _age[line]:
+                        _age[base + w].next = _age[base + w] + 1
 
     @always_comb
     def access():
-        o_ack.next = _tag == i_adr[ADRBITS:IDXBITS] and _valid and i_stb
-        o_dat.next = _cachemem[i_adr[IDXBITS:]]
-        o_mem_adr.next = concat(_filladr, _filloffs)
+        o_ack.next = _hit and i_stb
+        o_dat.next = _cachemem[(_hit_line << LINEBITS) | _req_offs]
+        o_mem_adr.next = (((_filltag << SETBITS) | _fillset) << LINEBITS) | _filloffs
         o_mem_stb.next = _state == t_State.FILL
+        # a wrapping burst ends on the word before the critical word, otherwise the first burst ends at the end of the line
+        if _fillcount == LINE - 1 or (not WRAP_BURST and _filloffs == LINE - 1):
+            o_mem_cti.next = CTI_END
+        else:
+            o_mem_cti.next = CTI_INCR
+        o_mem_bte.next = LINE_BTE
+
+    if TRACE is None:
+        return lookup, reset_and_fill, lru_logic, access
+
+    _trace_src = TRACE.register(ID)
+
+    @always(i_clk.posedge)
+    def trace_access():
+        if i_rstn == 1:
+            if _state == t_State.IDLE and i_stb and not _hit:
+                TRACE.emit(now(), EV_MISS, _trace_src, i_adr)
+            elif _state == t_State.FILL and i_mem_ack:
+                TRACE.emit(now(), EV_FILL_WORD, _trace_src, o_mem_adr, i_mem_dat)
+
+    @always(_state)
+    def trace_fill():
+        line_adr = ((int(_filltag) << SETBITS) | int(_fillset)) << LINEBITS
+        if _state == t_State.IDLE:
+            TRACE.emit(now(), EV_FILL_DONE, _trace_src, line_adr)
+        else:
+            TRACE.emit(now(), EV_FILL_START, _trace_src, line_adr)
 
-    return reset_and_fill, access
\ No newline at end of file
+    return lookup, reset_and_fill, lru_logic, access, trace_access, trace_fill
\ No newline at end of file
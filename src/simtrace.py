@@ -0,0 +1,171 @@
+import struct
+import sys
+
+import numpy as np
+
+"""
+Structured event tracing for cache simulation
+
+Blocks which support tracing take a TRACE parameter. When it is None (the default) no trace logic is instantiated at all, so disabled tracing
+costs nothing. When given a sink (TraceRing or TraceFile), the block registers itself as an event source during elaboration and adds a
+monitor process which records typed events.
+
+=== TRACE FILE FORMAT ===
+
+- magic: b"ATRC"
+- u16: number of event sources
+- for each source: u8 length + UTF-8 name
+- remainder: packed trace_dtype records (little endian)
+"""
+
+# event kinds
+EV_MISS = 0         # requested address not in cache (adr = requested address, dat = requested format if any)
+EV_FILL_START = 1   # fill begins (adr = first address to be fetched)
+EV_FILL_WORD = 2    # word received from backing memory (adr = memory address, dat = data)
+EV_FILL_DONE = 3    # fill complete, cached data is now valid (adr = cached address)
+
+ev_names = ("miss", "fill start", "fill word", "fill done")
+
+trace_dtype = np.dtype([("time", "<u8"), ("kind", "u1"), ("src", "<u2"), ("adr", "<u4"), ("dat", "<u4")])
+
+TRACE_MAGIC = b"ATRC"
+
+class TraceRing:
+    """
+    Trace sink which records events into a preallocated ring buffer, keeping only the most recent events
+
+    - capacity: max number of events retained
+    """
+
+    def __init__(self, capacity=1 << 16):
+        self.names = []
+        self._buf = np.zeros(capacity, dtype=trace_dtype)
+        self._count = 0
+
+    def register(self, name):
+        """
+        Register an event source, returns its source ID
+        """
+        self.names.append(name)
+        return len(self.names) - 1
+
+    def emit(self, time, kind, src, adr=0, dat=0):
+        self._buf[self._count % len(self._buf)] = (time, kind, src, int(adr), int(dat))
+        self._count += 1
+        if self._count % len(self._buf) == 0:
+            self._wrapped()
+
+    def _wrapped(self):
+        pass
+
+    @property
+    def dropped(self):
+        """
+        Number of events which were overwritten
+        """
+        return max(self._count - len(self._buf), 0)
+
+    def events(self):
+        """
+        Returns retained events in the order they were emitted
+        """
+        n = len(self._buf)
+        if self._count <= n:
+            return self._buf[:self._count].copy()
+        i = self._count % n
+        return np.concatenate((self._buf[i:], self._buf[:i]))
+
+class TraceFile(TraceRing):
+    """
+    Trace sink which streams events into a compact binary file, using a preallocated ring buffer as the write buffer
+
+    - path: output file path
+    - capacity: number of events buffered between writes
+    """
+
+    def __init__(self, path, capacity=1 << 16):
+        super().__init__(capacity)
+        self._file = open(path, 'wb')
+        self._flushed = 0
+        self._header_written = False
+
+    def _write_header(self):
+        self._file.write(TRACE_MAGIC)
+        self._file.write(struct.pack("<H", len(self.names)))
+        for name in self.names:
+            name = name.encode("utf-8")
+            self._file.write(struct.pack("<B", len(name)) + name)
+        self._header_written = True
+
+    def _wrapped(self):
+        self.flush()
+
+    def flush(self):
+        if not self._header_written:
+            self._write_header()
+        n = len(self._buf)
+        pending = self._count - self._flushed
+        start = self._flushed % n
+        self._file.write(self._buf[start:start + pending].tobytes())
+        self._flushed = self._count
+
+    @property
+    def dropped(self):
+        return 0
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+def read_trace(path):
+    """
+    Read a trace file written by TraceFile, returns (source names, events)
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != TRACE_MAGIC:
+        raise ValueError("%s is not a trace file" % path)
+    (num_names,) = struct.unpack_from("<H", data, 4)
+    offs = 6
+    names = []
+    for _ in range(num_names):
+        (name_len,) = struct.unpack_from("<B", data, offs)
+        names.append(data[offs + 1:offs + 1 + name_len].decode("utf-8"))
+        offs += 1 + name_len
+    return names, np.frombuffer(data, dtype=trace_dtype, offset=offs)
+
+def fill_latencies(events, src):
+    """
+    Returns the time between each fill start & fill done event of the given source
+    """
+    ev = events[events["src"] == src]
+    starts = ev["time"][ev["kind"] == EV_FILL_START].astype(np.int64)
+    dones = ev["time"][ev["kind"] == EV_FILL_DONE].astype(np.int64)
+    n = min(len(starts), len(dones))
+    return dones[:n] - starts[:n]
+
+def summarize(names, events):
+    """
+    Summarize a trace: per-source event counts and average fill latency
+    """
+    lines = ["%-16s %8s %8s %8s %12s" % ("source", "misses", "fills", "words", "avg latency")]
+    totals = np.zeros(len(ev_names), dtype=np.int64)
+    for (src, name) in enumerate(names):
+        ev = events[events["src"] == src]
+        if len(ev) == 0:
+            continue
+        counts = np.bincount(ev["kind"], minlength=len(ev_names))
+        totals += counts
+        lat = fill_latencies(events, src)
+        avg = "%.1f" % lat.mean() if len(lat) else "-"
+        lines.append("%-16s %8d %8d %8d %12s" % (name, counts[EV_MISS], counts[EV_FILL_DONE], counts[EV_FILL_WORD], avg))
+    lines.append("%-16s %8d %8d %8d" % ("total", totals[EV_MISS], totals[EV_FILL_DONE], totals[EV_FILL_WORD]))
+    if len(events):
+        lines.append("%d events, time %d - %d" % (len(events), events["time"].min(), events["time"].max()))
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: simtrace.py <trace file>")
+        sys.exit(1)
+    print(summarize(*read_trace(sys.argv[1])))
@@ -0,0 +1,54 @@
+from myhdl import *
+
+@block
+def SkidBuffer(i_rstn, i_clk, i_dat, i_valid, o_ready, o_dat, o_valid, i_ready):
+    """
+    Pipeline register with a valid/ready handshake on both sides, which passes one item per clock
+    o_ready only depends on the buffer's own state (not on i_ready), so the ready chain between stages is broken up as well as the data path:
+    an item accepted while the output is stalled is parked in a second "skid" register until the output drains
+
+    - i_rstn: Reset signal
+    - i_clk: Clock signal
+
+    - i_dat: Input data signals [N]
+    - i_valid: Input valid signal
+    - o_ready: Output ready to accept input signal
+    - o_dat: Output data signals [N - same widths as i_dat]
+    - o_valid: Output valid signal
+    - i_ready: Input ready to accept output signal
+    """
+
+    assert len(i_dat) == len(o_dat), "i_dat and o_dat must have the same number of signals"
+
+    N = len(i_dat)
+
+    _skid = [Signal(d.val) for d in i_dat]
+    _skid_valid = Signal(bool(0))
+
+    @always(i_clk.posedge, i_rstn)
+    def clk_logic():
+        if i_rstn == 0:
+            o_valid.next = False
+            _skid_valid.next = False
+        elif _skid_valid:
+            # move the parked item to the output once the current one has been taken
+            if i_ready:
+                for i in range(N):
+                    o_dat[i].next = _skid[i]
+                _skid_valid.next = False
+        elif o_valid and not i_ready:
+            # output is stalled, so park the incoming item (if any)
+            if i_valid:
+                for i in range(N):
+                    _skid[i].next = i_dat[i]
+                _skid_valid.next = True
+        else:
+            for i in range(N):
+                o_dat[i].next = i_dat[i]
+            o_valid.next = i_valid
+
+    @always_comb
+    def comb_logic():
+        o_ready.next = not _skid_valid
+
+    return clk_logic, comb_logic
\ No newline at end of file
@@ -0,0 +1,85 @@
+from myhdl import *
+
+from clk_driver import ClkDriver
+from mem import ROM
+from bus_arbiter import BusArbiter
+
+NUM_PORTS = 4
+NUM_TRANSACTIONS = 16
+
+test_mem_contents = tuple(range(256))
+
+@block
+def TestClient(i_rstn, i_clk, o_adr, i_dat, o_stb, i_ack, PORT, STATS):
+    # reads a run of consecutive words, keeping its request line high until every word has been acknowledged
+    @instance
+    def drive_client():
+        yield i_rstn.posedge
+        o_stb.next = True
+        for i in range(NUM_TRANSACTIONS):
+            o_adr.next = (PORT * 64) + i
+            yield i_clk.posedge
+            while not i_ack:
+                yield i_clk.posedge
+            if i_dat != (PORT * 64) + i:
+                STATS["errors"] += 1
+        o_stb.next = False
+        STATS["finish_time"][PORT] = int((now() - 200) / 20)
+
+    return drive_client
+
+@block
+def Top(MODE, BURST):
+    rst = ResetSignal(0, active=0, isasync=True)
+    clk = Signal(0)
+    clk_driver = ClkDriver(clk)
+
+    test_rom_o_data = Signal(intbv(0)[32:0])
+    test_rom_i_adr = Signal(intbv(0)[8:0])
+    test_rom = ROM(test_rom_o_data, test_rom_i_adr, CONTENT=test_mem_contents)
+
+    arbiter_i_adr = [Signal(intbv(0)[32:]) for _ in range(NUM_PORTS)]
+    arbiter_i_dat = [Signal(intbv(0)[32:]) for _ in range(NUM_PORTS)]
+    arbiter_o_dat = Signal(intbv(0)[32:])
+    arbiter_i_we  = [Signal(bool(0)) for _ in range(NUM_PORTS)]
+    arbiter_i_stb = [Signal(bool(0)) for _ in range(NUM_PORTS)]
+    arbiter_o_ack = [Signal(bool(0)) for _ in range(NUM_PORTS)]
+    arbiter_o_mem_adr = Signal(intbv(0)[32:])
+    arbiter_o_mem_dat = Signal(intbv(0)[32:])
+    arbiter_i_mem_dat = Signal(intbv(0)[32:])
+    arbiter_o_mem_we  = Signal(bool(0))
+    arbiter_o_mem_stb = Signal(bool(0))
+    arbiter_i_mem_ack = Signal(bool(0))
+    arbiter_o_wait_cycles = [Signal(intbv(0)[32:]) for _ in range(NUM_PORTS)]
+    arbiter = BusArbiter(rst, clk, arbiter_i_adr, arbiter_i_dat, arbiter_o_dat, arbiter_i_we, arbiter_i_stb, arbiter_o_ack,
+                         arbiter_o_mem_adr, arbiter_o_mem_dat, arbiter_i_mem_dat, arbiter_o_mem_we, arbiter_o_mem_stb, arbiter_i_mem_ack,
+                         arbiter_o_wait_cycles, NUM_PORTS=NUM_PORTS, MODE=MODE, BURST=BURST)
+
+    stats = {"finish_time": [0 for _ in range(NUM_PORTS)], "errors": 0}
+
+    @always_comb
+    def drive_comb():
+        test_rom_i_adr.next = arbiter_o_mem_adr
+        arbiter_i_mem_dat.next = test_rom_o_data
+        arbiter_i_mem_ack.next = arbiter_o_mem_stb
+
+    clients = [TestClient(rst, clk, arbiter_i_adr[i], arbiter_o_dat, arbiter_i_stb[i], arbiter_o_ack[i], PORT=i, STATS=stats) for i in range(NUM_PORTS)]
+
+    @instance
+    def drive_test():
+        rst.next = 0
+        yield delay(100)
+        rst.next = 1
+        yield delay(100)
+        while not all(stats["finish_time"]):
+            yield delay(20)
+        print("%s, burst %s: finished in %s cycles, %s errors" % (MODE, BURST, max(stats["finish_time"]), stats["errors"]))
+        for i in range(NUM_PORTS):
+            print("    port %s: done after %s cycles, waited %s cycles" % (i, stats["finish_time"][i], int(arbiter_o_wait_cycles[i])))
+        raise StopSimulation()
+
+    return clk_driver, test_rom, arbiter, drive_comb, clients, drive_test
+
+for (mode, burst) in (("priority", 1), ("round_robin", 1), ("round_robin", 4), ("round_robin", (8, 4, 2, 2))):
+    inst = Top(mode, burst)
+    inst.run_sim()
\ No newline at end of file
@@ -0,0 +1,245 @@
+import numpy as np
+from myhdl import block, delay, always, always_comb, Signal, ResetSignal, intbv, instance, now, StopSimulation
+
+from clk_driver import ClkDriver
+from tri_raster import TriRaster
+from tri_raster_ref import TriRasterRef, mismatches
+from cmd_proc import CmdProc, pack_fill, pack_state, pack_tri, pack_end
+from mem import DualPortRAM, BurstROM
+from frame_capture import FrameBuffer, FrameCapture
+
+# command processor test: a queue of small triangles with render state changes in between, executed straight from memory
+
+DIM = 32
+
+test_clear = {
+    "col_init": (0, 0, 0, 255 << 12),
+    "zow_init": 0xFFFFFF,
+}
+
+def make_tris():
+    # random triangles of all sizes, alternating between opaque depth tested triangles & blended ones
+    rng = np.random.default_rng(4321)
+    tris = []
+    while len(tris) < 24:
+        v = [tuple(int(c) for c in rng.integers(-4, DIM + 4, 2)) for _ in range(3)]
+        area = (v[1][0] - v[0][0]) * (v[2][1] - v[0][1]) - (v[1][1] - v[0][1]) * (v[2][0] - v[0][0])
+        if area == 0:
+            continue
+        if area < 0:
+            v[1], v[2] = v[2], v[1]
+        i = len(tris)
+        tri = {
+            "v0": v[0], "v1": v[1], "v2": v[2],
+            "col_init": ((i * 8) << 12, (255 - (i * 8)) << 12, 128 << 12, 160 << 12),
+            "col_dx": (1 << 12, 0, -1 << 12, 0),
+            "col_dy": (0, -1 << 12, 1 << 12, 0),
+            "zow_init": int(rng.integers(0x100000, 0xE00000)), "zow_dx": int(rng.integers(-0x4000, 0x4000)), "zow_dy": int(rng.integers(-0x4000, 0x4000)),
+        }
+        if i % 2:
+            tri.update({"dtest_en": 0, "dcmp": 1, "bl_en": 1, "bl_src": 3, "bl_dst": 7, "bl_op": 0})
+        else:
+            tri.update({"dtest_en": 1, "dcmp": 6, "bl_en": 0, "bl_src": 0, "bl_dst": 0, "bl_op": 0})
+        tris.append(tri)
+    return tris
+
+test_tris = make_tris()
+
+STATE_NAMES = ("dtest_en", "dcmp", "bl_en", "bl_src", "bl_dst", "bl_op")
+
+def make_queue(tris):
+    # only state which differs from the previous triangle is sent
+    queue = pack_fill(test_clear)
+    state = {}
+    for tri in tris:
+        changed = {name: tri[name] for name in STATE_NAMES if state.get(name) != tri[name]}
+        state.update(changed)
+        queue += pack_state(changed) + pack_tri(tri)
+    return queue + pack_end()
+
+test_queue = make_queue(test_tris)
+QUEUE_ADR = 0x40
+test_mem_contents = (0,) * QUEUE_ADR + tuple(test_queue)
+test_mem_contents = test_mem_contents + (0,) * ((1 << (len(test_mem_contents) - 1).bit_length()) - len(test_mem_contents))
+
+@block
+def Top(framebuffer, STATS):
+    rst = ResetSignal(0, active=0, isasync=True)
+    clk = Signal(0)
+    clk_driver = ClkDriver(clk)
+
+    colorbuffer_rd_addr = Signal(intbv(0)[32:0])
+    colorbuffer_wr_addr = Signal(intbv(0)[32:0])
+    colorbuffer_dout = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    colorbuffer_din = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    colorbuffer_we = [Signal(bool(0)) for _ in range(4)]
+    colorbuffers = [DualPortRAM(colorbuffer_dout[i], colorbuffer_rd_addr, colorbuffer_din[i], colorbuffer_wr_addr, colorbuffer_we[i], clk, WIDTH=32, DEPTH=256) for i in range(4)]
+
+    depthbuffer_rd_addr = Signal(intbv(0)[32:0])
+    depthbuffer_wr_addr = Signal(intbv(0)[32:0])
+    depthbuffer_dout = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    depthbuffer_din = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    depthbuffer_we = [Signal(bool(0)) for _ in range(4)]
+    depthbuffers = [DualPortRAM(depthbuffer_dout[i], depthbuffer_rd_addr, depthbuffer_din[i], depthbuffer_wr_addr, depthbuffer_we[i], clk, WIDTH=32, DEPTH=256) for i in range(4)]
+
+    tri_raster_tri_stb = Signal(bool(0))
+    tri_raster_fill_stb = Signal(bool(0))
+    tri_raster_flush_stb = Signal(bool(0))
+    tri_raster_busy = Signal(bool(0))
+    tri_raster_tri_ready = Signal(bool(0))
+    tri_raster_wr_en_rgb = [Signal(bool(0)) for _ in range(4)]
+    tri_raster_wr_data_rgb = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    tri_raster_wr_en_d = [Signal(bool(0)) for _ in range(4)]
+    tri_raster_wr_data_d = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    tri_raster_wr_pos = [Signal(intbv(0)[32:0]) for _ in range(2)]
+    tri_raster_rd_pos = [Signal(intbv(0)[32:0]) for _ in range(2)]
+    tri_raster_rd_data_rgb = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    tri_raster_rd_data_d = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    tri_raster_v0 = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    tri_raster_v1 = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    tri_raster_v2 = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    tri_raster_col_init = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    tri_raster_col_dx = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    tri_raster_col_dy = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    tri_raster_1ow_init = Signal(intbv(0)[32:0].signed())
+    tri_raster_1ow_dx = Signal(intbv(0)[32:0].signed())
+    tri_raster_1ow_dy = Signal(intbv(0)[32:0].signed())
+    tri_raster_sow_init = Signal(intbv(0)[32:0].signed())
+    tri_raster_sow_dx = Signal(intbv(0)[32:0].signed())
+    tri_raster_sow_dy = Signal(intbv(0)[32:0].signed())
+    tri_raster_tow_init = Signal(intbv(0)[32:0].signed())
+    tri_raster_tow_dx = Signal(intbv(0)[32:0].signed())
+    tri_raster_tow_dy = Signal(intbv(0)[32:0].signed())
+    tri_raster_zow_init = Signal(intbv(0)[32:0].signed())
+    tri_raster_zow_dx = Signal(intbv(0)[32:0].signed())
+    tri_raster_zow_dy = Signal(intbv(0)[32:0].signed())
+    tri_raster_tex_en = Signal(bool(0))
+    tri_raster_dtest_en = Signal(bool(0))
+    tri_raster_dcmp = Signal(intbv(0)[3:0])
+    tri_raster_bl_en = Signal(bool(0))
+    tri_raster_bl_src = Signal(intbv(0)[4:0])
+    tri_raster_bl_dst = Signal(intbv(0)[4:0])
+    tri_raster_bl_op = Signal(0)
+    tri_raster_fog_en = Signal(bool(0))
+    tri_raster_fog_col = Signal(intbv(0)[32:])
+    tri_raster_o_smp_stb = Signal(bool(0))
+    tri_raster_o_smp_st = [Signal(intbv(0)[32:0].signed()) for _ in range(8)]
+    tri_raster_o_smp_ddx = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    tri_raster_o_smp_ddy = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    tri_raster_i_smp_dat = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    tri_raster_i_smp_ack = Signal(bool(0))
+    tri_raster_i_fog_tbl = [Signal(intbv(0)[8:0]) for _ in range(64)]
+    tri_raster = TriRaster(rst, clk, tri_raster_v0, tri_raster_v1, tri_raster_v2,
+                           tri_raster_col_init, tri_raster_col_dx, tri_raster_col_dy,
+                           tri_raster_1ow_init, tri_raster_1ow_dx, tri_raster_1ow_dy,
+                           tri_raster_sow_init, tri_raster_sow_dx, tri_raster_sow_dy,
+                           tri_raster_tow_init, tri_raster_tow_dx, tri_raster_tow_dy,
+                           tri_raster_zow_init, tri_raster_zow_dx, tri_raster_zow_dy,
+                           tri_raster_tex_en, tri_raster_dtest_en, tri_raster_dcmp,
+                           tri_raster_bl_en, tri_raster_bl_src, tri_raster_bl_dst, tri_raster_bl_op,
+                           tri_raster_fog_en, tri_raster_fog_col,
+                           tri_raster_tri_stb, tri_raster_fill_stb, tri_raster_busy,
+                           tri_raster_wr_en_rgb, tri_raster_wr_data_rgb,
+                           tri_raster_wr_en_d, tri_raster_wr_data_d,
+                           tri_raster_wr_pos,
+                           tri_raster_rd_pos, tri_raster_rd_data_rgb, tri_raster_rd_data_d,
+                           tri_raster_o_smp_stb, tri_raster_o_smp_st, tri_raster_o_smp_ddx, tri_raster_o_smp_ddy, tri_raster_i_smp_dat, tri_raster_i_smp_ack,
+                           tri_raster_i_fog_tbl,
+                           tri_raster_flush_stb, o_tri_ready=tri_raster_tri_ready,
+                           DIM=DIM)
+    capture = FrameCapture(clk, tri_raster_wr_en_rgb, tri_raster_wr_data_rgb, tri_raster_wr_en_d, tri_raster_wr_data_d, tri_raster_wr_pos, framebuffer)
+
+    mem_o_data = Signal(intbv(0)[32:0])
+    mem_i_adr = Signal(intbv(0)[32:0])
+    mem_i_stb = Signal(bool(0))
+    mem_o_ack = Signal(bool(0))
+    mem_i_cti = Signal(intbv(0)[3:0])
+    mem_i_bte = Signal(intbv(0)[2:0])
+    mem = BurstROM(mem_o_data, mem_i_adr, mem_i_stb, mem_o_ack, mem_i_cti, mem_i_bte, clk, CONTENT=test_mem_contents)
+
+    cmd_proc_i_valid = Signal(bool(0))
+    cmd_proc_i_ptr = Signal(intbv(QUEUE_ADR)[32:0])
+    cmd_proc_o_ready = Signal(bool(0))
+    cmd_proc_o_tex_mip_tbl = [Signal(intbv(0)[32:0]) for _ in range(16)]
+    cmd_proc_o_tex_w = Signal(intbv(0)[4:0])
+    cmd_proc_o_tex_h = Signal(intbv(0)[4:0])
+    cmd_proc_o_tex_fmt = Signal(intbv(0)[2:0])
+    cmd_proc_o_tex_flt = Signal(bool(0))
+    cmd_proc_o_tex_clmp_s = Signal(bool(0))
+    cmd_proc_o_tex_clmp_t = Signal(bool(0))
+    cmd_proc_o_tex_mip = Signal(bool(0))
+    cmd_proc_o_resolve_stb = Signal(bool(0))
+    cmd_proc_i_resolve_busy = Signal(bool(0))
+    cmd_proc_o_packets = Signal(intbv(0)[32:0])
+    cmd_proc_o_wait_cycles = Signal(intbv(0)[32:0])
+    cmd_proc_o_starve_cycles = Signal(intbv(0)[32:0])
+    cmd_proc = CmdProc(rst, clk, cmd_proc_i_valid, cmd_proc_i_ptr, cmd_proc_o_ready,
+                       tri_raster_v0, tri_raster_v1, tri_raster_v2,
+                       tri_raster_col_init, tri_raster_col_dx, tri_raster_col_dy,
+                       tri_raster_1ow_init, tri_raster_1ow_dx, tri_raster_1ow_dy,
+                       tri_raster_sow_init, tri_raster_sow_dx, tri_raster_sow_dy,
+                       tri_raster_tow_init, tri_raster_tow_dx, tri_raster_tow_dy,
+                       tri_raster_zow_init, tri_raster_zow_dx, tri_raster_zow_dy,
+                       tri_raster_tex_en, tri_raster_dtest_en, tri_raster_dcmp,
+                       tri_raster_bl_en, tri_raster_bl_src, tri_raster_bl_dst, tri_raster_bl_op,
+                       tri_raster_fog_en, tri_raster_fog_col,
+                       cmd_proc_o_tex_mip_tbl, cmd_proc_o_tex_w, cmd_proc_o_tex_h, cmd_proc_o_tex_fmt, cmd_proc_o_tex_flt,
+                       cmd_proc_o_tex_clmp_s, cmd_proc_o_tex_clmp_t, cmd_proc_o_tex_mip,
+                       tri_raster_tri_stb, tri_raster_fill_stb, tri_raster_flush_stb, tri_raster_busy, tri_raster_tri_ready, cmd_proc_o_resolve_stb, cmd_proc_i_resolve_busy,
+                       mem_i_adr, mem_o_data, mem_i_stb, mem_o_ack, mem_i_cti, mem_i_bte,
+                       cmd_proc_o_packets, cmd_proc_o_wait_cycles, cmd_proc_o_starve_cycles)
+
+    @always_comb
+    def drive_comb():
+        colorbuffer_rd_addr.next = depthbuffer_rd_addr.next = tri_raster_rd_pos[0] + (tri_raster_rd_pos[1] << 4)
+        colorbuffer_wr_addr.next = depthbuffer_wr_addr.next = tri_raster_wr_pos[0] + (tri_raster_wr_pos[1] << 4)
+        for i in range(4):
+            colorbuffer_din[i].next = tri_raster_wr_data_rgb[i]
+            colorbuffer_we[i].next = tri_raster_wr_en_rgb[i]
+            depthbuffer_din[i].next = tri_raster_wr_data_d[i]
+            depthbuffer_we[i].next = tri_raster_wr_en_d[i]
+            tri_raster_rd_data_rgb[i].next = colorbuffer_dout[i]
+            tri_raster_rd_data_d[i].next = depthbuffer_dout[i]
+
+    @always(clk.posedge)
+    def count_busy():
+        if tri_raster_busy:
+            STATS["busy"] += 1
+
+    @instance
+    def drive_test():
+        rst.next = 0
+        yield delay(100)
+        rst.next = 1
+        yield delay(100)
+        # the host only submits the queue pointer
+        cmd_proc_i_valid.next = True
+        yield clk.posedge
+        cmd_proc_i_valid.next = False
+        begin_time = now()
+        yield clk.posedge
+        while not cmd_proc_o_ready:
+            yield clk.posedge
+        STATS["cycles"] = int((now() - begin_time) / 20)
+        STATS["packets"] = int(cmd_proc_o_packets)
+        STATS["wait"] = int(cmd_proc_o_wait_cycles)
+        STATS["starve"] = int(cmd_proc_o_starve_cycles)
+        yield delay(40)
+        raise StopSimulation()
+
+    return clk_driver, colorbuffers, depthbuffers, tri_raster, capture, mem, cmd_proc, drive_comb, count_busy, drive_test
+
+ref = TriRasterRef(DIM=DIM)
+ref.fill(test_clear)
+for tri in test_tris:
+    ref.draw(tri)
+
+rtl = FrameBuffer(DIM=DIM)
+stats = {"busy": 0}
+inst = Top(rtl, stats)
+inst.run_sim()
+print("%s triangles, %s words of commands" % (len(test_tris), len(test_queue)))
+print("Queue executed in %s cycles (%s packets), TriRaster busy for %s cycles" % (stats["cycles"], stats["packets"], stats["busy"]))
+print("Cycles waiting on TriRaster: %s, cycles TriRaster waited on command fetch: %s" % (stats["wait"], stats["starve"]))
+print("Color mismatches: %s" % len(mismatches(rtl.color, ref.color)))
+print("Depth mismatches: %s" % len(mismatches(rtl.depth, ref.depth)))
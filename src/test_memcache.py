@@ -2,8 +2,11 @@ import numpy as np
 from myhdl import *
 
 from clk_driver import ClkDriver
-from mem import RAM
+from mem import BurstRAM, BurstROM
 from memcache import MemCache
+from simtrace import TraceRing, summarize
+
+trace = TraceRing()
 
 @block
 def Top():
@@ -15,7 +18,11 @@ def Top():
     test_ram_i_data = Signal(intbv(0)[32:0])
     test_ram_i_adr = Signal(intbv(0)[8:0])
     test_ram_i_we = Signal(bool(0))
-    test_ram = RAM(test_ram_o_data, test_ram_i_data, test_ram_i_adr, test_ram_i_we, clk, WIDTH=32, DEPTH=256)
+    test_ram_i_stb = Signal(bool(0))
+    test_ram_o_ack = Signal(bool(0))
+    test_ram_i_cti = Signal(intbv(0)[3:0])
+    test_ram_i_bte = Signal(intbv(0)[2:0])
+    test_ram = BurstRAM(test_ram_o_data, test_ram_i_data, test_ram_i_adr, test_ram_i_we, test_ram_i_stb, test_ram_o_ack, test_ram_i_cti, test_ram_i_bte, clk, WIDTH=32, DEPTH=256)
 
     test_cache_i_adr = Signal(intbv(0)[8:0])
     test_cache_o_dat = Signal(intbv(0)[32:0])
@@ -25,15 +32,20 @@ def Top():
     test_cache_i_mem_dat = Signal(intbv(0)[32:0])
     test_cache_o_mem_stb = Signal(bool(0))
     test_cache_i_mem_ack = Signal(bool(0))
+    test_cache_o_mem_cti = Signal(intbv(0)[3:0])
+    test_cache_o_mem_bte = Signal(intbv(0)[2:0])
     test_cache = MemCache(rst, clk, test_cache_i_adr, test_cache_o_dat, test_cache_i_stb, test_cache_o_ack,
-                          test_cache_o_mem_adr, test_cache_i_mem_dat, test_cache_o_mem_stb, test_cache_i_mem_ack,
-                          WIDTH=32, ADRBITS=32, IDXBITS=4)
+                          test_cache_o_mem_adr, test_cache_i_mem_dat, test_cache_o_mem_stb, test_cache_i_mem_ack, test_cache_o_mem_cti, test_cache_o_mem_bte,
+                          WIDTH=32, ADRBITS=32, IDXBITS=4, TRACE=trace)
     
     @always_comb
     def drive_comb():
         test_ram_i_adr.next = test_cache_o_mem_adr
         test_cache_i_mem_dat.next = test_ram_o_data
-        test_cache_i_mem_ack.next = test_cache_o_mem_stb
+        test_ram_i_stb.next = test_cache_o_mem_stb
+        test_ram_i_cti.next = test_cache_o_mem_cti
+        test_ram_i_bte.next = test_cache_o_mem_bte
+        test_cache_i_mem_ack.next = test_ram_o_ack
 
     @instance
     def drive_test():
@@ -52,4 +64,78 @@ def Top():
     return clk_driver, drive_test, drive_comb, test_ram, test_cache
 
 inst = Top()
-inst.run_sim(20 * 1600)
\ No newline at end of file
+inst.run_sim(20 * 1600)
+inst.quit_sim()
+print(summarize(trace.names, trace.events()))
+
+# sequential reads, then two interleaved streams in different regions (like command queue & vertex reads), then the start again
+stream_mem_contents = tuple((i * 0x01010101) & 0xFFFFFFFF for i in range(256))
+stream_adrs = list(range(16)) + [adr for i in range(8) for adr in (0x40 + i, 0xC0 + i)] + list(range(16))
+
+@block
+def StreamTop(LINEBITS, WAYS, TRACE):
+    rst = ResetSignal(0, active=0, isasync=True)
+    clk = Signal(0)
+    clk_driver = ClkDriver(clk)
+
+    test_rom_o_data = Signal(intbv(0)[32:0])
+    test_rom_i_adr = Signal(intbv(0)[8:0])
+    test_rom_i_stb = Signal(bool(0))
+    test_rom_o_ack = Signal(bool(0))
+    test_rom_i_cti = Signal(intbv(0)[3:0])
+    test_rom_i_bte = Signal(intbv(0)[2:0])
+    test_rom = BurstROM(test_rom_o_data, test_rom_i_adr, test_rom_i_stb, test_rom_o_ack, test_rom_i_cti, test_rom_i_bte, clk, CONTENT=stream_mem_contents)
+
+    test_cache_i_adr = Signal(intbv(0)[8:0])
+    test_cache_o_dat = Signal(intbv(0)[32:0])
+    test_cache_i_stb = Signal(bool(0))
+    test_cache_o_ack = Signal(bool(0))
+    test_cache_o_mem_adr = Signal(intbv(0)[8:0])
+    test_cache_i_mem_dat = Signal(intbv(0)[32:0])
+    test_cache_o_mem_stb = Signal(bool(0))
+    test_cache_i_mem_ack = Signal(bool(0))
+    test_cache_o_mem_cti = Signal(intbv(0)[3:0])
+    test_cache_o_mem_bte = Signal(intbv(0)[2:0])
+    test_cache = MemCache(rst, clk, test_cache_i_adr, test_cache_o_dat, test_cache_i_stb, test_cache_o_ack,
+                          test_cache_o_mem_adr, test_cache_i_mem_dat, test_cache_o_mem_stb, test_cache_i_mem_ack, test_cache_o_mem_cti, test_cache_o_mem_bte,
+                          WIDTH=32, ADRBITS=32, IDXBITS=4, LINEBITS=LINEBITS, WAYS=WAYS, TRACE=TRACE)
+
+    @always_comb
+    def drive_comb():
+        test_rom_i_adr.next = test_cache_o_mem_adr
+        test_cache_i_mem_dat.next = test_rom_o_data
+        test_rom_i_stb.next = test_cache_o_mem_stb
+        test_rom_i_cti.next = test_cache_o_mem_cti
+        test_rom_i_bte.next = test_cache_o_mem_bte
+        test_cache_i_mem_ack.next = test_rom_o_ack
+
+    @instance
+    def drive_test():
+        rst.next = 0
+        yield delay(100)
+        rst.next = 1
+        yield delay(100)
+        begin_time = now()
+        mismatches = 0
+        for adr in stream_adrs:
+            test_cache_i_adr.next = adr
+            test_cache_i_stb.next = True
+            # check ack just before the clock edge, and hold the request until the edge it's acknowledged on
+            yield delay(5)
+            while not test_cache_o_ack:
+                yield delay(20)
+            if test_cache_o_dat != stream_mem_contents[adr]:
+                mismatches += 1
+            yield delay(15)
+        test_cache_i_stb.next = False
+        cycle_time = int((now() - begin_time) / 20)
+        print("%s words/line, %s way(s): %s reads in %s cycles, %s mismatches" % (1 << (4 if LINEBITS is None else LINEBITS), WAYS, len(stream_adrs), cycle_time, mismatches))
+        raise StopSimulation()
+
+    return clk_driver, drive_test, drive_comb, test_rom, test_cache
+
+for (linebits, ways) in ((None, 1), (2, 1), (2, 2), (2, 4), (1, 2)):
+    stream_trace = TraceRing()
+    inst = StreamTop(linebits, ways, stream_trace)
+    inst.run_sim()
+    print(summarize(stream_trace.names, stream_trace.events()))
\ No newline at end of file
@@ -0,0 +1,90 @@
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from util.tex_build import build_textures, build_mips, encode_chain, FMT_VQ
+from util.nxtc_dec import decode_texels
+
+# texture build test: builds mip chains for a set of textures in every format & links them into one memory image, checks every level decoded
+# from the image (at the address in its mip table) against the level encoded on its own, and times a full build, a fully cached rebuild, and a
+# rebuild after one texture changed
+
+rng = np.random.default_rng(23)
+
+def make_image(w, h):
+    # smooth gradient with some noise, so the NXTC encoder has something to fit
+    y, x = np.mgrid[0:h, 0:w]
+    base = np.stack([x * 255 // w, y * 255 // h, (x + y) * 127 // (w + h), np.full_like(x, 255)], axis=-1)
+    return np.clip(base + rng.integers(-24, 25, (h, w, 4)), 0, 255).astype(np.uint8)
+
+images = {
+    "crate": make_image(256, 256),
+    "floor": make_image(512, 512),
+    "sky": make_image(256, 64),
+    "decal": make_image(32, 128),
+    "small": make_image(4, 4),
+}
+
+cache_dir = tempfile.mkdtemp()
+try:
+    for fmt in range(6):
+        out = build_textures(images, fmt, adr=0x100, workers=1)
+        mem = np.concatenate([np.zeros(0x100, dtype=np.uint32), out.words])
+        bad = 0
+        levels = 0
+        chains = {name: build_mips(img) for (name, img) in images.items()}
+        if fmt == FMT_VQ:
+            # every VQ texture shares one codebook, trained across all of their levels
+            encoded = [np.frombuffer(e, dtype='<u4') for e in encode_chain([level for chain in chains.values() for level in chain], fmt)]
+            codebook = encoded.pop(0)
+        for (name, chain) in chains.items():
+            tex = out.textures[name]
+            if fmt == FMT_VQ:
+                (enc, encoded) = (encoded[:len(chain)], encoded[len(chain):])
+            else:
+                enc = [np.frombuffer(e, dtype='<u4') for e in encode_chain(chain, fmt)]
+            for (m, level) in enumerate(chain):
+                (h, w) = level.shape[:2]
+                got = decode_texels(mem, tex["tex_w"] - m, tex["tex_h"] - m, fmt, tex["tex_mip_tbl"][m], tex.get("tex_cb_adr", 0))
+                if fmt == FMT_VQ:
+                    expect = decode_texels(np.concatenate([codebook, enc[m]]), w.bit_length() - 1, h.bit_length() - 1, fmt, len(codebook))
+                else:
+                    expect = decode_texels(enc[m], w.bit_length() - 1, h.bit_length() - 1, fmt)
+                bad += int(not np.array_equal(got, expect))
+                levels += 1
+        print("Format %s: %s words, %s levels, %s bad levels" % (fmt, len(out.words), levels, bad))
+        if fmt == FMT_VQ:
+            print("    VQ codebooks: %s" % len(set(tex["tex_cb_adr"] for tex in out.textures.values())))
+
+    # mip chain & table of one texture
+    tex = out.textures["sky"]
+    print("sky: %s levels, mip table %s" % (len(build_mips(images["sky"])), [hex(a) for a in tex["tex_mip_tbl"]]))
+
+    # 8888 levels are stored exactly, so the smallest level decoded from the image is the box filtered source
+    out = build_textures(images, 1, workers=1)
+    tex = out.textures["crate"]
+    smallest = decode_texels(out.words, 2, 2, 1, tex["tex_mip_tbl"][15])
+    q = images["crate"].reshape(4, 64, 4, 64, 4).astype(np.float64).mean(axis=(1, 3))
+    got = np.stack([(smallest >> s) & 0xFF for s in (0, 8, 16, 24)], axis=-1)
+    print("crate 4x4 level vs average of source: max difference %.1f" % np.abs(got - q).max())
+
+    # build times: every texture encoded (serially & across processes), everything cached, one texture changed
+    fmt = 2
+    begin = time.perf_counter()
+    build_textures(images, fmt, workers=1)
+    print("Build (1 process): %.1f ms" % ((time.perf_counter() - begin) * 1000))
+    begin = time.perf_counter()
+    out = build_textures(images, fmt, cache_dir=cache_dir)
+    print("Build (process pool): %.1f ms, %s textures encoded" % ((time.perf_counter() - begin) * 1000, len(out.rebuilt)))
+    begin = time.perf_counter()
+    cached = build_textures(images, fmt, cache_dir=cache_dir)
+    print("Rebuild (cached): %.1f ms, %s textures encoded, image matches: %s" % (
+        (time.perf_counter() - begin) * 1000, len(cached.rebuilt), np.array_equal(cached.words, out.words)))
+    images["decal"] = make_image(32, 128)
+    begin = time.perf_counter()
+    cached = build_textures(images, fmt, cache_dir=cache_dir)
+    print("Rebuild (one changed): %.1f ms, textures encoded: %s" % ((time.perf_counter() - begin) * 1000, cached.rebuilt))
+finally:
+    shutil.rmtree(cache_dir)
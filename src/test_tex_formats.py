@@ -0,0 +1,198 @@
+import numpy as np
+from myhdl import *
+
+from clk_driver import ClkDriver
+from mem import BurstROM
+from texcache_sa import SetAssocTexCache
+from util.tex_build import build_textures, build_mips, FMT_VQ
+from util.nxtc_dec import decode_texels
+from util.vq_enc import ENTRIES
+
+# compressed texture format test: samples textures built with tex_build through a SetAssocTexCache over two frames, checks every sampled cluster
+# against util.nxtc_dec, and compares the cycles, fill cycles & bytes fetched per frame (codebook loads included), plus how closely each format
+# matches the source images, of:
+# - the same four 64x64 opaque textures in NXTC mode 0 & in VQ
+# - the same 64x64 cutout texture in NXTC mode 1 & mode 2 (punch-through), along with how many texels land on the wrong side of an alpha test
+
+rng = np.random.default_rng(24)
+
+NUM_TEXTURES = 4
+NUM_FRAMES = 2
+
+def make_image(i):
+    # smooth gradient (in a different direction & color per texture) with some noise, which neither format can keep
+    y, x = np.mgrid[0:64, 0:64]
+    (u, v) = (x, y) if i & 1 else (y, x)
+    base = np.stack([u * 4, v * 4, (u + v) * 2, np.full_like(x, 255)], axis=-1)
+    base = base[..., [(i + c) % 3 for c in range(3)] + [3]]
+    img = np.clip(base + rng.integers(-8, 9, (64, 64, 4)), 0, 255).astype(np.uint8)
+    img[..., 3] = 255
+    return img
+
+def make_cutout():
+    # "foliage": noisy green gradient, cut out by a few overlapping discs
+    y, x = np.mgrid[0:64, 0:64]
+    img = np.stack([x * 2, 96 + y * 2, x + y, np.zeros_like(x)], axis=-1)
+    img = np.clip(img + rng.integers(-8, 9, (64, 64, 4)), 0, 255).astype(np.uint8)
+    for (cx, cy, r) in ((20, 20, 14), (44, 24, 12), (30, 46, 16), (52, 52, 8)):
+        img[..., 3] |= ((((x - cx) ** 2) + ((y - cy) ** 2)) < r * r).astype(np.uint8) * 255
+    return img
+
+sources = [make_image(i) for i in range(NUM_TEXTURES)]
+cutout = make_cutout()
+images = {}
+fmts = {}
+for (i, img) in enumerate(sources):
+    images["nxtc %s" % i] = img
+    fmts["nxtc %s" % i] = 2
+    images["vq %s" % i] = img
+    fmts["vq %s" % i] = FMT_VQ
+for (name, fmt) in (("cutout mode 1", 3), ("cutout mode 2", 5)):
+    images[name] = cutout
+    fmts[name] = fmt
+image = build_textures(images, fmts, workers=1)
+# pad to a power of two, as BurstROM wraps addresses
+test_mem_contents = np.zeros(1 << (len(image.words) - 1).bit_length(), dtype=np.uint32)
+test_mem_contents[:len(image.words)] = image.words
+test_mem_contents = tuple(map(int, test_mem_contents))
+
+def frame(tex):
+    # one texture's share of a frame: sweep every other row of the full texture, then alternate between rows of mip 1 and mip 2, as a sampler
+    # blending two mip levels would
+    tbl = tex["tex_mip_tbl"]
+    smp = [(tbl[0], 6, 6, x, y) for y in range(0, 64, 2) for x in range(64)]
+    for y in range(0, 32, 2):
+        smp += [(tbl[1], 5, 5, x, y) for x in range(32)]
+        smp += [(tbl[2], 4, 4, x, y >> 1) for x in range(16)]
+    return smp
+
+@block
+def Top(LABEL, NAMES):
+    # draws every texture in NAMES, one after another, for each of NUM_FRAMES frames
+    rst = ResetSignal(0, active=0, isasync=True)
+    clk = Signal(0)
+    clk_driver = ClkDriver(clk)
+
+    test_rom_o_data = Signal(intbv(0)[32:0])
+    test_rom_i_adr = Signal(intbv(0)[32:0])
+    test_rom_i_stb = Signal(bool(0))
+    test_rom_o_ack = Signal(bool(0))
+    test_rom_i_cti = Signal(intbv(0)[3:0])
+    test_rom_i_bte = Signal(intbv(0)[2:0])
+    test_rom = BurstROM(test_rom_o_data, test_rom_i_adr, test_rom_i_stb, test_rom_o_ack, test_rom_i_cti, test_rom_i_bte, clk, CONTENT=test_mem_contents)
+
+    test_tx_i_tex_adr = Signal(intbv(0)[32:0])
+    test_tx_i_tex_w = Signal(intbv(0)[4:0])
+    test_tx_i_tex_h = Signal(intbv(0)[4:0])
+    test_tx_i_tex_fmt = Signal(intbv(0)[3:0])
+    test_tx_i_tex_cb_adr = Signal(intbv(0)[32:0])
+    test_tx_i_smp = [Signal(intbv(0)[32:0]) for _ in range(2)]
+    test_tx_o_dat = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    test_tx_i_stb = Signal(bool(0))
+    test_tx_o_ack = Signal(bool(0))
+    test_tx_o_mem_adr = Signal(intbv(0)[32:0])
+    test_tx_i_mem_dat = Signal(intbv(0)[32:0])
+    test_tx_o_mem_stb = Signal(bool(0))
+    test_tx_i_mem_ack = Signal(bool(0))
+    test_tx_o_mem_cti = Signal(intbv(0)[3:0])
+    test_tx_o_mem_bte = Signal(intbv(0)[2:0])
+    test_tx_o_hits = Signal(intbv(0)[32:0])
+    test_tx_o_misses = Signal(intbv(0)[32:0])
+    test_tx_o_cb_loads = Signal(intbv(0)[32:0])
+    test_tx = SetAssocTexCache(rst, clk, test_tx_i_tex_adr, test_tx_i_tex_w, test_tx_i_tex_h, test_tx_i_tex_fmt, test_tx_i_smp, test_tx_o_dat, test_tx_i_stb, test_tx_o_ack,
+                               test_tx_o_mem_adr, test_tx_i_mem_dat, test_tx_o_mem_stb, test_tx_i_mem_ack, test_tx_o_mem_cti, test_tx_o_mem_bte,
+                               test_tx_o_hits, test_tx_o_misses, test_tx_i_tex_cb_adr, test_tx_o_cb_loads)
+
+    # bus words fetched & cycles spent with a fill on the bus
+    _words = Signal(intbv(0)[32:0])
+    _fill_cycles = Signal(intbv(0)[32:0])
+
+    @always_comb
+    def drive_comb():
+        test_rom_i_adr.next = test_tx_o_mem_adr
+        test_tx_i_mem_dat.next = test_rom_o_data
+        test_rom_i_stb.next = test_tx_o_mem_stb
+        test_rom_i_cti.next = test_tx_o_mem_cti
+        test_rom_i_bte.next = test_tx_o_mem_bte
+        test_tx_i_mem_ack.next = test_rom_o_ack
+
+    @always(clk.posedge)
+    def count():
+        if test_tx_o_mem_stb:
+            _fill_cycles.next = _fill_cycles + 1
+            if test_tx_i_mem_ack:
+                _words.next = _words + 1
+
+    @instance
+    def drive_test():
+        rst.next = 0
+        yield delay(100)
+        rst.next = 1
+        yield delay(100)
+        decoded = {}
+        for f in range(NUM_FRAMES):
+            begin = (now(), int(test_tx_o_misses), int(_fill_cycles), int(_words), int(test_tx_o_cb_loads))
+            lookups = 0
+            mismatches = 0
+            for name in NAMES:
+                tex = image.textures[name]
+                fmt = tex["tex_fmt"]
+                cb_adr = tex.get("tex_cb_adr", 0)
+                test_tx_i_tex_fmt.next = fmt
+                test_tx_i_tex_cb_adr.next = cb_adr
+                for (adr, w, h, x, y) in frame(tex):
+                    test_tx_i_tex_adr.next = adr
+                    test_tx_i_tex_w.next = w
+                    test_tx_i_tex_h.next = h
+                    test_tx_i_smp[0].next = x
+                    test_tx_i_smp[1].next = y
+                    test_tx_i_stb.next = True
+                    # check ack just before the clock edge, and hold the request until the edge it's acknowledged on
+                    yield delay(5)
+                    while not test_tx_o_ack:
+                        yield delay(20)
+                    if adr not in decoded:
+                        decoded[adr] = decode_texels(test_mem_contents, w, h, fmt, adr, cb_adr)
+                    texels = decoded[adr]
+                    expected = (texels[y, x], texels[y, (x + 1) & ((1 << w) - 1)], texels[(y + 1) & ((1 << h) - 1), x], texels[(y + 1) & ((1 << h) - 1), (x + 1) & ((1 << w) - 1)])
+                    if tuple(int(d) for d in test_tx_o_dat) != tuple(int(d) for d in expected):
+                        mismatches += 1
+                    lookups += 1
+                    yield delay(15)
+            test_tx_i_stb.next = False
+            yield delay(20)
+            cycle_time = int((now() - begin[0]) / 20)
+            words = int(_words) - begin[3]
+            cb_words = (int(test_tx_o_cb_loads) - begin[4]) * ENTRIES * 4
+            print("%s frame %s: %s lookups, %s cycles, %s misses, %s mismatches" % (LABEL, f, lookups, cycle_time, int(test_tx_o_misses) - begin[1], mismatches))
+            print("    %s fill cycles, %s bytes fetched (codebook: %s bytes)" % (int(_fill_cycles) - begin[2], words * 4, cb_words * 4))
+        raise StopSimulation()
+
+    return clk_driver, drive_comb, count, drive_test, test_rom, test_tx
+
+for (label, names) in (("NXTC mode 0", ["nxtc %s" % i for i in range(NUM_TEXTURES)]), ("VQ", ["vq %s" % i for i in range(NUM_TEXTURES)]),
+                       ("NXTC mode 1", ["cutout mode 1"]), ("NXTC mode 2", ["cutout mode 2"])):
+    inst = Top(label, names)
+    inst.run_sim()
+
+# image quality of each level against the box filtered source
+for prefix in ("nxtc", "vq"):
+    for (i, img) in enumerate(sources):
+        tex = image.textures["%s %s" % (prefix, i)]
+        psnr = []
+        for (m, level) in enumerate(build_mips(img)):
+            texels = decode_texels(image.words, 6 - m, 6 - m, tex["tex_fmt"], tex["tex_mip_tbl"][m], tex.get("tex_cb_adr", 0))
+            rgb = np.stack([(texels >> s) & 0xFF for s in (0, 8, 16)], axis=-1).astype(np.float64)
+            mse = ((rgb - level[..., :3]) ** 2).mean()
+            psnr.append("%.1f" % (10 * np.log10(255.0 ** 2 / max(mse, 1e-9))))
+        print("%s %s: PSNR per level (dB): %s" % (prefix, i, ", ".join(psnr)))
+
+# top level of the cutout against the source: texels on the wrong side of an alpha test at 128, and color error of the texels which pass it
+opaque = cutout[..., 3] >= 128
+for name in ("cutout mode 1", "cutout mode 2"):
+    tex = image.textures[name]
+    texels = decode_texels(image.words, 6, 6, tex["tex_fmt"], tex["tex_mip_tbl"][0])
+    rgba = np.stack([(texels >> s) & 0xFF for s in (0, 8, 16, 24)], axis=-1).astype(np.float64)
+    mse = ((rgba[..., :3] - cutout[..., :3]) ** 2)[opaque].mean()
+    print("%s: %s words, %s alpha test errors, PSNR of opaque texels %.1f dB" % (
+        name, tex["tex_mip_tbl"][1] - tex["tex_mip_tbl"][0], np.count_nonzero((rgba[..., 3] >= 128) != opaque), 10 * np.log10(255.0 ** 2 / max(mse, 1e-9))))
@@ -4,6 +4,9 @@ from myhdl import *
 from clk_driver import ClkDriver
 from mem import ROM
 from texblock import TexBlock
+from simtrace import TraceRing, summarize
+
+trace = TraceRing()
 
 @block
 def Top():
@@ -28,7 +31,7 @@ def Top():
     test_tb_o_mem_stb = Signal(bool(0))
     test_tb_i_mem_ack = Signal(bool(0))
     test_tb = TexBlock(rst, clk, test_tb_i_blk_adr, test_tb_i_blk_fmt, test_tb_i_smp, test_tb_o_dat, test_tb_i_stb, test_tb_o_ack,
-                          test_tb_o_mem_adr, test_tb_i_mem_dat, test_tb_o_mem_stb, test_tb_i_mem_ack)
+                          test_tb_o_mem_adr, test_tb_i_mem_dat, test_tb_o_mem_stb, test_tb_i_mem_ack, TRACE=trace)
     
     @always_comb
     def drive_comb():
@@ -55,4 +58,5 @@ def Top():
     return clk_driver, drive_test, drive_comb, test_ram, test_tb
 
 inst = Top()
-inst.run_sim(20 * 1600)
\ No newline at end of file
+inst.run_sim(20 * 1600)
+print(summarize(trace.names, trace.events()))
\ No newline at end of file
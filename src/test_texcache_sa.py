@@ -0,0 +1,124 @@
+import numpy as np
+from myhdl import *
+
+from clk_driver import ClkDriver
+from mem import BurstROM
+from texcache import TexCache
+from texcache_sa import SetAssocTexCache
+from util.nxtc_dec import decode_texels
+
+# 256 words of random NXTC mode 0 data, which holds either a 32x32 texture at 0 with its 16x16 and 8x8 mips at 128 and 160, or a single 64x16 texture
+test_mem_contents = tuple(map(int, np.random.default_rng(1234).integers(0, 1 << 32, 256, dtype=np.uint64)))
+
+def scene_sweep():
+    # sweep every other row of a 32x32 texture
+    return [(0, 5, 5, x, y) for y in range(0, 32, 2) for x in range(32)]
+
+def scene_mip_switch():
+    # alternate between rows of mip 1 and mip 2, as a sampler blending two mip levels would
+    smp = []
+    for y in range(0, 16, 2):
+        smp += [(128, 4, 4, x, y) for x in range(16)]
+        smp += [(160, 3, 3, x, y >> 1) for x in range(8)]
+    return smp
+
+def scene_wrap():
+    # two passes over a 64x16 texture, which is wider than TexCache's 8x8 block window
+    return [(0, 6, 4, x, y) for _ in range(2) for y in range(0, 16, 2) for x in range(0, 64, 2)]
+
+scenes = (("32x32 sweep", scene_sweep()), ("mip switch", scene_mip_switch()), ("64x16 wrap", scene_wrap()))
+
+@block
+def Top(CACHE):
+    rst = ResetSignal(0, active=0, isasync=True)
+    clk = Signal(0)
+    clk_driver = ClkDriver(clk)
+
+    test_rom_o_data = Signal(intbv(0)[32:0])
+    test_rom_i_adr = Signal(intbv(0)[8:0])
+    test_rom_i_stb = Signal(bool(0))
+    test_rom_o_ack = Signal(bool(0))
+    test_rom_i_cti = Signal(intbv(0)[3:0])
+    test_rom_i_bte = Signal(intbv(0)[2:0])
+    test_rom = BurstROM(test_rom_o_data, test_rom_i_adr, test_rom_i_stb, test_rom_o_ack, test_rom_i_cti, test_rom_i_bte, clk, CONTENT=test_mem_contents)
+
+    test_tx_i_tex_adr = Signal(intbv(0)[8:0])
+    test_tx_i_tex_w = Signal(intbv(0)[4:0])
+    test_tx_i_tex_h = Signal(intbv(0)[4:0])
+    test_tx_i_tex_fmt = Signal(intbv(2)[2:0])
+    test_tx_i_smp = [Signal(intbv(0)[32:0]) for _ in range(2)]
+    test_tx_o_dat = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    test_tx_i_stb = Signal(bool(0))
+    test_tx_o_ack = Signal(bool(0))
+    test_tx_o_mem_adr = Signal(intbv(0)[8:0])
+    test_tx_i_mem_dat = Signal(intbv(0)[32:0])
+    test_tx_o_mem_stb = Signal(bool(0))
+    test_tx_i_mem_ack = Signal(bool(0))
+    test_tx_o_mem_cti = Signal(intbv(0)[3:0])
+    test_tx_o_mem_bte = Signal(intbv(0)[2:0])
+    test_tx_o_hits = Signal(intbv(0)[32:0])
+    test_tx_o_misses = Signal(intbv(0)[32:0])
+    if CACHE is SetAssocTexCache:
+        test_tx = SetAssocTexCache(rst, clk, test_tx_i_tex_adr, test_tx_i_tex_w, test_tx_i_tex_h, test_tx_i_tex_fmt, test_tx_i_smp, test_tx_o_dat, test_tx_i_stb, test_tx_o_ack,
+                                   test_tx_o_mem_adr, test_tx_i_mem_dat, test_tx_o_mem_stb, test_tx_i_mem_ack, test_tx_o_mem_cti, test_tx_o_mem_bte,
+                                   test_tx_o_hits, test_tx_o_misses)
+    else:
+        test_tx = TexCache(rst, clk, test_tx_i_tex_adr, test_tx_i_tex_w, test_tx_i_tex_h, test_tx_i_tex_fmt, test_tx_i_smp, test_tx_o_dat, test_tx_i_stb, test_tx_o_ack,
+                           test_tx_o_mem_adr, test_tx_i_mem_dat, test_tx_o_mem_stb, test_tx_i_mem_ack, test_tx_o_mem_cti, test_tx_o_mem_bte)
+
+    @always_comb
+    def drive_comb():
+        test_rom_i_adr.next = test_tx_o_mem_adr
+        test_tx_i_mem_dat.next = test_rom_o_data
+        test_rom_i_stb.next = test_tx_o_mem_stb
+        test_rom_i_cti.next = test_tx_o_mem_cti
+        test_rom_i_bte.next = test_tx_o_mem_bte
+        test_tx_i_mem_ack.next = test_rom_o_ack
+
+    @instance
+    def drive_test():
+        rst.next = 0
+        yield delay(100)
+        rst.next = 1
+        yield delay(100)
+        for (name, smp) in scenes:
+            # each scene starts with an empty cache
+            rst.next = 0
+            yield delay(20)
+            rst.next = 1
+            yield delay(20)
+            begin_time = now()
+            begin_hits = int(test_tx_o_hits)
+            begin_misses = int(test_tx_o_misses)
+            mismatches = 0
+            for (adr, w, h, x, y) in smp:
+                test_tx_i_tex_adr.next = adr
+                test_tx_i_tex_w.next = w
+                test_tx_i_tex_h.next = h
+                test_tx_i_smp[0].next = x
+                test_tx_i_smp[1].next = y
+                test_tx_i_stb.next = True
+                # check ack just before the clock edge, and hold the request until the edge it's acknowledged on
+                yield delay(5)
+                while not test_tx_o_ack:
+                    yield delay(20)
+                texels = decode_texels(test_mem_contents, w, h, 2, adr)
+                expected = (texels[y, x], texels[y, (x + 1) & ((1 << w) - 1)], texels[(y + 1) & ((1 << h) - 1), x], texels[(y + 1) & ((1 << h) - 1), (x + 1) & ((1 << w) - 1)])
+                if tuple(int(d) for d in test_tx_o_dat) != tuple(int(d) for d in expected):
+                    mismatches += 1
+                yield delay(15)
+            test_tx_i_stb.next = False
+            yield delay(20)
+            cycle_time = int((now() - begin_time) / 20)
+            print("%s: %s (%s lookups): %s cycles, %s mismatches" % (CACHE.__name__, name, len(smp), cycle_time, mismatches))
+            if CACHE is SetAssocTexCache:
+                hits = int(test_tx_o_hits) - begin_hits
+                misses = int(test_tx_o_misses) - begin_misses
+                print("    %s hits, %s misses (%.1f%% hit rate)" % (hits, misses, 100.0 * hits / max(hits + misses, 1)))
+        raise StopSimulation()
+
+    return clk_driver, drive_comb, drive_test, test_rom, test_tx
+
+for cache in (TexCache, SetAssocTexCache):
+    inst = Top(cache)
+    inst.run_sim()
\ No newline at end of file
@@ -0,0 +1,220 @@
+import numpy as np
+from myhdl import *
+
+from clk_driver import ClkDriver
+from mem import BurstROM
+from texcache_sa import SetAssocTexCache
+from texsample import TexSampler
+from texsample_pipe import TexSamplerPipe
+from texsample_quad import QuadTexSampler
+from util.tex_build import build_textures
+from util.nxtc_dec import decode_texels
+
+# texture sampler test: runs the same quads through TexSampler, TexSamplerPipe & QuadTexSampler (each backed by a SetAssocTexCache over a
+# BurstROM), checks TexSamplerPipe & QuadTexSampler are bit-identical to TexSampler, then checks QuadTexSampler's mip selection & level
+# addressing against a mip chain built by tex_build
+
+# random NXTC mode 0 data, holding a 32x32 texture at 0 with mips at 128, 160, and 168
+test_mem_contents = tuple(map(int, np.random.default_rng(4321).integers(0, 1 << 32, 256, dtype=np.uint64)))
+test_mip_tbl = (0, 128, 160, 168)
+
+def make_quads():
+    # walk an 8x8 grid of quads across the texture, with a random mix of filtering, clamping, mipmapping and scale per quad
+    # (the larger scales spread a quad's samples over more than a single 2x2 group of blocks)
+    rng = np.random.default_rng(99)
+    quads = []
+    for y in range(8):
+        for x in range(8):
+            scale = float(rng.choice((0.02, 0.05, 0.09, 0.3)))
+            s = int(((x * 2) * 0.09 - 0.2) * 4096)
+            t = int(((y * 2) * 0.07 + 0.1) * 4096)
+            ds = int(scale * 4096)
+            dt = int(scale * 0.8 * 4096)
+            st = (s, t, s + ds, t, s, t + dt, s + ds, t + dt)
+            quads.append((st, (ds, 0), (0, dt), bool(rng.integers(0, 4)), bool(rng.integers(0, 2)), bool(rng.integers(0, 2)), bool(rng.integers(0, 2))))
+    return quads
+
+test_quads = make_quads()
+
+# a 32x32 NXTC mode 0 mip chain built by tex_build, sampled unfiltered with mipmapping on: each quad's derivatives are a power of two texels of the
+# full texture, so each picks a known level, and every sample is checked against that level decoded by util.nxtc_dec
+chain_rng = np.random.default_rng(5)
+chain_image = build_textures({"chain": chain_rng.integers(0, 256, (32, 32, 4), dtype=np.uint8)}, 2, workers=1)
+chain_mip_tbl = tuple(chain_image.textures["chain"]["tex_mip_tbl"])
+chain_mem_contents = np.zeros(256, dtype=np.uint32)
+chain_mem_contents[:len(chain_image.words)] = chain_image.words
+chain_mem_contents = tuple(map(int, chain_mem_contents))
+
+def make_chain_quads():
+    quads = []
+    expected = []
+    levels = [decode_texels(chain_mem_contents, 5 - m, 5 - m, 2, chain_mip_tbl[m]) for m in range(4)]
+    for mip in range(4):
+        d = 128 << mip
+        for i in range(8):
+            s = int(chain_rng.integers(-4096, 8192))
+            t = int(chain_rng.integers(-4096, 8192))
+            st = (s, t, s + d, t, s, t + d, s + d, t + d)
+            quads.append((st, (d, 0), (0, d), False, False, False, True))
+            mask = (1 << (5 - mip)) - 1
+            for p in range(4):
+                x = (((st[p * 2] << (5 - mip)) - 2048) >> 12) & mask
+                y = (((st[(p * 2) + 1] << (5 - mip)) - 2048) >> 12) & mask
+                expected.append(int(levels[mip][y, x]))
+    return quads, expected
+
+chain_quads, chain_expected = make_chain_quads()
+
+@block
+def Top(SAMPLER, RESULTS, STATS, CONTENT, MIP_TBL, QUADS):
+    rst = ResetSignal(0, active=0, isasync=True)
+    clk = Signal(0)
+    clk_driver = ClkDriver(clk)
+
+    PORTS = 4 if SAMPLER is QuadTexSampler else 1
+
+    test_rom_o_data = Signal(intbv(0)[32:0])
+    test_rom_i_adr = Signal(intbv(0)[8:0])
+    test_rom_i_stb = Signal(bool(0))
+    test_rom_o_ack = Signal(bool(0))
+    test_rom_i_cti = Signal(intbv(0)[3:0])
+    test_rom_i_bte = Signal(intbv(0)[2:0])
+    test_rom = BurstROM(test_rom_o_data, test_rom_i_adr, test_rom_i_stb, test_rom_o_ack, test_rom_i_cti, test_rom_i_bte, clk, CONTENT=CONTENT)
+
+    test_tx_i_tex_adr = Signal(intbv(0)[8:0])
+    test_tx_i_tex_w = Signal(intbv(0)[4:0])
+    test_tx_i_tex_h = Signal(intbv(0)[4:0])
+    test_tx_i_tex_fmt = Signal(intbv(2)[2:0])
+    test_tx_i_smp = [Signal(intbv(0)[32:0]) for _ in range(PORTS * 2)]
+    test_tx_o_dat = [Signal(intbv(0)[32:0]) for _ in range(PORTS * 4)]
+    test_tx_i_stb = Signal(bool(0))
+    test_tx_o_ack = Signal(bool(0))
+    test_tx_o_mem_adr = Signal(intbv(0)[8:0])
+    test_tx_i_mem_dat = Signal(intbv(0)[32:0])
+    test_tx_o_mem_stb = Signal(bool(0))
+    test_tx_i_mem_ack = Signal(bool(0))
+    test_tx_o_mem_cti = Signal(intbv(0)[3:0])
+    test_tx_o_mem_bte = Signal(intbv(0)[2:0])
+    test_tx_o_hits = Signal(intbv(0)[32:0])
+    test_tx_o_misses = Signal(intbv(0)[32:0])
+    test_tx = SetAssocTexCache(rst, clk, test_tx_i_tex_adr, test_tx_i_tex_w, test_tx_i_tex_h, test_tx_i_tex_fmt, test_tx_i_smp, test_tx_o_dat, test_tx_i_stb, test_tx_o_ack,
+                               test_tx_o_mem_adr, test_tx_i_mem_dat, test_tx_o_mem_stb, test_tx_i_mem_ack, test_tx_o_mem_cti, test_tx_o_mem_bte,
+                               test_tx_o_hits, test_tx_o_misses, PORTS=PORTS)
+
+    smp_i_stb = Signal(bool(0))
+    smp_o_ready = Signal(bool(0))
+    smp_i_st = [Signal(intbv(0)[32:].signed()) for _ in range(PORTS * 2)]
+    smp_i_ddx = [Signal(intbv(0)[32:].signed()) for _ in range(2)]
+    smp_i_ddy = [Signal(intbv(0)[32:].signed()) for _ in range(2)]
+    smp_i_w = Signal(intbv(5)[4:0])
+    smp_i_h = Signal(intbv(5)[4:0])
+    smp_i_clmp_s = Signal(bool(0))
+    smp_i_clmp_t = Signal(bool(0))
+    smp_i_flt = Signal(bool(0))
+    smp_i_mip = Signal(bool(0))
+    smp_o_dat = [Signal(intbv(0)[32:0]) for _ in range(PORTS)]
+    smp_o_ack = Signal(bool(0))
+    smp_i_ready = Signal(bool(1))
+    smp_o_tc_stb = Signal(bool(0))
+    smp_o_tc_smp = [Signal(intbv(0)[32:0]) for _ in range(PORTS * 2)]
+    smp_o_tc_mip = Signal(intbv(0)[4:0])
+    smp_i_tc_dat = [Signal(intbv(0)[32:0]) for _ in range(PORTS * 4)]
+    smp_i_tc_ack = Signal(bool(0))
+    if SAMPLER is QuadTexSampler:
+        test_smp = QuadTexSampler(rst, clk, smp_i_stb, smp_i_st, smp_i_ddx, smp_i_ddy, smp_i_w, smp_i_h, smp_i_clmp_s, smp_i_clmp_t, smp_i_flt, smp_i_mip,
+                                  smp_o_dat, smp_o_ack,
+                                  smp_o_tc_stb, smp_o_tc_smp, smp_o_tc_mip, smp_i_tc_dat, smp_i_tc_ack)
+    elif SAMPLER is TexSamplerPipe:
+        test_smp = TexSamplerPipe(rst, clk, smp_i_stb, smp_o_ready, smp_i_st, smp_i_ddx, smp_i_ddy, smp_i_w, smp_i_h, smp_i_clmp_s, smp_i_clmp_t, smp_i_flt, smp_i_mip,
+                                  smp_o_dat[0], smp_o_ack, smp_i_ready,
+                                  smp_o_tc_stb, smp_o_tc_smp, smp_o_tc_mip, smp_i_tc_dat, smp_i_tc_ack)
+    else:
+        test_smp = TexSampler(rst, clk, smp_i_stb, smp_i_st, smp_i_ddx, smp_i_ddy, smp_i_w, smp_i_h, smp_i_clmp_s, smp_i_clmp_t, smp_i_flt, smp_i_mip,
+                              smp_o_dat[0], smp_o_ack,
+                              smp_o_tc_stb, smp_o_tc_smp, smp_o_tc_mip, smp_i_tc_dat, smp_i_tc_ack)
+
+    @always_comb
+    def drive_comb():
+        test_rom_i_adr.next = test_tx_o_mem_adr
+        test_tx_i_mem_dat.next = test_rom_o_data
+        test_rom_i_stb.next = test_tx_o_mem_stb
+        test_rom_i_cti.next = test_tx_o_mem_cti
+        test_rom_i_bte.next = test_tx_o_mem_bte
+        test_tx_i_mem_ack.next = test_rom_o_ack
+
+        for i in range(PORTS * 2):
+            test_tx_i_smp[i].next = smp_o_tc_smp[i]
+        test_tx_i_tex_adr.next = MIP_TBL[smp_o_tc_mip]
+        test_tx_i_tex_w.next = smp_i_w - smp_o_tc_mip
+        test_tx_i_tex_h.next = smp_i_h - smp_o_tc_mip
+        test_tx_i_stb.next = smp_o_tc_stb
+        smp_i_tc_ack.next = test_tx_o_ack
+        for i in range(PORTS * 4):
+            smp_i_tc_dat[i].next = test_tx_o_dat[i]
+
+    @instance
+    def collect_results():
+        # TexSampler & QuadTexSampler ack (and TexSamplerPipe outputs) a result on each clock edge where their valid signal is high
+        while True:
+            yield clk.posedge
+            if smp_o_ack:
+                for i in range(PORTS):
+                    RESULTS.append(int(smp_o_dat[i]))
+
+    @instance
+    def drive_test():
+        rst.next = 0
+        yield delay(100)
+        rst.next = 1
+        yield delay(100)
+        begin_time = now()
+        for (st, ddx, ddy, flt, clmp_s, clmp_t, mip) in QUADS:
+            smp_i_ddx[0].next = ddx[0]
+            smp_i_ddx[1].next = ddx[1]
+            smp_i_ddy[0].next = ddy[0]
+            smp_i_ddy[1].next = ddy[1]
+            smp_i_flt.next = flt
+            smp_i_clmp_s.next = clmp_s
+            smp_i_clmp_t.next = clmp_t
+            smp_i_mip.next = mip
+            # the quad sampler takes the whole quad at once, the others take one pixel at a time (with the quad's derivatives)
+            for p in range(4 // PORTS):
+                for i in range(PORTS * 2):
+                    smp_i_st[i].next = st[(p * 2) + i]
+                smp_i_stb.next = True
+                # check handshake just before the clock edge, and hold the request until the edge it's accepted on
+                yield delay(5)
+                if SAMPLER is TexSamplerPipe:
+                    while not smp_o_ready:
+                        yield delay(20)
+                else:
+                    while not smp_o_ack:
+                        yield delay(20)
+                yield delay(15)
+        smp_i_stb.next = False
+        while len(RESULTS) < len(QUADS) * 4:
+            yield delay(20)
+        STATS["cycles"] = int((now() - begin_time) / 20)
+        STATS["hits"] = int(test_tx_o_hits)
+        STATS["misses"] = int(test_tx_o_misses)
+        raise StopSimulation()
+
+    return clk_driver, test_rom, test_tx, test_smp, drive_comb, collect_results, drive_test
+
+results = {}
+for sampler in (TexSampler, TexSamplerPipe, QuadTexSampler):
+    results[sampler] = []
+    stats = {}
+    inst = Top(sampler, results[sampler], stats, test_mem_contents, test_mip_tbl, test_quads)
+    inst.run_sim()
+    print("%s: %s quads in %s cycles (%s block hits, %s misses)" % (sampler.__name__, len(test_quads), stats["cycles"], stats["hits"], stats["misses"]))
+
+for sampler in (TexSamplerPipe, QuadTexSampler):
+    mismatches = sum(1 for (a, b) in zip(results[TexSampler], results[sampler]) if a != b)
+    print("%s mismatches against TexSampler: %s" % (sampler.__name__, mismatches))
+
+chain_results = []
+inst = Top(QuadTexSampler, chain_results, {}, chain_mem_contents, chain_mip_tbl, chain_quads)
+inst.run_sim()
+mismatches = sum(1 for (a, b) in zip(chain_results, chain_expected) if a != b)
+print("tex_build mip chain: %s samples, %s mismatches" % (len(chain_results), mismatches))
@@ -0,0 +1,77 @@
+import time
+
+import numpy as np
+
+from tile_binner import bin_tris, build_queues
+from tri_setup import tri_setup, pack_tris, tri_params
+from tri_raster_ref import TriRasterRef
+from cmd_proc import CMD_TRI, CMD_END, TRI_WORDS, pack_fill, pack_state
+
+# tile binner test: binning throughput & tiles per triangle for frames of up to 200k triangles, whether every tile a triangle covers pixels of
+# (according to TriRasterRef) is binned, and that the queues laid out in the memory image hold the binned triangles
+
+DIM = 32
+
+def make_tris(rng, n, size, screen_w, screen_h):
+    # random triangles (of up to size pixels across), some of them hanging off the screen
+    center = rng.uniform((-size / 2, -size / 2), (screen_w + size / 2, screen_h + size / 2), (n, 1, 2))
+    pos = np.concatenate([center + rng.uniform(-size / 2, size / 2, (n, 3, 2)), rng.uniform(0, 1, (n, 3, 1))], axis=-1)
+    col = rng.integers(0, 256, (n, 3, 4))
+    uv = rng.uniform(0, 1, (n, 3, 2))
+    w = np.ones((n, 3))
+    return (pos, col, uv, w)
+
+rng = np.random.default_rng(99)
+
+# throughput: 640x480 frames (20x15 tiles) of small & large triangles
+SCREEN_W = 640
+SCREEN_H = 480
+for (n, size) in ((10000, 16), (100000, 16), (200000, 8), (100000, 64)):
+    (pos, col, uv, w) = make_tris(rng, n, size, SCREEN_W, SCREEN_H)
+    begin = time.perf_counter()
+    bins = bin_tris(pos, SCREEN_W, SCREEN_H, DIM=DIM)
+    bin_time = time.perf_counter() - begin
+    begin = time.perf_counter()
+    tris = tri_setup(pos[bins.tri], col[bins.tri], uv[bins.tri], w[bins.tri], tile=bins.tile_xy, DIM=DIM)
+    image = build_queues(pack_tris(tris), bins, 0x10000, prologue=pack_fill({"col_init": (0, 0, 0, 255 << 12), "zow_init": 0xFFFFFF}))
+    build_time = time.perf_counter() - begin
+    print("%s triangles (%spx): binned in %.1f ms (%.2f M triangles/s), %.2f tiles per triangle (%.2f by bounds alone), "
+          "setup & queues in %.1f ms, %s words" % (
+              n, size, bin_time * 1000, n / bin_time / 1e6, len(bins.tri) / n, bins.candidates / n, build_time * 1000, image.size))
+
+# every tile covered by a triangle has to be binned
+SCREEN_W = 192
+SCREEN_H = 128
+(pos, col, uv, w) = make_tris(rng, 300, 48, SCREEN_W, SCREEN_H)
+bins = bin_tris(pos, SCREEN_W, SCREEN_H, DIM=DIM)
+tiles_w = SCREEN_W // DIM
+tiles_h = SCREEN_H // DIM
+tiles = np.array([(tx, ty) for ty in range(tiles_h) for tx in range(tiles_w)])
+ref = TriRasterRef(DIM=DIM, BATCH=(len(tiles),))
+binned = np.zeros((len(pos), len(tiles)), dtype=bool)
+binned[bins.tri, bins.tile] = True
+covered = np.zeros_like(binned)
+for i in range(len(pos)):
+    tile_tris = tri_setup(np.repeat(pos[i:i + 1], len(tiles), axis=0), np.repeat(col[i:i + 1], len(tiles), axis=0),
+                          np.repeat(uv[i:i + 1], len(tiles), axis=0), np.repeat(w[i:i + 1], len(tiles), axis=0), tile=tiles, DIM=DIM)
+    tile_tris.update({"dtest_en": 0, "dcmp": 1})
+    covered[i] = ref.draw(tile_tris).any(axis=(-2, -1))
+print("%s triangles, %s tiles covered: %s covered tiles not binned, %s binned tiles with no pixels covered" % (
+    len(pos), np.count_nonzero(covered), np.count_nonzero(covered & ~binned), np.count_nonzero(binned & ~covered)))
+
+# walk the queues in the memory image, and check each holds the records of the triangles binned into its tile
+ADR = 0x400
+prologue = pack_state({"dtest_en": 0, "dcmp": 1})
+tris = tri_setup(pos[bins.tri], col[bins.tri], uv[bins.tri], w[bins.tri], tile=bins.tile_xy, DIM=DIM)
+records = pack_tris(tris)
+image = build_queues(records, bins, ADR, prologue=prologue)
+bad = 0
+for t in range(len(tiles)):
+    q = int(image[t]) - ADR
+    bad += int(not np.array_equal(image[q:q + len(prologue)], prologue))
+    q += len(prologue)
+    for r in np.nonzero(bins.tile == t)[0]:
+        bad += int(image[q] >> 24 != CMD_TRI or not np.array_equal(image[q:q + 1 + TRI_WORDS], records[r]))
+        q += 1 + TRI_WORDS
+    bad += int(image[q] >> 24 != CMD_END)
+print("Queue image: %s words, %s bad packets" % (image.size, bad))
@@ -0,0 +1,277 @@
+import numpy as np
+from myhdl import block, delay, always, Signal, ResetSignal, intbv, instance, now, StopSimulation
+
+from clk_driver import ClkDriver
+from mem import BurstRAM
+from bus_arbiter import BusArbiter
+from tile_core import TileCore
+from tile_dispatch import TileDispatch
+from cmd_proc import pack_fill, pack_state, pack_tri, pack_end
+from frame_capture import FrameBuffer, FrameCapture
+
+# frames rendered by tile cores sharing one memory bus, with a TileDispatch handing out the tiles and each finished tile resolved into a framebuffer
+# in shared memory:
+# - scaling benchmark: a 128x128 frame (4x4 tiles) with 1, 2, 4 and 8 tile cores
+# - resolve check: a 56x48 frame (2x2 tiles, the right & bottom ones only partly on screen) rendered by two tile cores, checked against the pixel
+#   cluster writes captured from each core on top of the clear color, and for writes outside of the framebuffer - the textured background only
+#   covers the top left half of the frame, so the resolve has to fill in fast cleared blocks
+DIM = 32
+
+# shared memory: random NXTC mode 0 data for a 32x32 texture at 0, followed by the command queue pointer table, the command queues, and the framebuffer
+TEX_ADR = 0
+TBL_ADR = 128
+QUEUE_ADR = 256
+FB_ADR = 0x4000
+
+test_tex_state = {
+    "tex_w": 5, "tex_h": 5, "tex_fmt": 2, "tex_flt": 1, "tex_mip_tbl": (TEX_ADR,) * 16,
+}
+
+test_clear = {
+    "col_init": (16 << 12, 16 << 12, 48 << 12, 255 << 12),
+    "zow_init": 0xFFFFFF,
+}
+CLEAR_COLOR = 16 | (16 << 8) | (48 << 16) | (255 << 24)
+
+def frame_tiles(fb_w, fb_h):
+    return ((fb_w + DIM - 1) // DIM, (fb_h + DIM - 1) // DIM)
+
+def make_tris(tiles_w, tiles_h, full_bg, num_tris):
+    # textured background covering the whole frame (or its top left half), with vertex colored triangles on top
+    # (iterators are given at the top left corner of each triangle's bounds, so they don't change when a triangle is moved into a tile's space)
+    W = tiles_w * DIM
+    H = tiles_h * DIM
+    tris = []
+    for (v0, v1, v2) in (((0, 0), (W, 0), (0, H)), ((W, 0), (W, H), (0, H)))[:2 if full_bg else 1]:
+        x0 = min(v0[0], v1[0], v2[0])
+        y0 = min(v0[1], v1[1], v2[1])
+        tris.append({
+            "v0": v0, "v1": v1, "v2": v2,
+            "col_init": (255 << 12, 255 << 12, 255 << 12, 255 << 12),
+            "1ow_init": 4096,
+            "sow_init": x0 * 128, "sow_dx": 128,
+            "tow_init": y0 * 128, "tow_dy": 128,
+            "zow_init": 0xF00000,
+            "tex_en": 1, "dtest_en": 1, "dcmp": 6,
+        })
+    rng = np.random.default_rng(17)
+    while len(tris) < num_tris:
+        v = [tuple(int(c) for c in rng.integers(-8, (W + 8, H + 8), 2)) for _ in range(3)]
+        area = (v[1][0] - v[0][0]) * (v[2][1] - v[0][1]) - (v[1][1] - v[0][1]) * (v[2][0] - v[0][0])
+        if area == 0 or abs(area) > W * H // 4:
+            continue
+        if area < 0:
+            v[1], v[2] = v[2], v[1]
+        tris.append({
+            "v0": v[0], "v1": v[1], "v2": v[2],
+            "col_init": tuple(int(c) << 12 for c in rng.integers(0, 256, 3)) + (255 << 12,),
+            "col_dx": (1 << 12, -1 << 12, 0, 0),
+            "col_dy": (0, 1 << 12, -1 << 12, 0),
+            "zow_init": int(rng.integers(0x100000, 0xE00000)), "zow_dx": int(rng.integers(-0x1000, 0x1000)), "zow_dy": int(rng.integers(-0x1000, 0x1000)),
+            "dtest_en": 1, "dcmp": 6,
+        })
+    return tris
+
+def bin_tris(tris, tiles_w, tiles_h):
+    # per-tile command queues (triangles overlapping each tile's bounds, moved into the tile's space), packed one after another, and the table of pointers to them
+    queues = []
+    table = []
+    for ty in range(tiles_h):
+        for tx in range(tiles_w):
+            table.append(QUEUE_ADR + len(queues))
+            queue = pack_state(test_tex_state) + pack_fill(test_clear)
+            for tri in tris:
+                xs = (tri["v0"][0], tri["v1"][0], tri["v2"][0])
+                ys = (tri["v0"][1], tri["v1"][1], tri["v2"][1])
+                if max(xs) >= tx * DIM and min(xs) < (tx + 1) * DIM and max(ys) >= ty * DIM and min(ys) < (ty + 1) * DIM:
+                    tile_tri = dict(tri)
+                    for v in ("v0", "v1", "v2"):
+                        tile_tri[v] = (tri[v][0] - (tx * DIM), tri[v][1] - (ty * DIM))
+                    queue += pack_state({name: tri.get(name, 0) for name in ("tex_en", "dtest_en", "dcmp")}) + pack_tri(tile_tri)
+            queues += queue + pack_end()
+    return queues, table
+
+def make_mem_contents(queues, table):
+    contents = tuple(map(int, np.random.default_rng(4321).integers(0, 1 << 32, TBL_ADR, dtype=np.uint64))) + tuple(table)
+    contents = contents + (0,) * (QUEUE_ADR - len(contents)) + tuple(queues)
+    assert len(contents) <= FB_ADR
+    return contents
+
+@block
+def TileSnapshot(i_clk, i_valid, i_tile, i_ready, i_resolve_bytes, i_resolve_cycles, FB, FB_W, FB_H, SCREEN, STATS):
+    # copies each tile captured from a core into the reference frame once the core has finished drawing it, and records each resolve's cycle count
+    # (once the core has written as many bytes as the tile has pixels on screen)
+    tile = [0, 0]
+    state = {"ready": True, "bytes": 0, "pending": []}
+
+    @always(i_clk.posedge)
+    def snapshot():
+        if i_ready and not state["ready"]:
+            SCREEN[tile[1] * DIM:(tile[1] + 1) * DIM, tile[0] * DIM:(tile[0] + 1) * DIM] = FB.color
+        if i_valid and i_ready:
+            tile[0] = int(i_tile[0])
+            tile[1] = int(i_tile[1])
+            FB.color[...] = CLEAR_COLOR
+            state["pending"].append(min(DIM, FB_W - (tile[0] * DIM)) * min(DIM, FB_H - (tile[1] * DIM)) * 4)
+        state["ready"] = bool(i_ready)
+        if state["pending"] and int(i_resolve_bytes) - state["bytes"] == state["pending"][0]:
+            STATS["resolve_cycles"].append(int(i_resolve_cycles))
+            state["bytes"] += state["pending"].pop(0)
+
+    return snapshot
+
+@block
+def Top(NUM_CORES, FB_W, FB_H, CONTENT, FB_MEM, STATS, SCREEN=None):
+    # SCREEN: reference frame to build from the pixel cluster writes captured from each core (None = don't capture them)
+    rst = ResetSignal(0, active=0, isasync=True)
+    clk = Signal(0)
+    clk_driver = ClkDriver(clk)
+
+    (TILES_W, TILES_H) = frame_tiles(FB_W, FB_H)
+    FB_STRIDE = FB_W
+
+    # port 0 is the tile dispatch, the rest are the tile cores
+    NUM_PORTS = NUM_CORES + 1
+
+    mem_o_data = Signal(intbv(0)[32:0])
+    mem_i_data = Signal(intbv(0)[32:0])
+    mem_i_adr = Signal(intbv(0)[32:0])
+    mem_i_we = Signal(bool(0))
+    mem_i_stb = Signal(bool(0))
+    mem_o_ack = Signal(bool(0))
+    mem_i_cti = Signal(intbv(0)[3:0])
+    mem_i_bte = Signal(intbv(0)[2:0])
+    mem = BurstRAM(mem_o_data, mem_i_data, mem_i_adr, mem_i_we, mem_i_stb, mem_o_ack, mem_i_cti, mem_i_bte, clk,
+                   WIDTH=32, DEPTH=FB_ADR + (FB_STRIDE * TILES_H * DIM), CONTENT=CONTENT)
+
+    arbiter_i_adr = [Signal(intbv(0)[32:]) for _ in range(NUM_PORTS)]
+    arbiter_i_dat = [Signal(intbv(0)[32:]) for _ in range(NUM_PORTS)]
+    arbiter_o_dat = Signal(intbv(0)[32:])
+    arbiter_i_we = [Signal(bool(0)) for _ in range(NUM_PORTS)]
+    arbiter_i_stb = [Signal(bool(0)) for _ in range(NUM_PORTS)]
+    arbiter_o_ack = [Signal(bool(0)) for _ in range(NUM_PORTS)]
+    arbiter_i_cti = [Signal(intbv(0)[3:]) for _ in range(NUM_PORTS)]
+    arbiter_i_bte = [Signal(intbv(0)[2:]) for _ in range(NUM_PORTS)]
+    arbiter_o_wait_cycles = [Signal(intbv(0)[32:]) for _ in range(NUM_PORTS)]
+    arbiter = BusArbiter(rst, clk, arbiter_i_adr, arbiter_i_dat, arbiter_o_dat, arbiter_i_we, arbiter_i_stb, arbiter_o_ack,
+                         mem_i_adr, mem_i_data, mem_o_data, mem_i_we, mem_i_stb, mem_o_ack,
+                         arbiter_o_wait_cycles, arbiter_i_cti, arbiter_i_bte, mem_i_cti, mem_i_bte,
+                         NUM_PORTS=NUM_PORTS, MODE="round_robin")
+
+    dispatch_i_stb = Signal(bool(0))
+    dispatch_i_tbl_adr = Signal(intbv(TBL_ADR)[32:0])
+    dispatch_i_tiles_w = Signal(intbv(TILES_W)[16:0])
+    dispatch_i_tiles_h = Signal(intbv(TILES_H)[16:0])
+    dispatch_o_busy = Signal(bool(0))
+    dispatch_o_core_valid = [Signal(bool(0)) for _ in range(NUM_CORES)]
+    dispatch_o_core_ptr = [Signal(intbv(0)[32:0]) for _ in range(NUM_CORES)]
+    dispatch_o_core_tile = [Signal(intbv(0)[16:0]) for _ in range(NUM_CORES * 2)]
+    dispatch_i_core_ready = [Signal(bool(0)) for _ in range(NUM_CORES)]
+    core_busy = [Signal(bool(0)) for _ in range(NUM_CORES)]
+    dispatch_o_core_tiles = [Signal(intbv(0)[32:0]) for _ in range(NUM_CORES)]
+    dispatch = TileDispatch(rst, clk, dispatch_i_stb, dispatch_i_tbl_adr, dispatch_i_tiles_w, dispatch_i_tiles_h, dispatch_o_busy,
+                            dispatch_o_core_valid, dispatch_o_core_ptr, dispatch_o_core_tile, dispatch_i_core_ready, core_busy,
+                            arbiter_i_adr[0], arbiter_o_dat, arbiter_i_stb[0], arbiter_o_ack[0], arbiter_i_cti[0], arbiter_i_bte[0],
+                            dispatch_o_core_tiles, NUM_CORES=NUM_CORES)
+
+    fb_adr = Signal(intbv(FB_ADR)[32:0])
+    fb_stride = Signal(intbv(FB_STRIDE)[32:0])
+    fb_w = Signal(intbv(FB_W)[16:0])
+    fb_h = Signal(intbv(FB_H)[16:0])
+    fog_tbl = [Signal(intbv(0)[8:0]) for _ in range(64)]
+    core_starve_cycles = [Signal(intbv(0)[32:0]) for _ in range(NUM_CORES)]
+    core_resolve_bytes = [Signal(intbv(0)[32:0]) for _ in range(NUM_CORES)]
+    core_resolve_cycles = [Signal(intbv(0)[32:0]) for _ in range(NUM_CORES)]
+    cores = []
+    captures = []
+    snapshots = []
+    for c in range(NUM_CORES):
+        wr_en_rgb = [Signal(bool(0)) for _ in range(4)]
+        wr_data_rgb = [Signal(intbv(0)[32:0]) for _ in range(4)]
+        wr_en_d = [Signal(bool(0)) for _ in range(4)]
+        wr_data_d = [Signal(intbv(0)[32:0]) for _ in range(4)]
+        wr_pos = [Signal(intbv(0)[32:0]) for _ in range(2)]
+        cores.append(TileCore(rst, clk, dispatch_o_core_valid[c], dispatch_o_core_ptr[c], dispatch_o_core_tile[c * 2:(c + 1) * 2], dispatch_i_core_ready[c], core_busy[c],
+                              fb_adr, fb_stride, fb_w, fb_h, fog_tbl,
+                              wr_en_rgb, wr_data_rgb, wr_en_d, wr_data_d, wr_pos,
+                              arbiter_i_adr[c + 1], arbiter_o_dat, arbiter_i_stb[c + 1], arbiter_o_ack[c + 1], arbiter_i_cti[c + 1], arbiter_i_bte[c + 1],
+                              arbiter_i_dat[c + 1], arbiter_i_we[c + 1],
+                              o_starve_cycles=core_starve_cycles[c],
+                              o_resolve_bytes=core_resolve_bytes[c], o_resolve_cycles=core_resolve_cycles[c],
+                              DIM=DIM, TEX_SETS=4, TEX_WAYS=2))
+        if SCREEN is not None:
+            fb = FrameBuffer(DIM=DIM)
+            captures.append(FrameCapture(clk, wr_en_rgb, wr_data_rgb, wr_en_d, wr_data_d, wr_pos, fb))
+            snapshots.append(TileSnapshot(clk, dispatch_o_core_valid[c], dispatch_o_core_tile[c * 2:(c + 1) * 2], dispatch_i_core_ready[c],
+                                          core_resolve_bytes[c], core_resolve_cycles[c], fb, FB_W, FB_H, SCREEN, STATS))
+
+    @always(clk.posedge)
+    def snoop():
+        # mirror framebuffer writes as the memory commits them
+        if mem_i_stb and mem_i_we and mem_o_ack and mem_i_adr >= FB_ADR:
+            adr = int(mem_i_adr) - FB_ADR
+            if adr < FB_STRIDE * FB_H and adr % FB_STRIDE < FB_W:
+                FB_MEM[adr // FB_STRIDE, adr % FB_STRIDE] = int(mem_i_data)
+            else:
+                STATS["outside"] += 1
+
+    @instance
+    def drive_test():
+        rst.next = 0
+        yield delay(100)
+        rst.next = 1
+        yield delay(100)
+        # the host only points the tile dispatch at the pointer table
+        dispatch_i_stb.next = True
+        yield clk.posedge
+        dispatch_i_stb.next = False
+        begin_time = now()
+        yield clk.posedge
+        # wait for every tile to be handed out & resolved
+        while dispatch_o_busy:
+            yield clk.posedge
+        STATS["cycles"] = int((now() - begin_time) / 20)
+        STATS["core_tiles"] = [int(t) for t in dispatch_o_core_tiles]
+        STATS["bus_wait"] = sum(int(w) for w in arbiter_o_wait_cycles)
+        STATS["starve"] = sum(int(s) for s in core_starve_cycles)
+        STATS["bytes"] = sum(int(b) for b in core_resolve_bytes)
+        yield delay(40)
+        raise StopSimulation()
+
+    return clk_driver, mem, arbiter, dispatch, cores, captures, snapshots, snoop, drive_test
+
+# scaling benchmark
+FB_W = 128
+FB_H = 128
+(tiles_w, tiles_h) = frame_tiles(FB_W, FB_H)
+test_tris = make_tris(tiles_w, tiles_h, True, 12)
+test_queues, test_table = bin_tris(test_tris, tiles_w, tiles_h)
+test_mem_contents = make_mem_contents(test_queues, test_table)
+print("%s triangles, %s tiles, %s words of commands" % (len(test_tris), len(test_table), len(test_queues)))
+
+screens = {}
+base_cycles = None
+for num_cores in (1, 2, 4, 8):
+    screens[num_cores] = np.zeros((FB_H, FB_W), dtype=np.uint32)
+    stats = {"outside": 0}
+    inst = Top(num_cores, FB_W, FB_H, test_mem_contents, screens[num_cores], stats)
+    inst.run_sim()
+    base_cycles = base_cycles or stats["cycles"]
+    print("%s core(s): frame in %s cycles (%.2fx), tiles per core: %s, bus wait cycles: %s, cycles starved of commands: %s, mismatches vs 1 core: %s" % (
+        num_cores, stats["cycles"], base_cycles / stats["cycles"], stats["core_tiles"], stats["bus_wait"], stats["starve"],
+        np.count_nonzero(screens[num_cores] != screens[1])))
+print("Distinct colors in frame: %s" % len(np.unique(screens[1])))
+
+# resolve check
+FB_W = 56
+FB_H = 48
+(tiles_w, tiles_h) = frame_tiles(FB_W, FB_H)
+test_queues, test_table = bin_tris(make_tris(tiles_w, tiles_h, False, 6), tiles_w, tiles_h)
+screen = np.zeros((tiles_h * DIM, tiles_w * DIM), dtype=np.uint32)
+fb_mem = np.zeros((FB_H, FB_W), dtype=np.uint32)
+stats = {"resolve_cycles": [], "outside": 0}
+inst = Top(2, FB_W, FB_H, make_mem_contents(test_queues, test_table), fb_mem, stats, screen)
+inst.run_sim()
+print("Resolve check: %sx%s frame in %s cycles, %s tiles resolved" % (FB_W, FB_H, stats["cycles"], len(stats["resolve_cycles"])))
+print("Resolved %s bytes (%s pixels on screen), resolve cycles per tile: %s" % (stats["bytes"], FB_W * FB_H, stats["resolve_cycles"]))
+print("Framebuffer mismatches: %s, writes outside of framebuffer: %s" % (np.count_nonzero(fb_mem != screen[:FB_H, :FB_W]), stats["outside"]))
@@ -0,0 +1,221 @@
+import numpy as np
+from myhdl import block, delay, always_comb, Signal, ResetSignal, intbv, instance, now, StopSimulation
+
+from clk_driver import ClkDriver
+from tri_raster import TriRaster
+from tri_raster_ref import TriRasterRef, mismatches
+from mem import DualPortRAM
+from frame_capture import FrameBuffer, FrameCapture
+
+# traversal benchmark: the same triangles rendered with each traversal order, with & without coarse blocks
+# (counting how many of the clusters visited actually had a pixel inside the triangle)
+# each is run twice: waiting for the rasterizer to go idle after every triangle, and streaming triangles in whenever it's ready to take one
+
+DIM = 32
+
+test_clear = {
+    "col_init": (0, 0, 0, 255 << 12),
+    "zow_init": 0xFFFFFF,
+}
+
+def make_tris():
+    # a few long slivers (the worst case for walking whole rows), followed by random triangles of all sizes
+    verts = [
+        ((1, 1), (31, 24), (28, 28)),
+        ((30, 0), (32, 2), (0, 31)),
+        ((0, 14), (32, 16), (0, 18)),
+        ((14, 0), (18, 0), (16, 32)),
+    ]
+    rng = np.random.default_rng(1234)
+    while len(verts) < 16:
+        v = [tuple(int(c) for c in rng.integers(-4, DIM + 4, 2)) for _ in range(3)]
+        # wind clockwise, skipping degenerate triangles
+        area = (v[1][0] - v[0][0]) * (v[2][1] - v[0][1]) - (v[1][1] - v[0][1]) * (v[2][0] - v[0][0])
+        if area == 0:
+            continue
+        if area < 0:
+            v[1], v[2] = v[2], v[1]
+        verts.append(tuple(v))
+    tris = []
+    for (i, (v0, v1, v2)) in enumerate(verts):
+        tris.append({
+            "v0": v0, "v1": v1, "v2": v2,
+            "col_init": ((i * 16) << 12, (255 - (i * 16)) << 12, 128 << 12, 255 << 12),
+            "col_dx": (0, 0, 0, 0),
+            "col_dy": (0, 0, 0, 0),
+            "zow_init": 0x80000,
+        })
+    return tris
+
+test_tris = make_tris()
+
+@block
+def Top(framebuffer, STATS, TRAVERSAL, BLOCK, STREAM):
+    rst = ResetSignal(0, active=0, isasync=True)
+    clk = Signal(0)
+    clk_driver = ClkDriver(clk)
+
+    colorbuffer_rd_addr = Signal(intbv(0)[32:0])
+    colorbuffer_wr_addr = Signal(intbv(0)[32:0])
+    colorbuffer_dout = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    colorbuffer_din = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    colorbuffer_we = [Signal(bool(0)) for _ in range(4)]
+    colorbuffers = [DualPortRAM(colorbuffer_dout[i], colorbuffer_rd_addr, colorbuffer_din[i], colorbuffer_wr_addr, colorbuffer_we[i], clk, WIDTH=32, DEPTH=256) for i in range(4)]
+
+    depthbuffer_rd_addr = Signal(intbv(0)[32:0])
+    depthbuffer_wr_addr = Signal(intbv(0)[32:0])
+    depthbuffer_dout = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    depthbuffer_din = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    depthbuffer_we = [Signal(bool(0)) for _ in range(4)]
+    depthbuffers = [DualPortRAM(depthbuffer_dout[i], depthbuffer_rd_addr, depthbuffer_din[i], depthbuffer_wr_addr, depthbuffer_we[i], clk, WIDTH=32, DEPTH=256) for i in range(4)]
+
+    tri_raster_tri_stb = Signal(bool(0))
+    tri_raster_fill_stb = Signal(bool(0))
+    tri_raster_flush_stb = Signal(bool(0))
+    tri_raster_busy = Signal(bool(0))
+    tri_raster_tri_ready = Signal(bool(0))
+    tri_raster_wr_en_rgb = [Signal(bool(0)) for _ in range(4)]
+    tri_raster_wr_data_rgb = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    tri_raster_wr_en_d = [Signal(bool(0)) for _ in range(4)]
+    tri_raster_wr_data_d = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    tri_raster_wr_pos = [Signal(intbv(0)[32:0]) for _ in range(2)]
+    tri_raster_rd_pos = [Signal(intbv(0)[32:0]) for _ in range(2)]
+    tri_raster_rd_data_rgb = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    tri_raster_rd_data_d = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    tri_raster_v0 = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    tri_raster_v1 = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    tri_raster_v2 = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    tri_raster_col_init = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    tri_raster_col_dx = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    tri_raster_col_dy = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    tri_raster_1ow_init = Signal(intbv(0)[32:0].signed())
+    tri_raster_1ow_dx = Signal(intbv(0)[32:0].signed())
+    tri_raster_1ow_dy = Signal(intbv(0)[32:0].signed())
+    tri_raster_sow_init = Signal(intbv(0)[32:0].signed())
+    tri_raster_sow_dx = Signal(intbv(0)[32:0].signed())
+    tri_raster_sow_dy = Signal(intbv(0)[32:0].signed())
+    tri_raster_tow_init = Signal(intbv(0)[32:0].signed())
+    tri_raster_tow_dx = Signal(intbv(0)[32:0].signed())
+    tri_raster_tow_dy = Signal(intbv(0)[32:0].signed())
+    tri_raster_zow_init = Signal(intbv(0)[32:0].signed())
+    tri_raster_zow_dx = Signal(intbv(0)[32:0].signed())
+    tri_raster_zow_dy = Signal(intbv(0)[32:0].signed())
+    tri_raster_tex_en = Signal(bool(0))
+    tri_raster_dtest_en = Signal(bool(0))
+    tri_raster_dcmp = Signal(intbv(0)[3:0])
+    tri_raster_bl_en = Signal(bool(0))
+    tri_raster_bl_src = Signal(intbv(0)[4:0])
+    tri_raster_bl_dst = Signal(intbv(0)[4:0])
+    tri_raster_bl_op = Signal(0)
+    tri_raster_fog_en = Signal(bool(0))
+    tri_raster_fog_col = Signal(intbv(0)[32:])
+    tri_raster_o_smp_stb = Signal(bool(0))
+    tri_raster_o_smp_st = [Signal(intbv(0)[32:0].signed()) for _ in range(8)]
+    tri_raster_o_smp_ddx = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    tri_raster_o_smp_ddy = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    tri_raster_i_smp_dat = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    tri_raster_i_smp_ack = Signal(bool(0))
+    tri_raster_i_fog_tbl = [Signal(intbv(0)[8:0]) for _ in range(64)]
+    tri_raster_o_quads_visited = Signal(intbv(0)[32:0])
+    tri_raster_o_quads_covered = Signal(intbv(0)[32:0])
+    tri_raster = TriRaster(rst, clk, tri_raster_v0, tri_raster_v1, tri_raster_v2,
+                           tri_raster_col_init, tri_raster_col_dx, tri_raster_col_dy,
+                           tri_raster_1ow_init, tri_raster_1ow_dx, tri_raster_1ow_dy,
+                           tri_raster_sow_init, tri_raster_sow_dx, tri_raster_sow_dy,
+                           tri_raster_tow_init, tri_raster_tow_dx, tri_raster_tow_dy,
+                           tri_raster_zow_init, tri_raster_zow_dx, tri_raster_zow_dy,
+                           tri_raster_tex_en, tri_raster_dtest_en, tri_raster_dcmp,
+                           tri_raster_bl_en, tri_raster_bl_src, tri_raster_bl_dst, tri_raster_bl_op,
+                           tri_raster_fog_en, tri_raster_fog_col,
+                           tri_raster_tri_stb, tri_raster_fill_stb, tri_raster_busy,
+                           tri_raster_wr_en_rgb, tri_raster_wr_data_rgb,
+                           tri_raster_wr_en_d, tri_raster_wr_data_d,
+                           tri_raster_wr_pos,
+                           tri_raster_rd_pos, tri_raster_rd_data_rgb, tri_raster_rd_data_d,
+                           tri_raster_o_smp_stb, tri_raster_o_smp_st, tri_raster_o_smp_ddx, tri_raster_o_smp_ddy, tri_raster_i_smp_dat, tri_raster_i_smp_ack,
+                           tri_raster_i_fog_tbl,
+                           i_flush_stb=tri_raster_flush_stb, o_quads_visited=tri_raster_o_quads_visited, o_quads_covered=tri_raster_o_quads_covered,
+                           o_tri_ready=tri_raster_tri_ready,
+                           DIM=DIM, BLOCK=BLOCK, TRAVERSAL=TRAVERSAL)
+    capture = FrameCapture(clk, tri_raster_wr_en_rgb, tri_raster_wr_data_rgb, tri_raster_wr_en_d, tri_raster_wr_data_d, tri_raster_wr_pos, framebuffer)
+
+    ports = {
+        "v0": tri_raster_v0, "v1": tri_raster_v1, "v2": tri_raster_v2,
+        "col_init": tri_raster_col_init, "col_dx": tri_raster_col_dx, "col_dy": tri_raster_col_dy,
+        "zow_init": tri_raster_zow_init,
+    }
+
+    def set_params(tri):
+        for (name, value) in tri.items():
+            port = ports[name]
+            if isinstance(port, list):
+                for i in range(len(port)):
+                    port[i].next = value[i]
+            else:
+                port.next = value
+
+    @always_comb
+    def drive_comb():
+        colorbuffer_rd_addr.next = depthbuffer_rd_addr.next = tri_raster_rd_pos[0] + (tri_raster_rd_pos[1] << 4)
+        colorbuffer_wr_addr.next = depthbuffer_wr_addr.next = tri_raster_wr_pos[0] + (tri_raster_wr_pos[1] << 4)
+        for i in range(4):
+            colorbuffer_din[i].next = tri_raster_wr_data_rgb[i]
+            colorbuffer_we[i].next = tri_raster_wr_en_rgb[i]
+            depthbuffer_din[i].next = tri_raster_wr_data_d[i]
+            depthbuffer_we[i].next = tri_raster_wr_en_d[i]
+            tri_raster_rd_data_rgb[i].next = colorbuffer_dout[i]
+            tri_raster_rd_data_d[i].next = depthbuffer_dout[i]
+
+    @instance
+    def drive_test():
+        rst.next = 0
+        yield delay(100)
+        rst.next = 1
+        yield delay(100)
+        set_params(test_clear)
+        tri_raster_fill_stb.next = True
+        yield delay(20)
+        tri_raster_fill_stb.next = False
+        while tri_raster_busy:
+            yield delay(20)
+        begin_time = now()
+        for tri in test_tris:
+            while not tri_raster_tri_ready:
+                yield delay(20)
+            set_params(tri)
+            tri_raster_tri_stb.next = True
+            yield delay(20)
+            tri_raster_tri_stb.next = False
+            while tri_raster_busy and not STREAM:
+                yield delay(20)
+        while tri_raster_busy:
+            yield delay(20)
+        STATS["cycles"] = int((now() - begin_time) / 20)
+        tri_raster_flush_stb.next = True
+        yield delay(20)
+        tri_raster_flush_stb.next = False
+        while tri_raster_busy:
+            yield delay(20)
+        STATS["visited"] = int(tri_raster_o_quads_visited)
+        STATS["covered"] = int(tri_raster_o_quads_covered)
+        yield delay(40)
+        raise StopSimulation()
+
+    return clk_driver, colorbuffers, depthbuffers, tri_raster, drive_comb, capture, drive_test
+
+ref = TriRasterRef(DIM=DIM)
+ref.fill(test_clear)
+for tri in test_tris:
+    ref.draw(tri)
+
+for block_size in (0, 8):
+    for traversal in ("scan", "span"):
+        for stream in (False, True):
+            rtl = FrameBuffer(DIM=DIM)
+            stats = {}
+            inst = Top(rtl, stats, traversal, block_size, stream)
+            inst.run_sim()
+            # NOTE: the counters only cover triangles, the clear's clusters are visited by FILL
+            print("TRAVERSAL=%s, BLOCK=%s, STREAM=%s: %s triangles in %s cycles, %s clusters visited, %s covered (%.1f%%), %s color / %s depth mismatches" % (
+                traversal, block_size, stream, len(test_tris), stats["cycles"], stats["visited"], stats["covered"], 100.0 * stats["covered"] / stats["visited"],
+                len(mismatches(rtl.color, ref.color)), len(mismatches(rtl.depth, ref.depth))))
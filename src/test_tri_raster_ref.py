@@ -0,0 +1,302 @@
+import numpy as np
+from myhdl import block, delay, always, always_comb, Signal, ResetSignal, intbv, instance, now, StopSimulation
+
+from clk_driver import ClkDriver
+from tri_raster import TriRaster
+from tri_raster_ref import TriRasterRef, mismatches
+from mem import DualPortRAM
+from frame_capture import FrameBuffer, FrameCapture
+
+# test scene: clear, then a few triangles exercising depth test, blending, fog, texturing and the top-left fill rule
+fog_tbl = [min((i - 16) << 4, 255) if i > 16 else 0 for i in range(64)]
+
+test_clear = {
+    "col_init": (64 << 12, 128 << 12, 255 << 12, 255 << 12),
+    "zow_init": 0xFFFFFF,
+}
+
+test_tris = [
+    {
+        "v0": (0, 0), "v1": (32, 0), "v2": (16, 32),
+        "col_init": (255 << 12, 0, 0, 128 << 12),
+        "col_dx": (int(-7.96875 * 4096), int(7.96875 * 4096), 0, 0),
+        "col_dy": (int(-7.96875 * 0.5 * 4096), int(-7.96875 * 0.5 * 4096), int(7.96875 * 4096), 0),
+        "zow_init": 0, "zow_dx": int(0.03125 * 0.5 * (1 << 24)), "zow_dy": int(0.03125 * 0.25 * (1 << 24)),
+        "dtest_en": 1, "dcmp": 6,
+        "bl_en": 1, "bl_src": 3, "bl_dst": 7, "bl_op": 0,
+        "fog_en": 1, "fog_col": 0xFF808080, "fog_tbl": fog_tbl,
+    },
+    {
+        "v0": (-6, 4), "v1": (30, 12), "v2": (2, 40),
+        "col_init": (32 << 12, 200 << 12, 90 << 12, 255 << 12),
+        "col_dx": (2 << 12, -3 << 12, 1 << 12, 0),
+        "col_dy": (3 << 12, 1 << 12, -2 << 12, 0),
+        "zow_init": 0x400000, "zow_dx": -0x8000, "zow_dy": 0x10000,
+        "dtest_en": 1, "dcmp": 4,
+        "bl_en": 1, "bl_src": 1, "bl_dst": 4, "bl_op": 1,
+        "fog_en": 0, "fog_col": 0, "fog_tbl": fog_tbl,
+    },
+    {
+        "v0": (10, 6), "v1": (28, 30), "v2": (6, 26),
+        "col_init": (255 << 12, 255 << 12, 0, 255 << 12),
+        "col_dx": (0, -4 << 12, 4 << 12, 0),
+        "col_dy": (-4 << 12, 0, 4 << 12, 0),
+        "zow_init": 0x200000, "zow_dx": 0, "zow_dy": 0x40000,
+        "dtest_en": 1, "dcmp": 7,
+        "bl_en": 0, "bl_src": 0, "bl_dst": 0, "bl_op": 0,
+        "fog_en": 1, "fog_col": 0xFF0000FF, "fog_tbl": fog_tbl,
+    },
+    {
+        "v0": (20, -8), "v1": (36, 20), "v2": (-4, 24),
+        "col_init": (255 << 12, 192 << 12, 128 << 12, 255 << 12),
+        "col_dx": (0, 0, 0, 0),
+        "col_dy": (-2 << 12, 0, 2 << 12, 0),
+        "1ow_init": 4096, "1ow_dx": 16, "1ow_dy": -8,
+        "sow_init": 0, "sow_dx": 255, "sow_dy": -64,
+        "tow_init": 512, "tow_dx": 32, "tow_dy": 255,
+        "zow_init": 0x100000, "zow_dx": 0x1000, "zow_dy": 0x1000,
+        "tex_en": 1, "dtest_en": 1, "dcmp": 6,
+        "bl_en": 1, "bl_src": 2, "bl_dst": 9, "bl_op": 0,
+        "fog_en": 0, "fog_col": 0, "fog_tbl": fog_tbl,
+    },
+    {
+        # thin diagonal sliver, mostly made of empty clusters
+        "v0": (1, 1), "v1": (31, 24), "v2": (28, 28),
+        "col_init": (0, 255 << 12, 255 << 12, 255 << 12),
+        "col_dx": (0, 0, 0, 0),
+        "col_dy": (0, 0, 0, 0),
+        "zow_init": 0x80000,
+        "dtest_en": 0, "dcmp": 1,
+        "fog_tbl": fog_tbl,
+    },
+    {
+        # near occluder over the upper right half of the tile
+        "v0": (0, 0), "v1": (32, 0), "v2": (32, 32),
+        "col_init": (96 << 12, 96 << 12, 96 << 12, 255 << 12),
+        "zow_init": 0x1000, "zow_dx": 0x10, "zow_dy": 0x10,
+        "dtest_en": 1, "dcmp": 1,
+        "fog_tbl": fog_tbl,
+    },
+    {
+        # entirely hidden behind the occluder
+        "v0": (24, 0), "v1": (32, 0), "v2": (32, 8),
+        "col_init": (255 << 12, 0, 255 << 12, 255 << 12),
+        "zow_init": 0x2000,
+        "dtest_en": 1, "dcmp": 4,
+        "fog_tbl": fog_tbl,
+    },
+    {
+        # partly hidden behind the occluder
+        "v0": (0, 0), "v1": (32, 0), "v2": (0, 32),
+        "col_init": (255 << 12, 128 << 12, 0, 255 << 12),
+        "col_dx": (0, 0, 0, 0),
+        "col_dy": (0, 0, 0, 0),
+        "zow_init": 0x2000, "zow_dx": 0x100, "zow_dy": 0x100,
+        "dtest_en": 1, "dcmp": 4,
+        "fog_tbl": fog_tbl,
+    },
+]
+
+def test_sampler(st, ddx, ddy):
+    # procedural "texture" which encodes the sample coordinates & derivatives passed to the sampler, so that they get checked too
+    return ((st[0] >> 4) & 0xFF) | (((st[1] >> 4) & 0xFF) << 8) | ((ddx[0] & 0xFF) << 16) | ((ddy[1] & 0xFF) << 24)
+
+DIM = 32
+
+# cycles the test sampler takes to ack a request, so that TEX holds clusters back & the rest of the pipeline has to stall behind it
+SMP_LATENCY = 3
+
+@block
+def Top(framebuffer, BLOCK):
+    rst = ResetSignal(0, active=0, isasync=True)
+    clk = Signal(0)
+    clk_driver = ClkDriver(clk)
+
+    colorbuffer_rd_addr = Signal(intbv(0)[32:0])
+    colorbuffer_wr_addr = Signal(intbv(0)[32:0])
+    colorbuffer_dout = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    colorbuffer_din = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    colorbuffer_we = [Signal(bool(0)) for _ in range(4)]
+    colorbuffers = [DualPortRAM(colorbuffer_dout[i], colorbuffer_rd_addr, colorbuffer_din[i], colorbuffer_wr_addr, colorbuffer_we[i], clk, WIDTH=32, DEPTH=256) for i in range(4)]
+
+    depthbuffer_rd_addr = Signal(intbv(0)[32:0])
+    depthbuffer_wr_addr = Signal(intbv(0)[32:0])
+    depthbuffer_dout = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    depthbuffer_din = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    depthbuffer_we = [Signal(bool(0)) for _ in range(4)]
+    depthbuffers = [DualPortRAM(depthbuffer_dout[i], depthbuffer_rd_addr, depthbuffer_din[i], depthbuffer_wr_addr, depthbuffer_we[i], clk, WIDTH=32, DEPTH=256) for i in range(4)]
+
+    tri_raster_tri_stb = Signal(bool(0))
+    tri_raster_fill_stb = Signal(bool(0))
+    tri_raster_flush_stb = Signal(bool(0))
+    tri_raster_busy = Signal(bool(0))
+    tri_raster_wr_en_rgb = [Signal(bool(0)) for _ in range(4)]
+    tri_raster_wr_data_rgb = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    tri_raster_wr_en_d = [Signal(bool(0)) for _ in range(4)]
+    tri_raster_wr_data_d = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    tri_raster_wr_pos = [Signal(intbv(0)[32:0]) for _ in range(2)]
+    tri_raster_rd_pos = [Signal(intbv(0)[32:0]) for _ in range(2)]
+    tri_raster_rd_data_rgb = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    tri_raster_rd_data_d = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    tri_raster_v0 = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    tri_raster_v1 = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    tri_raster_v2 = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    tri_raster_col_init = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    tri_raster_col_dx = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    tri_raster_col_dy = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    tri_raster_1ow_init = Signal(intbv(0)[32:0].signed())
+    tri_raster_1ow_dx = Signal(intbv(0)[32:0].signed())
+    tri_raster_1ow_dy = Signal(intbv(0)[32:0].signed())
+    tri_raster_sow_init = Signal(intbv(0)[32:0].signed())
+    tri_raster_sow_dx = Signal(intbv(0)[32:0].signed())
+    tri_raster_sow_dy = Signal(intbv(0)[32:0].signed())
+    tri_raster_tow_init = Signal(intbv(0)[32:0].signed())
+    tri_raster_tow_dx = Signal(intbv(0)[32:0].signed())
+    tri_raster_tow_dy = Signal(intbv(0)[32:0].signed())
+    tri_raster_zow_init = Signal(intbv(0)[32:0].signed())
+    tri_raster_zow_dx = Signal(intbv(0)[32:0].signed())
+    tri_raster_zow_dy = Signal(intbv(0)[32:0].signed())
+    tri_raster_tex_en = Signal(bool(0))
+    tri_raster_dtest_en = Signal(bool(0))
+    tri_raster_dcmp = Signal(intbv(0)[3:0])
+    tri_raster_bl_en = Signal(bool(0))
+    tri_raster_bl_src = Signal(intbv(0)[4:0])
+    tri_raster_bl_dst = Signal(intbv(0)[4:0])
+    tri_raster_bl_op = Signal(0)
+    tri_raster_fog_en = Signal(bool(0))
+    tri_raster_fog_col = Signal(intbv(0)[32:])
+    tri_raster_o_smp_stb = Signal(bool(0))
+    tri_raster_o_smp_st = [Signal(intbv(0)[32:0].signed()) for _ in range(8)]
+    tri_raster_o_smp_ddx = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    tri_raster_o_smp_ddy = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    tri_raster_i_smp_dat = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    tri_raster_i_smp_ack = Signal(bool(0))
+    tri_raster_i_fog_tbl = [Signal(intbv(0)[8:0]) for _ in range(64)]
+    tri_raster_o_stall_cycles = [Signal(intbv(0)[32:0]) for _ in range(5)]
+    tri_raster_o_quads_skipped = Signal(intbv(0)[32:0])
+    tri_raster_o_hiz_rejects = [Signal(intbv(0)[32:0]) for _ in range(3)]
+    tri_raster = TriRaster(rst, clk, tri_raster_v0, tri_raster_v1, tri_raster_v2,
+                           tri_raster_col_init, tri_raster_col_dx, tri_raster_col_dy,
+                           tri_raster_1ow_init, tri_raster_1ow_dx, tri_raster_1ow_dy,
+                           tri_raster_sow_init, tri_raster_sow_dx, tri_raster_sow_dy,
+                           tri_raster_tow_init, tri_raster_tow_dx, tri_raster_tow_dy,
+                           tri_raster_zow_init, tri_raster_zow_dx, tri_raster_zow_dy,
+                           tri_raster_tex_en, tri_raster_dtest_en, tri_raster_dcmp,
+                           tri_raster_bl_en, tri_raster_bl_src, tri_raster_bl_dst, tri_raster_bl_op,
+                           tri_raster_fog_en, tri_raster_fog_col,
+                           tri_raster_tri_stb, tri_raster_fill_stb, tri_raster_busy,
+                           tri_raster_wr_en_rgb, tri_raster_wr_data_rgb,
+                           tri_raster_wr_en_d, tri_raster_wr_data_d,
+                           tri_raster_wr_pos,
+                           tri_raster_rd_pos, tri_raster_rd_data_rgb, tri_raster_rd_data_d,
+                           tri_raster_o_smp_stb, tri_raster_o_smp_st, tri_raster_o_smp_ddx, tri_raster_o_smp_ddy, tri_raster_i_smp_dat, tri_raster_i_smp_ack,
+                           tri_raster_i_fog_tbl,
+                           tri_raster_flush_stb, tri_raster_o_stall_cycles, tri_raster_o_quads_skipped, o_hiz_rejects=tri_raster_o_hiz_rejects,
+                           DIM=DIM, BLOCK=BLOCK)
+    capture = FrameCapture(clk, tri_raster_wr_en_rgb, tri_raster_wr_data_rgb, tri_raster_wr_en_d, tri_raster_wr_data_d, tri_raster_wr_pos, framebuffer)
+
+    ports = {
+        "v0": tri_raster_v0, "v1": tri_raster_v1, "v2": tri_raster_v2,
+        "col_init": tri_raster_col_init, "col_dx": tri_raster_col_dx, "col_dy": tri_raster_col_dy,
+        "1ow_init": tri_raster_1ow_init, "1ow_dx": tri_raster_1ow_dx, "1ow_dy": tri_raster_1ow_dy,
+        "sow_init": tri_raster_sow_init, "sow_dx": tri_raster_sow_dx, "sow_dy": tri_raster_sow_dy,
+        "tow_init": tri_raster_tow_init, "tow_dx": tri_raster_tow_dx, "tow_dy": tri_raster_tow_dy,
+        "zow_init": tri_raster_zow_init, "zow_dx": tri_raster_zow_dx, "zow_dy": tri_raster_zow_dy,
+        "tex_en": tri_raster_tex_en, "dtest_en": tri_raster_dtest_en, "dcmp": tri_raster_dcmp,
+        "bl_en": tri_raster_bl_en, "bl_src": tri_raster_bl_src, "bl_dst": tri_raster_bl_dst, "bl_op": tri_raster_bl_op,
+        "fog_en": tri_raster_fog_en, "fog_col": tri_raster_fog_col, "fog_tbl": tri_raster_i_fog_tbl,
+    }
+
+    def set_params(tri):
+        for (name, value) in tri.items():
+            port = ports[name]
+            if isinstance(port, list):
+                for i in range(len(port)):
+                    port[i].next = value[i]
+            else:
+                port.next = value
+
+    @always_comb
+    def drive_comb():
+        colorbuffer_rd_addr.next = depthbuffer_rd_addr.next = tri_raster_rd_pos[0] + (tri_raster_rd_pos[1] << 4)
+        colorbuffer_wr_addr.next = depthbuffer_wr_addr.next = tri_raster_wr_pos[0] + (tri_raster_wr_pos[1] << 4)
+        for i in range(4):
+            colorbuffer_din[i].next = tri_raster_wr_data_rgb[i]
+            colorbuffer_we[i].next = tri_raster_wr_en_rgb[i]
+            depthbuffer_din[i].next = tri_raster_wr_data_d[i]
+            depthbuffer_we[i].next = tri_raster_wr_en_d[i]
+            tri_raster_rd_data_rgb[i].next = colorbuffer_dout[i]
+            tri_raster_rd_data_d[i].next = depthbuffer_dout[i]
+        for i in range(4):
+            tri_raster_i_smp_dat[i].next = test_sampler(tri_raster_o_smp_st[i * 2:(i + 1) * 2], tri_raster_o_smp_ddx, tri_raster_o_smp_ddy)
+        tri_raster_i_smp_ack.next = tri_raster_o_smp_stb and smp_wait == SMP_LATENCY - 1
+
+    smp_wait = Signal(intbv(0)[8:0])
+
+    @always(clk.posedge)
+    def drive_smp():
+        if tri_raster_o_smp_stb and not tri_raster_i_smp_ack:
+            smp_wait.next = smp_wait + 1
+        else:
+            smp_wait.next = 0
+
+    @instance
+    def drive_test():
+        rst.next = 0
+        yield delay(100)
+        rst.next = 1
+        yield delay(100)
+        set_params(test_clear)
+        tri_raster_fill_stb.next = True
+        yield delay(20)
+        tri_raster_fill_stb.next = False
+        begin_time = now()
+        while tri_raster_busy:
+            yield delay(20)
+        print("Cleared in %s cycles" % int((now() - begin_time) / 20))
+        for tri in test_tris:
+            set_params(tri)
+            set_params({name: (0,) * len(port) if isinstance(port, list) else 0 for (name, port) in ports.items() if name not in tri})
+            tri_raster_tri_stb.next = True
+            yield delay(20)
+            tri_raster_tri_stb.next = False
+            begin_time = now()
+            while tri_raster_busy:
+                yield delay(20)
+            print("Triangle finished in %s cycles" % int((now() - begin_time) / 20))
+        # write out the blocks no triangle has touched since the clear
+        tri_raster_flush_stb.next = True
+        yield delay(20)
+        tri_raster_flush_stb.next = False
+        begin_time = now()
+        while tri_raster_busy:
+            yield delay(20)
+        print("Flushed in %s cycles" % int((now() - begin_time) / 20))
+        print("Stall cycles (RASTERLOOP, ZTEST, TEX, COMBINE, BLEND): %s" % ", ".join(str(int(c)) for c in tri_raster_o_stall_cycles))
+        print("Clusters skipped by coarse test: %s" % int(tri_raster_o_quads_skipped))
+        print("Hi-Z rejections (triangles, blocks, clusters): %s" % ", ".join(str(int(c)) for c in tri_raster_o_hiz_rejects))
+        yield delay(40)
+        raise StopSimulation()
+
+    return clk_driver, colorbuffers, depthbuffers, tri_raster, drive_comb, drive_smp, capture, drive_test
+
+ref = TriRasterRef(DIM=DIM)
+ref.fill(test_clear)
+for tri in test_tris:
+    print("Reference pixels written: %s" % np.count_nonzero(ref.draw(tri, sampler=test_sampler)))
+
+# render with every cluster inside triangle bounds visited, then with 4x4 and 8x8 coarse blocks
+for block_size in (0, 4, 8):
+    print("BLOCK=%s:" % block_size)
+    rtl = FrameBuffer(DIM=DIM)
+    inst = Top(rtl, block_size)
+    inst.run_sim()
+    print("Color mismatches: %s" % len(mismatches(rtl.color, ref.color)))
+    print("Depth mismatches: %s" % len(mismatches(rtl.depth, ref.depth)))
+
+# the same scene, rendered as a batch of 256 tiles in a single pass
+batch = TriRasterRef(DIM=DIM, BATCH=(256,))
+batch.fill(test_clear)
+for tri in test_tris:
+    batch.draw(tri, sampler=test_sampler)
+print("Batch mismatches: %s" % len(mismatches(batch.color, np.broadcast_to(ref.color, batch.color.shape))))
@@ -0,0 +1,93 @@
+import time
+
+import numpy as np
+
+from tri_setup import tri_setup, pack_tris, tri_params, COL_ONE, OW_ONE, ZOW_ONE
+from tri_raster_ref import TriRasterRef
+
+# host triangle setup test: setup throughput, how closely the iterators hit the vertex attributes, and whether triangles set up separately for
+# each tile they cover render the same as when set up once for the whole screen
+
+DIM = 32
+
+def make_tris(rng, n, size, screen):
+    # random triangles (of up to size pixels across) inside a screen x screen area, with random colors, texture coordinates, depth & w
+    center = rng.uniform(0, screen, (n, 1, 2))
+    pos = np.concatenate([center + rng.uniform(-size / 2, size / 2, (n, 3, 2)), rng.uniform(0, 1, (n, 3, 1))], axis=-1)
+    col = rng.integers(0, 256, (n, 3, 4))
+    uv = rng.uniform(-2, 2, (n, 3, 2))
+    w = rng.uniform(0.5, 4, (n, 3))
+    return (pos, col, uv, w)
+
+rng = np.random.default_rng(2024)
+
+# throughput
+N = 100000
+(pos, col, uv, w) = make_tris(rng, N, 16, 640)
+begin = time.perf_counter()
+tris = tri_setup(pos, col, uv, w)
+setup_time = time.perf_counter() - begin
+begin = time.perf_counter()
+records = pack_tris(tris)
+pack_time = time.perf_counter() - begin
+print("Set up %s triangles in %.1f ms (%.2f M triangles/s), packed %s words in %.1f ms" % (
+    N, setup_time * 1000, N / setup_time / 1e6, records.size, pack_time * 1000))
+
+# iterators evaluated at each (snapped) vertex, against the vertex's own attributes
+v = np.stack([tris["v0"], tris["v1"], tris["v2"]], axis=1)
+bmin = v.min(axis=1)
+origin = np.where(bmin < 0, bmin, (bmin >> 1) << 1)
+steps = v - origin[:, None, :]
+area = (v[:, 1, 0] - v[:, 0, 0]) * (v[:, 2, 1] - v[:, 0, 1]) - (v[:, 1, 1] - v[:, 0, 1]) * (v[:, 2, 0] - v[:, 0, 0])
+# (vertex attributes follow the vertices when a triangle is turned around)
+flip = (np.rint(pos[:, 1, :2]) != v[:, 1]).any(axis=-1)
+def vertex_attr(a):
+    return np.where(flip.reshape((-1,) + (1,) * (a.ndim - 1)), a[:, [0, 2, 1]], a)
+def at_vertices(name):
+    init = tris[name + "_init"][:, None]
+    dx = tris[name + "_dx"][:, None]
+    dy = tris[name + "_dy"][:, None]
+    if init.ndim == 3:
+        return init + (dx * steps[..., 0:1]) + (dy * steps[..., 1:2])
+    return init + (dx * steps[..., 0]) + (dy * steps[..., 1])
+ok = area != 0
+expect = {
+    "col": vertex_attr(col) * COL_ONE,
+    "1ow": vertex_attr(w) * OW_ONE,
+    "sow": vertex_attr(uv[..., 0] / w) * OW_ONE,
+    "tow": vertex_attr(uv[..., 1] / w) * OW_ONE,
+    "zow": vertex_attr(pos[..., 2]) * ZOW_ONE,
+}
+print("%s degenerate triangles" % np.count_nonzero(~ok))
+for (name, e) in expect.items():
+    err = np.abs(at_vertices(name) - e)[ok]
+    print("%s: max error at vertices %.1f LSB (%.6f%% of full scale)" % (name, err.max(), 100.0 * err.max() / np.abs(e[ok]).max()))
+
+# a 2x2 tile screen: every triangle set up once for the whole screen & rendered as a single 64x64 area, vs set up for each tile
+# (depth/blend off, so only coverage & attribute rounding can differ)
+SCREEN = 2 * DIM
+(pos, col, uv, w) = make_tris(rng, 48, 40, SCREEN)
+whole = TriRasterRef(DIM=SCREEN)
+tiled = TriRasterRef(DIM=DIM, BATCH=(2, 2))
+whole_mask = np.zeros((SCREEN, SCREEN), dtype=bool)
+tiled_mask = np.zeros((2, 2, DIM, DIM), dtype=bool)
+state = {"dtest_en": 0, "dcmp": 1}
+screen_tris = tri_setup(pos, col, uv, w)
+tiles = np.array([(tx, ty) for ty in range(2) for tx in range(2)])
+for i in range(len(pos)):
+    tri = tri_params(screen_tris, i)
+    tri.update(state)
+    whole_mask |= whole.draw(tri)
+    tile_tris = tri_setup(np.repeat(pos[i:i + 1], 4, axis=0), np.repeat(col[i:i + 1], 4, axis=0), np.repeat(uv[i:i + 1], 4, axis=0),
+                          np.repeat(w[i:i + 1], 4, axis=0), tile=tiles, DIM=DIM)
+    tile_tris = {name: value.reshape((2, 2) + value.shape[1:]) for (name, value) in tile_tris.items()}
+    tile_tris.update(state)
+    tiled_mask |= tiled.draw(tile_tris)
+# stitch the tiles back together
+tiled_color = tiled.color.transpose(0, 2, 1, 3).reshape(SCREEN, SCREEN)
+tiled_mask = tiled_mask.transpose(0, 2, 1, 3).reshape(SCREEN, SCREEN)
+diff = np.abs(np.stack([(whole.color >> s) & 0xFF for s in (0, 8, 16, 24)]).astype(np.int64) -
+              np.stack([(tiled_color >> s) & 0xFF for s in (0, 8, 16, 24)]).astype(np.int64))
+print("Pixels covered: %s whole screen, %s tiled, coverage mismatches: %s" % (
+    np.count_nonzero(whole_mask), np.count_nonzero(tiled_mask), np.count_nonzero(whole_mask != tiled_mask)))
+print("Pixels with different colors: %s, max channel difference: %s" % (np.count_nonzero(diff.any(axis=0)), diff.max()))
@@ -1,6 +1,14 @@
 from myhdl import *
 
-t_State = enum("IDLE", "FILL_RGBA4444", "FILL_RGBA8888", "FILL_NXTC_0", "FILL_NXTC_1", "FILL_NXTC_2", "FILL_NXTC_3", "DEC_NXTC")
+from simtrace import EV_MISS, EV_FILL_START, EV_FILL_WORD, EV_FILL_DONE
+from mem import CTI_INCR, CTI_END, BTE_LINEAR
+
+t_State = enum("IDLE", "FILL_RGBA4444", "FILL_RGBA8888", "FILL_NXTC_0", "FILL_NXTC_1", "FILL_NXTC_2", "FILL_NXTC_3", "DEC_NXTC", "FILL_VQ")
+
+# block format of VQ textures
+FMT_VQ = 4
+# block format of NXTC mode 2 (punch-through alpha) textures
+FMT_NXTC_PUNCH = 5
 
 """
 === NXTC FORMAT ===
@@ -21,16 +29,24 @@ The actual logic can be done using simple sign inversions and bit shifts, which
 |10|11|14|15|
 =============
 
-NXTC has two modes: Mode 0 and Mode 1
+NXTC has three modes: Mode 0, Mode 1, and Mode 2
 Mode 0 encodes RGB data, and is assumed to be fully opaque
 Mode 1 extends the width of each block to 128 bits, adding a separate "alpha block". It is encoded in exactly the same way as RGB data, but only the "red" channel is used and is interpreted as alpha channel data.
+Mode 2 ("punch-through") is laid out exactly like mode 0, but reserves index 2 (-1.0) for fully transparent texels, which decode to the median color with an alpha of 0.
+Every other texel is opaque, so cutout textures get 1-bit alpha for the same 64 bits (and two fill words) as mode 0
+
+=== VQ FORMAT ===
+
+VQ blocks are a single 32-bit word (2 bits per texel): four 8-bit indices into a codebook of 2x2 texel quads, one per quad of the block in z-curve order.
+The codebook itself is held on-chip by a VQCodebook shared by every block, which looks up the four entries of the word currently on the fill bus, so a VQ block
+fills in a single bus word with no decode step (see util/vq_enc.py)
 """
 
 # TODO: Support non-swizzled textures?
 
 @block
 def TexBlock(i_rstn, i_clk, i_blk_adr, i_blk_fmt, i_smp, o_dat, i_stb, o_ack,
-             o_mem_adr, i_mem_dat, o_mem_stb, i_mem_ack, ID="texblock"):
+             o_mem_adr, i_mem_dat, o_mem_stb, i_mem_ack, o_mem_cti=None, o_mem_bte=None, i_vq_dat=None, PORTS=1, ID="texblock", TRACE=None):
     """
     Read-only 4x4 texture block cache
 
@@ -38,9 +54,9 @@ def TexBlock(i_rstn, i_clk, i_blk_adr, i_blk_fmt, i_smp, o_dat, i_stb, o_ack,
     - i_clk: Clock signal
     
     - i_blk_adr: Input block address
-    - i_blk_fmt: Input block format (0 = rgba4444, 1 = rgba8888, 2 = nxtc mode 0, 3 = nxtc mode 1)
-    - i_smp: Input index of top-left sample within 4x4 block (x + (y << 2))
-    - o_dat: Output read data [4 - one per texel in 2x2 block]
+    - i_blk_fmt: Input block format (0 = rgba4444, 1 = rgba8888, 2 = nxtc mode 0, 3 = nxtc mode 1, 4 = vq, 5 = nxtc mode 2)
+    - i_smp: Input index of top-left sample within 4x4 block (x + (y << 2)) [PORTS, or a single signal if PORTS is 1]
+    - o_dat: Output read data [4 * PORTS - one per texel in 2x2 block, for each read port]
     - i_stb: Request transaction signal
     - o_ack: Output data valid signal
 
@@ -48,8 +64,24 @@ def TexBlock(i_rstn, i_clk, i_blk_adr, i_blk_fmt, i_smp, o_dat, i_stb, o_ack,
     - i_mem_dat: Input read data from backing memory
     - o_mem_stb: Output request transaction signal to backing memory
     - i_mem_ack: Input data valid signal from backing memory
+    - o_mem_cti: Optional output cycle type to backing memory (each fill is a single incrementing burst over the block's words)
+    - o_mem_bte: Optional output burst type to backing memory
+    - i_vq_dat: Optional input codebook entries of the four quads of the VQ block word on i_mem_dat [16 - z-curve order] (from a VQCodebook, required for VQ blocks)
+
+    - PORTS: Number of read ports (each port reads its own 2x2 cluster from the block every clock)
+    - ID: Name of this block in traces
+    - TRACE: Optional trace sink (see simtrace.py) which records misses & fills
     """
 
+    if o_mem_cti is None:
+        o_mem_cti = Signal(intbv(0)[3:])
+    if o_mem_bte is None:
+        o_mem_bte = Signal(intbv(0)[2:])
+    if i_vq_dat is None:
+        i_vq_dat = [Signal(intbv(0)[32:]) for _ in range(16)]
+
+    smp_ports = [i_smp] if PORTS == 1 else i_smp
+
     # for a single 4x4 block, cache memory is split into four banks
     # this allows a 2x2 square of texels to be read in a single clock cycle, as each texel will be retrieved from a different bank
     _cachemem = [[Signal(intbv(0)[32:]) for _ in range(4)] for _ in range(4)]
@@ -68,6 +100,9 @@ def TexBlock(i_rstn, i_clk, i_blk_adr, i_blk_fmt, i_smp, o_dat, i_stb, o_ack,
     _nxtc_lscale_a = Signal(intbv(0)[10:])
     _nxtc_offsets_a = [Signal(intbv(0)[10:].signed()) for _ in range(16)]
 
+    # texels left transparent by mode 2
+    _nxtc_clear = [Signal(bool(0)) for _ in range(16)]
+
     _nxtc_mode = Signal(0)
 
     # final luma offset = trunc(luma_scale * scale_table[idx])
@@ -89,7 +124,6 @@ def TexBlock(i_rstn, i_clk, i_blk_adr, i_blk_fmt, i_smp, o_dat, i_stb, o_ack,
         elif _state == t_State.IDLE:
             # if requested block address is not loaded in cache, switch to FILL state
             if i_stb and (not _valid or _blkadr != i_blk_adr):
-                print("%s Cache miss (input block address: %s, format: %s, loaded block address: %s, valid: %s)" % (ID, i_blk_adr, i_blk_fmt, _blkadr, _valid))
                 if i_blk_fmt == 0:
                     _state.next = t_State.FILL_RGBA4444
                 elif i_blk_fmt == 1:
@@ -100,6 +134,11 @@ def TexBlock(i_rstn, i_clk, i_blk_adr, i_blk_fmt, i_smp, o_dat, i_stb, o_ack,
                 elif i_blk_fmt == 3:
                     _nxtc_mode.next = 1
                     _state.next = t_State.FILL_NXTC_0
+                elif i_blk_fmt == FMT_VQ:
+                    _state.next = t_State.FILL_VQ
+                elif i_blk_fmt == FMT_NXTC_PUNCH:
+                    _nxtc_mode.next = 2
+                    _state.next = t_State.FILL_NXTC_0
                 _filloffs.next = 0
                 _filladr.next = i_blk_adr
         elif _state == t_State.FILL_RGBA4444:
@@ -148,7 +187,8 @@ def TexBlock(i_rstn, i_clk, i_blk_adr, i_blk_fmt, i_smp, o_dat, i_stb, o_ack,
                     high_bit = low_bit + 2
                     idx = i_mem_dat[high_bit:low_bit]
                     _nxtc_offsets_rgb[i].next = (_nxtc_lscale_rgb if idx[0] else -_nxtc_lscale_rgb) >> (0 if idx[1] else 2)
-                if _nxtc_mode:
+                    _nxtc_clear[i].next = _nxtc_mode == 2 and idx == 2
+                if _nxtc_mode == 1:
                     _state.next = t_State.FILL_NXTC_2
                 else:
                     _state.next = t_State.DEC_NXTC
@@ -168,12 +208,17 @@ def TexBlock(i_rstn, i_clk, i_blk_adr, i_blk_fmt, i_smp, o_dat, i_stb, o_ack,
                 _state.next = t_State.DEC_NXTC
         elif _state == t_State.DEC_NXTC:
             for i in range(16):
-                offs_rgb = _nxtc_offsets_rgb[i]
+                offs_rgb = 0 if _nxtc_clear[i] else _nxtc_offsets_rgb[i]
                 offs_a = _nxtc_offsets_a[i]
                 r = sat(_nxtc_median_rgb[8:0] + offs_rgb)
                 g = sat(_nxtc_median_rgb[16:8] + offs_rgb)
                 b = sat(_nxtc_median_rgb[24:16] + offs_rgb)
-                a = sat(_nxtc_median_a + offs_a) if _nxtc_mode else intbv(255)[8:0]
+                if _nxtc_mode == 1:
+                    a = sat(_nxtc_median_a + offs_a)
+                elif _nxtc_clear[i]:
+                    a = intbv(0)[8:0]
+                else:
+                    a = intbv(255)[8:0]
                 col = concat(a, b, g, r)
                 bnk = i & 3
                 bnkoffs = i >> 2
@@ -181,47 +226,86 @@ def TexBlock(i_rstn, i_clk, i_blk_adr, i_blk_fmt, i_smp, o_dat, i_stb, o_ack,
             _blkadr.next = _filladr
             _valid.next = True
             _state.next = t_State.IDLE
+        elif _state == t_State.FILL_VQ:
+            # codebook entries are looked up from the block word as it arrives, the entry of quad N fills bank offset N
+            if i_mem_ack:
+                for i in range(16):
+                    _cachemem[i & 3][i >> 2].next = i_vq_dat[i]
+                _blkadr.next = _filladr
+                _valid.next = True
+                _state.next = t_State.IDLE
 
     @always_comb
     def access():
         o_ack.next = _blkadr == i_blk_adr and _valid and i_stb
 
-        sy = i_smp[4:2]
-        sx = i_smp[2:0]
-        smp0 = concat(sy,                   sx)
-        smp1 = concat(sy,                   intbv(sx + 1)[2:])
-        smp2 = concat(intbv(sy + 1)[2:],    sx)
-        smp3 = concat(intbv(sy + 1)[2:],    intbv(sx + 1)[2:])
-
-        bnk0 = concat(smp0[2], smp0[0])
-
-        adr0 = concat(smp0[3], smp0[1])
-        adr1 = concat(smp1[3], smp1[1])
-        adr2 = concat(smp2[3], smp2[1])
-        adr3 = concat(smp3[3], smp3[1])
-
-        if bnk0 == 0:
-            o_dat[0].next = _cachemem[0][adr0]
-            o_dat[1].next = _cachemem[1][adr1]
-            o_dat[2].next = _cachemem[2][adr2]
-            o_dat[3].next = _cachemem[3][adr3]
-        elif bnk0 == 1:
-            o_dat[0].next = _cachemem[1][adr0]
-            o_dat[1].next = _cachemem[0][adr1]
-            o_dat[2].next = _cachemem[3][adr2]
-            o_dat[3].next = _cachemem[2][adr3]
-        elif bnk0 == 2:
-            o_dat[0].next = _cachemem[2][adr0]
-            o_dat[1].next = _cachemem[3][adr1]
-            o_dat[2].next = _cachemem[0][adr2]
-            o_dat[3].next = _cachemem[1][adr3]
-        elif bnk0 == 3:
-            o_dat[0].next = _cachemem[3][adr0]
-            o_dat[1].next = _cachemem[2][adr1]
-            o_dat[2].next = _cachemem[1][adr2]
-            o_dat[3].next = _cachemem[0][adr3]
+        for p in range(PORTS):
+            smp = smp_ports[p]
+            sy = smp[4:2]
+            sx = smp[2:0]
+            smp0 = concat(sy,                   sx)
+            smp1 = concat(sy,                   intbv(sx + 1)[2:])
+            smp2 = concat(intbv(sy + 1)[2:],    sx)
+            smp3 = concat(intbv(sy + 1)[2:],    intbv(sx + 1)[2:])
+
+            bnk0 = concat(smp0[2], smp0[0])
+
+            adr0 = concat(smp0[3], smp0[1])
+            adr1 = concat(smp1[3], smp1[1])
+            adr2 = concat(smp2[3], smp2[1])
+            adr3 = concat(smp3[3], smp3[1])
+
+            if bnk0 == 0:
+                o_dat[(p * 4) + 0].next = _cachemem[0][adr0]
+                o_dat[(p * 4) + 1].next = _cachemem[1][adr1]
+                o_dat[(p * 4) + 2].next = _cachemem[2][adr2]
+                o_dat[(p * 4) + 3].next = _cachemem[3][adr3]
+            elif bnk0 == 1:
+                o_dat[(p * 4) + 0].next = _cachemem[1][adr0]
+                o_dat[(p * 4) + 1].next = _cachemem[0][adr1]
+                o_dat[(p * 4) + 2].next = _cachemem[3][adr2]
+                o_dat[(p * 4) + 3].next = _cachemem[2][adr3]
+            elif bnk0 == 2:
+                o_dat[(p * 4) + 0].next = _cachemem[2][adr0]
+                o_dat[(p * 4) + 1].next = _cachemem[3][adr1]
+                o_dat[(p * 4) + 2].next = _cachemem[0][adr2]
+                o_dat[(p * 4) + 3].next = _cachemem[1][adr3]
+            elif bnk0 == 3:
+                o_dat[(p * 4) + 0].next = _cachemem[3][adr0]
+                o_dat[(p * 4) + 1].next = _cachemem[2][adr1]
+                o_dat[(p * 4) + 2].next = _cachemem[1][adr2]
+                o_dat[(p * 4) + 3].next = _cachemem[0][adr3]
 
         o_mem_adr.next = _filladr + _filloffs
-        o_mem_stb.next = (_state == t_State.FILL_RGBA4444 or _state == t_State.FILL_RGBA8888 or _state == t_State.FILL_NXTC_0 or _state == t_State.FILL_NXTC_1 or _state == t_State.FILL_NXTC_2 or _state == t_State.FILL_NXTC_3)
+        o_mem_stb.next = (_state == t_State.FILL_RGBA4444 or _state == t_State.FILL_RGBA8888 or _state == t_State.FILL_NXTC_0 or _state == t_State.FILL_NXTC_1 or _state == t_State.FILL_NXTC_2 or _state == t_State.FILL_NXTC_3 or
+                          _state == t_State.FILL_VQ)
+
+        # flag the last word of the block's footprint as the end of the burst
+        if ((_state == t_State.FILL_RGBA4444 and _filloffs == 7) or (_state == t_State.FILL_RGBA8888 and _filloffs == 15) or
+            (_state == t_State.FILL_NXTC_1 and _nxtc_mode != 1) or _state == t_State.FILL_NXTC_3 or _state == t_State.FILL_VQ):
+            o_mem_cti.next = CTI_END
+        else:
+            o_mem_cti.next = CTI_INCR
+        o_mem_bte.next = BTE_LINEAR
+
+    if TRACE is None:
+        return reset_and_fill, access
+
+    _trace_src = TRACE.register(ID)
+
+    @always(i_clk.posedge)
+    def trace_access():
+        if i_rstn == 1:
+            if _state == t_State.IDLE and i_stb and (not _valid or _blkadr != i_blk_adr):
+                TRACE.emit(now(), EV_MISS, _trace_src, i_blk_adr, i_blk_fmt)
+            elif o_mem_stb and i_mem_ack:
+                TRACE.emit(now(), EV_FILL_WORD, _trace_src, o_mem_adr, i_mem_dat)
+
+    @always(_state)
+    def trace_fill():
+        if _state == t_State.IDLE:
+            TRACE.emit(now(), EV_FILL_DONE, _trace_src, _blkadr)
+        elif _state == t_State.FILL_RGBA4444 or _state == t_State.FILL_RGBA8888 or _state == t_State.FILL_NXTC_0 or _state == t_State.FILL_VQ:
+            TRACE.emit(now(), EV_FILL_START, _trace_src, _filladr)
 
-    return reset_and_fill, access
\ No newline at end of file
+    return reset_and_fill, access, trace_access, trace_fill
\ No newline at end of file
@@ -5,7 +5,7 @@ from bus_arbiter import BusArbiter
 
 @block
 def TexCache(i_rstn, i_clk, i_tex_adr, i_tex_w, i_tex_h, i_tex_fmt, i_smp, o_dat, i_stb, o_ack,
-             o_mem_adr, i_mem_dat, o_mem_stb, i_mem_ack):
+             o_mem_adr, i_mem_dat, o_mem_stb, i_mem_ack, o_mem_cti=None, o_mem_bte=None, TRACE=None):
     BLOCKS_WIDE = 8
     BLOCKS_HIGH = 8
     TOTAL_BLOCKS = BLOCKS_WIDE * BLOCKS_HIGH
@@ -27,19 +27,26 @@ def TexCache(i_rstn, i_clk, i_tex_adr, i_tex_w, i_tex_h, i_tex_fmt, i_smp, o_dat
     - i_mem_dat: Input read data from backing memory
     - o_mem_stb: Output request transaction signal to backing memory
     - i_mem_ack: Input data valid signal from backing memory
+    - o_mem_cti: Optional output cycle type to backing memory (block fills are issued as bursts)
+    - o_mem_bte: Optional output burst type to backing memory
+
+    - TRACE: Optional trace sink passed to each texture block
     """
 
     tb_i_blk_adr = [Signal(intbv(0)[8:0]) for _ in range(TOTAL_BLOCKS)]
     tb_i_blk_fmt = Signal(intbv(0)[2:0])
     tb_i_smp = Signal(intbv(0)[4:0])
-    tb_o_dat = [[Signal(intbv(0)[32:0]) for _ in range(4)] for _ in range(TOTAL_BLOCKS)]
+    # NOTE: kept as a flat list (4 per block), as always_comb can't infer sensitivity to a nested list of signals
+    tb_o_dat = [Signal(intbv(0)[32:0]) for _ in range(TOTAL_BLOCKS * 4)]
     tb_i_stb = [Signal(bool(0)) for _ in range(TOTAL_BLOCKS)]
     tb_o_ack = [Signal(bool(0)) for _ in range(TOTAL_BLOCKS)]
     tb_o_mem_adr = [Signal(intbv(0)[8:0]) for _ in range(TOTAL_BLOCKS)]
     tb_i_mem_dat = [Signal(intbv(0)[32:0]) for _ in range(TOTAL_BLOCKS)]
     tb_o_mem_stb = [Signal(bool(0)) for _ in range(TOTAL_BLOCKS)]
     tb_i_mem_ack = [Signal(bool(0)) for _ in range(TOTAL_BLOCKS)]
-    blocks = [TexBlock(i_rstn, i_clk, tb_i_blk_adr[i], tb_i_blk_fmt, tb_i_smp, tb_o_dat[i], tb_i_stb[i], tb_o_ack[i], tb_o_mem_adr[i], tb_i_mem_dat[i], tb_o_mem_stb[i], tb_i_mem_ack[i], ID="TB%s" % i) for i in range(TOTAL_BLOCKS)]
+    tb_o_mem_cti = [Signal(intbv(0)[3:]) for _ in range(TOTAL_BLOCKS)]
+    tb_o_mem_bte = [Signal(intbv(0)[2:]) for _ in range(TOTAL_BLOCKS)]
+    blocks = [TexBlock(i_rstn, i_clk, tb_i_blk_adr[i], tb_i_blk_fmt, tb_i_smp, tb_o_dat[i * 4:(i + 1) * 4], tb_i_stb[i], tb_o_ack[i], tb_o_mem_adr[i], tb_i_mem_dat[i], tb_o_mem_stb[i], tb_i_mem_ack[i], tb_o_mem_cti[i], tb_o_mem_bte[i], ID="TB%s" % i, TRACE=TRACE) for i in range(TOTAL_BLOCKS)]
 
     arbiter_i_adr = [Signal(intbv(0)[32:]) for _ in range(TOTAL_BLOCKS)]
     arbiter_i_dat = [Signal(intbv(0)[32:]) for _ in range(TOTAL_BLOCKS)]
@@ -55,7 +62,8 @@ def TexCache(i_rstn, i_clk, i_tex_adr, i_tex_w, i_tex_h, i_tex_fmt, i_smp, o_dat
     arbiter_i_mem_ack = Signal(bool(0))
     arbiter = BusArbiter(i_rstn, i_clk, arbiter_i_adr, arbiter_i_dat, arbiter_o_dat, arbiter_i_we, arbiter_i_stb, arbiter_o_ack,
                          arbiter_o_mem_adr, arbiter_o_mem_dat, arbiter_i_mem_dat, arbiter_o_mem_we, arbiter_o_mem_stb, arbiter_i_mem_ack,
-                         NUM_PORTS=TOTAL_BLOCKS)
+                         i_cti=tb_o_mem_cti, i_bte=tb_o_mem_bte, o_mem_cti=o_mem_cti, o_mem_bte=o_mem_bte,
+                         NUM_PORTS=TOTAL_BLOCKS, MODE="round_robin")
     
     # log2 of size per block of each format (RGBA4444, RGBA8888, NXTC mode 0, and NXTC mode 1)
     _blk_shift_table = (3, 4, 1, 2)
@@ -147,10 +155,10 @@ def TexCache(i_rstn, i_clk, i_tex_adr, i_tex_w, i_tex_h, i_tex_fmt, i_smp, o_dat
                 tb_i_blk_adr[i].next = 0
 
         # assemble output data from blocks we sampled from
-        o_dat[0].next = tb_o_dat[blk00][0]
-        o_dat[1].next = tb_o_dat[blk01][1]
-        o_dat[2].next = tb_o_dat[blk10][2]
-        o_dat[3].next = tb_o_dat[blk11][3]
+        o_dat[0].next = tb_o_dat[(blk00 * 4) + 0]
+        o_dat[1].next = tb_o_dat[(blk01 * 4) + 1]
+        o_dat[2].next = tb_o_dat[(blk10 * 4) + 2]
+        o_dat[3].next = tb_o_dat[(blk11 * 4) + 3]
         ####
         
         for i in range(TOTAL_BLOCKS):
@@ -0,0 +1,329 @@
+from myhdl import *
+
+from texblock import TexBlock, FMT_VQ
+from vq_codebook import VQCodebook
+from bus_arbiter import BusArbiter
+
+@block
+def SetAssocTexCache(i_rstn, i_clk, i_tex_adr, i_tex_w, i_tex_h, i_tex_fmt, i_smp, o_dat, i_stb, o_ack,
+                     o_mem_adr, i_mem_dat, o_mem_stb, i_mem_ack, o_mem_cti=None, o_mem_bte=None,
+                     o_hits=None, o_misses=None, i_tex_cb_adr=None, o_cb_loads=None,
+                     SETS=16, WAYS=4, PORTS=1, TRACE=None):
+    """
+    Read-only set associative texture cache, drop-in replacement for TexCache
+
+    Each line holds a single 4x4 texture block (backed by a TexBlock, which also takes care of fetching & decoding the block).
+    Lines are tagged with the full block address in a shared tag array, so blocks from any texture, mip level, or position in the texture may share the cache.
+    The set index is taken from the low bits of the block's X and Y position, which guarantees that the (up to) four blocks overlapped by a 2x2 cluster always
+    map to four different sets, so all four can be looked up (and filled) in parallel.
+    Each set uses LRU replacement.
+
+    If i_tex_cb_adr is given, the cache also holds a VQCodebook (sharing the cache's bus port with the TexBlocks) and can sample VQ textures: a lookup into a
+    VQ texture waits until the texture's codebook is loaded, which only happens when a VQ texture with a different codebook is sampled.
+    NOTE: lines are tagged by block address only, so two VQ textures may only share block addresses if they also share their codebook
+
+    With PORTS > 1 the cache takes a sample position per port (e.g. one for each pixel of a 2x2 quad) and serves every port whose 2x2 cluster lies within
+    the same 2x2 group of blocks as the first port in a single lookup, as each TexBlock has a read port per cache port. Ports which fall outside of that group
+    (e.g. a heavily minified quad) are served by further lookups on the following clocks, and o_ack is raised once every port has been served.
+
+    - i_rst: Reset signal
+    - i_clk: Clock signal
+
+    - i_tex_adr: Address of texture in memory
+    - i_tex_w: log2 of texture width (of the mip level at i_tex_adr)
+    - i_tex_h: log2 of texture height (of the mip level at i_tex_adr)
+    - i_tex_fmt: Texture block format (see TexBlock)
+    - i_smp: Texture sample position (x, y) [2 * PORTS - x, y for each port]
+    - o_dat: Output sampled 2x2 texel cluster [4 * PORTS - one cluster for each port]
+
+    - o_mem_adr: Output read address to backing memory
+    - i_mem_dat: Input read data from backing memory
+    - o_mem_stb: Output request transaction signal to backing memory
+    - i_mem_ack: Input data valid signal from backing memory
+    - o_mem_cti: Optional output cycle type to backing memory (block fills are issued as bursts)
+    - o_mem_bte: Optional output burst type to backing memory
+
+    - o_hits: Optional output count of block lookups which hit
+    - o_misses: Optional output count of block lookups which missed
+    - i_tex_cb_adr: Optional address of the codebook of VQ textures in memory (VQ textures are only supported if given)
+    - o_cb_loads: Optional output count of codebook loads
+
+    - SETS: Number of sets (power of two, at least 4)
+    - WAYS: Number of ways per set
+    - PORTS: Number of sample ports
+    - TRACE: Optional trace sink passed to each texture block
+    """
+
+    TOTAL_BLOCKS = SETS * WAYS
+    VQ = i_tex_cb_adr is not None
+    # the codebook gets the arbiter port after the blocks'
+    NUM_PORTS = TOTAL_BLOCKS + 1 if VQ else TOTAL_BLOCKS
+    SET_BITS = (SETS - 1).bit_length()
+    SET_X_BITS = (SET_BITS + 1) >> 1
+    SET_X_MASK = (1 << SET_X_BITS) - 1
+    SET_Y_MASK = (1 << (SET_BITS - SET_X_BITS)) - 1
+
+    assert SETS >= 4 and SETS == 1 << SET_BITS, "SETS must be a power of two, and at least 4"
+
+    if o_hits is None:
+        o_hits = Signal(intbv(0)[32:])
+    if o_misses is None:
+        o_misses = Signal(intbv(0)[32:])
+
+    tb_i_blk_adr = [Signal(intbv(0)[32:0]) for _ in range(TOTAL_BLOCKS)]
+    tb_i_blk_fmt = Signal(intbv(0)[3:0])
+    tb_i_smp = [Signal(intbv(0)[4:0]) for _ in range(PORTS)]
+    # NOTE: kept as a flat list (4 per port per block), as always_comb can't infer sensitivity to a nested list of signals
+    tb_o_dat = [Signal(intbv(0)[32:0]) for _ in range(TOTAL_BLOCKS * PORTS * 4)]
+    tb_i_stb = [Signal(bool(0)) for _ in range(TOTAL_BLOCKS)]
+    tb_o_ack = [Signal(bool(0)) for _ in range(TOTAL_BLOCKS)]
+    tb_o_mem_adr = [Signal(intbv(0)[32:0]) for _ in range(TOTAL_BLOCKS)]
+    tb_i_mem_dat = [Signal(intbv(0)[32:0]) for _ in range(TOTAL_BLOCKS)]
+    tb_o_mem_stb = [Signal(bool(0)) for _ in range(TOTAL_BLOCKS)]
+    tb_i_mem_ack = [Signal(bool(0)) for _ in range(TOTAL_BLOCKS)]
+    tb_o_mem_cti = [Signal(intbv(0)[3:]) for _ in range(TOTAL_BLOCKS)]
+    tb_o_mem_bte = [Signal(intbv(0)[2:]) for _ in range(TOTAL_BLOCKS)]
+    # codebook entries of the VQ block word on the bus, shared by every block
+    cb_o_dat = [Signal(intbv(0)[32:0]) for _ in range(16)]
+    blocks = [TexBlock(i_rstn, i_clk, tb_i_blk_adr[i], tb_i_blk_fmt, tb_i_smp[0] if PORTS == 1 else tb_i_smp, tb_o_dat[i * PORTS * 4:(i + 1) * PORTS * 4], tb_i_stb[i], tb_o_ack[i],
+                        tb_o_mem_adr[i], tb_i_mem_dat[i], tb_o_mem_stb[i], tb_i_mem_ack[i], tb_o_mem_cti[i], tb_o_mem_bte[i], cb_o_dat,
+                        PORTS=PORTS, ID="S%sW%s" % (i // WAYS, i % WAYS), TRACE=TRACE) for i in range(TOTAL_BLOCKS)]
+
+    arbiter_i_adr = [Signal(intbv(0)[32:]) for _ in range(NUM_PORTS)]
+    arbiter_i_dat = [Signal(intbv(0)[32:]) for _ in range(NUM_PORTS)]
+    arbiter_o_dat = Signal(intbv(0)[32:])
+    arbiter_i_we  = [Signal(bool(0)) for _ in range(NUM_PORTS)]
+    arbiter_i_stb = [Signal(bool(0)) for _ in range(NUM_PORTS)]
+    arbiter_o_ack = [Signal(bool(0)) for _ in range(NUM_PORTS)]
+    arbiter_o_mem_adr = Signal(intbv(0)[32:])
+    arbiter_o_mem_dat = Signal(intbv(0)[32:])
+    arbiter_i_mem_dat = Signal(intbv(0)[32:])
+    arbiter_o_mem_we  = Signal(bool(0))
+    arbiter_o_mem_stb = Signal(bool(0))
+    arbiter_i_mem_ack = Signal(bool(0))
+    arbiter_i_cti = tb_o_mem_cti + [Signal(intbv(0)[3:])] if VQ else tb_o_mem_cti
+    arbiter_i_bte = tb_o_mem_bte + [Signal(intbv(0)[2:])] if VQ else tb_o_mem_bte
+    arbiter = BusArbiter(i_rstn, i_clk, arbiter_i_adr, arbiter_i_dat, arbiter_o_dat, arbiter_i_we, arbiter_i_stb, arbiter_o_ack,
+                         arbiter_o_mem_adr, arbiter_o_mem_dat, arbiter_i_mem_dat, arbiter_o_mem_we, arbiter_o_mem_stb, arbiter_i_mem_ack,
+                         i_cti=arbiter_i_cti, i_bte=arbiter_i_bte, o_mem_cti=o_mem_cti, o_mem_bte=o_mem_bte,
+                         NUM_PORTS=NUM_PORTS, MODE="round_robin")
+
+    # lookups are held off (while i_stb is high) until a VQ texture's codebook is loaded
+    _stb = Signal(bool(0))
+    if VQ:
+        cb_i_stb = Signal(bool(0))
+        cb_o_ready = Signal(bool(0))
+        codebook = VQCodebook(i_rstn, i_clk, i_tex_cb_adr, cb_i_stb, cb_o_ready, arbiter_o_dat, cb_o_dat,
+                              arbiter_i_adr[TOTAL_BLOCKS], arbiter_o_dat, arbiter_i_stb[TOTAL_BLOCKS], arbiter_o_ack[TOTAL_BLOCKS],
+                              arbiter_i_cti[TOTAL_BLOCKS], arbiter_i_bte[TOTAL_BLOCKS], o_cb_loads)
+
+        @always_comb
+        def codebook_logic():
+            cb_i_stb.next = i_stb and i_tex_fmt == FMT_VQ
+            _stb.next = i_stb and (i_tex_fmt != FMT_VQ or cb_o_ready)
+    else:
+        codebook = []
+
+        @always_comb
+        def codebook_logic():
+            _stb.next = i_stb
+
+    # shared tag array, indexed by (set * WAYS) + way
+    _tag = [Signal(intbv(0)[32:]) for _ in range(TOTAL_BLOCKS)]
+    _valid = [Signal(bool(0)) for _ in range(TOTAL_BLOCKS)]
+    # LRU age of each way within its set (0 = most recently used, WAYS - 1 = least recently used)
+    _age = [Signal(intbv(0, min=0, max=WAYS)) for _ in range(TOTAL_BLOCKS)]
+
+    # lookup results for each of the four blocks in the 2x2 group of blocks being looked up
+    _slot_adr = [Signal(intbv(0)[32:]) for _ in range(4)]
+    _slot_set = [Signal(intbv(0, min=0, max=SETS)) for _ in range(4)]
+    _slot_way = [Signal(intbv(0, min=0, max=WAYS)) for _ in range(4)]
+    _slot_hit = [Signal(bool(0)) for _ in range(4)]
+    _slot_used = [Signal(bool(0)) for _ in range(4)]
+    # which slot each texel of each port's 2x2 cluster is read from
+    _texel_slot = [Signal(intbv(0, min=0, max=4)) for _ in range(PORTS * 4)]
+    # ports served by the current lookup
+    _serve = [Signal(bool(0)) for _ in range(PORTS)]
+    _lookup_ack = Signal(bool(0))
+
+    # ports served by earlier lookups of the current request, along with their data
+    _done = [Signal(bool(0)) for _ in range(PORTS)]
+    _done_dat = [Signal(intbv(0)[32:0]) for _ in range(PORTS * 4)]
+
+    _pending = Signal(bool(0))
+
+    # log2 of size per block of each format (RGBA4444, RGBA8888, NXTC mode 0, NXTC mode 1, VQ, and NXTC mode 2)
+    _blk_shift_table = (3, 4, 1, 2, 0, 1)
+
+    @always_comb
+    def lookup():
+        txw = 1 << i_tex_w
+        txh = 1 << i_tex_h
+
+        blw = txw >> 2
+        blh = txh >> 2
+
+        blw_mask = blw - 1
+        blh_mask = blh - 1
+
+        # the group of blocks is anchored on the first port which hasn't been served yet
+        lead = 0
+        for p in range(PORTS - 1, -1, -1):
+            if not _done[p]:
+                lead = p
+
+        blk_x0 = concat(intbv(0)[11:0], i_smp[lead * 2][9:2]) & blw_mask
+        blk_x1 = (concat(intbv(0)[11:0], i_smp[lead * 2][9:2]) + 1) & blw_mask
+
+        blk_y0 = concat(intbv(0)[11:0], i_smp[(lead * 2) + 1][9:2]) & blh_mask
+        blk_y1 = (concat(intbv(0)[11:0], i_smp[(lead * 2) + 1][9:2]) + 1) & blh_mask
+
+        blk_shift = _blk_shift_table[i_tex_fmt]
+
+        blk_x = (blk_x0, blk_x1, blk_x0, blk_x1)
+        blk_y = (blk_y0, blk_y0, blk_y1, blk_y1)
+
+        for q in range(4):
+            adr = i_tex_adr + ((blk_x[q] + (blk_y[q] * blw)) << blk_shift)
+            s = (blk_x[q] & SET_X_MASK) | ((blk_y[q] & SET_Y_MASK) << SET_X_BITS)
+
+            # search set for block, otherwise pick a victim (first invalid way, or least recently used way)
+            hit = False
+            way = 0
+            victim = 0
+            for w in range(WAYS):
+                line = (s * WAYS) + w
+                if _valid[line] and _tag[line] == adr and not hit:
+                    hit = True
+                    way = w
+            for w in range(WAYS - 1, -1, -1):
+                line = (s * WAYS) + w
+                if _age[line] == WAYS - 1:
+                    victim = w
+            for w in range(WAYS - 1, -1, -1):
+                line = (s * WAYS) + w
+                if not _valid[line]:
+                    victim = w
+
+            _slot_adr[q].next = adr
+            _slot_set[q].next = s
+            _slot_way[q].next = way if hit else victim
+            _slot_hit[q].next = hit
+
+        # find the block column/row of each port's cluster relative to the group. a cluster only crosses into the next block column/row if its
+        # top-left sample is on the block's last column/row (a texture only one block wide/high wraps back around into the same block)
+        used = [False, False, False, False]
+        for p in range(PORTS):
+            rx0 = (int(i_smp[p * 2][9:2]) - blk_x0) & blw_mask
+            ry0 = (int(i_smp[(p * 2) + 1][9:2]) - blk_y0) & blh_mask
+            rx1 = ((rx0 + 1) & blw_mask) if i_smp[p * 2][2:0] == 3 else rx0
+            ry1 = ((ry0 + 1) & blh_mask) if i_smp[(p * 2) + 1][2:0] == 3 else ry0
+            serve = not _done[p] and rx0 <= 1 and rx1 <= 1 and ry0 <= 1 and ry1 <= 1
+            for k in range(4):
+                q = (rx1 if k & 1 else rx0) | ((ry1 if k & 2 else ry0) << 1)
+                if serve:
+                    used[q] = True
+                    _texel_slot[(p * 4) + k].next = q
+                else:
+                    _texel_slot[(p * 4) + k].next = 0
+            _serve[p].next = serve
+
+        for q in range(4):
+            _slot_used[q].next = used[q]
+
+    @always_comb
+    def comb_logic():
+        # route each slot's block address into the cache line it hits (or is about to be filled into)
+        for i in range(TOTAL_BLOCKS):
+            tb_i_blk_adr[i].next = 0
+            tb_i_stb[i].next = False
+
+        ack = _stb
+        for q in range(4):
+            if _slot_used[q]:
+                line = (_slot_set[q] * WAYS) + _slot_way[q]
+                tb_i_blk_adr[line].next = _slot_adr[q]
+                tb_i_stb[line].next = _stb
+                ack = ack and _slot_hit[q] and tb_o_ack[line]
+        _lookup_ack.next = ack
+
+        # the request is done once every port has been served
+        for p in range(PORTS):
+            ack = ack and (_done[p] or _serve[p])
+        o_ack.next = ack
+
+        tb_i_blk_fmt.next = i_tex_fmt
+        for p in range(PORTS):
+            tb_i_smp[p].next = concat(i_smp[(p * 2) + 1][2:], i_smp[p * 2][2:])
+
+        # assemble output data from blocks we sampled from (or from the data held for ports served by an earlier lookup)
+        for p in range(PORTS):
+            for k in range(4):
+                if _done[p]:
+                    o_dat[(p * 4) + k].next = _done_dat[(p * 4) + k]
+                else:
+                    q = _texel_slot[(p * 4) + k]
+                    line = (_slot_set[q] * WAYS) + _slot_way[q]
+                    o_dat[(p * 4) + k].next = tb_o_dat[(((line * PORTS) + p) * 4) + k]
+
+        for i in range(TOTAL_BLOCKS):
+            arbiter_i_adr[i].next = tb_o_mem_adr[i]
+            tb_i_mem_dat[i].next = arbiter_o_dat
+            arbiter_i_stb[i].next = tb_o_mem_stb[i]
+            tb_i_mem_ack[i].next = arbiter_o_ack[i]
+
+        o_mem_adr.next = arbiter_o_mem_adr
+        arbiter_i_mem_dat.next = i_mem_dat
+        o_mem_stb.next = arbiter_o_mem_stb
+        arbiter_i_mem_ack.next = i_mem_ack
+
+    @always(i_clk.posedge, i_rstn)
+    def tag_logic():
+        if i_rstn == 0:
+            for i in range(TOTAL_BLOCKS):
+                _valid[i].next = False
+                _age[i].next = i % WAYS
+            for p in range(PORTS):
+                _done[p].next = False
+            _pending.next = False
+            o_hits.next = 0
+            o_misses.next = 0
+        elif _stb:
+            hits = 0
+            misses = 0
+            for q in range(4):
+                if _slot_used[q]:
+                    base = _slot_set[q] * WAYS
+                    line = base + _slot_way[q]
+                    # on a miss, allocate the victim way. its TexBlock starts filling on this same clock
+                    if not _slot_hit[q]:
+                        _tag[line].next = _slot_adr[q]
+                        _valid[line].next = True
+                        misses += 1
+                    else:
+                        hits += 1
+                    # mark way as most recently used
+                    for w in range(WAYS):
+                        if w == _slot_way[q]:
+                            _age[base + w].next = 0
+                        elif _age[base + w] < _age[line]:
+                            _age[base + w].next = _age[base + w] + 1
+            # only count lookups on the first clock of each lookup
+            if not _pending:
+                o_hits.next = o_hits + hits
+                o_misses.next = o_misses + misses
+            _pending.next = not _lookup_ack
+            # hold on to the data of ports served by this lookup until the rest of the request has been served
+            for p in range(PORTS):
+                if o_ack:
+                    _done[p].next = False
+                elif _lookup_ack and _serve[p]:
+                    _done[p].next = True
+                    for k in range(4):
+                        _done_dat[(p * 4) + k].next = o_dat[(p * 4) + k]
+        else:
+            for p in range(PORTS):
+                _done[p].next = False
+            _pending.next = False
+
+    return (blocks, arbiter, codebook, codebook_logic, lookup, comb_logic, tag_logic)
@@ -134,8 +134,8 @@ def TexSampler(i_rstn, i_clk, i_stb, i_st, i_ddx, i_ddy, i_w, i_h, i_clmp_s, i_c
 
         o_tc_mip.next = mip
 
-        mipw = i_w >> mip
-        miph = i_h >> mip
+        mipw = i_w - mip
+        miph = i_h - mip
 
         maxw = (1 << mipw) - 1
         maxh = (1 << miph) - 1
@@ -0,0 +1,207 @@
+from myhdl import *
+
+@block
+def TexSamplerPipe(i_rstn, i_clk, i_valid, o_ready, i_st, i_ddx, i_ddy, i_w, i_h, i_clmp_s, i_clmp_t, i_flt, i_mip, o_dat, o_valid, i_ready,
+                   o_tc_stb, o_tc_smp, o_tc_mip, i_tc_dat, i_tc_ack):
+    """
+    Pipelined version of TexSampler, which accepts a new sample request every clock as long as the TexCache keeps hitting
+    Results are bit-identical to TexSampler
+
+    Stages:
+    - ADDR: mip level & sample position are calculated from the request (comb), and registered on accept
+    - CACHE: sample position is sent to the TexCache, 2x2 cluster is registered on ack along with per-channel horizontal deltas
+    - HLERP: top & bottom rows of the cluster are lerped horizontally
+    - VLERP: rows are lerped vertically into the output color
+
+    Each stage holds its contents until the next stage can take them, so the pipeline stalls on cache misses or when the output isn't ready
+
+    - i_valid: Input request valid signal
+    - o_ready: Output ready to accept request signal
+    - i_st: Input texture coordinates (S,T) 24.12 fixed point
+    - i_ddx: Input change of (S, T) wrt X (24.12 fixed point)
+    - i_ddy: Input change of (S, T) wrt Y (24.12 fixed point)
+    - i_w: log2 of texture width
+    - i_h: log2 of texture height
+    - i_clmp_s: Clamp S
+    - i_clmp_t: Clamp T
+    - i_flt: Input enable filter signal
+    - i_mip: Input enable mip signal
+    - o_dat: Output sampled color
+    - o_valid: Output valid signal
+    - i_ready: Input ready to accept output signal
+
+    - o_tc_stb: Output request signal to backing TexCache
+    - o_tc_smp: Output sample coordinate to backing TexCache
+    - o_tc_mip: Output mip level to backing TexCache
+    - i_tc_dat: Input sample data from backing TexCache
+    - i_tc_ack: Input ack signal from backing TexCache
+    """
+
+    # ADDR -> CACHE
+    _c_valid = Signal(bool(0))
+    _c_smp = [Signal(intbv(0)[32:]) for _ in range(2)]
+    _c_mip = Signal(intbv(0)[4:])
+    _c_fx = Signal(intbv(0)[12:])
+    _c_fy = Signal(intbv(0)[12:])
+    _c_flt = Signal(bool(0))
+
+    # CACHE -> HLERP
+    _h_valid = Signal(bool(0))
+    _h_samples = [Signal(intbv(0)[32:]) for _ in range(4)]
+    _h_dx0 = [Signal(intbv(0)[32:].signed()) for _ in range(4)]
+    _h_dx1 = [Signal(intbv(0)[32:].signed()) for _ in range(4)]
+    _h_fx = Signal(intbv(0)[12:])
+    _h_fy = Signal(intbv(0)[12:])
+    _h_flt = Signal(bool(0))
+
+    # HLERP -> VLERP
+    _v_valid = Signal(bool(0))
+    _v_dat = Signal(intbv(0)[32:])
+    _v_x0 = [Signal(intbv(0)[32:].signed()) for _ in range(4)]
+    _v_dy = [Signal(intbv(0)[32:].signed()) for _ in range(4)]
+    _v_fy = Signal(intbv(0)[12:])
+    _v_flt = Signal(bool(0))
+
+    # VLERP -> output
+    _o_valid = Signal(bool(0))
+
+    # ADDR stage results
+    _a_smp = [Signal(intbv(0)[32:]) for _ in range(2)]
+    _a_mip = Signal(intbv(0)[4:])
+    _a_fx = Signal(intbv(0)[12:])
+    _a_fy = Signal(intbv(0)[12:])
+
+    # stage advance signals
+    _o_ready = Signal(bool(0))
+    _v_ready = Signal(bool(0))
+    _h_ready = Signal(bool(0))
+    _c_ready = Signal(bool(0))
+
+    def clamp_coord(v, vmin, vmax):
+        if v < vmin:
+            return vmin
+        elif v >= vmax:
+            return vmax
+        return v
+
+    def log2_int(a, BITLEN=32):
+        for i in range(BITLEN - 1, -1, -1):
+            if a[i]:
+                return i
+        return 0
+
+    @always_comb
+    def addr_logic():
+        # calculate mip level from ddx/ddy (same as TexSampler)
+        dsdx = i_ddx[0] << i_w
+        dtdx = i_ddx[1] << i_w
+        dsdy = i_ddy[0] << i_h
+        dtdy = i_ddy[1] << i_h
+
+        ddx = ((dsdx * dsdx) >> 12) + ((dtdx * dtdx) >> 12)
+        ddy = ((dsdy * dsdy) >> 12) + ((dtdy * dtdy) >> 12)
+
+        maxmip_w = i_w - 2 if i_w >= 2 else 0
+        maxmip_h = i_h - 2 if i_h >= 2 else 0
+        maxmip = min(maxmip_w, maxmip_h)
+        mip = min(log2_int(intbv(max(ddx, ddy))[32:12], BITLEN=20) >> 1, maxmip) if i_mip else 0
+
+        mipw = i_w - mip
+        miph = i_h - mip
+
+        maxw = (1 << mipw) - 1
+        maxh = (1 << miph) - 1
+
+        # note: half texel bias
+        x = (i_st[0] << mipw) - 2048
+        y = (i_st[1] << miph) - 2048
+
+        sx = clamp_coord(x, 0, maxw << 12) if i_clmp_s else x
+        sy = clamp_coord(y, 0, maxh << 12) if i_clmp_t else y
+
+        _a_mip.next = mip
+        _a_smp[0].next = (sx >> 12) & maxw
+        _a_smp[1].next = (sy >> 12) & maxh
+        _a_fx.next = sx & 0xFFF
+        _a_fy.next = sy & 0xFFF
+
+    @always_comb
+    def ready_logic():
+        # a stage can take new contents if it's empty, or if its current contents move on this clock
+        o_valid.next = _o_valid
+        _o_ready.next = not _o_valid or i_ready
+        _v_ready.next = not _v_valid or _o_ready
+        _h_ready.next = not _h_valid or _v_ready
+        _c_ready.next = not _c_valid or (i_tc_ack and _h_ready)
+
+    @always_comb
+    def port_logic():
+        o_ready.next = _c_ready
+        o_tc_stb.next = _c_valid and _h_ready
+        o_tc_smp[0].next = _c_smp[0]
+        o_tc_smp[1].next = _c_smp[1]
+        o_tc_mip.next = _c_mip
+
+    @always(i_clk.posedge, i_rstn)
+    def clk_logic():
+        if i_rstn == 0:
+            _c_valid.next = False
+            _h_valid.next = False
+            _v_valid.next = False
+            _o_valid.next = False
+        else:
+            # VLERP -> output
+            if _o_ready:
+                _o_valid.next = _v_valid
+                if _v_valid:
+                    if _v_flt:
+                        r = intbv(_v_x0[0] + ((_v_dy[0] * _v_fy) >> 12))[8:0]
+                        g = intbv(_v_x0[1] + ((_v_dy[1] * _v_fy) >> 12))[8:0]
+                        b = intbv(_v_x0[2] + ((_v_dy[2] * _v_fy) >> 12))[8:0]
+                        a = intbv(_v_x0[3] + ((_v_dy[3] * _v_fy) >> 12))[8:0]
+                        o_dat.next = concat(a, b, g, r)
+                    else:
+                        o_dat.next = _v_dat
+
+            # HLERP -> VLERP
+            if _v_ready:
+                _v_valid.next = _h_valid
+                if _h_valid:
+                    for c in range(4):
+                        lo = c * 8
+                        hi = lo + 8
+                        x0 = _h_samples[0][hi:lo] + ((_h_dx0[c] * _h_fx) >> 12)
+                        x1 = _h_samples[2][hi:lo] + ((_h_dx1[c] * _h_fx) >> 12)
+                        _v_x0[c].next = x0
+                        _v_dy[c].next = x1 - x0
+                    _v_dat.next = _h_samples[0]
+                    _v_fy.next = _h_fy
+                    _v_flt.next = _h_flt
+
+            # CACHE -> HLERP
+            if _h_ready:
+                _h_valid.next = _c_valid and i_tc_ack
+                if _c_valid and i_tc_ack:
+                    for c in range(4):
+                        lo = c * 8
+                        hi = lo + 8
+                        _h_dx0[c].next = concat(intbv(0)[24:0], i_tc_dat[1][hi:lo]) - concat(intbv(0)[24:0], i_tc_dat[0][hi:lo])
+                        _h_dx1[c].next = concat(intbv(0)[24:0], i_tc_dat[3][hi:lo]) - concat(intbv(0)[24:0], i_tc_dat[2][hi:lo])
+                    for i in range(4):
+                        _h_samples[i].next = i_tc_dat[i]
+                    _h_fx.next = _c_fx
+                    _h_fy.next = _c_fy
+                    _h_flt.next = _c_flt
+
+            # ADDR -> CACHE
+            if _c_ready:
+                _c_valid.next = i_valid
+                if i_valid:
+                    _c_smp[0].next = _a_smp[0]
+                    _c_smp[1].next = _a_smp[1]
+                    _c_mip.next = _a_mip
+                    _c_fx.next = _a_fx
+                    _c_fy.next = _a_fy
+                    _c_flt.next = i_flt
+
+    return addr_logic, ready_logic, port_logic, clk_logic
\ No newline at end of file
@@ -0,0 +1,149 @@
+from myhdl import *
+
+t_State = enum("IDLE", "LERP1", "LERP2")
+
+@block
+def QuadTexSampler(i_rstn, i_clk, i_stb, i_st, i_ddx, i_ddy, i_w, i_h, i_clmp_s, i_clmp_t, i_flt, i_mip, o_dat, o_ack,
+                   o_tc_stb, o_tc_smp, o_tc_mip, i_tc_dat, i_tc_ack):
+    """
+    Version of TexSampler which samples all four pixels of a 2x2 quad at once, to be paired with a SetAssocTexCache with PORTS=4
+    A single mip level is picked for the whole quad from the quad's d(S, T)/dx and d(S, T)/dy, and each pixel's sample is otherwise bit-identical to TexSampler
+
+    - i_stb: Input request signal
+    - i_st: Input texture coordinates (S,T) 24.12 fixed point [8 - S, T for each pixel of the quad]
+    - i_ddx: Input change of (S, T) wrt X across the quad (24.12 fixed point)
+    - i_ddy: Input change of (S, T) wrt Y across the quad (24.12 fixed point)
+    - i_w: log2 of texture width
+    - i_h: log2 of texture height
+    - i_clmp_s: Clamp S
+    - i_clmp_t: Clamp T
+    - i_flt: Input enable filter signal
+    - i_mip: Input enable mip signal
+    - o_dat: Output sampled colors [4 - one per pixel of the quad]
+    - o_ack: Output valid signal
+
+    - o_tc_stb: Output request signal to backing TexCache
+    - o_tc_smp: Output sample coordinates to backing TexCache [8 - x, y for each pixel of the quad]
+    - o_tc_mip: Output mip level to backing TexCache
+    - i_tc_dat: Input sample data from backing TexCache [16 - 2x2 texel cluster for each pixel of the quad]
+    - i_tc_ack: Input ack signal from backing TexCache
+    """
+
+    _state = Signal(t_State.IDLE)
+
+    # NOTE: per-pixel, per-channel state is kept in flat lists indexed by (pixel * 4) + channel (r, g, b, a)
+    _samples = [Signal(intbv(0)[32:]) for _ in range(16)]
+
+    _px = [Signal(intbv(0)[32:].signed()) for _ in range(4)]
+    _py = [Signal(intbv(0)[32:].signed()) for _ in range(4)]
+
+    _dx0 = [Signal(intbv(0)[32:].signed()) for _ in range(16)]
+    _dx1 = [Signal(intbv(0)[32:].signed()) for _ in range(16)]
+    _dy = [Signal(intbv(0)[32:].signed()) for _ in range(16)]
+
+    def clamp_coord(v, vmin, vmax):
+        if v < vmin:
+            return vmin
+        elif v >= vmax:
+            return vmax
+        return v
+
+    def read_req():
+        for i in range(16):
+            _samples[i].next = i_tc_dat[i]
+
+        for p in range(4):
+            for c in range(4):
+                lo = c * 8
+                hi = lo + 8
+                _dx0[(p * 4) + c].next = concat(intbv(0)[24:0], i_tc_dat[(p * 4) + 1][hi:lo]) - concat(intbv(0)[24:0], i_tc_dat[(p * 4) + 0][hi:lo])
+                _dx1[(p * 4) + c].next = concat(intbv(0)[24:0], i_tc_dat[(p * 4) + 3][hi:lo]) - concat(intbv(0)[24:0], i_tc_dat[(p * 4) + 2][hi:lo])
+
+        if i_flt:
+            _state.next = t_State.LERP1
+        else:
+            _state.next = t_State.IDLE
+
+    @always(i_clk.posedge, i_rstn)
+    def clk_logic():
+        if i_rstn == 0:
+            _state.next = t_State.IDLE
+        elif _state == t_State.IDLE:
+            if i_stb and i_tc_ack:
+                read_req()
+        elif _state == t_State.LERP1:
+            for p in range(4):
+                for c in range(4):
+                    lo = c * 8
+                    hi = lo + 8
+                    x0_next = _samples[(p * 4) + 0][hi:lo] + ((_dx0[(p * 4) + c] * _px[p][12:0]) >> 12)
+                    x1_next = _samples[(p * 4) + 2][hi:lo] + ((_dx1[(p * 4) + c] * _px[p][12:0]) >> 12)
+                    _dx0[(p * 4) + c].next = x0_next
+                    _dy[(p * 4) + c].next = x1_next - x0_next
+            _state.next = t_State.LERP2
+        elif _state == t_State.LERP2:
+            _state.next = t_State.IDLE
+
+    def log2_int(a, BITLEN=32):
+        for i in range(BITLEN - 1, -1, -1):
+            if a[i]:
+                return i
+        return 0
+
+    @always_comb
+    def comb_logic():
+        # calculate mip level from ddx/ddy, once for the whole quad
+        dsdx = i_ddx[0] << i_w
+        dtdx = i_ddx[1] << i_w
+        dsdy = i_ddy[0] << i_h
+        dtdy = i_ddy[1] << i_h
+
+        ddx = ((dsdx * dsdx) >> 12) + ((dtdx * dtdx) >> 12)
+        ddy = ((dsdy * dsdy) >> 12) + ((dtdy * dtdy) >> 12)
+
+        maxmip_w = i_w - 2 if i_w >= 2 else 0
+        maxmip_h = i_h - 2 if i_h >= 2 else 0
+        maxmip = min(maxmip_w, maxmip_h)
+        mip = min(log2_int(intbv(max(ddx, ddy))[32:12], BITLEN=20) >> 1, maxmip) if i_mip else 0
+
+        o_tc_mip.next = mip
+
+        mipw = i_w - mip
+        miph = i_h - mip
+
+        maxw = (1 << mipw) - 1
+        maxh = (1 << miph) - 1
+
+        for p in range(4):
+            # note: half texel bias
+            x = (i_st[p * 2] << mipw) - 2048
+            y = (i_st[(p * 2) + 1] << miph) - 2048
+
+            sx = clamp_coord(x, 0, maxw << 12) if i_clmp_s else x
+            sy = clamp_coord(y, 0, maxh << 12) if i_clmp_t else y
+
+            _px[p].next = sx
+            _py[p].next = sy
+
+            o_tc_smp[p * 2].next = (sx >> 12) & maxw
+            o_tc_smp[(p * 2) + 1].next = (sy >> 12) & maxh
+
+            if i_flt:
+                r = intbv(_dx0[(p * 4) + 0] + ((_dy[(p * 4) + 0] * _py[p][12:0]) >> 12))[8:0]
+                g = intbv(_dx0[(p * 4) + 1] + ((_dy[(p * 4) + 1] * _py[p][12:0]) >> 12))[8:0]
+                b = intbv(_dx0[(p * 4) + 2] + ((_dy[(p * 4) + 2] * _py[p][12:0]) >> 12))[8:0]
+                a = intbv(_dx0[(p * 4) + 3] + ((_dy[(p * 4) + 3] * _py[p][12:0]) >> 12))[8:0]
+                o_dat[p].next = concat(a, b, g, r)
+            else:
+                o_dat[p].next = i_tc_dat[p * 4]
+
+        if i_flt:
+            o_ack.next = i_stb and _state == t_State.LERP2
+        else:
+            o_ack.next = i_stb and i_tc_ack
+
+        # NOTE: unlike TexSampler, the cache isn't strobed again during LERP2, as a quad which takes more than one lookup would otherwise leave
+        # the cache holding on to part of the finished quad's samples when the next quad comes in
+        o_tc_stb.next = i_stb and _state == t_State.IDLE
+
+    return clk_logic, comb_logic
\ No newline at end of file
@@ -0,0 +1,251 @@
+from myhdl import *
+
+from tri_raster import TriRaster
+from texcache_sa import SetAssocTexCache
+from texsample_quad import QuadTexSampler
+from tile_resolve import TileResolve
+from cmd_proc import CmdProc
+from bus_arbiter import BusArbiter
+from mem import DualPortRAM
+
+@block
+def TileCore(i_rstn, i_clk, i_cmd_valid, i_cmd_ptr, i_cmd_tile, o_cmd_ready, o_busy,
+             i_fb_adr, i_fb_stride, i_fb_w, i_fb_h, i_fog_tbl,
+             o_wr_en_rgb, o_wr_data_rgb, o_wr_en_d, o_wr_data_d, o_wr_pos,
+             o_mem_adr, i_mem_dat, o_mem_stb, i_mem_ack, o_mem_cti, o_mem_bte,
+             o_mem_dat=None, o_mem_we=None,
+             o_tex_hits=None, o_tex_misses=None, o_resolve_bytes=None, o_resolve_cycles=None, o_packets=None, o_starve_cycles=None,
+             DIM=32, BLOCK=8, TEX_SETS=16, TEX_WAYS=4):
+    """
+    A single tile core: a CmdProc feeding a TriRaster with its own tile color/depth buffers (one DualPortRAM bank per pixel of a 2x2 cluster), its own texture path
+    (QuadTexSampler + SetAssocTexCache), and a TileResolve which writes finished tiles into a framebuffer in shared memory
+
+    The core is handed a tile's command queue pointer & the tile's x/y (in tiles), and executes the queue (see CmdProc). The end of the queue resolves the tile
+    to the framebuffer at i_fb_adr, after which the core is immediately ready for the next tile (which may be cleared while the resolve runs). The resolve
+    writes blocks the TriRaster still has fast cleared with the clear color, so the tile isn't flushed first (CmdProc's flush request is left unconnected).
+    The command processor, texture cache & resolve share the o_mem_* bus port through a BusArbiter. The tile core's pixel cluster writes are mirrored on o_wr_*
+    so they can be captured
+
+    - i_rstn: Reset signal
+    - i_clk: Clock signal
+
+    - i_cmd_valid: Input tile valid signal (the tile is taken on a clock where both i_cmd_valid & o_cmd_ready are high)
+    - i_cmd_ptr: Input address of the tile's command queue in shared memory
+    - i_cmd_tile: Input x/y of the tile in the framebuffer (in tiles) [2]
+    - o_cmd_ready: 1 while ready to take a tile, 0 otherwise
+    - o_busy: 1 while a tile is being drawn or resolved, 0 otherwise
+
+    - i_fb_adr: Input word address of the framebuffer in shared memory
+    - i_fb_stride: Input framebuffer row stride (in words)
+    - i_fb_w: Input framebuffer width (in pixels, resolves are clipped to it)
+    - i_fb_h: Input framebuffer height (in pixels, resolves are clipped to it)
+    - i_fog_tbl: Input fog density table (see TriRaster) [64]
+
+    - o_wr_en_rgb: for each pixel in cluster, 1 if output pixel color is valid, 0 otherwise
+    - o_wr_data_rgb: Output pixel cluster colors
+    - o_wr_en_d: for each pixel in cluster, 1 if output pixel depth is valid, 0 otherwise
+    - o_wr_data_d: Output pixel cluster depth values
+    - o_wr_pos: Output pixel cluster x/y
+
+    - o_mem_adr: Output address to shared memory
+    - i_mem_dat: Input read data from shared memory
+    - o_mem_stb: Output request transaction signal to shared memory
+    - i_mem_ack: Input transaction acknowledge signal from shared memory
+    - o_mem_cti: Output cycle type identifier to shared memory
+    - o_mem_bte: Output burst type extension to shared memory
+    - o_mem_dat: Optional output write data to shared memory
+    - o_mem_we: Optional output write enable signal to shared memory
+
+    - o_tex_hits: Optional output count of texture cache block lookups which hit
+    - o_tex_misses: Optional output count of texture cache block lookups which missed
+    - o_resolve_bytes: Optional output count of bytes written to shared memory by resolves
+    - o_resolve_cycles: Optional output number of cycles the last resolve took
+    - o_packets: Optional output count of command packets executed
+    - o_starve_cycles: Optional output count of cycles the TriRaster sat idle while a command packet was being fetched
+
+    - DIM: width/height of tile
+    - BLOCK: coarse traversal block size of the TriRaster
+    - TEX_SETS: Number of texture cache sets
+    - TEX_WAYS: Number of texture cache ways per set
+    """
+
+    if o_mem_dat is None:
+        o_mem_dat = Signal(intbv(0)[32:])
+    if o_mem_we is None:
+        o_mem_we = Signal(bool(0))
+
+    QUADS = DIM >> 1
+    QUAD_SHIFT = QUADS.bit_length() - 1
+
+    # bus clients: command processor, texture cache, resolve
+    bus_i_adr = [Signal(intbv(0)[32:0]) for _ in range(3)]
+    bus_i_dat = [Signal(intbv(0)[32:0]) for _ in range(3)]
+    bus_o_dat = Signal(intbv(0)[32:0])
+    bus_i_we = [Signal(bool(0)) for _ in range(3)]
+    bus_i_stb = [Signal(bool(0)) for _ in range(3)]
+    bus_o_ack = [Signal(bool(0)) for _ in range(3)]
+    bus_i_cti = [Signal(intbv(0)[3:0]) for _ in range(3)]
+    bus_i_bte = [Signal(intbv(0)[2:0]) for _ in range(3)]
+    bus = BusArbiter(i_rstn, i_clk, bus_i_adr, bus_i_dat, bus_o_dat, bus_i_we, bus_i_stb, bus_o_ack,
+                     o_mem_adr, o_mem_dat, i_mem_dat, o_mem_we, o_mem_stb, i_mem_ack,
+                     None, bus_i_cti, bus_i_bte, o_mem_cti, o_mem_bte,
+                     NUM_PORTS=3, MODE="round_robin")
+
+    tri_raster_v0 = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    tri_raster_v1 = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    tri_raster_v2 = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    tri_raster_col_init = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    tri_raster_col_dx = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    tri_raster_col_dy = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    tri_raster_1ow_init = Signal(intbv(0)[32:0].signed())
+    tri_raster_1ow_dx = Signal(intbv(0)[32:0].signed())
+    tri_raster_1ow_dy = Signal(intbv(0)[32:0].signed())
+    tri_raster_sow_init = Signal(intbv(0)[32:0].signed())
+    tri_raster_sow_dx = Signal(intbv(0)[32:0].signed())
+    tri_raster_sow_dy = Signal(intbv(0)[32:0].signed())
+    tri_raster_tow_init = Signal(intbv(0)[32:0].signed())
+    tri_raster_tow_dx = Signal(intbv(0)[32:0].signed())
+    tri_raster_tow_dy = Signal(intbv(0)[32:0].signed())
+    tri_raster_zow_init = Signal(intbv(0)[32:0].signed())
+    tri_raster_zow_dx = Signal(intbv(0)[32:0].signed())
+    tri_raster_zow_dy = Signal(intbv(0)[32:0].signed())
+    tri_raster_tex_en = Signal(bool(0))
+    tri_raster_dtest_en = Signal(bool(0))
+    tri_raster_dcmp = Signal(intbv(0)[3:0])
+    tri_raster_bl_en = Signal(bool(0))
+    tri_raster_bl_src = Signal(intbv(0)[4:0])
+    tri_raster_bl_dst = Signal(intbv(0)[4:0])
+    tri_raster_bl_op = Signal(0)
+    tri_raster_fog_en = Signal(bool(0))
+    tri_raster_fog_col = Signal(intbv(0)[32:])
+    tri_raster_tri_stb = Signal(bool(0))
+    tri_raster_fill_stb = Signal(bool(0))
+    # (not connected to the TriRaster, see the resolve)
+    tri_raster_flush_stb = Signal(bool(0))
+    tri_raster_busy = Signal(bool(0))
+    tri_raster_tri_ready = Signal(bool(0))
+
+    tex_mip_tbl = [Signal(intbv(0)[32:0]) for _ in range(16)]
+    tex_w = Signal(intbv(0)[4:0])
+    tex_h = Signal(intbv(0)[4:0])
+    tex_fmt = Signal(intbv(0)[3:0])
+    tex_flt = Signal(bool(0))
+    tex_clmp_s = Signal(bool(0))
+    tex_clmp_t = Signal(bool(0))
+    tex_mip = Signal(bool(0))
+    tex_cb_adr = Signal(intbv(0)[32:0])
+
+    resolve_stb = Signal(bool(0))
+    resolve_busy = Signal(bool(0))
+    # blocks the resolve fills in with the clear color, rather than the TriRaster flushing them into the tile buffers first
+    CLR_BLOCK = BLOCK if BLOCK != 0 else DIM
+    tri_raster_cleared = [Signal(bool(0)) for _ in range((DIM // CLR_BLOCK) ** 2)]
+    tri_raster_clr_col = Signal(intbv(0)[32:0])
+
+    cmd_proc = CmdProc(i_rstn, i_clk, i_cmd_valid, i_cmd_ptr, o_cmd_ready,
+                       tri_raster_v0, tri_raster_v1, tri_raster_v2,
+                       tri_raster_col_init, tri_raster_col_dx, tri_raster_col_dy,
+                       tri_raster_1ow_init, tri_raster_1ow_dx, tri_raster_1ow_dy,
+                       tri_raster_sow_init, tri_raster_sow_dx, tri_raster_sow_dy,
+                       tri_raster_tow_init, tri_raster_tow_dx, tri_raster_tow_dy,
+                       tri_raster_zow_init, tri_raster_zow_dx, tri_raster_zow_dy,
+                       tri_raster_tex_en, tri_raster_dtest_en, tri_raster_dcmp,
+                       tri_raster_bl_en, tri_raster_bl_src, tri_raster_bl_dst, tri_raster_bl_op,
+                       tri_raster_fog_en, tri_raster_fog_col,
+                       tex_mip_tbl, tex_w, tex_h, tex_fmt, tex_flt, tex_clmp_s, tex_clmp_t, tex_mip,
+                       tri_raster_tri_stb, tri_raster_fill_stb, tri_raster_flush_stb, tri_raster_busy, tri_raster_tri_ready, resolve_stb, resolve_busy,
+                       bus_i_adr[0], bus_o_dat, bus_i_stb[0], bus_o_ack[0], bus_i_cti[0], bus_i_bte[0],
+                       o_packets, None, o_starve_cycles, tex_cb_adr)
+
+    tx_i_tex_adr = Signal(intbv(0)[32:0])
+    tx_i_tex_w = Signal(intbv(0)[4:0])
+    tx_i_tex_h = Signal(intbv(0)[4:0])
+    tx_i_smp = [Signal(intbv(0)[32:0]) for _ in range(8)]
+    tx_o_dat = [Signal(intbv(0)[32:0]) for _ in range(16)]
+    tx_i_stb = Signal(bool(0))
+    tx_o_ack = Signal(bool(0))
+    tx = SetAssocTexCache(i_rstn, i_clk, tx_i_tex_adr, tx_i_tex_w, tx_i_tex_h, tex_fmt, tx_i_smp, tx_o_dat, tx_i_stb, tx_o_ack,
+                          bus_i_adr[1], bus_o_dat, bus_i_stb[1], bus_o_ack[1], bus_i_cti[1], bus_i_bte[1],
+                          o_tex_hits, o_tex_misses, tex_cb_adr, SETS=TEX_SETS, WAYS=TEX_WAYS, PORTS=4)
+
+    smp_i_stb = Signal(bool(0))
+    smp_i_st = [Signal(intbv(0)[32:].signed()) for _ in range(8)]
+    smp_i_ddx = [Signal(intbv(0)[32:].signed()) for _ in range(2)]
+    smp_i_ddy = [Signal(intbv(0)[32:].signed()) for _ in range(2)]
+    smp_o_dat = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    smp_o_ack = Signal(bool(0))
+    smp_o_tc_stb = Signal(bool(0))
+    smp_o_tc_smp = [Signal(intbv(0)[32:0]) for _ in range(8)]
+    smp_o_tc_mip = Signal(intbv(0)[4:0])
+    smp = QuadTexSampler(i_rstn, i_clk, smp_i_stb, smp_i_st, smp_i_ddx, smp_i_ddy, tex_w, tex_h, tex_clmp_s, tex_clmp_t, tex_flt, tex_mip, smp_o_dat, smp_o_ack,
+                         smp_o_tc_stb, smp_o_tc_smp, smp_o_tc_mip, tx_o_dat, tx_o_ack)
+
+    colorbuffer_rd_addr = Signal(intbv(0)[32:0])
+    colorbuffer_wr_addr = Signal(intbv(0)[32:0])
+    colorbuffer_dout = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    colorbuffers = [DualPortRAM(colorbuffer_dout[i], colorbuffer_rd_addr, o_wr_data_rgb[i], colorbuffer_wr_addr, o_wr_en_rgb[i], i_clk,
+                                WIDTH=32, DEPTH=QUADS * QUADS, ID="colorbuffer_%s" % i) for i in range(4)]
+
+    # tile being drawn, latched for its resolve
+    _tile = [Signal(intbv(0)[16:0]) for _ in range(2)]
+    resolve_rd_adr = Signal(intbv(0)[32:0])
+    resolve = TileResolve(i_rstn, i_clk, resolve_stb, i_fb_adr, i_fb_stride, i_fb_w, i_fb_h, _tile, resolve_busy,
+                          resolve_rd_adr, colorbuffer_dout,
+                          bus_i_adr[2], bus_i_dat[2], bus_i_we[2], bus_i_stb[2], bus_o_ack[2], bus_i_cti[2], bus_i_bte[2],
+                          o_resolve_bytes, o_resolve_cycles, tri_raster_cleared, tri_raster_clr_col, DIM=DIM, CLR_BLOCK=CLR_BLOCK)
+
+    depthbuffer_rd_addr = Signal(intbv(0)[32:0])
+    depthbuffer_wr_addr = Signal(intbv(0)[32:0])
+    depthbuffer_dout = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    depthbuffers = [DualPortRAM(depthbuffer_dout[i], depthbuffer_rd_addr, o_wr_data_d[i], depthbuffer_wr_addr, o_wr_en_d[i], i_clk,
+                                WIDTH=32, DEPTH=QUADS * QUADS, ID="depthbuffer_%s" % i) for i in range(4)]
+
+    tri_raster_rd_pos = [Signal(intbv(0)[32:0]) for _ in range(2)]
+    tri_raster_o_smp_stb = Signal(bool(0))
+    tri_raster = TriRaster(i_rstn, i_clk, tri_raster_v0, tri_raster_v1, tri_raster_v2,
+                           tri_raster_col_init, tri_raster_col_dx, tri_raster_col_dy,
+                           tri_raster_1ow_init, tri_raster_1ow_dx, tri_raster_1ow_dy,
+                           tri_raster_sow_init, tri_raster_sow_dx, tri_raster_sow_dy,
+                           tri_raster_tow_init, tri_raster_tow_dx, tri_raster_tow_dy,
+                           tri_raster_zow_init, tri_raster_zow_dx, tri_raster_zow_dy,
+                           tri_raster_tex_en, tri_raster_dtest_en, tri_raster_dcmp,
+                           tri_raster_bl_en, tri_raster_bl_src, tri_raster_bl_dst, tri_raster_bl_op,
+                           tri_raster_fog_en, tri_raster_fog_col,
+                           tri_raster_tri_stb, tri_raster_fill_stb, tri_raster_busy,
+                           o_wr_en_rgb, o_wr_data_rgb,
+                           o_wr_en_d, o_wr_data_d,
+                           o_wr_pos,
+                           tri_raster_rd_pos, colorbuffer_dout, depthbuffer_dout,
+                           tri_raster_o_smp_stb, smp_i_st, smp_i_ddx, smp_i_ddy, smp_o_dat, smp_o_ack,
+                           i_fog_tbl,
+                           o_tri_ready=tri_raster_tri_ready, o_cleared=tri_raster_cleared, o_clr_col=tri_raster_clr_col,
+                           DIM=DIM, BLOCK=BLOCK)
+
+    @always(i_clk.posedge)
+    def tile_logic():
+        if i_cmd_valid and o_cmd_ready:
+            _tile[0].next = i_cmd_tile[0]
+            _tile[1].next = i_cmd_tile[1]
+
+    @always_comb
+    def drive_comb():
+        smp_i_stb.next = tri_raster_o_smp_stb
+        for i in range(8):
+            tx_i_smp[i].next = smp_o_tc_smp[i]
+        # the cache is given the size of the mip level being sampled, not of the whole texture
+        tx_i_tex_adr.next = tex_mip_tbl[smp_o_tc_mip]
+        tx_i_tex_w.next = tex_w - smp_o_tc_mip
+        tx_i_tex_h.next = tex_h - smp_o_tc_mip
+        tx_i_stb.next = smp_o_tc_stb
+
+        # the TriRaster doesn't read the tile buffers while a resolve is running (see CmdProc)
+        depthbuffer_rd_addr.next = tri_raster_rd_pos[0] + (tri_raster_rd_pos[1] << QUAD_SHIFT)
+        if resolve_busy:
+            colorbuffer_rd_addr.next = resolve_rd_adr
+        else:
+            colorbuffer_rd_addr.next = tri_raster_rd_pos[0] + (tri_raster_rd_pos[1] << QUAD_SHIFT)
+        colorbuffer_wr_addr.next = depthbuffer_wr_addr.next = o_wr_pos[0] + (o_wr_pos[1] << QUAD_SHIFT)
+
+        o_busy.next = not o_cmd_ready or resolve_busy or resolve_stb
+
+    return bus, cmd_proc, tx, smp, colorbuffers, depthbuffers, resolve, tri_raster, tile_logic, drive_comb
@@ -0,0 +1,125 @@
+from myhdl import *
+
+from mem import CTI_CLASSIC, BTE_LINEAR
+
+t_State = enum("IDLE", "FETCH", "DISPATCH")
+
+@block
+def TileDispatch(i_rstn, i_clk, i_stb, i_tbl_adr, i_tiles_w, i_tiles_h, o_busy,
+                 o_core_valid, o_core_ptr, o_core_tile, i_core_ready, i_core_busy,
+                 o_mem_adr, i_mem_dat, o_mem_stb, i_mem_ack, o_mem_cti=None, o_mem_bte=None,
+                 o_core_tiles=None,
+                 NUM_CORES=4):
+    """
+    Tile dispatch unit
+
+    Walks a table of per-tile command queue pointers in shared memory (one word per tile, in row-major tile order), and hands each tile to whichever
+    tile core is idle (the lowest numbered one, if several are). The next table entry is fetched as soon as a tile has been handed out, so it's usually
+    waiting by the time another core goes idle
+
+    Each core has a valid/ready handshake: a core raises i_core_ready while it's idle, and takes the tile offered on o_core_ptr/o_core_tile on a clock where
+    both o_core_valid and i_core_ready are high (after which it's expected to lower i_core_ready until it has finished the tile). A core may be ready for its
+    next tile while it still writes the last one out (e.g. TileCore's resolve), so it also reports i_core_busy until the tile is in shared memory
+
+    - i_rstn: Reset signal
+    - i_clk: Clock signal
+
+    - i_stb: Input start frame request signal
+    - i_tbl_adr: Input address of the command queue pointer table in shared memory
+    - i_tiles_w: Input width of the frame in tiles
+    - i_tiles_h: Input height of the frame in tiles
+    - o_busy: 1 while tiles are still being handed out or any core is busy, 0 once the frame is finished (every tile drawn & written out)
+
+    - o_core_valid: Output tile valid signals [NUM_CORES]
+    - o_core_ptr: Output command queue pointer of the tile [NUM_CORES]
+    - o_core_tile: Output x/y of the tile [2 * NUM_CORES - x, y for each core]
+    - i_core_ready: Input core ready to take a tile signals [NUM_CORES]
+    - i_core_busy: Input core busy signals, 1 until the core's tile is finished & written out (e.g. TileCore's o_busy) [NUM_CORES]
+
+    - o_mem_adr: Output read address to shared memory
+    - i_mem_dat: Input read data from shared memory
+    - o_mem_stb: Output request transaction signal to shared memory
+    - i_mem_ack: Input transaction acknowledge signal from shared memory
+    - o_mem_cti: Optional output cycle type identifier to shared memory (always classic cycles)
+    - o_mem_bte: Optional output burst type extension to shared memory
+
+    - o_core_tiles: Optional output count of tiles handed to each core [NUM_CORES]
+
+    - NUM_CORES: Number of tile cores
+    """
+
+    if o_mem_cti is None:
+        o_mem_cti = Signal(intbv(0)[3:])
+    if o_mem_bte is None:
+        o_mem_bte = Signal(intbv(0)[2:])
+    if o_core_tiles is None:
+        o_core_tiles = [Signal(intbv(0)[32:]) for _ in range(NUM_CORES)]
+
+    _state = Signal(t_State.IDLE)
+    # position & table address of the tile being fetched/offered
+    _tile = [Signal(intbv(0)[16:0]) for _ in range(2)]
+    _adr = Signal(intbv(0)[32:0])
+    _ptr = Signal(intbv(0)[32:0])
+    # core the current tile is offered to (NUM_CORES if none is ready)
+    _core = Signal(intbv(0, min=0, max=NUM_CORES + 1))
+
+    @always(i_clk.posedge, i_rstn)
+    def clk_logic():
+        if i_rstn == 0:
+            _state.next = t_State.IDLE
+            for i in range(NUM_CORES):
+                o_core_tiles[i].next = 0
+        elif _state == t_State.IDLE:
+            if i_stb and i_tiles_w != 0 and i_tiles_h != 0:
+                _adr.next = i_tbl_adr
+                _tile[0].next = 0
+                _tile[1].next = 0
+                _state.next = t_State.FETCH
+        elif _state == t_State.FETCH:
+            if i_mem_ack:
+                _ptr.next = i_mem_dat
+                _state.next = t_State.DISPATCH
+        elif _state == t_State.DISPATCH:
+            if _core != NUM_CORES:
+                # tile has been taken, move on to the next one
+                o_core_tiles[_core].next = o_core_tiles[_core] + 1
+                _adr.next = _adr + 1
+                if _tile[0] == i_tiles_w - 1:
+                    if _tile[1] == i_tiles_h - 1:
+                        # every tile has been handed out
+                        _state.next = t_State.IDLE
+                    else:
+                        _tile[0].next = 0
+                        _tile[1].next = _tile[1] + 1
+                        _state.next = t_State.FETCH
+                else:
+                    _tile[0].next = _tile[0] + 1
+                    _state.next = t_State.FETCH
+
+    @always_comb
+    def pick_core():
+        core = NUM_CORES
+        for i in range(NUM_CORES - 1, -1, -1):
+            if i_core_ready[i]:
+                core = i
+        _core.next = core if _state == t_State.DISPATCH else NUM_CORES
+
+    @always_comb
+    def comb_logic():
+        for i in range(NUM_CORES):
+            o_core_valid[i].next = _core == i
+            o_core_ptr[i].next = _ptr
+            o_core_tile[i * 2].next = _tile[0]
+            o_core_tile[(i * 2) + 1].next = _tile[1]
+
+        o_mem_adr.next = _adr
+        o_mem_stb.next = _state == t_State.FETCH
+        o_mem_cti.next = CTI_CLASSIC
+        o_mem_bte.next = BTE_LINEAR
+
+        busy = False
+        for i in range(NUM_CORES):
+            busy = busy or i_core_busy[i] or not i_core_ready[i]
+        o_busy.next = _state != t_State.IDLE or busy
+
+    return clk_logic, pick_core, comb_logic
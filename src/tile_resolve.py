@@ -0,0 +1,140 @@
+from myhdl import *
+
+from mem import CTI_INCR, CTI_END, BTE_LINEAR
+
+t_State = enum("IDLE", "BURST")
+
+@block
+def TileResolve(i_rstn, i_clk, i_stb, i_fb_adr, i_fb_stride, i_fb_w, i_fb_h, i_tile, o_busy,
+                o_rd_adr, i_rd_dat,
+                o_mem_adr, o_mem_dat, o_mem_we, o_mem_stb, i_mem_ack, o_mem_cti, o_mem_bte,
+                o_bytes=None, o_cycles=None, i_cleared=None, i_clr_col=None,
+                DIM=32, CLR_BLOCK=8):
+    """
+    Tile resolve DMA
+
+    Copies a finished tile out of the four banked tile color buffers (one bank per pixel of a 2x2 cluster, addressed by cluster x + cluster y * DIM/2)
+    into a framebuffer in shared memory, one pixel per 32-bit word. Each row of the tile is written as a single incrementing burst
+
+    Tiles are clipped to the framebuffer's width & height, so edge tiles of a framebuffer whose size isn't a multiple of DIM only write the rows & row
+    bursts (of fewer than DIM pixels) which lie inside it, and tiles entirely outside of it write nothing
+
+    With i_cleared & i_clr_col (TriRaster's o_cleared & o_clr_col), pixels of blocks which are still fast cleared are written with the clear color rather
+    than read from the tile buffers, so the tile doesn't need flushing first. The flags & color are latched when the resolve starts
+
+    The tile buffers are only read, so the next tile may be cleared while a resolve is running, but nothing may be drawn into them until o_busy goes low
+
+    - i_rstn: Reset signal
+    - i_clk: Clock signal
+
+    - i_stb: Input start resolve request signal
+    - i_fb_adr: Input word address of the framebuffer in shared memory
+    - i_fb_stride: Input framebuffer row stride (in words)
+    - i_fb_w: Input framebuffer width (in pixels)
+    - i_fb_h: Input framebuffer height (in pixels)
+    - i_tile: Input x/y of the tile in the framebuffer (in tiles) [2]
+    - o_busy: 1 while a resolve is running, 0 otherwise
+
+    - o_rd_adr: Output read address to tile color buffers
+    - i_rd_dat: Input read data from tile color buffers [4]
+
+    - o_mem_adr: Output write address to shared memory
+    - o_mem_dat: Output write data to shared memory
+    - o_mem_we: Output write enable signal to shared memory
+    - o_mem_stb: Output request transaction signal to shared memory
+    - i_mem_ack: Input transaction acknowledge signal from shared memory
+    - o_mem_cti: Output cycle type identifier to shared memory
+    - o_mem_bte: Output burst type extension to shared memory
+
+    - o_bytes: Optional output count of bytes written to shared memory
+    - o_cycles: Optional output number of cycles the last resolve took
+    - i_cleared: Optional input fast clear flag of each block of the tile [(DIM / CLR_BLOCK) ** 2]
+    - i_clr_col: Optional input clear color
+
+    - DIM: width/height of tile
+    - CLR_BLOCK: width/height of TriRaster's fast clear blocks (its BLOCK, or DIM if that is 0)
+    """
+
+    if o_bytes is None:
+        o_bytes = Signal(intbv(0)[32:])
+    if o_cycles is None:
+        o_cycles = Signal(intbv(0)[32:])
+
+    QUAD_SHIFT = (DIM >> 1).bit_length() - 1
+    CLR_SHIFT = CLR_BLOCK.bit_length() - 1
+    CLR_DIM = DIM // CLR_BLOCK
+
+    if i_cleared is None:
+        i_cleared = [Signal(bool(0)) for _ in range(CLR_DIM * CLR_DIM)]
+    if i_clr_col is None:
+        i_clr_col = Signal(intbv(0)[32:])
+
+    _state = Signal(t_State.IDLE)
+    # pixel being written & address of the start of its row in the framebuffer
+    _x = Signal(intbv(0, min=0, max=DIM))
+    _y = Signal(intbv(0, min=0, max=DIM))
+    _row_adr = Signal(intbv(0)[32:0])
+    # last pixel of each row burst & last row of the tile, after clipping
+    _x_last = Signal(intbv(0, min=0, max=DIM))
+    _y_last = Signal(intbv(0, min=0, max=DIM))
+    _cycles = Signal(intbv(0)[32:0])
+    # fast clear flags & color of the tile being resolved
+    _cleared = [Signal(bool(0)) for _ in range(CLR_DIM * CLR_DIM)]
+    _clr_col = Signal(intbv(0)[32:0])
+
+    @always(i_clk.posedge, i_rstn)
+    def clk_logic():
+        if i_rstn == 0:
+            _state.next = t_State.IDLE
+            o_bytes.next = 0
+            o_cycles.next = 0
+        elif _state == t_State.IDLE:
+            # pixels of the framebuffer left right of & below the tile's top left corner
+            rem_w = i_fb_w - (i_tile[0] * DIM)
+            rem_h = i_fb_h - (i_tile[1] * DIM)
+            if i_stb:
+                if rem_w > 0 and rem_h > 0:
+                    _row_adr.next = (i_fb_adr + (i_tile[1] * DIM * i_fb_stride) + (i_tile[0] * DIM)) & 0xFFFFFFFF
+                    _x.next = 0
+                    _y.next = 0
+                    _x_last.next = DIM - 1 if rem_w >= DIM else rem_w - 1
+                    _y_last.next = DIM - 1 if rem_h >= DIM else rem_h - 1
+                    _cycles.next = 1
+                    for b in range(CLR_DIM * CLR_DIM):
+                        _cleared[b].next = i_cleared[b]
+                    _clr_col.next = i_clr_col
+                    _state.next = t_State.BURST
+                else:
+                    # tile lies entirely outside of the framebuffer
+                    o_cycles.next = 0
+        elif _state == t_State.BURST:
+            _cycles.next = _cycles + 1
+            if i_mem_ack:
+                o_bytes.next = o_bytes + 4
+                if _x == _x_last:
+                    # end of row burst
+                    _x.next = 0
+                    if _y == _y_last:
+                        o_cycles.next = _cycles + 1
+                        _state.next = t_State.IDLE
+                    else:
+                        _y.next = _y + 1
+                        _row_adr.next = _row_adr + i_fb_stride
+                else:
+                    _x.next = _x + 1
+
+    @always_comb
+    def comb_logic():
+        o_rd_adr.next = (_x >> 1) + ((_y >> 1) << QUAD_SHIFT)
+        if _cleared[(_x >> CLR_SHIFT) + ((_y >> CLR_SHIFT) * CLR_DIM)]:
+            o_mem_dat.next = _clr_col
+        else:
+            o_mem_dat.next = i_rd_dat[(_x & 1) | ((_y & 1) << 1)]
+        o_mem_adr.next = _row_adr + _x
+        o_mem_we.next = True
+        o_mem_stb.next = _state == t_State.BURST
+        o_mem_cti.next = CTI_END if _x == _x_last else CTI_INCR
+        o_mem_bte.next = BTE_LINEAR
+        o_busy.next = _state != t_State.IDLE
+
+    return clk_logic, comb_logic
@@ -1,6 +1,9 @@
 from myhdl import *
 
-t_State = enum("WAITING", "SETUP1", "SETUP2", "SETUP3", "SETUP4", "RASTERLOOP", "TEX0", "TEX1", "TEX2", "TEX3", "COMBINE", "BLEND0", "BLEND1", "BLEND2", "BLEND3", "FILL")
+from skid_buffer import SkidBuffer
+
+t_State = enum("WAITING", "SETUP4", "COARSE", "RASTERLOOP", "FLUSH")
+t_Setup = enum("IDLE", "SETUP1", "SETUP2", "SETUP3", "DONE")
 
 @block
 def TriRaster(i_rst, i_clk, i_v0, i_v1, i_v2,
@@ -11,13 +14,44 @@ def TriRaster(i_rst, i_clk, i_v0, i_v1, i_v2,
               i_zow_init, i_zow_dx, i_zow_dy,
               i_tex_en, i_dtest_en, i_dcmp, i_bl_en, i_bl_src, i_bl_dst, i_bl_op, i_fog_en, i_fog_col,
               i_tri_stb, i_fill_stb, o_busy, o_wr_en_rgb, o_wr_data_rgb, o_wr_en_d, o_wr_data_d, o_wr_pos,
-              i_rd_data_rgb, i_rd_data_d,
+              o_rd_pos, i_rd_data_rgb, i_rd_data_d,
               o_smp_stb, o_smp_st, o_smp_ddx, o_smp_ddy, i_smp_dat, i_smp_ack,
               i_fog_tbl,
-              DIM=32):
+              i_flush_stb=None, o_stall_cycles=None, o_quads_skipped=None, o_quads_visited=None, o_quads_covered=None, o_hiz_rejects=None, o_tri_ready=None,
+              o_cleared=None, o_clr_col=None,
+              DIM=32, BLOCK=8, TRAVERSAL="span", HIZ=True, TRI_FIFO=2):
     """
     Triangle rasterizer
 
+    Traversal walks triangle bounds one BLOCKxBLOCK pixel block at a time (COARSE): the edge functions are evaluated at the block's corners,
+    so blocks entirely outside the triangle are skipped in a single cycle, and blocks entirely inside it skip the per-pixel coverage test
+
+    With HIZ, the min/max depth of each block of the tile is kept as well (updated as depth values are written), and blocks - or whole triangles,
+    in SETUP4 - where the depth test can't pass for any pixel are skipped the same way
+
+    Triangles are queued in a TRI_FIFO deep FIFO, and set up (SETUP1-3) into a shadow copy of the traversal registers, so the next triangle's setup
+    runs while the current one is still being rasterized. Each triangle's render state is queued along with it, so the inputs may change as soon as it
+    has been taken. i_tri_stb is the valid half of a valid/ready handshake: a triangle is taken on any clock where both i_tri_stb and o_tri_ready are high
+
+    Traversal (SETUP4, COARSE, RASTERLOOP) hands one 2x2 cluster per clock to a pipeline of stages joined by SkidBuffers:
+    - ZTEST: coverage (from the cluster's bary weights) & depth test against the depth buffer at o_rd_pos, clusters with no pixels left are dropped here
+    - TEX: the whole cluster is sampled through the QuadTexSampler, holding the cluster until the sampler acks (skipped if texturing is disabled)
+    - COMBINE: vertex/texture color combine & fog
+    - BLEND: blend with the destination colors read during ZTEST
+    - WRITE: cluster is written out at o_wr_pos
+
+    Fills are fast clears: a fill request only captures the clear color & depth and marks every block of the tile as cleared, which takes a single cycle
+    whatever the size of the tile. Reads from a cleared block return the clear values instead of the tile buffer's contents, and the first write to a
+    cleared block first writes the whole block out with the clear values (holding the cluster in WRITE meanwhile). A flush request writes out every
+    block which is still cleared, so that the tile buffer can be read directly - which takes a cycle per cluster of every block left cleared, so it
+    still grows with the untouched area of the tile. Readers which can substitute the clear color themselves (e.g. TileResolve) should take
+    o_cleared & o_clr_col instead, and skip the flush
+
+    A triangle isn't traversed until the last cluster of the previous one has been written (its setup is held in the shadow registers meanwhile),
+    and a triangle never covers the same cluster twice, so the destination colors & depth values read in ZTEST are always up to date
+
+    Fill & flush requests are only accepted once every queued triangle has been drawn, and should only be made while o_busy is low
+
     - i_rst: Reset signal
     - i_clk: Clock signal
     - i_v0: triangle vertex 0 x/y
@@ -26,9 +60,10 @@ def TriRaster(i_rst, i_clk, i_v0, i_v1, i_v2,
     - i_col_init: starting color (at top left corner of triangle bounds) - Q8.12 fixed point
     - i_col_dx: color increment wrt x - Q8.12 fixed point
     - i_col_dy: color increment wrt y - Q8.12 fixed point
-    - i_1ow_init: starting 1/w (at top left corner of triangle bounds) - Q12.12 fixed point
-    - i_1ow_dx: 1/w increment wrt x - Q12.12 fixed point
-    - i_1ow_dy: 1/w increment wrt y - Q12.12 fixed point
+    - i_1ow_init: starting w (at top left corner of triangle bounds) - Q12.12 fixed point. There is no divider: the sampler takes S, T as (s/w * 1ow) >> 12,
+      so this iterator carries w (interpolated linearly in screen space, see tri_setup) rather than 1/w
+    - i_1ow_dx: w increment wrt x - Q12.12 fixed point
+    - i_1ow_dy: w increment wrt y - Q12.12 fixed point
     - i_sow_init: starting s/w (at top left corner of triangle bounds) - Q12.12 fixed point
     - i_sow_dx: s/w increment wrt x - Q12.12 fixed point
     - i_sow_dy: s/w increment wrt y - Q12.12 fixed point
@@ -47,81 +82,280 @@ def TriRaster(i_rst, i_clk, i_v0, i_v1, i_v2,
     - i_bl_op: Blend operation (0 = dst + src, 1 = dst - src)
     - i_fog_en: Enable fog
     - i_fog_col: Fog color
-    - i_tri_stb: Input draw triangle request signal
-    - i_fill_stb: Input fill request signal
-    - o_busy: 1 if busy, 0 if idle
+    - i_tri_stb: Input draw triangle request (valid) signal
+    - i_fill_stb: Input fill (fast clear) request signal
+    - o_busy: 1 while any triangle is queued, being set up or drawn (or a fill/flush is running), 0 if idle
     - o_wr_en_rgb: for each pixel in cluster, 1 if output pixel color is valid, 0 otherwise
     - o_wr_data_rgb: Output pixel cluster colors
     - o_wr_en_ds: for each pixel in cluster, 1 if output pixel depth is valid, 0 otherwise
     - o_wr_data_d: Output pixel cluster depth values
     - o_wr_pos: Output pixel cluster x/y
-    - i_rd_data_rgb: Input pixel cluster colors
-    - i_rd_data_d: Input pixel cluster depth values
-    - o_smp_stb: Output request transaction signal to TexSampler unit
-    - o_smp_st: Output ST coordinates to TexSampler unit
-    - o_smp_ddx: Output delta of ST wrt X to TexSampler unit
-    - o_smp_ddy: Output delta of ST wrt Y to TexSampler unit
-    - i_smp_dat: Input texture sample from TexSampler unit
-    - i_smp_ack: Input request acknowledge signal from TexSampler unit
+    - o_rd_pos: Output x/y of pixel cluster to read
+    - i_rd_data_rgb: Input pixel cluster colors (at o_rd_pos)
+    - i_rd_data_d: Input pixel cluster depth values (at o_rd_pos)
+    - o_smp_stb: Output request transaction signal to QuadTexSampler unit
+    - o_smp_st: Output ST coordinates to QuadTexSampler unit [8 - S, T for each pixel in cluster]
+    - o_smp_ddx: Output delta of ST wrt X across the cluster to QuadTexSampler unit
+    - o_smp_ddy: Output delta of ST wrt Y across the cluster to QuadTexSampler unit
+    - i_smp_dat: Input texture samples from QuadTexSampler unit [4 - one for each pixel in cluster]
+    - i_smp_ack: Input request acknowledge signal from QuadTexSampler unit
     - i_fog_tbl: Input fog table registers [64]
+    - i_flush_stb: Optional input flush request signal
+    - o_stall_cycles: Optional output count of cycles each stage spent holding on to a cluster it couldn't pass on [5 - RASTERLOOP, ZTEST, TEX, COMBINE, BLEND]
+    - o_quads_skipped: Optional output count of clusters inside triangle bounds which were skipped by the coarse block test
+    - o_quads_visited: Optional output count of clusters visited by traversal
+    - o_quads_covered: Optional output count of visited clusters which had at least one pixel inside the triangle
+    - o_hiz_rejects: Optional output counts of work skipped by the Hi-Z test [3 - triangles, blocks, clusters inside triangle bounds]
+    - o_tri_ready: Optional output ready to take a triangle signal (1 while the triangle FIFO has space)
+    - o_cleared: Optional output fast clear flags, 1 for each block still holding the clear values (not written to the tile buffer) [(DIM / BLOCK) ** 2,
+      or 1 if BLOCK is 0 - in row-major block order]
+    - o_clr_col: Optional output clear color
     
     - DIM: width/height of render area
+    - BLOCK: width/height of coarse traversal & fast clear blocks in pixels (power of two, at least 4 - or 0 to walk every cluster inside triangle bounds,
+      and clear the whole tile as a single block)
+    - TRAVERSAL: order clusters are visited in within a block ("scan" = every cluster of each row, left to right, "span" = serpentine, leaving each row
+      as soon as the triangle's edges rule out any more coverage along it)
+    - HIZ: keep depth bounds per coarse block for early depth rejection (ignored if BLOCK is 0)
+    - TRI_FIFO: number of triangles which can be queued up behind the one being set up
     """
 
     _state = Signal(t_State.WAITING)
-    _v0 = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
-    _v1 = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
-    _v2 = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
     _bmin = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
     _bmax = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
-    _offs = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
     _a01 = Signal(intbv(0)[32:0].signed())
     _a12 = Signal(intbv(0)[32:0].signed())
     _a20 = Signal(intbv(0)[32:0].signed())
     _b01 = Signal(intbv(0)[32:0].signed())
     _b12 = Signal(intbv(0)[32:0].signed())
     _b20 = Signal(intbv(0)[32:0].signed())
-    _bias0 = Signal(intbv(0)[32:0].signed())
-    _bias1 = Signal(intbv(0)[32:0].signed())
-    _bias2 = Signal(intbv(0)[32:0].signed())
     _w0_row = Signal(intbv(0)[32:0].signed())
     _w1_row = Signal(intbv(0)[32:0].signed())
     _w2_row = Signal(intbv(0)[32:0].signed())
+    _w0_base = Signal(intbv(0)[32:0].signed())
+    _w1_base = Signal(intbv(0)[32:0].signed())
+    _w2_base = Signal(intbv(0)[32:0].signed())
     _w0 = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
     _w1 = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
     _w2 = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
     _p = [Signal(intbv(0)[32:0]) for _ in range(2)]
+    _blk = [Signal(intbv(0)[32:0]) for _ in range(2)]
+    _rmin = [Signal(intbv(0)[32:0]) for _ in range(2)]
+    _rmax = [Signal(intbv(0)[32:0]) for _ in range(2)]
+    # set while walking a block which is known to be entirely inside the triangle
+    _full = Signal(bool(0))
+    # span traversal: cluster the current row was entered at, direction of travel, and whether the row has already been turned around on
+    _x0 = Signal(intbv(0)[32:0])
+    _left = Signal(bool(0))
+    _back = Signal(bool(0))
 
+    _col_base = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
     _col_row = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
     _col_dx = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
     _col_dy = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
-    _col = [[Signal(intbv(0)[32:0].signed()) for _ in range(4)] for _ in range(4)]
+    # NOTE: flat list indexed by (pixel * 4) + channel (r, g, b, a), so it can be handed to the pipeline as-is
+    _col = [Signal(intbv(0)[32:0].signed()) for _ in range(16)]
 
+    _1ow_base = Signal(intbv(0)[32:0].signed())
     _1ow_row = Signal(intbv(0)[32:0].signed())
     _1ow_dx = Signal(intbv(0)[32:0].signed())
     _1ow_dy = Signal(intbv(0)[32:0].signed())
     _1ow = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
 
+    _sow_base = Signal(intbv(0)[32:0].signed())
     _sow_row = Signal(intbv(0)[32:0].signed())
     _sow_dx = Signal(intbv(0)[32:0].signed())
     _sow_dy = Signal(intbv(0)[32:0].signed())
     _sow = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
 
+    _tow_base = Signal(intbv(0)[32:0].signed())
     _tow_row = Signal(intbv(0)[32:0].signed())
     _tow_dx = Signal(intbv(0)[32:0].signed())
     _tow_dy = Signal(intbv(0)[32:0].signed())
     _tow = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
 
+    _zow_base = Signal(intbv(0)[32:0].signed())
     _zow_row = Signal(intbv(0)[32:0].signed())
     _zow_dx = Signal(intbv(0)[32:0].signed())
     _zow_dy = Signal(intbv(0)[32:0].signed())
     _zow = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
 
-    _tex_col = [Signal(intbv(0)[32:0]) for _ in range(4)]
-    _out_col = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    # render state of the triangle being drawn
+    RS_IN = [i_tex_en, i_dtest_en, i_dcmp, i_bl_en, i_bl_src, i_bl_dst, i_bl_op, i_fog_en, i_fog_col]
+    _rs = [Signal(r.val) for r in RS_IN]
+    (_rs_tex_en, _rs_dtest_en, _rs_dcmp, _rs_bl_en, _rs_bl_src, _rs_bl_dst, _rs_bl_op, _rs_fog_en, _rs_fog_col) = _rs
+
+    # triangle FIFO: each entry holds the triangle parameters (in the order of TRI_IN) & render state
+    TRI_IN = (i_v0 + i_v1 + i_v2 + i_col_init + i_col_dx + i_col_dy + [i_1ow_init, i_1ow_dx, i_1ow_dy, i_sow_init, i_sow_dx, i_sow_dy,
+              i_tow_init, i_tow_dx, i_tow_dy, i_zow_init, i_zow_dx, i_zow_dy])
+    TRI_WORDS = len(TRI_IN)
+    RS_WORDS = len(RS_IN)
+    _fifo_tri = [Signal(t.val) for _ in range(TRI_FIFO) for t in TRI_IN]
+    _fifo_rs = [Signal(r.val) for _ in range(TRI_FIFO) for r in RS_IN]
+    _fifo_rd = Signal(intbv(0, min=0, max=TRI_FIFO))
+    _fifo_wr = Signal(intbv(0, min=0, max=TRI_FIFO))
+    _fifo_count = Signal(intbv(0, min=0, max=TRI_FIFO + 1))
+
+    # triangle setup (SETUP1-3) works on its own registers, and leaves the traversal registers of the next triangle in a shadow copy of them
+    # (in the order of _regs), which is copied over once the current triangle has been drawn
+    _setup_state = Signal(t_Setup.IDLE)
+    _v0 = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    _v1 = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    _v2 = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    _offs = [Signal(intbv(0)[32:0].signed()) for _ in range(2)]
+    _bias0 = Signal(intbv(0)[32:0].signed())
+    _bias1 = Signal(intbv(0)[32:0].signed())
+    _bias2 = Signal(intbv(0)[32:0].signed())
+    _regs = (_bmin + _bmax + [_a01, _a12, _a20, _b01, _b12, _b20, _w0_base, _w1_base, _w2_base] + _col_base + _col_dx + _col_dy +
+             [_1ow_base, _1ow_dx, _1ow_dy, _sow_base, _sow_dx, _sow_dy, _tow_base, _tow_dx, _tow_dy, _zow_base, _zow_dx, _zow_dy] + _rs)
+    _s_regs = [Signal(r.val) for r in _regs]
+    (_s_bmin, _s_bmax) = (_s_regs[0:2], _s_regs[2:4])
+    (_s_a01, _s_a12, _s_a20, _s_b01, _s_b12, _s_b20, _s_w0_base, _s_w1_base, _s_w2_base) = _s_regs[4:13]
+    (_s_col_base, _s_col_dx, _s_col_dy) = (_s_regs[13:17], _s_regs[17:21], _s_regs[21:25])
+    (_s_1ow_base, _s_1ow_dx, _s_1ow_dy, _s_sow_base, _s_sow_dx, _s_sow_dy,
+     _s_tow_base, _s_tow_dx, _s_tow_dy, _s_zow_base, _s_zow_dx, _s_zow_dy) = _s_regs[25:37]
+    _s_rs = _s_regs[37:]
+    # set while the next triangle is handed from the shadow registers to traversal
+    _setup_take = Signal(bool(0))
+
+    if i_flush_stb is None:
+        i_flush_stb = Signal(bool(0))
+    if o_tri_ready is None:
+        o_tri_ready = Signal(bool(0))
+    if o_stall_cycles is None:
+        o_stall_cycles = [Signal(intbv(0)[32:]) for _ in range(5)]
+    if o_quads_skipped is None:
+        o_quads_skipped = Signal(intbv(0)[32:])
+    if o_quads_visited is None:
+        o_quads_visited = Signal(intbv(0)[32:])
+    if o_quads_covered is None:
+        o_quads_covered = Signal(intbv(0)[32:])
+
+    if o_hiz_rejects is None:
+        o_hiz_rejects = [Signal(intbv(0)[32:]) for _ in range(3)]
+
+    if o_cleared is None:
+        o_cleared = [Signal(bool(0)) for _ in range((DIM // BLOCK) ** 2 if BLOCK != 0 else 1)]
+    if o_clr_col is None:
+        o_clr_col = Signal(intbv(0)[32:])
+
+    assert TRI_FIFO >= 1, "TRI_FIFO must be at least 1"
+
+    assert TRAVERSAL in ("scan", "span"), "Unknown traversal order: %s" % TRAVERSAL
+
+    assert BLOCK == 0 or (BLOCK >= 4 and (BLOCK & (BLOCK - 1)) == 0), "BLOCK must be 0 or a power of two of at least 4"
+
+    # blocks are aligned to multiples of BLOCK within the render area, and measured in 2x2 clusters
+    BLOCK_QUADS = BLOCK >> 1
+    BLOCK_SHIFT = BLOCK_QUADS.bit_length() - 1
+
+    # Hi-Z: each block's bounds are made of a base min/max (which holds for all of its pixels), and a min/max for the layer of pixels written
+    # since (marked in a per-pixel mask) - once every pixel of the block has been written, the layer's bounds become the new base
+    # when a later triangle writes values nearer than the layer's, the layer is folded into the base and restarted, so that a near occluder
+    # isn't held back by whatever pixels earlier triangles left in the layer
+    HIZ_DIM = (DIM // BLOCK) if HIZ and BLOCK != 0 else 0
+    _hiz_min = [Signal(intbv(0)[32:]) for _ in range(HIZ_DIM * HIZ_DIM)]
+    _hiz_max = [Signal(intbv(0xFFFFFFFF)[32:]) for _ in range(HIZ_DIM * HIZ_DIM)]
+    _hiz_layer_min = [Signal(intbv(0xFFFFFFFF)[32:]) for _ in range(HIZ_DIM * HIZ_DIM)]
+    _hiz_layer_max = [Signal(intbv(0)[32:]) for _ in range(HIZ_DIM * HIZ_DIM)]
+    _hiz_layer_mask = [Signal(intbv(0)[BLOCK * BLOCK:]) for _ in range(HIZ_DIM * HIZ_DIM)]
+    _hiz_layer_id = [Signal(intbv(0)[8:]) for _ in range(HIZ_DIM * HIZ_DIM)]
+    # counts triangles (as the pipeline drains between them, this always matches the cluster being written)
+    _tri_id = Signal(intbv(0)[8:])
+
+    # fast clear blocks are the coarse traversal blocks, or the whole tile
+    CLR_BLOCK = BLOCK if BLOCK != 0 else DIM
+    CLR_QUADS = CLR_BLOCK >> 1
+    CLR_SHIFT = CLR_QUADS.bit_length() - 1
+    CLR_DIM = DIM // CLR_BLOCK
+
+    _clr_col = Signal(intbv(0)[32:])
+    _clr_d = Signal(intbv(0)[32:])
+    _cleared = [Signal(bool(0)) for _ in range(CLR_DIM * CLR_DIM)]
+    # fill request accepted this cycle
+    _clr_stb = Signal(bool(0))
+    # block being written out with clear values (either the one being flushed, or the one the cluster in WRITE belongs to), and the cluster of it being written
+    _mat_en = Signal(bool(0))
+    _mat_blk = Signal(intbv(0)[32:])
+    _mat_q = Signal(intbv(0)[32:])
+    _flush_blk = Signal(intbv(0)[32:])
+
+    # NOTE: for each pipeline register, signals suffixed with _d are what the previous stage computed (and hands to the register),
+    # everything else is what the register currently holds (and feeds the next stage)
+
+    # RASTERLOOP -> ZTEST
+    _ztest_valid_d = Signal(bool(0))
+    _ztest_ready_d = Signal(bool(0))
+    _ztest_valid = Signal(bool(0))
+    _ztest_ready = Signal(bool(0))
+    _ztest_pos = [Signal(intbv(0)[32:0]) for _ in range(2)]
+    _ztest_w0 = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    _ztest_w1 = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    _ztest_w2 = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    _ztest_col = [Signal(intbv(0)[32:0].signed()) for _ in range(16)]
+    _ztest_1ow = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    _ztest_sow = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    _ztest_tow = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    _ztest_zow = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    _ztest_full = Signal(bool(0))
+
+    # ZTEST -> TEX
+    _tex_valid_d = Signal(bool(0))
+    _tex_ready_d = Signal(bool(0))
+    _tex_mask_d = [Signal(bool(0)) for _ in range(4)]
+    _tex_dst_d = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    _tex_valid = Signal(bool(0))
+    _tex_ready = Signal(bool(0))
+    _tex_pos = [Signal(intbv(0)[32:0]) for _ in range(2)]
+    _tex_mask = [Signal(bool(0)) for _ in range(4)]
+    _tex_col = [Signal(intbv(0)[32:0].signed()) for _ in range(16)]
+    _tex_1ow = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    _tex_sow = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    _tex_tow = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    _tex_zow = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    _tex_dst = [Signal(intbv(0)[32:0]) for _ in range(4)]
 
-    _sample_valid = [Signal(bool(0)) for _ in range(4)]
-    _depth_test = [Signal(bool(0)) for _ in range(4)]
+    # TEX -> COMBINE
+    _comb_valid_d = Signal(bool(0))
+    _comb_ready_d = Signal(bool(0))
+    _comb_col_d = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    _comb_valid = Signal(bool(0))
+    _comb_ready = Signal(bool(0))
+    _comb_pos = [Signal(intbv(0)[32:0]) for _ in range(2)]
+    _comb_mask = [Signal(bool(0)) for _ in range(4)]
+    _comb_col = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    _comb_zow = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    _comb_dst = [Signal(intbv(0)[32:0]) for _ in range(4)]
+
+    # COMBINE -> BLEND (COMBINE never holds a cluster back, so its handshake is just passed through)
+    _blend_col_d = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    _blend_valid = Signal(bool(0))
+    _blend_ready = Signal(bool(0))
+    _blend_pos = [Signal(intbv(0)[32:0]) for _ in range(2)]
+    _blend_mask = [Signal(bool(0)) for _ in range(4)]
+    _blend_col = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    _blend_zow = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+    _blend_dst = [Signal(intbv(0)[32:0]) for _ in range(4)]
+
+    # BLEND -> WRITE (as above - WRITE takes the cluster it's holding unless its block has to be written out with clear values first)
+    _wr_col_d = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    _wr_valid = Signal(bool(0))
+    _wr_ready = Signal(bool(1))
+    _wr_pos = [Signal(intbv(0)[32:0]) for _ in range(2)]
+    _wr_mask = [Signal(bool(0)) for _ in range(4)]
+    _wr_col = [Signal(intbv(0)[32:0]) for _ in range(4)]
+    _wr_zow = [Signal(intbv(0)[32:0].signed()) for _ in range(4)]
+
+    ztest_reg = SkidBuffer(i_rst, i_clk, _p + _w0 + _w1 + _w2 + _col + _1ow + _sow + _tow + _zow + [_full], _ztest_valid_d, _ztest_ready_d,
+                           _ztest_pos + _ztest_w0 + _ztest_w1 + _ztest_w2 + _ztest_col + _ztest_1ow + _ztest_sow + _ztest_tow + _ztest_zow + [_ztest_full], _ztest_valid, _ztest_ready)
+    tex_reg = SkidBuffer(i_rst, i_clk, _ztest_pos + _tex_mask_d + _ztest_col + _ztest_1ow + _ztest_sow + _ztest_tow + _ztest_zow + _tex_dst_d, _tex_valid_d, _tex_ready_d,
+                         _tex_pos + _tex_mask + _tex_col + _tex_1ow + _tex_sow + _tex_tow + _tex_zow + _tex_dst, _tex_valid, _tex_ready)
+    comb_reg = SkidBuffer(i_rst, i_clk, _tex_pos + _tex_mask + _comb_col_d + _tex_zow + _tex_dst, _comb_valid_d, _comb_ready_d,
+                          _comb_pos + _comb_mask + _comb_col + _comb_zow + _comb_dst, _comb_valid, _comb_ready)
+    blend_reg = SkidBuffer(i_rst, i_clk, _comb_pos + _comb_mask + _blend_col_d + _comb_zow + _comb_dst, _comb_valid, _comb_ready,
+                           _blend_pos + _blend_mask + _blend_col + _blend_zow + _blend_dst, _blend_valid, _blend_ready)
+    wr_reg = SkidBuffer(i_rst, i_clk, _blend_pos + _blend_mask + _wr_col_d + _blend_zow, _blend_valid, _blend_ready,
+                        _wr_pos + _wr_mask + _wr_col + _wr_zow, _wr_valid, _wr_ready)
 
     def isTopLeft(a, b):
         return (a[1] == b[1] and b[0] > a[0]) or (b[1] > a[1])
@@ -135,23 +369,24 @@ def TriRaster(i_rst, i_clk, i_v0, i_v1, i_v2,
     def orient2D(a, b, c):
         return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
         
-    def depth_test():
-        if i_dcmp == 0:
-            return [not i_dtest_en for _ in range(4)]
-        elif i_dcmp == 1:
+    # NOTE: the helpers below take every signal they read as an argument, so that the always_comb stages calling them are sensitive to it
+    def depth_test(dcmp, dtest_en, zow, dst):
+        if dcmp == 0:
+            return [not dtest_en for _ in range(4)]
+        elif dcmp == 1:
             return [True for _ in range(4)]
-        elif i_dcmp == 2:
-            return [(not i_dtest_en or _zow[i] == i_rd_data_d[i]) for i in range(4)]
-        elif i_dcmp == 3:
-            return [(not i_dtest_en or _zow[i] != i_rd_data_d[i]) for i in range(4)]
-        elif i_dcmp == 4:
-            return [(not i_dtest_en or _zow[i] < i_rd_data_d[i]) for i in range(4)]
-        elif i_dcmp == 5:
-            return [(not i_dtest_en or _zow[i] > i_rd_data_d[i]) for i in range(4)]
-        elif i_dcmp == 6:
-            return [(not i_dtest_en or _zow[i] <= i_rd_data_d[i]) for i in range(4)]
-        elif i_dcmp == 7:
-            return [(not i_dtest_en or _zow[i] >= i_rd_data_d[i]) for i in range(4)]
+        elif dcmp == 2:
+            return [(not dtest_en or zow[i] == dst[i]) for i in range(4)]
+        elif dcmp == 3:
+            return [(not dtest_en or zow[i] != dst[i]) for i in range(4)]
+        elif dcmp == 4:
+            return [(not dtest_en or zow[i] < dst[i]) for i in range(4)]
+        elif dcmp == 5:
+            return [(not dtest_en or zow[i] > dst[i]) for i in range(4)]
+        elif dcmp == 6:
+            return [(not dtest_en or zow[i] <= dst[i]) for i in range(4)]
+        elif dcmp == 7:
+            return [(not dtest_en or zow[i] >= dst[i]) for i in range(4)]
         else:
             return [False for _ in range(4)]
         
@@ -206,26 +441,26 @@ def TriRaster(i_rst, i_clk, i_v0, i_v1, i_v2,
         else:
             return intbv(a)[8:0]
     
-    def do_blend(idx):
-        src_r = _out_col[idx][8:0]
-        src_g = _out_col[idx][16:8]
-        src_b = _out_col[idx][24:16]
-        src_a = _out_col[idx][32:24]
+    def do_blend(src_col, dst_col, bl_src, bl_dst, bl_op):
+        src_r = src_col[8:0]
+        src_g = src_col[16:8]
+        src_b = src_col[24:16]
+        src_a = src_col[32:24]
         src_rgba = (src_r, src_g, src_b, src_a)
 
-        dst_r = i_rd_data_rgb[idx][8:0]
-        dst_g = i_rd_data_rgb[idx][16:8]
-        dst_b = i_rd_data_rgb[idx][24:16]
-        dst_a = i_rd_data_rgb[idx][32:24]
+        dst_r = dst_col[8:0]
+        dst_g = dst_col[16:8]
+        dst_b = dst_col[24:16]
+        dst_a = dst_col[32:24]
         dst_rgba = (dst_r, dst_g, dst_b, dst_a)
 
-        src_fac = get_blend_fac(i_bl_src, src_rgba, dst_rgba)
-        dst_fac = get_blend_fac(i_bl_dst, src_rgba, dst_rgba)
+        src_fac = get_blend_fac(bl_src, src_rgba, dst_rgba)
+        dst_fac = get_blend_fac(bl_dst, src_rgba, dst_rgba)
 
         src_op = color_mul(src_rgba, src_fac)
         dst_op = color_mul(dst_rgba, dst_fac)
 
-        if i_bl_op == 0:
+        if bl_op == 0:
             return concat(color_sat8(dst_op[3] + src_op[3]),
                           color_sat8(dst_op[2] + src_op[2]),
                           color_sat8(dst_op[1] + src_op[1]),
@@ -236,51 +471,20 @@ def TriRaster(i_rst, i_clk, i_v0, i_v1, i_v2,
                           color_sat8(dst_op[1] - src_op[1]),
                           color_sat8(dst_op[0] - src_op[0]))
     
-    def get_out_stw():
-        if _state == t_State.TEX0:
-            return (_sow[0], _tow[0], _1ow[0])
-        elif _state == t_State.TEX1:
-            return (_sow[1], _tow[1], _1ow[1])
-        elif _state == t_State.TEX2:
-            return (_sow[2], _tow[2], _1ow[2])
-        elif _state == t_State.TEX3:
-            return (_sow[3], _tow[3], _1ow[3])
-        else:
-            return (0, 0, 0)
-    
-    def get_stw_row():
-        if _state == t_State.TEX0 or _state == t_State.TEX1:
-            return (_sow[0], _tow[0], _1ow[0], _sow[1], _tow[1], _1ow[1])
-        elif _state == t_State.TEX2 or _state == t_State.TEX3:
-            return (_sow[2], _tow[2], _1ow[2], _sow[3], _tow[3], _1ow[3])
-        else:
-            return (0, 0, 0, 0, 0, 0)
-        
-    def get_stw_col():
-        if _state == t_State.TEX0 or _state == t_State.TEX2:
-            return (_sow[0], _tow[0], _1ow[0], _sow[2], _tow[2], _1ow[2])
-        elif _state == t_State.TEX1 or _state == t_State.TEX3:
-            return (_sow[1], _tow[1], _1ow[1], _sow[3], _tow[3], _1ow[3])
-        else:
-            return (0, 0, 0, 0, 0, 0)
-
-    def get_out_color(idx):
-        if i_tex_en:
-            return _tex_col[idx]
-        else:
-            vr = _col[idx][0][20:12]
-            vg = _col[idx][1][20:12]
-            vb = _col[idx][2][20:12]
-            va = _col[idx][3][20:12]
-            return concat(va, vb, vg, vr)
+    def get_vtx_color(vtx_col):
+        vr = vtx_col[0][20:12]
+        vg = vtx_col[1][20:12]
+        vb = vtx_col[2][20:12]
+        va = vtx_col[3][20:12]
+        return concat(va, vb, vg, vr)
         
-    def apply_fog(src_col, zow):
-        if i_fog_en:
+    def apply_fog(src_col, zow, fog_en, fog_col, fog_tbl):
+        if fog_en:
             fog_idx = zow[24:18]
-            fog_density = i_fog_tbl[fog_idx]
-            fr = i_fog_col[8:0]
-            fg = i_fog_col[16:8]
-            fb = i_fog_col[24:16]
+            fog_density = fog_tbl[fog_idx]
+            fr = fog_col[8:0]
+            fg = fog_col[16:8]
+            fb = fog_col[24:16]
             cr = src_col[8:0]
             cg = src_col[16:8]
             cb = src_col[24:16]
@@ -300,374 +504,646 @@ def TriRaster(i_rst, i_clk, i_v0, i_v1, i_v2,
         else:
             return src_col
 
+    def clr_block(pos):
+        return ((pos[1] >> CLR_SHIFT) * CLR_DIM) + (pos[0] >> CLR_SHIFT)
+
+    def set_cluster(w0, w1, w2, col, ow, sow, tow, zow):
+        # set the iterators of the current 2x2 cluster from the values of its top left pixel
+        _w0[0].next = w0
+        _w1[0].next = w1
+        _w2[0].next = w2
+        _w0[1].next = w0 + _a12
+        _w1[1].next = w1 + _a20
+        _w2[1].next = w2 + _a01
+        _w0[2].next = w0 + _b12
+        _w1[2].next = w1 + _b20
+        _w2[2].next = w2 + _b01
+        _w0[3].next = w0 + _a12 + _b12
+        _w1[3].next = w1 + _a20 + _b20
+        _w2[3].next = w2 + _a01 + _b01
+        for i in range(4):
+            _col[i].next = col[i]
+            _col[4 + i].next = col[i] + _col_dx[i]
+            _col[8 + i].next = col[i] + _col_dy[i]
+            _col[12 + i].next = col[i] + _col_dx[i] + _col_dy[i]
+        _1ow[0].next = ow
+        _1ow[1].next = ow + _1ow_dx
+        _1ow[2].next = ow + _1ow_dy
+        _1ow[3].next = ow + _1ow_dx + _1ow_dy
+        _sow[0].next = sow
+        _sow[1].next = sow + _sow_dx
+        _sow[2].next = sow + _sow_dy
+        _sow[3].next = sow + _sow_dx + _sow_dy
+        _tow[0].next = tow
+        _tow[1].next = tow + _tow_dx
+        _tow[2].next = tow + _tow_dy
+        _tow[3].next = tow + _tow_dx + _tow_dy
+        _zow[0].next = zow
+        _zow[1].next = zow + _zow_dx
+        _zow[2].next = zow + _zow_dy
+        _zow[3].next = zow + _zow_dx + _zow_dy
+
+    def start_row(w0_row, w1_row, w2_row, col_row, ow_row, sow_row, tow_row, zow_row):
+        # set row start values & the iterators of the first 2x2 cluster in the row
+        _w0_row.next = w0_row
+        _w1_row.next = w1_row
+        _w2_row.next = w2_row
+        for i in range(4):
+            _col_row[i].next = col_row[i]
+        _1ow_row.next = ow_row
+        _sow_row.next = sow_row
+        _tow_row.next = tow_row
+        _zow_row.next = zow_row
+        set_cluster(w0_row, w1_row, w2_row, col_row, ow_row, sow_row, tow_row, zow_row)
+
+    def enter_run(x0, y0, x1, y1, full):
+        # start walking the clusters from x0/y0 to x1/y1, with iterators offset from the top left corner of triangle bounds
+        # NOTE: offsets are in pixels, as iterators step by one pixel
+        nx = (x0 - _bmin[0]) << 1
+        ny = (y0 - _bmin[1]) << 1
+        start_row(_w0_base + (_a12 * nx) + (_b12 * ny), _w1_base + (_a20 * nx) + (_b20 * ny), _w2_base + (_a01 * nx) + (_b01 * ny),
+                  [_col_base[i] + (_col_dx[i] * nx) + (_col_dy[i] * ny) for i in range(4)],
+                  _1ow_base + (_1ow_dx * nx) + (_1ow_dy * ny), _sow_base + (_sow_dx * nx) + (_sow_dy * ny),
+                  _tow_base + (_tow_dx * nx) + (_tow_dy * ny), _zow_base + (_zow_dx * nx) + (_zow_dy * ny))
+        _p[0].next = x0
+        _p[1].next = y0
+        _rmin[0].next = x0
+        _rmin[1].next = y0
+        _rmax[0].next = x1
+        _rmax[1].next = y1
+        _full.next = full
+        _x0.next = x0
+        _left.next = False
+        _back.next = False
+
+    def next_block(bx, by):
+        if bx + BLOCK_QUADS > _bmax[0]:
+            return ((_bmin[0] >> BLOCK_SHIFT) << BLOCK_SHIFT, by + BLOCK_QUADS)
+        return (bx + BLOCK_QUADS, by)
+
+    def is_last_block(bx, by):
+        return bx + BLOCK_QUADS > _bmax[0] and by + BLOCK_QUADS > _bmax[1]
+
+    def skip_block(bx, by):
+        if is_last_block(bx, by):
+            _state.next = t_State.WAITING
+        else:
+            nxt = next_block(bx, by)
+            _blk[0].next = nxt[0]
+            _blk[1].next = nxt[1]
+            _state.next = t_State.COARSE
+
+    def zow_bounds(nx0, ny0, nx1, ny1):
+        # min/max of z/w across the given pixel rectangle (relative to the top left corner of triangle bounds), which lie at its corners
+        zow = [_zow_base + (_zow_dx * nx) + (_zow_dy * ny) for nx in (nx0, nx1) for ny in (ny0, ny1)]
+        return (min2(min2(zow[0], zow[1]), min2(zow[2], zow[3])), max2(max2(zow[0], zow[1]), max2(zow[2], zow[3])))
+
+    def hiz_bounds(r):
+        return (min2(_hiz_min[r], _hiz_layer_min[r]), max2(_hiz_max[r], _hiz_layer_max[r]))
+
+    def hiz_reject(zmin, zmax, dmin, dmax):
+        # true if the depth test fails for every z/w in zmin..zmax against every depth value in dmin..dmax
+        if not _rs_dtest_en:
+            return False
+        elif _rs_dcmp == 0:
+            return True
+        elif _rs_dcmp == 2:
+            return zmax < dmin or zmin > dmax
+        elif _rs_dcmp == 4:
+            return zmin >= dmax
+        elif _rs_dcmp == 5:
+            return zmax <= dmin
+        elif _rs_dcmp == 6:
+            return zmin > dmax
+        elif _rs_dcmp == 7:
+            return zmax < dmin
+        else:
+            return False
+
+    def hiz_reject_tri():
+        # bounds of every block overlapping triangle bounds
+        dmin = 0xFFFFFFFF
+        dmax = 0
+        for r in range(HIZ_DIM * HIZ_DIM):
+            rx = (r % HIZ_DIM) << BLOCK_SHIFT
+            ry = (r // HIZ_DIM) << BLOCK_SHIFT
+            if rx + BLOCK_QUADS > _bmin[0] and rx <= _bmax[0] and ry + BLOCK_QUADS > _bmin[1] and ry <= _bmax[1]:
+                (rmin, rmax) = hiz_bounds(r)
+                dmin = min2(dmin, rmin)
+                dmax = max2(dmax, rmax)
+        (zmin, zmax) = zow_bounds(0, 0, ((_bmax[0] - _bmin[0]) << 1) + 1, ((_bmax[1] - _bmin[1]) << 1) + 1)
+        return hiz_reject(zmin, zmax, dmin, dmax)
+
+    def visit_block(bx, by):
+        # clusters of the block which lie inside triangle bounds
+        x0 = max2(bx, _bmin[0])
+        y0 = max2(by, _bmin[1])
+        x1 = min2(bx + BLOCK_QUADS - 1, _bmax[0])
+        y1 = min2(by + BLOCK_QUADS - 1, _bmax[1])
+        # evaluate each edge function at the corner pixels of the whole block: if all four lie outside of any one edge, no pixel in the block
+        # can be covered, and if all of them lie inside every edge, all pixels in the block are
+        nx0 = (bx - _bmin[0]) << 1
+        ny0 = (by - _bmin[1]) << 1
+        nx1 = nx0 + (BLOCK_QUADS << 1) - 1
+        ny1 = ny0 + (BLOCK_QUADS << 1) - 1
+        reject = False
+        full = True
+        for (w, a, b) in ((_w0_base, _a12, _b12), (_w1_base, _a20, _b20), (_w2_base, _a01, _b01)):
+            outside = [(w + (a * nx) + (b * ny)) < 0 for nx in (nx0, nx1) for ny in (ny0, ny1)]
+            reject = reject or (outside[0] and outside[1] and outside[2] and outside[3])
+            full = full and not (outside[0] or outside[1] or outside[2] or outside[3])
+        if reject:
+            o_quads_skipped.next = o_quads_skipped + ((x1 - x0 + 1) * (y1 - y0 + 1))
+            skip_block(bx, by)
+        elif HIZ_DIM != 0 and hiz_reject(*(zow_bounds(nx0, ny0, nx1, ny1) + hiz_bounds(((by >> BLOCK_SHIFT) * HIZ_DIM) + (bx >> BLOCK_SHIFT)))):
+            o_hiz_rejects[1].next = o_hiz_rejects[1] + 1
+            o_hiz_rejects[2].next = o_hiz_rejects[2] + ((x1 - x0 + 1) * (y1 - y0 + 1))
+            skip_block(bx, by)
+        else:
+            _blk[0].next = bx
+            _blk[1].next = by
+            enter_run(x0, y0, x1, y1, full)
+            _state.next = t_State.RASTERLOOP
+
+    def is_covered(w0, w1, w2):
+        return ((w0[0] >= 0 and w1[0] >= 0 and w2[0] >= 0) or (w0[1] >= 0 and w1[1] >= 0 and w2[1] >= 0) or
+                (w0[2] >= 0 and w1[2] >= 0 and w2[2] >= 0) or (w0[3] >= 0 and w1[3] >= 0 and w2[3] >= 0))
+
+    def is_blocked(w0, w1, w2, step):
+        # true if every pixel of the cluster lies outside an edge which doesn't get any closer when stepping along the row by step clusters,
+        # so that no cluster further along the row in that direction can be covered either
+        for (w, a) in ((w0, _a12), (w1, _a20), (w2, _a01)):
+            if w[0] < 0 and w[1] < 0 and w[2] < 0 and w[3] < 0 and (a * step) <= 0:
+                return True
+        return False
+
+    def finish_run():
+        if BLOCK == 0 or is_last_block(_blk[0], _blk[1]):
+            # finished
+            _state.next = t_State.WAITING
+        else:
+            # test the next block right away, so that moving on to a block which isn't rejected doesn't cost a cycle
+            nxt = next_block(_blk[0], _blk[1])
+            visit_block(nxt[0], nxt[1])
+
+    def scan_step():
+        # walk every cluster of the run, row by row
+        if _p[0] == _rmax[0]:
+            if _p[1] == _rmax[1]:
+                finish_run()
+            else:
+                # new row, increment row start values & update current iterators
+                start_row(_w0_row + (_b12 << 1), _w1_row + (_b20 << 1), _w2_row + (_b01 << 1),
+                          [_col_row[i] + (_col_dy[i] << 1) for i in range(4)],
+                          _1ow_row + (_1ow_dy << 1), _sow_row + (_sow_dy << 1), _tow_row + (_tow_dy << 1), _zow_row + (_zow_dy << 1))
+                # set position to next row
+                _p[0].next = _rmin[0]
+                _p[1].next = _p[1] + 1
+        else:
+            # increment bary weights
+            for i in range(4):
+                _w0[i].next = _w0[i] + (_a12 << 1)
+                _w1[i].next = _w1[i] + (_a20 << 1)
+                _w2[i].next = _w2[i] + (_a01 << 1)
+            # increment color iterators
+            for i in range(4):
+                for j in range(4):
+                    _col[(i * 4) + j].next = _col[(i * 4) + j] + (_col_dx[j] << 1)
+            # increment w, s/w, t/w, and z/w iterators
+            for i in range(4):
+                _1ow[i].next = _1ow[i] + (_1ow_dx << 1)
+                _sow[i].next = _sow[i] + (_sow_dx << 1)
+                _tow[i].next = _tow[i] + (_tow_dx << 1)
+                _zow[i].next = _zow[i] + (_zow_dx << 1)
+            # increment position
+            _p[0].next = _p[0] + 1
+
+    def span_step():
+        # each row is walked outwards from the cluster it was entered at, first in the current direction & then in the other one,
+        # and each direction is left as soon as the next cluster along the row is blocked by an edge (or lies outside the run)
+        step = -1 if _left else 1
+        nx = _p[0] + step
+        nw0 = [_w0[i] + ((_a12 * step) << 1) for i in range(4)]
+        nw1 = [_w1[i] + ((_a20 * step) << 1) for i in range(4)]
+        nw2 = [_w2[i] + ((_a01 * step) << 1) for i in range(4)]
+        if nx >= _rmin[0] and nx <= _rmax[0] and not is_blocked(nw0, nw1, nw2, step):
+            # step along the row
+            set_cluster(nw0[0], nw1[0], nw2[0],
+                        [_col[i] + ((_col_dx[i] * step) << 1) for i in range(4)],
+                        _1ow[0] + ((_1ow_dx * step) << 1), _sow[0] + ((_sow_dx * step) << 1),
+                        _tow[0] + ((_tow_dx * step) << 1), _zow[0] + ((_zow_dx * step) << 1))
+            _p[0].next = nx
+            return
+        if not _back:
+            # turn around, and walk the other side of the cluster the row was entered at
+            bx = _x0 - step
+            bw0 = _w0_row - ((_a12 * step) << 1)
+            bw1 = _w1_row - ((_a20 * step) << 1)
+            bw2 = _w2_row - ((_a01 * step) << 1)
+            if (bx >= _rmin[0] and bx <= _rmax[0] and
+                    not is_blocked([bw0, bw0 + _a12, bw0 + _b12, bw0 + _a12 + _b12],
+                                   [bw1, bw1 + _a20, bw1 + _b20, bw1 + _a20 + _b20],
+                                   [bw2, bw2 + _a01, bw2 + _b01, bw2 + _a01 + _b01], -step)):
+                set_cluster(bw0, bw1, bw2,
+                            [_col_row[i] - ((_col_dx[i] * step) << 1) for i in range(4)],
+                            _1ow_row - ((_1ow_dx * step) << 1), _sow_row - ((_sow_dx * step) << 1),
+                            _tow_row - ((_tow_dx * step) << 1), _zow_row - ((_zow_dx * step) << 1))
+                _p[0].next = bx
+                _left.next = not _left
+                _back.next = True
+                return
+        if _p[1] == _rmax[1]:
+            finish_run()
+        else:
+            # enter the next row right below the current cluster, walking back the way we came (so the next row's span is usually reached right away)
+            start_row(_w0[0] + (_b12 << 1), _w1[0] + (_b20 << 1), _w2[0] + (_b01 << 1),
+                      [_col[i] + (_col_dy[i] << 1) for i in range(4)],
+                      _1ow[0] + (_1ow_dy << 1), _sow[0] + (_sow_dy << 1), _tow[0] + (_tow_dy << 1), _zow[0] + (_zow_dy << 1))
+            _p[1].next = _p[1] + 1
+            _x0.next = _p[0]
+            _left.next = not _left
+            _back.next = False
+
     @always(i_clk.posedge, i_rst)
     def process():
         if i_rst == 0:
             _state.next = t_State.WAITING
+            o_quads_skipped.next = 0
+            o_quads_visited.next = 0
+            o_quads_covered.next = 0
+            for i in range(3):
+                o_hiz_rejects[i].next = 0
         elif _state == t_State.WAITING:
-            if i_tri_stb:
-                # capture triangle parameters
-                _v0[0].next = i_v0[0]
-                _v0[1].next = i_v0[1]
-                _v1[0].next = i_v1[0]
-                _v1[1].next = i_v1[1]
-                _v2[0].next = i_v2[0]
-                _v2[1].next = i_v2[1]
-                for i in range(4):
-                    _col_row[i].next = i_col_init[i]
-                    _col_dx[i].next = i_col_dx[i]
-                    _col_dy[i].next = i_col_dy[i]
-                _1ow_row.next = i_1ow_init
-                _1ow_dx.next = i_1ow_dx
-                _1ow_dy.next = i_1ow_dy
-                _sow_row.next = i_sow_init
-                _sow_dx.next = i_sow_dx
-                _sow_dy.next = i_sow_dy
-                _tow_row.next = i_tow_init
-                _tow_dx.next = i_tow_dx
-                _tow_dy.next = i_tow_dy
-                _zow_row.next = i_zow_init
-                _zow_dx.next = i_zow_dx
-                _zow_dy.next = i_zow_dy
-                # begin calculating triangle bounds
-                _bmin[0].next = min2(i_v0[0], i_v1[0])
-                _bmin[1].next = min2(i_v0[1], i_v1[1])
-                _bmax[0].next = max2(i_v0[0], i_v1[0])
-                _bmax[1].next = max2(i_v0[1], i_v1[1])
-                #
-                _state.next = t_State.SETUP1
-            elif i_fill_stb:
-                # capture fill color + depth
-                for i in range(4):
-                    _out_col[i].next = concat(
-                        i_col_init[3][20:12],
-                        i_col_init[2][20:12],
-                        i_col_init[1][20:12],
-                        i_col_init[0][20:12]
-                    )
-                    _zow[i].next = i_zow_init
-                # set up fill position
-                _p[0].next = 0
-                _p[1].next = 0
-                #
-                _state.next = t_State.FILL
-        elif _state == t_State.FILL:
-            if _p[0] == 15:
-                if _p[1] == 15:
-                    # finished
+            if _setup_take:
+                # next triangle has been set up, and the pipeline has drained: start drawing it
+                for i in range(len(_regs)):
+                    _regs[i].next = _s_regs[i]
+                _tri_id.next = (_tri_id + 1) % 256
+                _state.next = t_State.SETUP4
+            elif _clr_stb:
+                # (handled by fast_clear)
+                pass
+            elif i_flush_stb and not tri_pending():
+                _flush_blk.next = 0
+                _state.next = t_State.FLUSH
+        elif _state == t_State.FLUSH:
+            # move on once the current block has been written out (or right away, if it isn't cleared)
+            if not _mat_en or _mat_q == (CLR_QUADS * CLR_QUADS) - 1:
+                if _flush_blk == (CLR_DIM * CLR_DIM) - 1:
                     _state.next = t_State.WAITING
                 else:
-                    # next row
-                    _p[0].next = 0
-                    _p[1].next = _p[1] + 1
-            else:
-                # increment x
-                _p[0].next = _p[0].next + 1
-        elif _state == t_State.SETUP1:
-            # finish calculating triangle bounds
-            _bmin[0].next = min2(_bmin[0], _v2[0])
-            _bmin[1].next = min2(_bmin[1], _v2[1])
-            _bmax[0].next = max2(_bmax[0], _v2[0])
-            _bmax[1].next = max2(_bmax[1], _v2[1])
-            # compute step increment values for barycentric weights
-            _a01.next = _v0[1] - _v1[1]
-            _a12.next = _v1[1] - _v2[1]
-            _a20.next = _v2[1] - _v0[1]
-            _b01.next = _v1[0] - _v0[0]
-            _b12.next = _v2[0] - _v1[0]
-            _b20.next = _v0[0] - _v2[0]
-            # bias for top/left fill rule
-            _bias0.next = 0 if isTopLeft(_v1, _v2) else -1
-            _bias1.next = 0 if isTopLeft(_v2, _v0) else -1
-            _bias2.next = 0 if isTopLeft(_v0, _v1) else -1
-            #
-            _state.next = t_State.SETUP2
-        elif _state == t_State.SETUP2:
-            # if top left corner of triangle bounds is less than 0, then compute offset value (used to offset triangle attributes such as colors, UVs, etc)
-            _offs[0].next = -_bmin[0] if _bmin[0] < 0 else 0
-            _offs[1].next = -_bmin[1] if _bmin[1] < 0 else 0
-            # clamp bounds to render area
-            # NOTE: we draw a 2x2 cluster at a time, so we also divide bounds by 2 (adding 1 to _bmax so it rounds up instead of down)
-            _bmin[0].next = max2(_bmin[0] >> 1, 0)
-            _bmin[1].next = max2(_bmin[1] >> 1, 0)
-            _bmax[0].next = min2((_bmax[0] + 1) >> 1, (DIM >> 1) - 1)
-            _bmax[1].next = min2((_bmax[1] + 1) >> 1, (DIM >> 1) - 1)
-            #
-            _state.next = t_State.SETUP3
-        elif _state == t_State.SETUP3:
-            # offset triangle attribute iterators
-            for i in range(4):
-                _col_row[i].next = _col_row[i] + (_col_dx[i] * _offs[0]) + (_col_dy[i] * _offs[1])
-            _1ow_row.next = _1ow_row + (_1ow_dx * _offs[0]) + (_1ow_dy * _offs[1])
-            _sow_row.next = _sow_row + (_sow_dx * _offs[0]) + (_sow_dy * _offs[1])
-            _tow_row.next = _tow_row + (_tow_dx * _offs[0]) + (_tow_dy * _offs[1])
-            _zow_row.next = _zow_row + (_zow_dx * _offs[0]) + (_zow_dy * _offs[1])
-            # store current position
-            _p[0].next = _bmin[0]
-            _p[1].next = _bmin[1]
-            # compute row start values for barycentric weights
-            new_w0_row = orient2D(i_v1, i_v2, _bmin) + _bias0
-            new_w1_row = orient2D(i_v2, i_v0, _bmin) + _bias1
-            new_w2_row = orient2D(i_v0, i_v1, _bmin) + _bias2
-            _w0_row.next = new_w0_row
-            _w1_row.next = new_w1_row
-            _w2_row.next = new_w2_row
-            # compute initial barycentric weights for 2x2 cluster
-            _w0[0].next = new_w0_row
-            _w1[0].next = new_w1_row
-            _w2[0].next = new_w2_row
-            _w0[1].next = new_w0_row + _a12
-            _w1[1].next = new_w1_row + _a20
-            _w2[1].next = new_w2_row + _a01
-            _w0[2].next = new_w0_row + _b12
-            _w1[2].next = new_w1_row + _b20
-            _w2[2].next = new_w2_row + _b01
-            _w0[3].next = new_w0_row + _a12 + _b12
-            _w1[3].next = new_w1_row + _a20 + _b20
-            _w2[3].next = new_w2_row + _a01 + _b01
-            #
-            _state.next = t_State.SETUP4
+                    _flush_blk.next = _flush_blk + 1
         elif _state == t_State.SETUP4:
-            # compute initial color iterators for 2x2 cluster
-            for i in range(4):
-                _col[0][i].next = _col_row[i]
-                _col[1][i].next = _col_row[i] + _col_dx[i]
-                _col[2][i].next = _col_row[i] + _col_dy[i]
-                _col[3][i].next = _col_row[i] + _col_dx[i] + _col_dy[i]
-            # compute initial 1/w, s/w, t/w, and z/w iterators for 2x2 cluster
-            _1ow[0].next = _1ow_row
-            _1ow[1].next = _1ow_row + _1ow_dx
-            _1ow[2].next = _1ow_row + _1ow_dy
-            _1ow[3].next = _1ow_row + _1ow_dx + _1ow_dy
-            _sow[0].next = _sow_row
-            _sow[1].next = _sow_row + _sow_dx
-            _sow[2].next = _sow_row + _sow_dy
-            _sow[3].next = _sow_row + _sow_dx + _sow_dy
-            _tow[0].next = _tow_row
-            _tow[1].next = _tow_row + _tow_dx
-            _tow[2].next = _tow_row + _tow_dy
-            _tow[3].next = _tow_row + _tow_dx + _tow_dy
-            _zow[0].next = _zow_row
-            _zow[1].next = _zow_row + _zow_dx
-            _zow[2].next = _zow_row + _zow_dy
-            _zow[3].next = _zow_row + _zow_dx + _zow_dy
-            #
-            # if the computed bary weights lie outside the triangle, just skip this cluster
-            if (not _sample_valid[0]) and (not _sample_valid[1]) and (not _sample_valid[2]) and (not _sample_valid[3]):
+            if _bmin[0] > _bmax[0] or _bmin[1] > _bmax[1]:
+                # triangle bounds lie entirely outside of the render area
+                _state.next = t_State.WAITING
+            elif HIZ_DIM != 0 and hiz_reject_tri():
+                # triangle lies entirely behind (or in front of) what's already in the depth buffer
+                o_hiz_rejects[0].next = o_hiz_rejects[0] + 1
+                o_hiz_rejects[2].next = o_hiz_rejects[2] + ((_bmax[0] - _bmin[0] + 1) * (_bmax[1] - _bmin[1] + 1))
+                _state.next = t_State.WAITING
+            elif BLOCK == 0:
+                # no coarse level: just walk every cluster inside triangle bounds
+                enter_run(_bmin[0], _bmin[1], _bmax[0], _bmax[1], False)
                 _state.next = t_State.RASTERLOOP
-            # if texturing enabled: switch to texturing state
-            elif i_tex_en:
-                _state.next = t_State.TEX0
             else:
-                _state.next = t_State.COMBINE
+                # start at the block holding the top left corner of triangle bounds
+                _blk[0].next = (_bmin[0] >> BLOCK_SHIFT) << BLOCK_SHIFT
+                _blk[1].next = (_bmin[1] >> BLOCK_SHIFT) << BLOCK_SHIFT
+                _state.next = t_State.COARSE
+        elif _state == t_State.COARSE:
+            visit_block(_blk[0], _blk[1])
         elif _state == t_State.RASTERLOOP:
-            if _p[0] == _bmax[0]:
-                if _p[1] == _bmax[1]:
-                    # finished
-                    _state.next = t_State.WAITING
+            # the current cluster is handed to the pipeline (clusters outside the triangle are dropped there), step to the next one once it's been taken
+            if _ztest_ready_d:
+                o_quads_visited.next = o_quads_visited + 1
+                if _full or is_covered(_w0, _w1, _w2):
+                    o_quads_covered.next = o_quads_covered + 1
+                if TRAVERSAL == "span":
+                    span_step()
                 else:
-                    # new row, increment row start values & update current bary weights
-                    next_w0_row = _w0_row + (_b12 << 1)
-                    next_w1_row = _w1_row + (_b20 << 1)
-                    next_w2_row = _w2_row + (_b01 << 1)
-                    _w0_row.next = next_w0_row
-                    _w1_row.next = next_w1_row
-                    _w2_row.next = next_w2_row
-                    # compute new barycentric weights for 2x2 cluster
-                    _w0[0].next = next_w0_row
-                    _w1[0].next = next_w1_row
-                    _w2[0].next = next_w2_row
-                    _w0[1].next = next_w0_row + _a12
-                    _w1[1].next = next_w1_row + _a20
-                    _w2[1].next = next_w2_row + _a01
-                    _w0[2].next = next_w0_row + _b12
-                    _w1[2].next = next_w1_row + _b20
-                    _w2[2].next = next_w2_row + _b01
-                    _w0[3].next = next_w0_row + _a12 + _b12
-                    _w1[3].next = next_w1_row + _a20 + _b20
-                    _w2[3].next = next_w2_row + _a01 + _b01
-                    # increment color row start values & update current color iterators
-                    for i in range(4):
-                        next_col_row = _col_row[i] + (_col_dy[i] << 1)
-                        _col_row[i].next = next_col_row
-                        _col[0][i].next = next_col_row
-                        _col[1][i].next = next_col_row + _col_dx[i]
-                        _col[2][i].next = next_col_row + _col_dy[i]
-                        _col[3][i].next = next_col_row + _col_dx[i] + _col_dy[i]
-                    # increment 1/w, s/w, t/w, and z/w row start values & update current iterators
-                    next_1ow_row = _1ow_row + (_1ow_dy << 1)
-                    _1ow_row.next = next_1ow_row
-                    _1ow[0].next = next_1ow_row
-                    _1ow[1].next = next_1ow_row + _1ow_dx
-                    _1ow[2].next = next_1ow_row + _1ow_dy
-                    _1ow[3].next = next_1ow_row + _1ow_dx + _1ow_dy
-                    #
-                    next_sow_row = _sow_row + (_sow_dy << 1)
-                    _sow_row.next = next_sow_row
-                    _sow[0].next = next_sow_row
-                    _sow[1].next = next_sow_row + _sow_dx
-                    _sow[2].next = next_sow_row + _sow_dy
-                    _sow[3].next = next_sow_row + _sow_dx + _sow_dy
-                    #
-                    next_tow_row = _tow_row + (_tow_dy << 1)
-                    _tow_row.next = next_tow_row
-                    _tow[0].next = next_tow_row
-                    _tow[1].next = next_tow_row + _tow_dx
-                    _tow[2].next = next_tow_row + _tow_dy
-                    _tow[3].next = next_tow_row + _tow_dx + _tow_dy
-                    #
-                    next_zow_row = _zow_row + (_zow_dy << 1)
-                    _zow_row.next = next_zow_row
-                    _zow[0].next = next_zow_row
-                    _zow[1].next = next_zow_row + _zow_dx
-                    _zow[2].next = next_zow_row + _zow_dy
-                    _zow[3].next = next_zow_row + _zow_dx + _zow_dy
-                    # set position to next row
-                    _p[0].next = _bmin[0]
-                    _p[1].next = _p[1] + 1
-                    # if texturing is enabled: switch to texturing state
-                    if i_tex_en:
-                        _state.next = t_State.TEX0
-                    else:
-                        _state.next = t_State.COMBINE
-            else:
-                # increment bary weights
-                for i in range(4):
-                    _w0[i].next = _w0[i] + (_a12 << 1)
-                    _w1[i].next = _w1[i] + (_a20 << 1)
-                    _w2[i].next = _w2[i] + (_a01 << 1)
-                # increment color iterators
-                for i in range(4):
-                    for j in range(4):
-                        _col[i][j].next = _col[i][j] + (_col_dx[j] << 1)
-                # increment 1/w, s/w, t/w, and z/w iterators
-                for i in range(4):
-                    _1ow[i].next = _1ow[i] + (_1ow_dx << 1)
-                    _sow[i].next = _sow[i] + (_sow_dx << 1)
-                    _tow[i].next = _tow[i] + (_tow_dx << 1)
-                    _zow[i].next = _zow[i] + (_zow_dx << 1)
-                # increment position
-                _p[0].next = _p[0] + 1
-                # if texturing is enabled: switch to texturing state
-                if i_tex_en:
-                    _state.next = t_State.TEX0
-                else:
-                    _state.next = t_State.COMBINE
-        elif _state == t_State.TEX0:
-            # actually if the computed bary weights lie outside the triangle, just skip texturing this cluster
-            if (not _sample_valid[0] or not _depth_test[0]) and (not _sample_valid[1] or not _depth_test[1]) and (not _sample_valid[2] or not _depth_test[2]) and (not _sample_valid[3] or not _depth_test[3]):
-                _state.next = t_State.RASTERLOOP
-            elif i_smp_ack:
-                _tex_col[0].next = combine_vtx_colors(i_smp_dat, _col[0])
-                if _sample_valid[1] and _depth_test[1]:
-                    _state.next = t_State.TEX1
-                elif _sample_valid[2] and _depth_test[2]:
-                    _state.next = t_State.TEX2
-                elif _sample_valid[3] and _depth_test[3]:
-                    _state.next = t_State.TEX3
-                else:
-                    _state.next = t_State.COMBINE
-        elif _state == t_State.TEX1:
-            if i_smp_ack:
-                _tex_col[1].next = combine_vtx_colors(i_smp_dat, _col[1])
-                if _sample_valid[2] and _depth_test[2]:
-                    _state.next = t_State.TEX2
-                elif _sample_valid[3] and _depth_test[3]:
-                    _state.next = t_State.TEX3
-                else:
-                    _state.next = t_State.COMBINE
-        elif _state == t_State.TEX2:
-            if i_smp_ack:
-                _tex_col[2].next = combine_vtx_colors(i_smp_dat, _col[2])
-                _state.next = t_State.TEX3
-                if _sample_valid[3] and _depth_test[3]:
-                    _state.next = t_State.TEX3
+                    scan_step()
+
+    def tri_pending():
+        # true while any triangle is queued or being set up (or is being handed in)
+        return i_tri_stb or _fifo_count != 0 or _setup_state != t_Setup.IDLE
+
+    def setup_load(tri, rs):
+        # capture triangle parameters & render state
+        _v0[0].next = tri[0]
+        _v0[1].next = tri[1]
+        _v1[0].next = tri[2]
+        _v1[1].next = tri[3]
+        _v2[0].next = tri[4]
+        _v2[1].next = tri[5]
+        for i in range(4):
+            _s_col_base[i].next = tri[6 + i]
+            _s_col_dx[i].next = tri[10 + i]
+            _s_col_dy[i].next = tri[14 + i]
+        _s_1ow_base.next = tri[18]
+        _s_1ow_dx.next = tri[19]
+        _s_1ow_dy.next = tri[20]
+        _s_sow_base.next = tri[21]
+        _s_sow_dx.next = tri[22]
+        _s_sow_dy.next = tri[23]
+        _s_tow_base.next = tri[24]
+        _s_tow_dx.next = tri[25]
+        _s_tow_dy.next = tri[26]
+        _s_zow_base.next = tri[27]
+        _s_zow_dx.next = tri[28]
+        _s_zow_dy.next = tri[29]
+        for i in range(RS_WORDS):
+            _s_rs[i].next = rs[i]
+        # begin calculating triangle bounds
+        _s_bmin[0].next = min2(tri[0], tri[2])
+        _s_bmin[1].next = min2(tri[1], tri[3])
+        _s_bmax[0].next = max2(tri[0], tri[2])
+        _s_bmax[1].next = max2(tri[1], tri[3])
+        _setup_state.next = t_Setup.SETUP1
+
+    @always(i_clk.posedge, i_rst)
+    def setup():
+        if i_rst == 0:
+            _setup_state.next = t_Setup.IDLE
+            _fifo_rd.next = 0
+            _fifo_wr.next = 0
+            _fifo_count.next = 0
+        else:
+            push = i_tri_stb and o_tri_ready
+            pop = False
+            if _setup_state == t_Setup.IDLE or (_setup_state == t_Setup.DONE and _setup_take):
+                if _fifo_count != 0:
+                    # set up the oldest queued triangle
+                    e = int(_fifo_rd)
+                    setup_load(_fifo_tri[e * TRI_WORDS:(e + 1) * TRI_WORDS], _fifo_rs[e * RS_WORDS:(e + 1) * RS_WORDS])
+                    _fifo_rd.next = (_fifo_rd + 1) % TRI_FIFO
+                    pop = True
+                elif push:
+                    # nothing queued, so set up the new triangle right away
+                    setup_load(TRI_IN, RS_IN)
+                    push = False
                 else:
-                    _state.next = t_State.COMBINE
-        elif _state == t_State.TEX3:
-            if i_smp_ack:
-                _tex_col[3].next = combine_vtx_colors(i_smp_dat, _col[3])
-                _state.next = t_State.COMBINE
-        elif _state == t_State.COMBINE:
-            for i in range(4):
-                src_col = get_out_color(i)
-                _out_col[i].next = apply_fog(src_col, _zow[i])
-            if i_bl_en:
-                _state.next = t_State.BLEND0
-            else:
-                _state.next = t_State.RASTERLOOP
-        elif _state == t_State.BLEND0:
-            _out_col[0].next = do_blend(0)
-            if _sample_valid[1] and _depth_test[1]:
-                _state.next = t_State.BLEND1
-            elif _sample_valid[2] and _depth_test[2]:
-                _state.next = t_State.BLEND2
-            elif _sample_valid[3] and _depth_test[3]:
-                _state.next = t_State.BLEND3
+                    _setup_state.next = t_Setup.IDLE
+            elif _setup_state == t_Setup.SETUP1:
+                # finish calculating triangle bounds
+                _s_bmin[0].next = min2(_s_bmin[0], _v2[0])
+                _s_bmin[1].next = min2(_s_bmin[1], _v2[1])
+                _s_bmax[0].next = max2(_s_bmax[0], _v2[0])
+                _s_bmax[1].next = max2(_s_bmax[1], _v2[1])
+                # compute step increment values for barycentric weights
+                _s_a01.next = _v0[1] - _v1[1]
+                _s_a12.next = _v1[1] - _v2[1]
+                _s_a20.next = _v2[1] - _v0[1]
+                _s_b01.next = _v1[0] - _v0[0]
+                _s_b12.next = _v2[0] - _v1[0]
+                _s_b20.next = _v0[0] - _v2[0]
+                # bias for top/left fill rule
+                _bias0.next = 0 if isTopLeft(_v1, _v2) else -1
+                _bias1.next = 0 if isTopLeft(_v2, _v0) else -1
+                _bias2.next = 0 if isTopLeft(_v0, _v1) else -1
+                #
+                _setup_state.next = t_Setup.SETUP2
+            elif _setup_state == t_Setup.SETUP2:
+                # if top left corner of triangle bounds is less than 0, then compute offset value (used to offset triangle attributes such as colors, UVs, etc)
+                _offs[0].next = -_s_bmin[0] if _s_bmin[0] < 0 else 0
+                _offs[1].next = -_s_bmin[1] if _s_bmin[1] < 0 else 0
+                # clamp bounds to render area
+                # NOTE: we draw a 2x2 cluster at a time, so we also divide bounds by 2 (adding 1 to _bmax so it rounds up instead of down)
+                _s_bmin[0].next = max2(_s_bmin[0] >> 1, 0)
+                _s_bmin[1].next = max2(_s_bmin[1] >> 1, 0)
+                _s_bmax[0].next = min2((_s_bmax[0] + 1) >> 1, (DIM >> 1) - 1)
+                _s_bmax[1].next = min2((_s_bmax[1] + 1) >> 1, (DIM >> 1) - 1)
+                #
+                _setup_state.next = t_Setup.SETUP3
+            elif _setup_state == t_Setup.SETUP3:
+                # offset triangle attribute iterators
+                for i in range(4):
+                    _s_col_base[i].next = _s_col_base[i] + (_s_col_dx[i] * _offs[0]) + (_s_col_dy[i] * _offs[1])
+                _s_1ow_base.next = _s_1ow_base + (_s_1ow_dx * _offs[0]) + (_s_1ow_dy * _offs[1])
+                _s_sow_base.next = _s_sow_base + (_s_sow_dx * _offs[0]) + (_s_sow_dy * _offs[1])
+                _s_tow_base.next = _s_tow_base + (_s_tow_dx * _offs[0]) + (_s_tow_dy * _offs[1])
+                _s_zow_base.next = _s_zow_base + (_s_zow_dx * _offs[0]) + (_s_zow_dy * _offs[1])
+                # compute barycentric weights at the top left pixel of triangle bounds (_bmin is in units of 2x2 clusters by now)
+                p = [_s_bmin[0] << 1, _s_bmin[1] << 1]
+                _s_w0_base.next = orient2D(_v1, _v2, p) + _bias0
+                _s_w1_base.next = orient2D(_v2, _v0, p) + _bias1
+                _s_w2_base.next = orient2D(_v0, _v1, p) + _bias2
+                # (held here until traversal takes it)
+                _setup_state.next = t_Setup.DONE
+
+            if push:
+                # queue the new triangle
+                e = int(_fifo_wr)
+                for i in range(TRI_WORDS):
+                    _fifo_tri[(e * TRI_WORDS) + i].next = TRI_IN[i]
+                for i in range(RS_WORDS):
+                    _fifo_rs[(e * RS_WORDS) + i].next = RS_IN[i]
+                _fifo_wr.next = (_fifo_wr + 1) % TRI_FIFO
+            _fifo_count.next = _fifo_count + int(push) - int(pop)
+
+    @always(i_clk.posedge, i_rst)
+    def fast_clear():
+        if i_rst == 0:
+            _mat_q.next = 0
+            for b in range(CLR_DIM * CLR_DIM):
+                _cleared[b].next = False
+        elif _clr_stb:
+            _clr_col.next = get_vtx_color(i_col_init)
+            _clr_d.next = i_zow_init[32:0]
+            for b in range(CLR_DIM * CLR_DIM):
+                _cleared[b].next = True
+        elif _mat_en:
+            if _mat_q == (CLR_QUADS * CLR_QUADS) - 1:
+                # whole block has been written out
+                _cleared[_mat_blk].next = False
+                _mat_q.next = 0
             else:
-                _state.next = t_State.RASTERLOOP
-        elif _state == t_State.BLEND1:
-            _out_col[1].next = do_blend(1)
-            if _sample_valid[2] and _depth_test[2]:
-                _state.next = t_State.BLEND2
-            elif _sample_valid[3] and _depth_test[3]:
-                _state.next = t_State.BLEND3
+                _mat_q.next = _mat_q + 1
+
+    @always(i_clk.posedge, i_rst)
+    def hiz_update():
+        if i_rst == 0:
+            # nothing is known about the depth buffer's contents yet
+            for r in range(HIZ_DIM * HIZ_DIM):
+                _hiz_min[r].next = 0
+                _hiz_max[r].next = 0xFFFFFFFF
+                _hiz_layer_min[r].next = 0xFFFFFFFF
+                _hiz_layer_max[r].next = 0
+                _hiz_layer_mask[r].next = 0
+                _hiz_layer_id[r].next = 0
+        elif _clr_stb:
+            # every pixel now holds the clear depth
+            for r in range(HIZ_DIM * HIZ_DIM):
+                _hiz_min[r].next = i_zow_init[32:0]
+                _hiz_max[r].next = i_zow_init[32:0]
+                _hiz_layer_min[r].next = 0xFFFFFFFF
+                _hiz_layer_max[r].next = 0
+                _hiz_layer_mask[r].next = 0
+        elif HIZ_DIM != 0 and _wr_valid and _wr_ready:
+            r = ((_wr_pos[1] >> BLOCK_SHIFT) * HIZ_DIM) + (_wr_pos[0] >> BLOCK_SHIFT)
+            x = (_wr_pos[0] & (BLOCK_QUADS - 1)) << 1
+            y = (_wr_pos[1] & (BLOCK_QUADS - 1)) << 1
+            # bounds & pixel mask of the depth values written out by the cluster
+            wr_min = 0xFFFFFFFF
+            wr_max = 0
+            wr_mask = 0
+            for i in range(4):
+                if _wr_mask[i]:
+                    z = int(_wr_zow[i][32:0])
+                    wr_min = min2(wr_min, z)
+                    wr_max = max2(wr_max, z)
+                    wr_mask = wr_mask | (1 << (((y + (i >> 1)) * BLOCK) + x + (i & 1)))
+            base_min = int(_hiz_min[r])
+            base_max = int(_hiz_max[r])
+            if _hiz_layer_mask[r] != 0 and _hiz_layer_id[r] != _tri_id and wr_max < _hiz_layer_max[r]:
+                # fold the layer into the base, and start a new one with this cluster
+                base_min = min2(base_min, _hiz_layer_min[r])
+                base_max = max2(base_max, _hiz_layer_max[r])
+                zmin = wr_min
+                zmax = wr_max
+                mask = wr_mask
             else:
-                _state.next = t_State.RASTERLOOP
-        elif _state == t_State.BLEND2:
-            _out_col[2].next = do_blend(2)
-            if _sample_valid[3] and _depth_test[3]:
-                _state.next = t_State.BLEND3
+                # add the cluster to the block's layer
+                zmin = min2(_hiz_layer_min[r], wr_min)
+                zmax = max2(_hiz_layer_max[r], wr_max)
+                mask = _hiz_layer_mask[r] | wr_mask
+            _hiz_layer_id[r].next = _tri_id
+            if mask == (1 << (BLOCK * BLOCK)) - 1:
+                # every pixel of the block has been written since the base bounds were set, so the layer's bounds hold for the whole block
+                _hiz_min[r].next = zmin
+                _hiz_max[r].next = zmax
+                _hiz_layer_min[r].next = 0xFFFFFFFF
+                _hiz_layer_max[r].next = 0
+                _hiz_layer_mask[r].next = 0
             else:
-                _state.next = t_State.RASTERLOOP
-        elif _state == t_State.BLEND3:
-            _out_col[3].next = do_blend(3)
-            _state.next = t_State.RASTERLOOP
+                _hiz_min[r].next = base_min
+                _hiz_max[r].next = base_max
+                _hiz_layer_min[r].next = zmin
+                _hiz_layer_max[r].next = zmax
+                _hiz_layer_mask[r].next = mask
+
+    @always(i_clk.posedge, i_rst)
+    def stall_count():
+        if i_rst == 0:
+            for i in range(5):
+                o_stall_cycles[i].next = 0
+        else:
+            if _state == t_State.RASTERLOOP and not _ztest_ready_d:
+                o_stall_cycles[0].next = o_stall_cycles[0] + 1
+            if _ztest_valid and not _ztest_ready:
+                o_stall_cycles[1].next = o_stall_cycles[1] + 1
+            if _tex_valid and not _tex_ready:
+                o_stall_cycles[2].next = o_stall_cycles[2] + 1
+            if _comb_valid and not _comb_ready:
+                o_stall_cycles[3].next = o_stall_cycles[3] + 1
+            if _blend_valid and not _blend_ready:
+                o_stall_cycles[4].next = o_stall_cycles[4] + 1
+
+    @always_comb
+    def traverse_comb():
+        _ztest_valid_d.next = _state == t_State.RASTERLOOP
+        drained = not (_ztest_valid or _tex_valid or _comb_valid or _blend_valid or _wr_valid)
+        _setup_take.next = _state == t_State.WAITING and _setup_state == t_Setup.DONE and drained
+        _clr_stb.next = (_state == t_State.WAITING and i_fill_stb and not i_tri_stb and _fifo_count == 0 and _setup_state == t_Setup.IDLE)
+        o_tri_ready.next = _fifo_count != TRI_FIFO
 
     @always_comb
-    def process_comb():
-        dtest = depth_test()
-        smp_valid = [(_w0[i][31] | _w1[i][31] | _w2[i][31]) == 0 for i in range(4)]
+    def ztest_comb():
+        # read back the destination colors & depth values of the cluster
+        o_rd_pos[0].next = _ztest_pos[0]
+        o_rd_pos[1].next = _ztest_pos[1]
 
+        # (blocks which are still cleared haven't been written out yet)
+        cleared = _cleared[clr_block(_ztest_pos)]
         for i in range(4):
-            _sample_valid[i].next = smp_valid[i]
-            _depth_test[i].next = dtest[i]
+            _tex_dst_d[i].next = _clr_col if cleared else i_rd_data_rgb[i]
 
-            o_wr_data_rgb[i].next = _out_col[i]
-            o_wr_data_d[i].next = _zow[i]
-            o_wr_en_rgb[i].next = o_wr_en_d[i].next = (_state == t_State.RASTERLOOP and smp_valid[i] and dtest[i]) or _state == t_State.FILL
+        dtest = depth_test(_rs_dcmp, _rs_dtest_en, _ztest_zow, [_clr_d if cleared else i_rd_data_d[i] for i in range(4)])
+        # (pixels of a block which is entirely inside the triangle don't need their own coverage test)
+        mask = [(_ztest_full or ((_ztest_w0[i][31] | _ztest_w1[i][31] | _ztest_w2[i][31]) == 0)) and dtest[i] for i in range(4)]
+        for i in range(4):
+            _tex_mask_d[i].next = mask[i]
 
-        o_smp_stb.next = _state == t_State.TEX0 or _state == t_State.TEX1 or _state == t_State.TEX2 or _state == t_State.TEX3
+        # clusters where no pixel survives are dropped right here
+        any_mask = mask[0] or mask[1] or mask[2] or mask[3]
+        _tex_valid_d.next = _ztest_valid and any_mask
+        _ztest_ready.next = _tex_ready_d or not any_mask
 
-        (out_s, out_t, out_w) = get_out_stw()
+    @always_comb
+    def tex_comb():
+        # perspective correct S, T for each pixel in the cluster
+        smp_s = [(_tex_sow[i] * _tex_1ow[i]) >> 12 for i in range(4)]
+        smp_t = [(_tex_tow[i] * _tex_1ow[i]) >> 12 for i in range(4)]
 
-        s0 = (out_s * out_w) >> 12
-        t0 = (out_t * out_w) >> 12
+        for i in range(4):
+            o_smp_st[i * 2].next = smp_s[i]
+            o_smp_st[(i * 2) + 1].next = smp_t[i]
 
-        wx1 = out_w + _1ow_dx
-        wy1 = out_w + _1ow_dy
+        # derivatives are taken once per cluster, from the differences between its pixels
+        o_smp_ddx[0].next = smp_s[1] - smp_s[0]
+        o_smp_ddx[1].next = smp_t[1] - smp_t[0]
+        o_smp_ddy[0].next = smp_s[2] - smp_s[0]
+        o_smp_ddy[1].next = smp_t[2] - smp_t[0]
 
-        sx1 = ((out_s + _sow_dx) * wx1) >> 12
-        tx1 = ((out_t + _tow_dx) * wx1) >> 12
+        # the request is only made once the result has somewhere to go, so it's held steady until the sampler acks it
+        # (COMBINE's register can't fill up in the meantime, as nothing else is pushed into it)
+        tex = _rs_tex_en
+        o_smp_stb.next = _tex_valid and tex and _comb_ready_d
+
+        for i in range(4):
+            if tex:
+                _comb_col_d[i].next = combine_vtx_colors(i_smp_dat[i], _tex_col[i * 4:(i + 1) * 4])
+            else:
+                _comb_col_d[i].next = get_vtx_color(_tex_col[i * 4:(i + 1) * 4])
+
+        done = not tex or i_smp_ack
+        _comb_valid_d.next = _tex_valid and done
+        _tex_ready.next = _comb_ready_d and done
+
+    @always_comb
+    def comb_comb():
+        for i in range(4):
+            _blend_col_d[i].next = apply_fog(_comb_col[i], _comb_zow[i], _rs_fog_en, _rs_fog_col, i_fog_tbl)
 
-        sy1 = ((out_s + _sow_dy) * wy1) >> 12
-        ty1 = ((out_t + _tow_dy) * wy1) >> 12
+    @always_comb
+    def blend_comb():
+        for i in range(4):
+            if _rs_bl_en:
+                _wr_col_d[i].next = do_blend(_blend_col[i], _blend_dst[i], _rs_bl_src, _rs_bl_dst, _rs_bl_op)
+            else:
+                _wr_col_d[i].next = _blend_col[i]
 
-        dsdx = sx1 - s0
-        dsdy = sy1 - s0
+    @always_comb
+    def mat_comb():
+        blk = _flush_blk if _state == t_State.FLUSH else clr_block(_wr_pos)
+        _mat_blk.next = blk
+        mat = _cleared[blk] and (_state == t_State.FLUSH or _wr_valid)
+        _mat_en.next = mat
+        _wr_ready.next = not mat
 
-        dtdx = tx1 - t0
-        dtdy = ty1 - t0
+        for b in range(CLR_DIM * CLR_DIM):
+            o_cleared[b].next = _cleared[b]
+        o_clr_col.next = _clr_col
 
-        o_smp_st[0].next = s0
-        o_smp_st[1].next = t0
-        o_smp_ddx[0].next = dsdx
-        o_smp_ddx[1].next = dtdx
-        o_smp_ddy[0].next = dsdy
-        o_smp_ddy[1].next = dtdy
+    @always_comb
+    def wr_comb():
+        if _mat_en:
+            # write out a cluster of the block with the clear values
+            for i in range(4):
+                o_wr_data_rgb[i].next = _clr_col
+                o_wr_data_d[i].next = _clr_d
+                o_wr_en_rgb[i].next = o_wr_en_d[i].next = True
+            o_wr_pos[0].next = ((_mat_blk % CLR_DIM) << CLR_SHIFT) + (_mat_q & (CLR_QUADS - 1))
+            o_wr_pos[1].next = ((_mat_blk // CLR_DIM) << CLR_SHIFT) + (_mat_q >> CLR_SHIFT)
+        else:
+            for i in range(4):
+                o_wr_data_rgb[i].next = _wr_col[i]
+                o_wr_data_d[i].next = _wr_zow[i]
+                o_wr_en_rgb[i].next = o_wr_en_d[i].next = _wr_valid and _wr_mask[i]
+            o_wr_pos[0].next = _wr_pos[0]
+            o_wr_pos[1].next = _wr_pos[1]
 
-        o_wr_pos[0].next = _p[0]
-        o_wr_pos[1].next = _p[1]
-        o_busy.next = _state != t_State.WAITING
+        o_busy.next = (_state != t_State.WAITING or _fifo_count != 0 or _setup_state != t_Setup.IDLE or _ztest_valid or _tex_valid or _comb_valid or _blend_valid or _wr_valid)
 
-    return process, process_comb
\ No newline at end of file
+    return (process, setup, fast_clear, hiz_update, stall_count, traverse_comb, ztest_comb, tex_comb, comb_comb, blend_comb, mat_comb, wr_comb,
+            ztest_reg, tex_reg, comb_reg, blend_reg, wr_reg)
\ No newline at end of file
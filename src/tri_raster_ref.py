@@ -0,0 +1,220 @@
+import numpy as np
+
+"""
+Functional (non cycle-accurate) NumPy model of TriRaster
+
+Reproduces the fixed point math of the TriRaster RTL bit for bit, but evaluates every pixel of a tile (or of a whole batch of tiles) at once
+using array operations instead of walking the tile one 2x2 cluster at a time. Intended as a fast "golden" renderer to compare RTL runs against.
+
+Triangle & state parameters are passed as a dict keyed by the name of the matching TriRaster input port, minus the "i_" prefix:
+    v0, v1, v2, col_init, col_dx, col_dy, 1ow_init, 1ow_dx, 1ow_dy, sow_init, sow_dx, sow_dy, tow_init, tow_dx, tow_dy,
+    zow_init, zow_dx, zow_dy, tex_en, dtest_en, dcmp, bl_en, bl_src, bl_dst, bl_op, fog_en, fog_col, fog_tbl
+
+Each value may be a scalar (or a [2]/[4]/[64] list for vertices, colors and the fog table), or an array with a leading batch shape matching the
+batch shape of the model, in which case each tile in the batch gets its own triangle.
+"""
+
+def _param(tri, name, default=0):
+    # broadcast a per-tile parameter against the (y, x) pixel grid
+    return np.asarray(tri.get(name, default), dtype=np.int64)[..., None, None]
+
+def _vec_param(tri, name, n):
+    # broadcast a per-tile [n] parameter against the (y, x) pixel grid, returns a list of n arrays
+    v = np.asarray(tri.get(name, (0,) * n), dtype=np.int64)
+    return [v[..., i][..., None, None] for i in range(n)]
+
+def _byte(a, shift):
+    return (a >> shift) & 0xFF
+
+def _pack_rgba(r, g, b, a):
+    return ((a << 24) | (b << 16) | (g << 8) | r).astype(np.uint32)
+
+def is_top_left(a, b):
+    return ((a[1] == b[1]) & (b[0] > a[0])) | (b[1] > a[1])
+
+def orient2D(a, b, c):
+    return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+
+def depth_test(zow, dst, dtest_en, dcmp):
+    dtest_en = dtest_en != 0
+    always = np.ones(np.broadcast(zow, dst).shape, dtype=bool)
+    return np.select(
+        [dcmp == 0, dcmp == 1, dcmp == 2, dcmp == 3, dcmp == 4, dcmp == 5, dcmp == 6, dcmp == 7],
+        [~dtest_en & always,
+         always,
+         ~dtest_en | (zow == dst),
+         ~dtest_en | (zow != dst),
+         ~dtest_en | (zow < dst),
+         ~dtest_en | (zow > dst),
+         ~dtest_en | (zow <= dst),
+         ~dtest_en | (zow >= dst)],
+        False)
+
+def combine_vtx_colors(tex_col, vtx_col):
+    tex_col = tex_col.astype(np.int64)
+    return _pack_rgba(*[((_byte(vtx_col[i], 12) * _byte(tex_col, i * 8)) >> 8) & 0xFF for i in range(4)])
+
+def apply_fog(src_col, zow, fog_col, fog_tbl):
+    src_col = src_col.astype(np.int64)
+    fog_idx = (zow >> 18) & 0x3F
+    fog_density = np.take_along_axis(fog_tbl, fog_idx[..., None], axis=-1)[..., 0]
+    out = [_byte(src_col, i * 8) + (((_byte(fog_col, i * 8) - _byte(src_col, i * 8)) * fog_density) >> 8) for i in range(3)]
+    return _pack_rgba(out[0] & 0xFF, out[1] & 0xFF, out[2] & 0xFF, _byte(src_col, 24))
+
+def get_blend_fac(fac, src, dst):
+    full = np.full_like(src[0], 255)
+    zero = np.zeros_like(src[0])
+    conds = [fac == i for i in range(10)]
+    rgb = [np.select(conds, [zero, full, src[c], src[3], dst[c], dst[3], 255 - src[c], 255 - src[3], 255 - dst[c], 255 - dst[3]], zero)
+           for c in range(3)]
+    return rgb + [full]
+
+def do_blend(src_col, dst_col, bl_src, bl_dst, bl_op):
+    src = [_byte(src_col.astype(np.int64), i * 8) for i in range(4)]
+    dst = [_byte(dst_col.astype(np.int64), i * 8) for i in range(4)]
+    src_fac = get_blend_fac(bl_src, src, dst)
+    dst_fac = get_blend_fac(bl_dst, src, dst)
+    src_op = [(src[i] * src_fac[i]) >> 8 for i in range(4)]
+    dst_op = [(dst[i] * dst_fac[i]) >> 8 for i in range(4)]
+    out = [np.clip(np.where(bl_op == 0, dst_op[i] + src_op[i], dst_op[i] - src_op[i]), 0, 255) for i in range(4)]
+    return _pack_rgba(*out)
+
+class TriRasterRef:
+    """
+    Reference model of a TriRaster tile core and its color/depth tile buffers
+
+    - DIM: width/height of render area
+    - BATCH: batch shape (number of independent tiles evaluated at once, () for a single tile)
+
+    - color: tile color buffer [*BATCH, DIM, DIM] (uint32, packed as ABGR like o_wr_data_rgb)
+    - depth: tile depth buffer [*BATCH, DIM, DIM] (uint32, same as o_wr_data_d)
+    """
+
+    def __init__(self, DIM=32, BATCH=()):
+        self.DIM = DIM
+        self.BATCH = tuple(BATCH)
+        self.color = np.zeros(self.BATCH + (DIM, DIM), dtype=np.uint32)
+        self.depth = np.zeros(self.BATCH + (DIM, DIM), dtype=np.uint32)
+        y, x = np.mgrid[0:DIM, 0:DIM]
+        # cluster position & index of each pixel within its 2x2 cluster
+        self._qx = x >> 1
+        self._qy = y >> 1
+        self._ix = x & 1
+        self._iy = y & 1
+
+    def fill(self, tri):
+        """
+        Equivalent of pulsing i_fill_stb: fills tile with (col_init >> 12) and zow_init
+        """
+        col = _vec_param(tri, "col_init", 4)
+        zow = _param(tri, "zow_init")
+        # NOTE: like the FILL state this always covers 16x16 clusters, regardless of DIM
+        self.color[..., :32, :32] = _pack_rgba(*[_byte(c, 12) for c in col])
+        self.depth[..., :32, :32] = (zow & 0xFFFFFFFF).astype(np.uint32)
+
+    def draw(self, tri, sampler=None):
+        """
+        Equivalent of pulsing i_tri_stb: rasterizes a triangle into the tile buffers
+
+        - tri: triangle & state parameters (see module docs)
+        - sampler: required if tex_en is set. Called as sampler(st, ddx, ddy) with the (S, T) of every pixel, and the d(S, T)/dx and d(S, T)/dy tuples
+                   of the 2x2 cluster each pixel belongs to (what TriRaster would drive on o_smp_st/o_smp_ddx/o_smp_ddy), must return an array of
+                   packed texel colors (what the QuadTexSampler would return on i_smp_dat)
+
+        Returns the mask of pixels which were written
+        """
+        DIM = self.DIM
+        v0 = _vec_param(tri, "v0", 2)
+        v1 = _vec_param(tri, "v1", 2)
+        v2 = _vec_param(tri, "v2", 2)
+
+        # SETUP1/SETUP2: triangle bounds, clamped to render area in units of 2x2 clusters
+        bmin = [np.minimum(np.minimum(v0[i], v1[i]), v2[i]) for i in range(2)]
+        bmax = [np.maximum(np.maximum(v0[i], v1[i]), v2[i]) for i in range(2)]
+        offs = [np.where(bmin[i] < 0, -bmin[i], 0) for i in range(2)]
+        qmin = [np.maximum(bmin[i] >> 1, 0) for i in range(2)]
+        qmax = [np.minimum((bmax[i] + 1) >> 1, (DIM >> 1) - 1) for i in range(2)]
+
+        # number of x/y steps from the first pixel visited
+        nx = ((self._qx - qmin[0]) << 1) + self._ix
+        ny = ((self._qy - qmin[1]) << 1) + self._iy
+
+        # SETUP3: barycentric weights w/ top-left fill rule bias, evaluated at the first pixel visited
+        p = [q << 1 for q in qmin]
+        bias0 = np.where(is_top_left(v1, v2), 0, -1)
+        bias1 = np.where(is_top_left(v2, v0), 0, -1)
+        bias2 = np.where(is_top_left(v0, v1), 0, -1)
+        w0 = orient2D(v1, v2, p) + bias0 + (v1[1] - v2[1]) * nx + (v2[0] - v1[0]) * ny
+        w1 = orient2D(v2, v0, p) + bias1 + (v2[1] - v0[1]) * nx + (v0[0] - v2[0]) * ny
+        w2 = orient2D(v0, v1, p) + bias2 + (v0[1] - v1[1]) * nx + (v1[0] - v0[0]) * ny
+
+        in_bounds = (self._qx >= qmin[0]) & (self._qx <= qmax[0]) & (self._qy >= qmin[1]) & (self._qy <= qmax[1])
+        smp_valid = in_bounds & (w0 >= 0) & (w1 >= 0) & (w2 >= 0)
+
+        # attribute iterators
+        def iterate(init, dx, dy):
+            return init + (dx * offs[0]) + (dy * offs[1]) + (dx * nx) + (dy * ny)
+
+        col_init = _vec_param(tri, "col_init", 4)
+        col_dx = _vec_param(tri, "col_dx", 4)
+        col_dy = _vec_param(tri, "col_dy", 4)
+        col = [iterate(col_init[i], col_dx[i], col_dy[i]) for i in range(4)]
+        zow = iterate(_param(tri, "zow_init"), _param(tri, "zow_dx"), _param(tri, "zow_dy"))
+
+        # depth test
+        dst_d = self.depth.astype(np.int64)
+        dtest = depth_test(zow, dst_d, _param(tri, "dtest_en"), _param(tri, "dcmp"))
+        wr_en = smp_valid & dtest
+
+        # texturing
+        tex_en = _param(tri, "tex_en") != 0
+        out_col = _pack_rgba(*[_byte(c, 12) for c in col])
+        if np.any(tex_en & wr_en):
+            if sampler is None:
+                raise ValueError("tex_en is set, but no sampler was provided")
+            ow_dx = _param(tri, "1ow_dx")
+            ow_dy = _param(tri, "1ow_dy")
+            sow_dx = _param(tri, "sow_dx")
+            sow_dy = _param(tri, "sow_dy")
+            tow_dx = _param(tri, "tow_dx")
+            tow_dy = _param(tri, "tow_dy")
+            ow = iterate(_param(tri, "1ow_init"), ow_dx, ow_dy)
+            sow = iterate(_param(tri, "sow_init"), sow_dx, sow_dy)
+            tow = iterate(_param(tri, "tow_init"), tow_dx, tow_dy)
+            s0 = (sow * ow) >> 12
+            t0 = (tow * ow) >> 12
+            # derivatives are the differences between the pixels of each 2x2 cluster, taken from its top left pixel
+            qow = ow - (ow_dx * self._ix) - (ow_dy * self._iy)
+            qsow = sow - (sow_dx * self._ix) - (sow_dy * self._iy)
+            qtow = tow - (tow_dx * self._ix) - (tow_dy * self._iy)
+            qs0 = (qsow * qow) >> 12
+            qt0 = (qtow * qow) >> 12
+            wx1 = qow + ow_dx
+            wy1 = qow + ow_dy
+            dsdx = (((qsow + sow_dx) * wx1) >> 12) - qs0
+            dtdx = (((qtow + tow_dx) * wx1) >> 12) - qt0
+            dsdy = (((qsow + sow_dy) * wy1) >> 12) - qs0
+            dtdy = (((qtow + tow_dy) * wy1) >> 12) - qt0
+            tex_col = np.asarray(sampler((s0, t0), (dsdx, dtdx), (dsdy, dtdy)), dtype=np.uint32)
+            out_col = np.where(tex_en, combine_vtx_colors(tex_col, col), out_col)
+
+        # fog
+        fog_en = _param(tri, "fog_en") != 0
+        if np.any(fog_en):
+            fog_tbl = np.asarray(tri.get("fog_tbl", (0,) * 64), dtype=np.int64)[..., None, None, :]
+            out_col = np.where(fog_en, apply_fog(out_col, zow, _param(tri, "fog_col"), fog_tbl), out_col)
+
+        # blending
+        bl_en = _param(tri, "bl_en") != 0
+        if np.any(bl_en):
+            out_col = np.where(bl_en, do_blend(out_col, self.color, _param(tri, "bl_src"), _param(tri, "bl_dst"), _param(tri, "bl_op")), out_col)
+
+        self.color[...] = np.where(wr_en, out_col, self.color)
+        self.depth[...] = np.where(wr_en, (zow & 0xFFFFFFFF).astype(np.uint32), self.depth)
+        return wr_en
+
+def mismatches(a, b):
+    """
+    Returns the coordinates ([*BATCH,] y, x) of every pixel which differs between two buffers
+    """
+    return np.argwhere(np.asarray(a) != np.asarray(b))
@@ -0,0 +1,121 @@
+import numpy as np
+
+from cmd_proc import CMD_TRI, TRI_RECORD, TRI_WORDS, pack_header
+
+"""
+Host side triangle setup
+
+Computes the TriRaster attribute iterators (color, w, s/w, t/w & z/w, each as init/dx/dy) of a whole batch of transformed triangles at once,
+using array operations instead of per-triangle Python code. Each attribute is fit with a plane equation across the triangle, and init is the
+plane's value at the first pixel TriRaster steps from - the top left corner of triangle bounds in tile space, rounded down to a 2x2 cluster (or the
+corner itself, if it lies left of/above the tile, as SETUP3 then offsets the iterators by it)
+
+Vertex positions are snapped to whole pixels (TriRaster vertices are integers), and the planes are fit through the snapped positions, so every
+iterator hits the vertex's own value at the vertex
+
+TriRaster has no divider: the sampler's S, T are taken as (s/w * 1ow) >> 12, so the 1ow iterator is loaded with w (interpolated linearly in screen
+space) rather than 1/w. S, T are exact at the vertices and for affine (constant w) triangles, and approximate in between
+
+Triangles are returned as a dict keyed like TriRasterRef's triangle parameters (and cmd_proc's TRI_RECORD), with a leading [N] axis on every value:
+    v0, v1, v2 [N, 2], col_init, col_dx, col_dy [N, 4], 1ow_init ... zow_dy [N]
+"""
+
+# fixed point scale of each iterator
+COL_ONE = 1 << 12
+OW_ONE = 1 << 12
+# z/w of 0..1 maps to the 24 bit depth range (the clear depth & fog table index use the same range)
+ZOW_ONE = 0xFFFFFF
+
+def orient2D(a, b, c):
+    return (b[..., 0] - a[..., 0]) * (c[..., 1] - a[..., 1]) - (b[..., 1] - a[..., 1]) * (c[..., 0] - a[..., 0])
+
+def _plane(a, e1, e2, area):
+    # d/dx & d/dy of an attribute [N, 3, ...] given at the vertices, from the edges v0->v1 & v0->v2 [N, 2] and twice the (non zero) area [N]
+    e1 = e1.reshape(e1.shape + (1,) * (a.ndim - 2))
+    e2 = e2.reshape(e2.shape + (1,) * (a.ndim - 2))
+    area = area.reshape(area.shape + (1,) * (a.ndim - 2))
+    d1 = a[:, 1] - a[:, 0]
+    d2 = a[:, 2] - a[:, 0]
+    dx = ((d1 * e2[:, 1]) - (d2 * e1[:, 1])) / area
+    dy = ((d2 * e1[:, 0]) - (d1 * e2[:, 0])) / area
+    return (dx, dy)
+
+def _fixed(a, one):
+    return np.rint(a * one).astype(np.int64)
+
+def tri_setup(pos, col, uv, w, tile=None, DIM=32):
+    """
+    Sets up a batch of N triangles for drawing into the given tiles
+
+    - pos: vertex screen positions [N, 3, 3] - x/y in pixels, z/w (0..1)
+    - col: vertex colors [N, 3, 4] - r, g, b, a (0..255)
+    - uv: vertex texture coordinates [N, 3, 2] (1.0 = width/height of the texture)
+    - w: vertex clip space w [N, 3]
+    - tile: x/y of the tile each triangle is set up for (in tiles) [N, 2], or None for tile 0, 0
+    - DIM: width/height of tile
+
+    Triangles wound the other way are turned around (TriRaster only covers pixels where all edge functions are positive). Degenerate (zero area)
+    triangles get zero gradients, and should be dropped by the caller
+
+    Returns the triangle parameters (see module docs)
+    """
+    pos = np.asarray(pos, dtype=np.float64)
+    col = np.asarray(col, dtype=np.float64)
+    uv = np.asarray(uv, dtype=np.float64)
+    w = np.asarray(w, dtype=np.float64)
+
+    # snap to whole pixels in tile space
+    v = np.rint(pos[..., :2]).astype(np.int64)
+    if tile is not None:
+        v = v - (np.asarray(tile, dtype=np.int64)[:, None, :] * DIM)
+    area = orient2D(v[:, 0], v[:, 1], v[:, 2])
+
+    # turn negatively wound triangles around (swapping v1 & v2, and their attributes)
+    order = np.where((area < 0)[:, None], [0, 2, 1], [0, 1, 2])
+    v = np.take_along_axis(v, order[..., None], axis=1)
+    area = np.abs(area)
+
+    # attributes, in the order of the iterators
+    attrs = np.concatenate([
+        np.take_along_axis(col, order[..., None], axis=1),
+        np.take_along_axis(np.stack([w, uv[..., 0] / w, uv[..., 1] / w, pos[..., 2]], axis=-1), order[..., None], axis=1),
+    ], axis=-1)
+    e1 = (v[:, 1] - v[:, 0]).astype(np.float64)
+    e2 = (v[:, 2] - v[:, 0]).astype(np.float64)
+    (dx, dy) = _plane(attrs, e1, e2, np.where(area == 0, 1, area).astype(np.float64))
+    dx = np.where((area == 0)[:, None], 0, dx)
+    dy = np.where((area == 0)[:, None], 0, dy)
+
+    # first pixel TriRaster steps from
+    bmin = v.min(axis=1)
+    origin = np.where(bmin < 0, bmin, (bmin >> 1) << 1)
+    init = attrs[:, 0] + (dx * (origin[:, 0:1] - v[:, 0, 0:1])) + (dy * (origin[:, 1:2] - v[:, 0, 1:2]))
+
+    tris = {"v0": v[:, 0], "v1": v[:, 1], "v2": v[:, 2]}
+    for (name, (a, b), one) in (("col", (0, 4), COL_ONE), ("1ow", (4, 5), OW_ONE), ("sow", (5, 6), OW_ONE), ("tow", (6, 7), OW_ONE),
+                                ("zow", (7, 8), ZOW_ONE)):
+        for (suffix, value) in (("init", init), ("dx", dx), ("dy", dy)):
+            value = _fixed(value[:, a:b], one)
+            tris["%s_%s" % (name, suffix)] = value if b - a > 1 else value[:, 0]
+    return tris
+
+def pack_tris(tris):
+    """
+    Packs triangle records for a batch of set up triangles (the vectorized equivalent of cmd_proc's pack_tri)
+
+    Returns an array of records [N, 1 + TRI_WORDS] (uint32, header first)
+    """
+    n = tris["v0"].shape[0]
+    words = np.empty((n, 1 + TRI_WORDS), dtype=np.uint32)
+    words[:, 0] = pack_header(CMD_TRI)
+    i = 1
+    for (name, count) in TRI_RECORD:
+        words[:, i:i + count] = (np.asarray(tris[name], dtype=np.int64).reshape(n, count) & 0xFFFFFFFF).astype(np.uint32)
+        i += count
+    return words
+
+def tri_params(tris, i):
+    """
+    Parameters of the i'th triangle of a batch, as plain ints (as used by TriRasterRef, pack_tri & the testbenches)
+    """
+    return {name: (tuple(int(c) for c in value[i]) if value.ndim > 1 else int(value[i])) for (name, value) in tris.items()}
@@ -1,6 +1,7 @@
 import sys
-import struct
-from math import *
+from math import log2
+
+import numpy as np
 from PIL import Image
 
 # table to map swizzled texel index to actual X,Y in block
@@ -23,55 +24,146 @@ block_swizzle_table = [
     (3, 3),
 ]
 
-def sat(a):
-    if a < 0:
-        return 0
-    elif a > 255:
-        return 255
+# log2 of size per block of each format (RGBA4444, RGBA8888, NXTC mode 0, NXTC mode 1, VQ, and NXTC mode 2), same as SetAssocTexCache
+blk_shift_table = (3, 4, 1, 2, 0, 1)
+
+# number of codebook entries of VQ textures (see vq_enc.py)
+VQ_ENTRIES = 256
+
+def _sat(a):
+    return np.clip(a, 0, 255)
+
+def _pack_rgba(r, g, b, a):
+    return (a.astype(np.uint32) << 24) | (b.astype(np.uint32) << 16) | (g.astype(np.uint32) << 8) | r.astype(np.uint32)
+
+def _unpack_indices(idx_word):
+    # [N] 32-bit index words -> [N, 16] 2-bit indices, texel 0 in the lowest bits
+    return (idx_word[:, None].astype(np.int64) >> (np.arange(16) * 2)) & 0b11
+
+def decode_rgba4444(words):
+    # FILL_RGBA4444: each word fills two neighbouring banks at the same bank offset
+    # NOTE: like TexBlock, both texels are expanded from the low 16 bits of the word
+    lo = words.astype(np.int64) & 0xFFFF
+    col = _pack_rgba((lo & 0xF) << 4, ((lo >> 4) & 0xF) << 4, ((lo >> 8) & 0xF) << 4, ((lo >> 12) & 0xF) << 4)
+    out = np.empty((len(words), 16), dtype=np.uint32)
+    for f in range(8):
+        bnk = (f & 1) << 1
+        bnkoffs = f >> 1
+        out[:, bnk | (bnkoffs << 2)] = col[:, f]
+        out[:, (bnk + 1) | (bnkoffs << 2)] = col[:, f]
+    return out
+
+def decode_rgba8888(words):
+    # FILL_RGBA8888: word N is stored straight into bank (N & 3), offset (N >> 2), which is texel N in z-curve order
+    return words.astype(np.uint32)
+
+def decode_nxtc(words, mode):
+    # FILL_NXTC_0..3 + DEC_NXTC
+    words = words.astype(np.int64)
+    median_rgb = words[:, 0] & 0xFFFFFF
+    lscale_rgb = (words[:, 0] >> 24)[:, None]
+    idx = _unpack_indices(words[:, 1])
+    offs_rgb = np.where(idx & 1, lscale_rgb, -lscale_rgb) >> np.where(idx & 2, 0, 2)
+    # mode 2: index 2 is a transparent texel of the median color
+    clear = (idx == 2) if mode == 2 else np.zeros(idx.shape, dtype=bool)
+    offs_rgb = np.where(clear, 0, offs_rgb)
+    r = _sat((median_rgb & 0xFF)[:, None] + offs_rgb)
+    g = _sat(((median_rgb >> 8) & 0xFF)[:, None] + offs_rgb)
+    b = _sat(((median_rgb >> 16) & 0xFF)[:, None] + offs_rgb)
+    if mode == 1:
+        median_a = (words[:, 2] & 0xFF)[:, None]
+        lscale_a = (words[:, 2] >> 24)[:, None]
+        idx_a = _unpack_indices(words[:, 3])
+        offs_a = np.where(idx_a & 1, lscale_a, -lscale_a) >> np.where(idx_a & 2, 0, 1)
+        a = _sat(median_a + offs_a)
     else:
-        return a
-
-def decode_block_0(src_data):
-    out_pixels = [[(0, 0, 0) for _ in range(4)] for _ in range(4)]
-    (median_r, median_g, median_b, luma_scale, luma_idx) = struct.unpack("<BBBBI", src_data)
-    luma_table = (-(luma_scale >> 1), luma_scale >> 1, luma_scale, luma_scale)
-    for i in range(16):
-        idx = (luma_idx >> (i * 2)) & 0b11
-        offs = luma_table[idx]
-        r = sat(median_r + offs)
-        g = sat(median_g + offs)
-        b = sat(median_b + offs)
-        (px, py) = block_swizzle_table[i]
-        out_pixels[px][py] = (r, g, b, 255)
-    return out_pixels
-
-print("Opening: %s" % sys.argv[1])
-in_file = open(sys.argv[1], 'rb')
-in_file.seek(0, 2)
-in_file_len = in_file.tell()
-in_file.seek(0, 0)
-
-print("Len: %s bytes" % in_file_len)
-num_blocks = in_file_len / 8
-print("Num blocks: %s" % num_blocks)
-blocks_size = int(sqrt(num_blocks))
-print("Block dim: %s" % blocks_size)
-img_size = blocks_size * 4
-print("Img size: %s" % img_size)
-
-out_img = Image.new('RGBA', (img_size, img_size))
-
-for j in range(blocks_size):
-    for i in range(blocks_size):
-        bx = i * 4
-        by = j * 4
-        # read block
-        block_data = in_file.read(8)
-        block_dec = decode_block_0(block_data)
-        for y in range(4):
-            for x in range(4):
-                c = block_dec[x][y]
-                out_img.putpixel((bx + x, by + y), c)
-
-out_img.save(sys.argv[2])
-print("Finished")
\ No newline at end of file
+        a = np.where(clear, 0, 255)
+    return _pack_rgba(r, g, b, a)
+
+def decode_vq(words, codebook):
+    # FILL_VQ: each byte of the word picks the codebook entry of one 2x2 quad, which fills one bank offset of all four banks
+    idx = (words[:, 0:1].astype(np.int64) >> (np.arange(4) * 8)) & (VQ_ENTRIES - 1)
+    return codebook.reshape(-1, 4)[idx].reshape(len(words), 16).astype(np.uint32)
+
+def decode_blocks(words, fmt, codebook=None):
+    """
+    Decode [N, block size] memory words into [N, 16] packed texels (z-curve order), exactly as TexBlock fills its cache
+
+    - fmt: block format (0 = rgba4444, 1 = rgba8888, 2 = nxtc mode 0, 3 = nxtc mode 1, 4 = vq, 5 = nxtc mode 2)
+    - codebook: codebook words of VQ blocks (VQ_ENTRIES * 4)
+    """
+    if fmt == 0:
+        return decode_rgba4444(words)
+    elif fmt == 1:
+        return decode_rgba8888(words)
+    elif fmt == 2:
+        return decode_nxtc(words, 0)
+    elif fmt == 3:
+        return decode_nxtc(words, 1)
+    elif fmt == 4:
+        return decode_vq(words, codebook)
+    elif fmt == 5:
+        return decode_nxtc(words, 2)
+    raise ValueError("Unknown texture format: %s" % fmt)
+
+def decode_texels(mem, tex_w, tex_h, tex_fmt, tex_adr=0, tex_cb_adr=0):
+    """
+    Decode a texture from a memory image into packed texels, the same values TexCache would return for each texel
+
+    - mem: memory contents (array of 32-bit words, or raw little-endian bytes)
+    - tex_w: log2 of texture width (same as i_tex_w)
+    - tex_h: log2 of texture height (same as i_tex_h)
+    - tex_fmt: texture block format (same as i_tex_fmt)
+    - tex_adr: word address of texture in memory (same as i_tex_adr)
+    - tex_cb_adr: word address of the codebook of a VQ texture in memory (same as i_tex_cb_adr)
+
+    Returns a [height, width] uint32 array
+    """
+    if isinstance(mem, (bytes, bytearray, memoryview)):
+        mem = np.frombuffer(mem, dtype='<u4')
+    mem = np.asarray(mem)
+    blw = 1 << max(tex_w - 2, 0)
+    blh = 1 << max(tex_h - 2, 0)
+    blk_size = 1 << blk_shift_table[tex_fmt]
+    # blocks are stored in row-major order, each block is blk_size words
+    adr = tex_adr + (np.arange(blw * blh)[:, None] << blk_shift_table[tex_fmt]) + np.arange(blk_size)
+    codebook = mem[tex_cb_adr:tex_cb_adr + (VQ_ENTRIES * 4)] if tex_fmt == 4 else None
+    texels = decode_blocks(mem[adr], tex_fmt, codebook)
+    # un-swizzle z-curve order into row-major 4x4 blocks, then un-tile
+    unswizzle = np.argsort([y * 4 + x for (x, y) in block_swizzle_table])
+    texels = texels[:, unswizzle].reshape(blh, blw, 4, 4).transpose(0, 2, 1, 3)
+    return texels.reshape(blh * 4, blw * 4)
+
+def decode_texture(mem, tex_w, tex_h, tex_fmt, tex_adr=0, tex_cb_adr=0):
+    """
+    Decode a texture from a memory image into an RGBA image (see decode_texels)
+
+    Returns a [height, width, 4] uint8 array
+    """
+    texels = decode_texels(mem, tex_w, tex_h, tex_fmt, tex_adr, tex_cb_adr)
+    return texels.astype('<u4').view(np.uint8).reshape(texels.shape + (4,))
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: nxtc_dec.py <input file> <output image> [log2 width] [log2 height] [format]")
+        sys.exit(1)
+
+    print("Opening: %s" % sys.argv[1])
+    with open(sys.argv[1], 'rb') as in_file:
+        mem = np.frombuffer(in_file.read(), dtype='<u4')
+
+    if len(sys.argv) > 5:
+        tex_w = int(sys.argv[3])
+        tex_h = int(sys.argv[4])
+        tex_fmt = int(sys.argv[5])
+    else:
+        # assume square NXTC mode 0 texture
+        tex_fmt = 2
+        num_blocks = len(mem) >> blk_shift_table[tex_fmt]
+        tex_w = tex_h = int(log2(num_blocks)) // 2 + 2
+
+    print("Size: %sx%s, format: %s" % (1 << tex_w, 1 << tex_h, tex_fmt))
+    # VQ files (from vq_enc.py) start with the codebook
+    tex_adr = VQ_ENTRIES * 4 if tex_fmt == 4 else 0
+    Image.fromarray(decode_texture(mem, tex_w, tex_h, tex_fmt, tex_adr), 'RGBA').save(sys.argv[2])
+    print("Finished")
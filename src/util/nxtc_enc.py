@@ -1,5 +1,9 @@
+import os
 import sys
-import struct
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
 from PIL import Image
 
 # table to map swizzled texel index to actual X,Y in block
@@ -22,66 +26,150 @@ block_swizzle_table = [
     (3, 3),
 ]
 
-def sat(a):
-    if a < 0:
-        return 0
-    elif a > 255:
-        return 255
-    else:
-        return a
+# images with at least this many blocks get split across a process pool (512x512 and up)
+PARALLEL_MIN_BLOCKS = 128 * 128
+
+# packed layout of a single 64-bit NXTC sub-block: median color (or median alpha in the first byte), luma scale, and 16 2-bit indices
+nxtc_block_dtype = np.dtype([("median", "u1", (3,)), ("scale", "u1"), ("idx", "<u4")])
+
+def swizzle_blocks(img):
+    """
+    Split an image into 4x4 blocks with texels stored in z-curve order
+
+    - img: RGBA image (PIL image or [h, w, 4] array)
+
+    Returns a [blocks high, blocks wide, 16, 4] uint8 array
+    """
+    a = np.asarray(img, dtype=np.uint8)
+    bh = a.shape[0] >> 2
+    bw = a.shape[1] >> 2
+    a = a[:bh * 4, :bw * 4].reshape(bh, 4, bw, 4, a.shape[2]).transpose(0, 2, 1, 3, 4).reshape(bh, bw, 16, a.shape[2])
+    return a[:, :, [y * 4 + x for (x, y) in block_swizzle_table]]
+
+def pack_indices(idx):
+    # pack [N, 16] 2-bit indices into a 32-bit word per block, texel 0 in the lowest bits
+    return (idx.astype(np.uint64) << (np.arange(16, dtype=np.uint64) * 2)).sum(axis=-1).astype(np.uint32)
 
-def encode_block_0(b: Image.Image):
+def encode_rgb(blocks):
+    """
+    Encode [N, 16, 4] swizzled blocks into NXTC color sub-blocks
+    """
+    px = blocks[:, :, :3].astype(np.int32)
     # calculate median rgb & luma, store luma per pixel
-    median_r = 0
-    median_g = 0
-    median_b = 0
-    lumas = [0 for _ in range(16)]
-    for i in range(16):
-        px_pos = block_swizzle_table[i]
-        px_rgb = b.getpixel(px_pos)
-        px_luma = max(px_rgb[0], px_rgb[1], px_rgb[2])
-        lumas[i] = px_luma
-        median_r += px_rgb[0]
-        median_g += px_rgb[1]
-        median_b += px_rgb[2]
-    median_r >>= 4
-    median_g >>= 4
-    median_b >>= 4
-    median_luma = max(median_r, median_g, median_b)
+    lumas = px.max(axis=2)
+    median = px.sum(axis=1) >> 4
+    median_luma = median.max(axis=1)
     # calculate luma offset from median per pixel & offset range
-    luma_offs = [0 for _ in range(16)]
-    luma_scale = 0
-    for i in range(16):
-        luma_offs[i] = lumas[i] - median_luma
-        offs_abs = abs(luma_offs[i])
-        if offs_abs > luma_scale:
-            luma_scale = offs_abs
-    luma_table = (-(luma_scale >> 1), luma_scale >> 1, luma_scale, luma_scale)
-    # convert luma offsets to indices into table (-0.25, 0.25, -1.0, 1.0) and pack into 32 bits
-    luma_bits = 0
-    if luma_scale > 0:
-        for i in range(16):
-            # search for luma offset which minimizes error
-            l = [sat(median_luma + luma_table[j]) for j in range(4)]
-            e = [abs(lumas[i] - l[j]) for j in range(4)]
-            luma_idx = e.index(min(e))
-            luma_bits |= luma_idx << (i * 2)
-    # return packed 64-bit result
-    return struct.pack("<BBBBI", median_r, median_g, median_b, luma_scale, luma_bits)
-
-img = Image.open(sys.argv[1]).convert("RGBA")
-out_file = open(sys.argv[2], 'wb')
-
-blocks_wide = img.width >> 2
-blocks_high = img.height >> 2
-
-for j in range(blocks_wide):
-    for i in range(blocks_high):
-        bx = i * 4
-        by = j * 4
-        block_src = img.crop((bx, by, bx + 4, by + 4))
-        block_enc = encode_block_0(block_src)
-        out_file.write(block_enc)
-
-out_file.close()
-print("Finished")
\ No newline at end of file
+    luma_scale = np.abs(lumas - median_luma[:, None]).max(axis=1)
+    luma_table = np.stack([-(luma_scale >> 1), luma_scale >> 1, luma_scale, luma_scale], axis=1)
+    # search for luma offset which minimizes error (first match wins on ties)
+    l = np.clip(median_luma[:, None] + luma_table, 0, 255)
+    e = np.abs(lumas[:, :, None] - l[:, None, :])
+    luma_idx = np.where(luma_scale[:, None] > 0, e.argmin(axis=2), 0)
+
+    out = np.zeros(len(blocks), dtype=nxtc_block_dtype)
+    out["median"] = median
+    out["scale"] = luma_scale
+    out["idx"] = pack_indices(luma_idx)
+    return out
+
+def encode_alpha(blocks):
+    """
+    Encode [N, 16, 4] swizzled blocks into NXTC mode 1 alpha sub-blocks
+
+    Alpha offsets use the table TexBlock decodes alpha with: (-0.5, 0.5, -1.0, 1.0) * luma scale
+    """
+    alpha = blocks[:, :, 3].astype(np.int32)
+    median = alpha.sum(axis=1) >> 4
+    scale = np.abs(alpha - median[:, None]).max(axis=1)
+    table = np.stack([(-scale) >> 1, scale >> 1, -scale, scale], axis=1)
+    l = np.clip(median[:, None] + table, 0, 255)
+    e = np.abs(alpha[:, :, None] - l[:, None, :])
+    idx = np.where(scale[:, None] > 0, e.argmin(axis=2), 0)
+
+    out = np.zeros(len(blocks), dtype=nxtc_block_dtype)
+    out["median"][:, 0] = median
+    out["scale"] = scale
+    out["idx"] = pack_indices(idx)
+    return out
+
+def encode_punch(blocks, threshold=128):
+    """
+    Encode [N, 16, 4] swizzled blocks into NXTC mode 2 (punch-through alpha) blocks
+
+    Texels with alpha below threshold are stored as transparent (index 2). Opaque texels are left with indices 0, 1 & 3, which TexBlock decodes as
+    offsets of (-0.25, 0.25, 1.0) * luma scale, so the median & scale are picked to spread those three over the luma range of the block's opaque texels
+    """
+    px = blocks[:, :, :3].astype(np.int32)
+    opaque = blocks[:, :, 3] >= threshold
+    lumas = px.max(axis=2)
+    lo = np.where(opaque, lumas, 255).min(axis=1)
+    hi = np.where(opaque, lumas, 0).max(axis=1)
+    luma_scale = np.clip(np.rint((hi - lo) / 1.25), 0, 255).astype(np.int32)
+    # shift the average color of the opaque texels to the median luma
+    count = np.maximum(opaque.sum(axis=1), 1)
+    mean = (px * opaque[:, :, None]).sum(axis=1) // count[:, None]
+    median = np.clip(mean + (lo + (luma_scale >> 2) - mean.max(axis=1))[:, None], 0, 255)
+    median_luma = median.max(axis=1)
+    # search for luma offset which minimizes error, among the indices left for opaque texels
+    luma_table = np.stack([(-luma_scale) >> 2, luma_scale >> 2, -luma_scale, luma_scale], axis=1)
+    l = np.clip(median_luma[:, None] + luma_table, 0, 255)
+    e = np.abs(lumas[:, :, None] - l[:, None, :])
+    e[:, :, 2] = 1 << 16
+    luma_idx = np.where(opaque, e.argmin(axis=2), 2)
+
+    out = np.zeros(len(blocks), dtype=nxtc_block_dtype)
+    out["median"] = np.where(opaque.any(axis=1)[:, None], median, 0)
+    out["scale"] = luma_scale
+    out["idx"] = pack_indices(luma_idx)
+    return out
+
+def encode_blocks(blocks, mode=0):
+    """
+    Encode [N, 16, 4] swizzled blocks, returns packed NXTC data (64 bits per block for modes 0 & 2, 128 bits per block for mode 1)
+    """
+    if mode == 2:
+        return encode_punch(blocks).tobytes()
+    rgb = encode_rgb(blocks)
+    if mode == 0:
+        return rgb.tobytes()
+    out = np.empty((len(blocks), 2), dtype=nxtc_block_dtype)
+    out[:, 0] = rgb
+    out[:, 1] = encode_alpha(blocks)
+    return out.tobytes()
+
+def encode_image(img, mode=0, workers=None):
+    """
+    Encode an image to NXTC, blocks are stored in row-major order
+
+    - img: PIL image (or [h, w, 4] RGBA array)
+    - mode: NXTC mode (0 = opaque RGB, 1 = RGB + alpha block, 2 = RGB + punch-through alpha)
+    - workers: max number of worker processes used for large images (None = one per CPU, 1 = always encode in this process)
+    """
+    if isinstance(img, Image.Image):
+        img = img.convert("RGBA")
+    blocks = swizzle_blocks(img)
+    blocks = blocks.reshape(-1, 16, blocks.shape[3])
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    # (once split, each worker gets at least a quarter of PARALLEL_MIN_BLOCKS)
+    workers = min(workers, len(blocks) // (PARALLEL_MIN_BLOCKS >> 2)) if len(blocks) >= PARALLEL_MIN_BLOCKS else 1
+    if workers <= 1:
+        return encode_blocks(blocks, mode)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return b"".join(pool.map(encode_blocks, np.array_split(blocks, workers * 4), repeat(mode)))
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: nxtc_enc.py <input image> <output file> [mode]")
+        sys.exit(1)
+
+    img = Image.open(sys.argv[1]).convert("RGBA")
+    mode = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    with open(sys.argv[2], 'wb') as out_file:
+        out_file.write(encode_image(img, mode))
+
+    print("Finished")
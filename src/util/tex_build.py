@@ -0,0 +1,255 @@
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+try:
+    from .nxtc_enc import swizzle_blocks, encode_blocks
+    from . import vq_enc
+except ImportError:
+    from nxtc_enc import swizzle_blocks, encode_blocks
+    import vq_enc
+
+# log2 of size per block of each format (RGBA4444, RGBA8888, NXTC mode 0, NXTC mode 1, VQ, and NXTC mode 2), same as SetAssocTexCache
+blk_shift_table = (3, 4, 1, 2, 0, 1)
+
+# block format of VQ textures, whose levels share a codebook
+FMT_VQ = 4
+
+# smallest mip level TexSampler will pick (log2 of width/height)
+MIN_LEVEL_SHIFT = 2
+
+# number of mip base registers
+MIP_TBL_SIZE = 16
+
+# bump whenever encoded output changes, so stale cache entries are never used
+BUILD_VERSION = 2
+
+def build_mips(img):
+    """
+    Generate a box filtered mip chain, down to the level where either side is 4 texels (the smallest level TexSampler picks)
+
+    - img: RGBA image (PIL image or [h, w, 4] array), width & height must be powers of two, of at least 4
+
+    Returns a list of [h, w, 4] uint8 arrays, starting with the image itself
+    """
+    if isinstance(img, Image.Image):
+        img = img.convert("RGBA")
+    a = np.asarray(img, dtype=np.uint8)
+    (h, w) = a.shape[:2]
+    if h < 4 or w < 4 or (h & (h - 1)) != 0 or (w & (w - 1)) != 0:
+        raise ValueError("Texture size must be a power of two of at least 4x4, got %sx%s" % (w, h))
+    levels = [a]
+    while min(a.shape[0], a.shape[1]) > (1 << MIN_LEVEL_SHIFT) and len(levels) < MIP_TBL_SIZE:
+        q = a.astype(np.uint16)
+        a = ((q[0::2, 0::2] + q[1::2, 0::2] + q[0::2, 1::2] + q[1::2, 1::2] + 2) >> 2).astype(np.uint8)
+        levels.append(a)
+    return levels
+
+def encode_level(img, fmt):
+    """
+    Encode an RGBA image ([h, w, 4] array) in the given TexBlock format (same as i_tex_fmt, except VQ - see encode_chain), blocks are stored in row-major order
+
+    Returns the encoded bytes
+    """
+    blocks = swizzle_blocks(img)
+    blocks = blocks.reshape(-1, 16, 4).astype(np.uint32)
+    texels = blocks[:, :, 0] | (blocks[:, :, 1] << 8) | (blocks[:, :, 2] << 16) | (blocks[:, :, 3] << 24)
+    if fmt == 0:
+        # each word holds two horizontally neighbouring texels (stored in banks N & N+1 at the same bank offset), the left one in the low 16 bits
+        t16 = (blocks[:, :, 0] >> 4) | ((blocks[:, :, 1] >> 4) << 4) | ((blocks[:, :, 2] >> 4) << 8) | ((blocks[:, :, 3] >> 4) << 12)
+        f = np.arange(8)
+        lo = ((f & 1) << 1) | ((f >> 1) << 2)
+        return (t16[:, lo] | (t16[:, lo + 1] << 16)).astype('<u4').tobytes()
+    elif fmt == 1:
+        # one word per texel, in z-curve order
+        return texels.astype('<u4').tobytes()
+    elif fmt == 2:
+        return encode_blocks(blocks, 0)
+    elif fmt == 3:
+        return encode_blocks(blocks, 1)
+    elif fmt == 5:
+        return encode_blocks(blocks, 2)
+    raise ValueError("Unknown texture format: %s" % fmt)
+
+def encode_chain(levels, fmt):
+    """
+    Encode a list of mip levels in the given TexBlock format
+
+    Returns a list of encoded bytes - VQ textures start with the codebook shared by every level (trained across all of them, which may be the levels
+    of several textures), followed by each level
+    """
+    if fmt == FMT_VQ:
+        (codebook, blocks) = vq_enc.encode_images(levels)
+        return [codebook] + blocks
+    return [encode_level(level, fmt) for level in levels]
+
+def content_hash(img, fmt):
+    """
+    Cache key of a texture: hash of its texels, size & format (and the build version)
+    """
+    h = hashlib.sha256()
+    h.update(("%s:%s:%s" % (BUILD_VERSION, fmt, img.shape)).encode())
+    h.update(np.ascontiguousarray(img).tobytes())
+    return h.hexdigest()
+
+class TexImage:
+    """
+    Result of building a set of textures: one memory image holding every mip level of every texture
+
+    - words: memory image (uint32 words), to be loaded at the address it was built for
+    - textures: texture state of each texture, keyed by name - tex_w, tex_h, tex_fmt & tex_mip_tbl (the word address of each mip level,
+      with the smallest level repeated through the rest of the table), plus tex_cb_adr for VQ textures (the same for all of them, as they share a
+      codebook), as taken by cmd_proc's pack_state
+    - rebuilt: names of the textures which were encoded (rather than found in the cache)
+    """
+
+    def __init__(self, words, textures, rebuilt):
+        self.words = words
+        self.textures = textures
+        self.rebuilt = rebuilt
+
+def build_textures(images, fmt, adr=0, align=16, cache_dir=None, workers=None):
+    """
+    Build & link a set of textures into one memory image
+
+    Every texture gets a box filtered mip chain (see build_mips), with each level encoded in its format & placed at the next multiple of align words.
+    Encoded chains are cached by content hash, so only textures which changed since the last build are encoded again, and the levels which do need
+    encoding are spread across a process pool
+
+    Every VQ texture in the set shares one codebook (placed ahead of the textures), so switching between them never reloads VQCodebook. As the
+    codebook is trained across all of them, changing any VQ texture encodes every VQ texture again
+
+    - images: source images keyed by texture name (PIL images, [h, w, 4] arrays, or image file paths)
+    - fmt: texture format for every texture (same as i_tex_fmt), or a dict of formats keyed by texture name
+    - adr: word address the image will be loaded at
+    - align: alignment of each mip level (and VQ codebook) in words (at least the block size of the format)
+    - cache_dir: directory to cache encoded mip chains in (None = no caching)
+    - workers: max number of worker processes (None = one per CPU, 1 = always encode in this process)
+
+    Returns a TexImage
+    """
+    chains = {}
+    fmts = {}
+    hashes = {}
+    for (name, img) in images.items():
+        if isinstance(img, str):
+            img = Image.open(img)
+        if isinstance(img, Image.Image):
+            img = img.convert("RGBA")
+        img = np.asarray(img, dtype=np.uint8)
+        fmts[name] = fmt[name] if isinstance(fmt, dict) else fmt
+        if align < (1 << blk_shift_table[fmts[name]]):
+            raise ValueError("Alignment of %s words is smaller than a block of format %s" % (align, fmts[name]))
+        chains[name] = build_mips(img)
+        hashes[name] = content_hash(img, fmts[name])
+
+    # VQ textures share a single codebook, trained across every level of every one of them, so it's loaded into VQCodebook once for all of them.
+    # They're encoded (and cached) together, keyed by the hashes of all of them
+    vq_names = [name for name in images if fmts[name] == FMT_VQ]
+    if vq_names:
+        h = hashlib.sha256()
+        for name in vq_names:
+            h.update(hashes[name].encode())
+        vq_hash = h.hexdigest()
+    groups = [[name] for name in images if fmts[name] != FMT_VQ] + ([vq_names] if vq_names else [])
+    group_hashes = [hashes[group[0]] if fmts[group[0]] != FMT_VQ else vq_hash for group in groups]
+
+    # look up each chain (or the VQ textures) in the cache
+    encoded = {}
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        for (group, group_hash) in zip(groups, group_hashes):
+            path = os.path.join(cache_dir, group_hash + ".bin")
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    encoded[tuple(group)] = f.read()
+
+    # encode everything which wasn't cached, a job per level (or one job for all VQ textures, as their levels share a codebook)
+    stale = [(group, group_hash) for (group, group_hash) in zip(groups, group_hashes) if tuple(group) not in encoded]
+    jobs = []
+    for (group, _) in stale:
+        if fmts[group[0]] == FMT_VQ:
+            jobs.append((tuple(group), [level for name in group for level in chains[name]], FMT_VQ))
+        else:
+            jobs += [(tuple(group), [level], fmts[group[0]]) for level in chains[group[0]]]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(jobs))
+    if workers <= 1:
+        results = [encode_chain(levels, fmt) for (_, levels, fmt) in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(encode_chain, [levels for (_, levels, _) in jobs], [fmt for (_, _, fmt) in jobs]))
+    for (group, group_hash) in stale:
+        encoded[tuple(group)] = b"".join(b"".join(r) for (job, r) in zip(jobs, results) if job[0] == tuple(group))
+        if cache_dir is not None:
+            with open(os.path.join(cache_dir, group_hash + ".bin"), "wb") as f:
+                f.write(encoded[tuple(group)])
+    rebuilt = [name for name in images if any(name in group for (group, _) in stale)]
+
+    # split each encoded chain (or the VQ textures) back into the shared codebook & the levels of each texture
+    codebook = []
+    levels = {}
+    for group in groups:
+        data = np.frombuffer(encoded[tuple(group)], dtype='<u4')
+        pos = 0
+        if fmts[group[0]] == FMT_VQ:
+            codebook = [data[:vq_enc.ENTRIES * 4]]
+            pos = vq_enc.ENTRIES * 4
+        for name in group:
+            levels[name] = []
+            for level in chains[name]:
+                size = ((level.shape[0] >> 2) * (level.shape[1] >> 2)) << blk_shift_table[fmts[name]]
+                levels[name].append(data[pos:pos + size])
+                pos += size
+
+    # link: place the VQ codebook, then every level of every texture, at the next aligned address
+    words = []
+    adrs = []
+    offs = 0
+    for data in codebook + [level for name in images for level in levels[name]]:
+        pad = (-(adr + offs)) % align
+        words.append(np.zeros(pad, dtype=np.uint32))
+        offs += pad
+        adrs.append(adr + offs)
+        words.append(data)
+        offs += len(data)
+    cb_adr = adrs.pop(0) if codebook else 0
+    textures = {}
+    for name in images:
+        (h, w) = chains[name][0].shape[:2]
+        tbl = adrs[:len(levels[name])]
+        adrs = adrs[len(levels[name]):]
+        textures[name] = {
+            "tex_w": w.bit_length() - 1,
+            "tex_h": h.bit_length() - 1,
+            "tex_fmt": fmts[name],
+        }
+        if fmts[name] == FMT_VQ:
+            textures[name]["tex_cb_adr"] = cb_adr
+        textures[name]["tex_mip_tbl"] = tbl + [tbl[-1]] * (MIP_TBL_SIZE - len(tbl))
+    words = np.concatenate(words).astype(np.uint32) if words else np.zeros(0, dtype=np.uint32)
+    return TexImage(words, textures, rebuilt)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print("Usage: tex_build.py <output file> <format> <input image> [input image ...]")
+        print("Writes the memory image to the output file, and the texture state of each texture to <output file>.json")
+        sys.exit(1)
+
+    images = {os.path.basename(path): path for path in sys.argv[3:]}
+    out = build_textures(images, int(sys.argv[2]), cache_dir=os.path.join(os.path.dirname(os.path.abspath(sys.argv[1])), ".tex_cache"))
+
+    with open(sys.argv[1], 'wb') as out_file:
+        out_file.write(out.words.astype('<u4').tobytes())
+    with open(sys.argv[1] + ".json", 'w') as out_file:
+        json.dump(out.textures, out_file, indent=4)
+
+    for (name, tex) in out.textures.items():
+        print("%s: %sx%s, mip levels at %s" % (name, 1 << tex["tex_w"], 1 << tex["tex_h"], sorted(set(tex["tex_mip_tbl"]))))
+    print("Finished (%s words, %s of %s textures encoded)" % (len(out.words), len(out.rebuilt), len(out.textures)))
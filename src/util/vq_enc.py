@@ -0,0 +1,121 @@
+import sys
+
+import numpy as np
+from PIL import Image
+
+try:
+    from .nxtc_enc import swizzle_blocks
+except ImportError:
+    from nxtc_enc import swizzle_blocks
+
+"""
+=== VQ FORMAT ===
+
+VQ textures (TexBlock format 4) are vector quantized in 2x2 texel quads: each 4x4 block is a single 32-bit word holding four 8-bit codebook indices, one
+per quad of the block in z-curve order (top-left quad in the lowest byte, then top-right, bottom-left & bottom-right), for 2 bits per texel.
+Each codebook entry is four RGBA8888 texels, also in z-curve order, so the entry of quad N fills bank offset N of all four TexBlock banks.
+
+The codebook is ENTRIES * 4 words, and is stored separately from the blocks (at the texture's tex_cb_adr), as it's loaded into VQCodebook once and
+then shared by every block & mip level of the texture - and by every other texture encoded with it (tex_build trains a single codebook across all of
+the VQ textures it links together, so switching between them never reloads it).
+"""
+
+# number of codebook entries (the size of VQCodebook)
+ENTRIES = 256
+
+# rows of quads searched at once, bounds the size of the distance matrix
+SEARCH_CHUNK = 8192
+
+def image_quads(img):
+    """
+    Split an image into 2x2 quads, in the order the quads of each block are stored
+
+    Returns a [blocks * 4, 16] uint8 array (4 texels of 4 channels per quad)
+    """
+    blocks = swizzle_blocks(img)
+    return blocks.reshape(-1, 16)
+
+def nearest(quads, codebook):
+    """
+    Index of the closest codebook entry (by squared error) for each of a set of quads
+    """
+    quads = np.asarray(quads, dtype=np.float32)
+    codebook = np.asarray(codebook, dtype=np.float32)
+    cnorm = (codebook * codebook).sum(axis=1)
+    out = np.empty(len(quads), dtype=np.int64)
+    for i in range(0, len(quads), SEARCH_CHUNK):
+        q = quads[i:i + SEARCH_CHUNK]
+        out[i:i + SEARCH_CHUNK] = (cnorm[None, :] - (2 * (q @ codebook.T))).argmin(axis=1)
+    return out
+
+def train_codebook(quads, entries=ENTRIES, iters=8, seed=0):
+    """
+    Train a codebook for a set of quads with k-means
+
+    - quads: [N, 16] quads (see image_quads), e.g. from every mip level of a texture
+    - entries: number of codebook entries
+    - iters: number of k-means iterations
+
+    Returns a [entries, 16] uint8 array
+    """
+    quads = np.asarray(quads, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    (uniq, counts) = np.unique(quads, axis=0, return_counts=True)
+    if len(uniq) <= entries:
+        # few enough distinct quads to store every one of them exactly
+        codebook = np.zeros((entries, 16), dtype=np.float32)
+        codebook[:len(uniq)] = uniq
+        return np.rint(codebook).astype(np.uint8)
+    codebook = uniq[rng.choice(len(uniq), entries, replace=False)]
+    for _ in range(iters):
+        idx = nearest(uniq, codebook)
+        sums = np.zeros_like(codebook)
+        np.add.at(sums, idx, uniq * counts[:, None])
+        n = np.bincount(idx, weights=counts, minlength=entries)
+        empty = n == 0
+        codebook = np.where(empty[:, None], codebook, sums / np.maximum(n, 1)[:, None])
+        # entries nobody picked are moved onto random quads
+        if empty.any():
+            codebook[empty] = uniq[rng.choice(len(uniq), np.count_nonzero(empty), replace=False)]
+    return np.clip(np.rint(codebook), 0, 255).astype(np.uint8)
+
+def pack_codebook(codebook):
+    """
+    Pack a [entries, 16] codebook into codebook memory words (4 RGBA8888 words per entry)
+    """
+    c = np.asarray(codebook, dtype=np.uint32).reshape(-1, 4, 4)
+    return (c[..., 0] | (c[..., 1] << 8) | (c[..., 2] << 16) | (c[..., 3] << 24)).astype('<u4').tobytes()
+
+def encode_blocks(quads, codebook):
+    """
+    Encode [blocks * 4, 16] quads with a codebook, returns the packed block words (one per block)
+    """
+    idx = nearest(quads, codebook).astype(np.uint32).reshape(-1, 4)
+    return (idx[:, 0] | (idx[:, 1] << 8) | (idx[:, 2] << 16) | (idx[:, 3] << 24)).astype('<u4').tobytes()
+
+def encode_images(imgs, entries=ENTRIES, iters=8):
+    """
+    Encode a set of images (e.g. the levels of a mip chain) sharing a single codebook, blocks are stored in row-major order
+
+    - imgs: list of PIL images (or [h, w, 4] RGBA arrays)
+
+    Returns the packed codebook, and the packed blocks of each image
+    """
+    quads = [image_quads(np.asarray(img.convert("RGBA") if isinstance(img, Image.Image) else img, dtype=np.uint8)) for img in imgs]
+    codebook = train_codebook(np.concatenate(quads), entries, iters)
+    return (pack_codebook(codebook), [encode_blocks(q, codebook) for q in quads])
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: vq_enc.py <input image> <output file>")
+        print("Writes the codebook, followed by the blocks")
+        sys.exit(1)
+
+    img = Image.open(sys.argv[1]).convert("RGBA")
+    (codebook, (blocks,)) = encode_images([img])
+
+    with open(sys.argv[2], 'wb') as out_file:
+        out_file.write(codebook)
+        out_file.write(blocks)
+
+    print("Finished")
@@ -0,0 +1,91 @@
+from myhdl import *
+
+from mem import CTI_INCR, CTI_END, BTE_LINEAR
+
+@block
+def VQCodebook(i_rstn, i_clk, i_cb_adr, i_stb, o_ready, i_idx, o_dat,
+               o_mem_adr, i_mem_dat, o_mem_stb, i_mem_ack, o_mem_cti=None, o_mem_bte=None, o_loads=None, ENTRIES=256):
+    """
+    On-chip codebook for VQ textures (see TexBlock)
+
+    Holds ENTRIES codebook entries of four RGBA8888 texels (a 2x2 quad, in z-curve order), stored in memory as ENTRIES * 4 consecutive words. The codebook is
+    tagged with the address it was loaded from, and stays resident until a different one is requested, at which point it's reloaded as a single burst.
+    Lookups are combinational: i_idx is meant to be wired to the read data bus the TexBlocks fill from, so the entries of all four quads of a VQ block word
+    are ready on the same clock the word is acknowledged
+
+    - i_rstn: Reset signal
+    - i_clk: Clock signal
+
+    - i_cb_adr: Input address of codebook in memory
+    - i_stb: Input codebook request signal (loads the codebook at i_cb_adr if it isn't already loaded)
+    - o_ready: 1 while the codebook at i_cb_adr is loaded, 0 otherwise
+    - i_idx: Input VQ block word (four 8-bit entry indices)
+    - o_dat: Output codebook entries of each index [16 - 4 texels per index, in index order]
+
+    - o_mem_adr: Output read address to backing memory
+    - i_mem_dat: Input read data from backing memory
+    - o_mem_stb: Output request transaction signal to backing memory
+    - i_mem_ack: Input data valid signal from backing memory
+    - o_mem_cti: Optional output cycle type to backing memory
+    - o_mem_bte: Optional output burst type to backing memory
+
+    - o_loads: Optional output count of codebook loads
+
+    - ENTRIES: Number of codebook entries (power of two, up to 256)
+    """
+
+    WORDS = ENTRIES * 4
+
+    assert ENTRIES <= 256 and ENTRIES == 1 << (ENTRIES - 1).bit_length(), "ENTRIES must be a power of two, up to 256"
+
+    if o_mem_cti is None:
+        o_mem_cti = Signal(intbv(0)[3:])
+    if o_mem_bte is None:
+        o_mem_bte = Signal(intbv(0)[2:])
+    if o_loads is None:
+        o_loads = Signal(intbv(0)[32:])
+
+    # NOTE: kept as a flat list (entry * 4 + texel), as always_comb can't infer sensitivity to a nested list of signals
+    _cb = [Signal(intbv(0)[32:]) for _ in range(WORDS)]
+
+    _tag = Signal(intbv(0)[32:])
+    _valid = Signal(bool(0))
+    _loading = Signal(bool(0))
+    _filloffs = Signal(intbv(0, min=0, max=WORDS))
+
+    @always(i_clk.posedge, i_rstn)
+    def load():
+        if i_rstn == 0:
+            _valid.next = False
+            _loading.next = False
+            o_loads.next = 0
+        elif _loading:
+            if i_mem_ack:
+                _cb[_filloffs].next = i_mem_dat
+                if _filloffs == WORDS - 1:
+                    _valid.next = True
+                    _loading.next = False
+                else:
+                    _filloffs.next = _filloffs + 1
+        elif i_stb and not o_ready:
+            _tag.next = i_cb_adr
+            _valid.next = False
+            _filloffs.next = 0
+            _loading.next = True
+            o_loads.next = o_loads + 1
+
+    @always_comb
+    def access():
+        o_ready.next = _valid and _tag == i_cb_adr
+
+        for q in range(4):
+            entry = i_idx[(q * 8) + 8:q * 8] & (ENTRIES - 1)
+            for k in range(4):
+                o_dat[(q * 4) + k].next = _cb[(entry * 4) + k]
+
+        o_mem_adr.next = _tag + _filloffs
+        o_mem_stb.next = _loading
+        o_mem_cti.next = CTI_END if _filloffs == WORDS - 1 else CTI_INCR
+        o_mem_bte.next = BTE_LINEAR
+
+    return load, access